@@ -1,13 +1,5 @@
-import sqlite3
-from datetime import datetime
+from log_writer import get_log_writer
 
 def log_activity(db_path, user_id, activity_type, description):
-    try:
-        conn = sqlite3.connect(db_path)
-        cur = conn.cursor()
-        cur.execute('INSERT INTO activity_logs (user_id, activity_type, description, timestamp) VALUES (?, ?, ?, ?)', (
-            user_id, activity_type, description, datetime.utcnow().isoformat()
-        ))
-        conn.commit()
-    finally:
-        conn.close()
+    """Queue an activity_logs row; it is written in the background with other recent events"""
+    return get_log_writer(db_path).log_activity(user_id, activity_type, description)
@@ -6,6 +6,8 @@ Add role column to users table and set admin for admin user
 import sqlite3
 import os
 
+from migrations import apply_migrations
+
 DB_PATH = 'smartsecure.db'
 
 def add_role_column():
@@ -13,17 +15,9 @@ def add_role_column():
         conn = sqlite3.connect(DB_PATH)
         cursor = conn.cursor()
         
-        # Check if role column exists
-        cursor.execute("PRAGMA table_info(users)")
-        columns = [col[1] for col in cursor.fetchall()]
-        
-        if 'role' not in columns:
-            print("Adding role column to users table...")
-            cursor.execute("ALTER TABLE users ADD COLUMN role TEXT DEFAULT 'user'")
-            conn.commit()
-            print("✅ Role column added")
-        else:
-            print("✅ Role column already exists")
+        # The role column is added by migration 2
+        applied = apply_migrations(conn)
+        print(f"✅ Schema up to date (applied {applied or 'nothing'})")
         
         # Set admin role for admin user
         cursor.execute("UPDATE users SET role = 'admin' WHERE username = 'admin'")
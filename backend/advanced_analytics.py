@@ -5,213 +5,280 @@ Business Intelligence for SmartSecure Sri Lanka
 
 import sqlite3
 import json
+import threading
 from datetime import datetime, timezone, timedelta
-from collections import defaultdict
+from collections import OrderedDict, defaultdict
 import math
 
+from db_pool import get_pool
+from migrations import ensure_schema
+from request_logging import get_logger
+
+log = get_logger(__name__)
+
+# Executive reports kept per engine, keyed by (days, data version)
+REPORT_CACHE_SIZE = 16
+PERFORMANCE_DAYS = 7
+
 class AdvancedAnalytics:
-    """Advanced analytics and business intelligence"""
+    """Advanced analytics and business intelligence
+    
+    Activity, security event and upload figures are read from the hourly and
+    daily rollup tables (migration 5) that triggers keep up to date, so a
+    report costs O(days in the window) rather than O(events). Windows are
+    bound parameters and start at midnight (UTC) `days` days ago.
     
-    def __init__(self, db_path):
+    Each rollup table is read once per window by a _load_* method, and the
+    report sections are assembled from those rows in Python; the executive
+    report shares one read of every table between its sections and is
+    cached until the analytics data version (bumped by triggers on every
+    write to the source tables, migration 6) changes.
+    """
+    
+    def __init__(self, db_path, cache_size=REPORT_CACHE_SIZE):
         self.db_path = db_path
+        self.cache_size = cache_size
+        self._reports = OrderedDict()
+        self._reports_lock = threading.Lock()
+    
+    def _connection(self):
+        ensure_schema(self.db_path)
+        return get_pool(self.db_path).connection()
+    
+    # -- one pass per table --
+    
+    @staticmethod
+    def _window_start(conn, days) -> str:
+        """First day (YYYY-MM-DD, UTC) inside a window of `days` days"""
+        return conn.execute("SELECT DATE('now', ?)", (f'-{int(days)} days',)).fetchone()[0]
+    
+    @staticmethod
+    def _rollup_hour(conn) -> str:
+        """Current hour bucket (UTC); activity and metrics writes do not move the data version"""
+        return conn.execute("SELECT strftime('%Y-%m-%dT%H', 'now')").fetchone()[0]
+    
+    @staticmethod
+    def data_version(conn) -> int:
+        row = conn.execute("SELECT version FROM data_versions WHERE name = 'analytics'").fetchone()
+        return row[0] if row else 0
+    
+    @staticmethod
+    def _load_users(conn):
+        """(registration day, users registered, of which active)"""
+        return conn.execute('''
+            SELECT DATE(created_date) as date, COUNT(*), SUM(is_active = 1)
+            FROM users GROUP BY date
+        ''').fetchall()
+    
+    @staticmethod
+    def _load_activity_users(conn, start):
+        return conn.execute('SELECT day, user_id, events FROM activity_users_daily WHERE day >= ?',
+                            (start,)).fetchall()
+    
+    @staticmethod
+    def _load_activity_hourly(conn, start):
+        return conn.execute('SELECT hour, activity_type, events FROM activity_hourly WHERE hour >= ?',
+                            (f'{start}T00',)).fetchall()
+    
+    @staticmethod
+    def _load_uploads(conn, start):
+        return conn.execute('''
+            SELECT day, file_category, files, total_size, threat_sum, high_threat_files
+            FROM uploads_daily WHERE day >= ?
+        ''', (start,)).fetchall()
+    
+    @staticmethod
+    def _load_security_events(conn, start):
+        return conn.execute('SELECT day, threat_level, events FROM security_events_daily WHERE day >= ?',
+                            (start,)).fetchall()
+    
+    @staticmethod
+    def _metric_columns(conn):
+        """(name column, time column) of system_metrics, or None if the table is missing.
+        
+        The migrated schema has metric_name / recorded_at; databases written
+        by older versions of system_monitor have metric_type / timestamp.
+        """
+        columns = {row[1] for row in conn.execute('PRAGMA table_info(system_metrics)')}
+        if not columns:
+            return None
+        name_column = 'metric_name' if 'metric_name' in columns else 'metric_type'
+        time_column = 'recorded_at' if 'recorded_at' in columns else 'timestamp'
+        if name_column not in columns or time_column not in columns:
+            return None
+        return name_column, time_column
+    
+    def _load_metrics(self, conn, start):
+        """Daily averages of the CPU and memory metrics, or None without a system_metrics table"""
+        columns = self._metric_columns(conn)
+        if columns is None:
+            return None
+        name_column, time_column = columns
+        return conn.execute(f'''
+            SELECT {name_column}, DATE({time_column}) as date, AVG(metric_value)
+            FROM system_metrics
+            WHERE {name_column} IN ('cpu_usage', 'memory_usage')
+            AND {time_column} >= ?
+            GROUP BY {name_column}, date
+            ORDER BY date
+        ''', (start,)).fetchall()
+    
+    # -- report sections, assembled from the loaded rows --
+    
+    @staticmethod
+    def _user_section(start, users, activity_users, activity_hourly):
+        registration_trend = [{'date': date, 'count': count}
+                              for date, count, _ in sorted(users, key=lambda row: row[0] or '')
+                              if date and date >= start]
+        
+        active_by_day = defaultdict(int)
+        engagement = defaultdict(int)
+        for day, user_id, events in activity_users:
+            active_by_day[day] += 1
+            engagement[user_id] += events
+        activity_trend = [{'date': day, 'active_users': count} for day, count in sorted(active_by_day.items())]
+        avg_engagement = sum(engagement.values()) / len(engagement) if engagement else 0
+        
+        by_type = defaultdict(int)
+        for _, activity_type, events in activity_hourly:
+            by_type[activity_type] += events
+        top_activities = [{'activity': activity_type, 'count': count}
+                          for activity_type, count in sorted(by_type.items(), key=lambda item: (-item[1], item[0]))[:10]]
+        
+        return {
+            'registration_trend': registration_trend,
+            'activity_trend': activity_trend,
+            'avg_engagement': round(avg_engagement, 2),
+            'top_activities': top_activities,
+            'total_active_users': len(engagement)
+        }
+    
+    @staticmethod
+    def _security_section(uploads, security_events, activity_hourly):
+        # day -> [files, threat_sum, high_threat_files]; category -> [files, threat_sum]
+        by_day = defaultdict(lambda: [0, 0.0, 0])
+        by_category = defaultdict(lambda: [0, 0.0])
+        for day, category, files, _, threat_sum, high_threat_files in uploads:
+            totals = by_day[day]
+            totals[0] += files
+            totals[1] += threat_sum
+            totals[2] += high_threat_files
+            by_category[category][0] += files
+            by_category[category][1] += threat_sum
+        
+        threat_trends = [{
+            'date': day,
+            'avg_threat': round(threat_sum / files, 3),
+            'total_files': files,
+            'high_threat_files': high_threat_files
+        } for day, (files, threat_sum, high_threat_files) in sorted(by_day.items()) if files > 0]
+        
+        security_events_by_level = defaultdict(int)
+        for _, threat_level, events in security_events:
+            security_events_by_level[threat_level] += events
+        
+        file_categories = [{
+            'category': category,
+            'count': files,
+            'avg_threat': round(threat_sum / files, 3)
+        } for category, (files, threat_sum) in sorted(by_category.items(), key=lambda item: (-item[1][0], item[0]))
+            if files > 0]
+        
+        failed_by_day = defaultdict(int)
+        for hour, activity_type, events in activity_hourly:
+            if activity_type == 'SECURITY_LOGIN_FAILED':
+                failed_by_day[hour[:10]] += events
+        failed_login_trend = [{'date': day, 'failed_attempts': count} for day, count in sorted(failed_by_day.items())]
+        
+        return {
+            'threat_trends': threat_trends,
+            'security_events_by_level': dict(security_events_by_level),
+            'file_categories': file_categories,
+            'failed_login_trend': failed_login_trend
+        }
+    
+    def _performance_section(self, metrics):
+        if metrics is None:
+            return self._get_mock_performance_data()
+        cpu_trends, memory_trends = [], []
+        for metric, date, value in metrics:
+            if metric == 'cpu_usage':
+                cpu_trends.append({'date': date, 'avg_cpu': round(value, 2)})
+            else:
+                memory_trends.append({'date': date, 'avg_memory': round(value, 2)})
+        
+        if not cpu_trends and not memory_trends:
+            return self._get_mock_performance_data()
+        
+        return {
+            'cpu_trends': cpu_trends,
+            'memory_trends': memory_trends,
+            'status': 'live_data'
+        }
+    
+    @staticmethod
+    def _business_section(users, activity_users, activity_hourly, uploads):
+        # day -> [total_size, files]
+        storage = defaultdict(lambda: [0, 0])
+        for day, _, files, total_size, _, _ in uploads:
+            storage[day][0] += total_size
+            storage[day][1] += files
+        storage_trends = [{
+            'date': day,
+            'total_size_mb': round(total_size / (1024*1024), 2),
+            'file_count': files
+        } for day, (total_size, files) in sorted(storage.items()) if files > 0]
+        
+        by_hour = defaultdict(int)
+        for hour, _, events in activity_hourly:
+            by_hour[int(hour[11:13])] += events
+        hourly_activity = [{'hour': hour, 'activity': count} for hour, count in sorted(by_hour.items())]
+        
+        active_users = len({user_id for _, user_id, _ in activity_users})
+        total_users = sum(active or 0 for _, _, active in users)
+        retention_rate = (active_users / total_users * 100) if total_users > 0 else 0
+        
+        return {
+            'storage_trends': storage_trends,
+            'hourly_activity': hourly_activity,
+            'retention_rate': round(retention_rate, 2),
+            'active_users': active_users,
+            'total_users': total_users
+        }
+    
+    # -- public API --
     
     def get_user_analytics(self, days=30):
         """Get comprehensive user analytics"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            # User registration trends
-            cursor.execute('''
-                SELECT DATE(created_date) as date, COUNT(*) as count
-                FROM users 
-                WHERE created_date > datetime('now', '-{} days')
-                GROUP BY DATE(created_date)
-                ORDER BY date
-            '''.format(days))
-            
-            registration_trend = [{'date': row[0], 'count': row[1]} for row in cursor.fetchall()]
-            
-            # Active users by day
-            cursor.execute('''
-                SELECT DATE(timestamp) as date, COUNT(DISTINCT user_id) as active_users
-                FROM activity_logs 
-                WHERE timestamp > datetime('now', '-{} days')
-                GROUP BY DATE(timestamp)
-                ORDER BY date
-            '''.format(days))
-            
-            activity_trend = [{'date': row[0], 'active_users': row[1]} for row in cursor.fetchall()]
-            
-            # User engagement metrics
-            cursor.execute('''
-                SELECT user_id, COUNT(*) as activity_count
-                FROM activity_logs 
-                WHERE timestamp > datetime('now', '-{} days')
-                GROUP BY user_id
-            '''.format(days))
-            
-            engagement_data = cursor.fetchall()
-            avg_engagement = sum(row[1] for row in engagement_data) / len(engagement_data) if engagement_data else 0
-            
-            # Top activities
-            cursor.execute('''
-                SELECT activity_type, COUNT(*) as count
-                FROM activity_logs 
-                WHERE timestamp > datetime('now', '-{} days')
-                GROUP BY activity_type
-                ORDER BY count DESC
-                LIMIT 10
-            '''.format(days))
-            
-            top_activities = [{'activity': row[0], 'count': row[1]} for row in cursor.fetchall()]
-            
-            conn.close()
-            
-            return {
-                'registration_trend': registration_trend,
-                'activity_trend': activity_trend,
-                'avg_engagement': round(avg_engagement, 2),
-                'top_activities': top_activities,
-                'total_active_users': len(engagement_data)
-            }
-            
-        except Exception as e:
-            print(f"❌ User analytics error: {e}")
+            with self._connection() as conn:
+                start = self._window_start(conn, days)
+                return self._user_section(start, self._load_users(conn), self._load_activity_users(conn, start),
+                                          self._load_activity_hourly(conn, start))
+        except Exception:
+            log.exception('User analytics error')
             return {}
     
     def get_security_analytics(self, days=30):
         """Get security-focused analytics"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            # Threat detection trends
-            cursor.execute('''
-                SELECT DATE(upload_date) as date, 
-                       AVG(threat_score) as avg_threat,
-                       COUNT(*) as total_files,
-                       SUM(CASE WHEN threat_score > 0.5 THEN 1 ELSE 0 END) as high_threat_files
-                FROM files 
-                WHERE upload_date > datetime('now', '-{} days')
-                GROUP BY DATE(upload_date)
-                ORDER BY date
-            '''.format(days))
-            
-            threat_trends = []
-            for row in cursor.fetchall():
-                threat_trends.append({
-                    'date': row[0],
-                    'avg_threat': round(row[1] or 0, 3),
-                    'total_files': row[2],
-                    'high_threat_files': row[3]
-                })
-            
-            # Security events by severity
-            cursor.execute('''
-                SELECT threat_level, COUNT(*) as count
-                FROM security_events 
-                WHERE timestamp > datetime('now', '-{} days')
-                GROUP BY threat_level
-            '''.format(days))
-            
-            security_events_by_level = {row[0]: row[1] for row in cursor.fetchall()}
-            
-            # File categories analysis
-            cursor.execute('''
-                SELECT file_category, COUNT(*) as count, AVG(threat_score) as avg_threat
-                FROM files 
-                WHERE upload_date > datetime('now', '-{} days')
-                GROUP BY file_category
-                ORDER BY count DESC
-            '''.format(days))
-            
-            file_categories = []
-            for row in cursor.fetchall():
-                file_categories.append({
-                    'category': row[0],
-                    'count': row[1],
-                    'avg_threat': round(row[2] or 0, 3)
-                })
-            
-            # Failed login attempts analysis
-            cursor.execute('''
-                SELECT DATE(timestamp) as date, COUNT(*) as failed_attempts
-                FROM activity_logs 
-                WHERE activity_type = 'SECURITY_LOGIN_FAILED'
-                AND timestamp > datetime('now', '-{} days')
-                GROUP BY DATE(timestamp)
-                ORDER BY date
-            '''.format(days))
-            
-            failed_login_trend = [{'date': row[0], 'failed_attempts': row[1]} for row in cursor.fetchall()]
-            
-            conn.close()
-            
-            return {
-                'threat_trends': threat_trends,
-                'security_events_by_level': security_events_by_level,
-                'file_categories': file_categories,
-                'failed_login_trend': failed_login_trend
-            }
-            
-        except Exception as e:
-            print(f"❌ Security analytics error: {e}")
+            with self._connection() as conn:
+                start = self._window_start(conn, days)
+                return self._security_section(self._load_uploads(conn, start),
+                                              self._load_security_events(conn, start),
+                                              self._load_activity_hourly(conn, start))
+        except Exception:
+            log.exception('Security analytics error')
             return {}
     
-    def get_performance_analytics(self, days=7):
+    def get_performance_analytics(self, days=PERFORMANCE_DAYS):
         """Get system performance analytics"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            # Check if system_metrics table exists and has data
-            cursor.execute('''
-                SELECT name FROM sqlite_master 
-                WHERE type='table' AND name='system_metrics'
-            ''')
-            
-            if not cursor.fetchone():
-                conn.close()
-                return self._get_mock_performance_data()
-            
-            # CPU usage trends
-            cursor.execute('''
-                SELECT DATE(timestamp) as date, AVG(metric_value) as avg_cpu
-                FROM system_metrics 
-                WHERE metric_type = 'cpu_usage'
-                AND timestamp > datetime('now', '-{} days')
-                GROUP BY DATE(timestamp)
-                ORDER BY date
-            '''.format(days))
-            
-            cpu_trends = [{'date': row[0], 'avg_cpu': round(row[1], 2)} for row in cursor.fetchall()]
-            
-            # Memory usage trends
-            cursor.execute('''
-                SELECT DATE(timestamp) as date, AVG(metric_value) as avg_memory
-                FROM system_metrics 
-                WHERE metric_type = 'memory_usage'
-                AND timestamp > datetime('now', '-{} days')
-                GROUP BY DATE(timestamp)
-                ORDER BY date
-            '''.format(days))
-            
-            memory_trends = [{'date': row[0], 'avg_memory': round(row[1], 2)} for row in cursor.fetchall()]
-            
-            conn.close()
-            
-            if not cpu_trends and not memory_trends:
-                return self._get_mock_performance_data()
-            
-            return {
-                'cpu_trends': cpu_trends,
-                'memory_trends': memory_trends,
-                'status': 'live_data'
-            }
-            
-        except Exception as e:
-            print(f"❌ Performance analytics error: {e}")
+            with self._connection() as conn:
+                metrics = self._load_metrics(conn, self._window_start(conn, days))
+            return self._performance_section(metrics)
+        except Exception:
+            log.exception('Performance analytics error')
             return self._get_mock_performance_data()
     
     def _get_mock_performance_data(self):
@@ -241,114 +308,99 @@ class AdvancedAnalytics:
     def get_business_insights(self, days=30):
         """Get business intelligence insights"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            # Storage usage patterns
-            cursor.execute('''
-                SELECT DATE(upload_date) as date, 
-                       SUM(file_size) as total_size,
-                       COUNT(*) as file_count
-                FROM files 
-                WHERE upload_date > datetime('now', '-{} days')
-                GROUP BY DATE(upload_date)
-                ORDER BY date
-            '''.format(days))
-            
-            storage_trends = []
-            for row in cursor.fetchall():
-                storage_trends.append({
-                    'date': row[0],
-                    'total_size_mb': round(row[1] / (1024*1024), 2),
-                    'file_count': row[2]
-                })
-            
-            # Peak usage hours
-            cursor.execute('''
-                SELECT strftime('%H', timestamp) as hour, COUNT(*) as activity_count
-                FROM activity_logs 
-                WHERE timestamp > datetime('now', '-{} days')
-                GROUP BY strftime('%H', timestamp)
-                ORDER BY hour
-            '''.format(days))
-            
-            hourly_activity = [{'hour': int(row[0]), 'activity': row[1]} for row in cursor.fetchall()]
-            
-            # User retention metrics
-            cursor.execute('''
-                SELECT COUNT(DISTINCT user_id) as total_users
-                FROM activity_logs 
-                WHERE timestamp > datetime('now', '-{} days')
-            '''.format(days))
-            
-            active_users = cursor.fetchone()[0]
-            
-            cursor.execute('SELECT COUNT(*) FROM users WHERE is_active = 1')
-            total_users = cursor.fetchone()[0]
-            
-            retention_rate = (active_users / total_users * 100) if total_users > 0 else 0
-            
-            conn.close()
-            
-            return {
-                'storage_trends': storage_trends,
-                'hourly_activity': hourly_activity,
-                'retention_rate': round(retention_rate, 2),
-                'active_users': active_users,
-                'total_users': total_users
-            }
-            
-        except Exception as e:
-            print(f"❌ Business insights error: {e}")
+            with self._connection() as conn:
+                start = self._window_start(conn, days)
+                return self._business_section(self._load_users(conn), self._load_activity_users(conn, start),
+                                              self._load_activity_hourly(conn, start),
+                                              self._load_uploads(conn, start))
+        except Exception:
+            log.exception('Business insights error')
             return {}
     
     def generate_executive_report(self, days=30):
-        """Generate executive summary report"""
+        """Generate executive summary report.
+
+        Cached until users, files or security events change, or the hour turns
+        (activity and system metrics are at most an hour behind).
+        """
         try:
-            user_analytics = self.get_user_analytics(days)
-            security_analytics = self.get_security_analytics(days)
-            performance_analytics = self.get_performance_analytics(7)
-            business_insights = self.get_business_insights(days)
-            
-            # Calculate key metrics
-            total_files = sum(trend.get('total_files', 0) for trend in security_analytics.get('threat_trends', []))
-            avg_threat_score = sum(trend.get('avg_threat', 0) for trend in security_analytics.get('threat_trends', [])) / len(security_analytics.get('threat_trends', [1]))
-            
-            security_events = sum(security_analytics.get('security_events_by_level', {}).values())
-            
-            # Risk assessment
-            if avg_threat_score > 0.7 or security_events > 50:
-                risk_level = 'HIGH'
-            elif avg_threat_score > 0.4 or security_events > 20:
-                risk_level = 'MEDIUM'
-            else:
-                risk_level = 'LOW'
-            
-            return {
-                'report_date': datetime.now(timezone.utc).isoformat(),
-                'period_days': days,
-                'executive_summary': {
-                    'total_users': business_insights.get('total_users', 0),
-                    'active_users': business_insights.get('active_users', 0),
-                    'retention_rate': business_insights.get('retention_rate', 0),
-                    'total_files_processed': total_files,
-                    'avg_threat_score': round(avg_threat_score, 3),
-                    'security_events': security_events,
-                    'risk_level': risk_level
-                },
-                'detailed_analytics': {
-                    'user_metrics': user_analytics,
-                    'security_metrics': security_analytics,
-                    'performance_metrics': performance_analytics,
-                    'business_metrics': business_insights
-                },
-                'recommendations': self._generate_executive_recommendations(avg_threat_score, security_events, business_insights)
-            }
-            
-        except Exception as e:
-            print(f"❌ Executive report error: {e}")
+            days = int(days)
+            with self._connection() as conn:
+                # One read transaction: the version and the rows it describes come from the same snapshot
+                conn.execute('BEGIN')
+                version = self.data_version(conn)
+                # The window moves at midnight even when no data changes
+                key = (days, self._window_start(conn, days), self._rollup_hour(conn), version)
+                with self._reports_lock:
+                    report = self._reports.get(key)
+                    if report is not None:
+                        self._reports.move_to_end(key)
+                        return report
+                report = self._build_executive_report(conn, days, version)
+            
+            with self._reports_lock:
+                self._reports[key] = report
+                # Reports for older versions can never be served again
+                for stale in [k for k in self._reports if k[-1] < version]:
+                    del self._reports[stale]
+                while len(self._reports) > self.cache_size:
+                    self._reports.popitem(last=False)
+            return report
+        
+        except Exception:
+            log.exception('Executive report error')
             return {}
     
+    def _build_executive_report(self, conn, days, version):
+        start = self._window_start(conn, days)
+        users = self._load_users(conn)
+        activity_users = self._load_activity_users(conn, start)
+        activity_hourly = self._load_activity_hourly(conn, start)
+        uploads = self._load_uploads(conn, start)
+        
+        user_analytics = self._user_section(start, users, activity_users, activity_hourly)
+        security_analytics = self._security_section(uploads, self._load_security_events(conn, start), activity_hourly)
+        performance_analytics = self._performance_section(
+            self._load_metrics(conn, self._window_start(conn, PERFORMANCE_DAYS)))
+        business_insights = self._business_section(users, activity_users, activity_hourly, uploads)
+        
+        # Calculate key metrics
+        threat_trends = security_analytics['threat_trends']
+        total_files = sum(trend['total_files'] for trend in threat_trends)
+        avg_threat_score = sum(trend['avg_threat'] for trend in threat_trends) / (len(threat_trends) or 1)
+        
+        security_events = sum(security_analytics['security_events_by_level'].values())
+        
+        # Risk assessment
+        if avg_threat_score > 0.7 or security_events > 50:
+            risk_level = 'HIGH'
+        elif avg_threat_score > 0.4 or security_events > 20:
+            risk_level = 'MEDIUM'
+        else:
+            risk_level = 'LOW'
+        
+        return {
+            'report_date': datetime.now(timezone.utc).isoformat(),
+            'period_days': days,
+            'data_version': version,
+            'executive_summary': {
+                'total_users': business_insights['total_users'],
+                'active_users': business_insights['active_users'],
+                'retention_rate': business_insights['retention_rate'],
+                'total_files_processed': total_files,
+                'avg_threat_score': round(avg_threat_score, 3),
+                'security_events': security_events,
+                'risk_level': risk_level
+            },
+            'detailed_analytics': {
+                'user_metrics': user_analytics,
+                'security_metrics': security_analytics,
+                'performance_metrics': performance_analytics,
+                'business_metrics': business_insights
+            },
+            'recommendations': self._generate_executive_recommendations(avg_threat_score, security_events, business_insights)
+        }
+    
     def _generate_executive_recommendations(self, avg_threat, security_events, business_data):
         """Generate executive recommendations"""
         recommendations = []
@@ -383,7 +435,61 @@ class AdvancedAnalytics:
         
         return recommendations
 
+def _camel(value):
+    """Recursively rename snake_case keys to the camelCase the dashboard expects"""
+    if isinstance(value, dict):
+        return {(key.split('_')[0] + ''.join(part.title() for part in key.split('_')[1:])
+                 if isinstance(key, str) and key.islower() else key): _camel(item)
+                for key, item in value.items()}
+    if isinstance(value, list):
+        return [_camel(item) for item in value]
+    return value
+
+def dashboard_payload(report):
+    """Executive report reshaped for the analytics dashboard (userAnalytics, securityAnalytics, ...)"""
+    if not report:
+        return {}
+    details = report['detailed_analytics']
+    summary = report['executive_summary']
+    user_metrics = details['user_metrics']
+    security_metrics = details['security_metrics']
+    threat_trends = security_metrics['threat_trends']
+    return {
+        'periodDays': report['period_days'],
+        'generatedAt': report['report_date'],
+        'dataVersion': report.get('data_version'),
+        'summary': _camel(summary),
+        'userAnalytics': {
+            **_camel(user_metrics),
+            'totalUsers': summary['total_users'],
+            'activeUsers': summary['active_users'],
+            'newUsers': sum(row['count'] for row in user_metrics['registration_trend']),
+            'retentionRate': summary['retention_rate'],
+        },
+        'securityAnalytics': {
+            **_camel(security_metrics),
+            'totalThreats': sum(row['high_threat_files'] for row in threat_trends),
+            'securityEvents': summary['security_events'],
+            'riskLevel': summary['risk_level'],
+            'riskScore': round(summary['avg_threat_score'] * 100, 1),
+        },
+        'performanceAnalytics': _camel(details['performance_metrics']),
+        'businessInsights': _camel(details['business_metrics']),
+        'recommendations': report['recommendations'],
+    }
+
 # Initialize analytics
 def create_analytics_engine(db_path):
     """Create analytics engine instance"""
-    return AdvancedAnalytics(db_path)
\ No newline at end of file
+    return AdvancedAnalytics(db_path)
+
+_engines = {}
+_engines_lock = threading.Lock()
+
+def get_analytics_engine(db_path):
+    """Shared engine (and report cache) for a database file"""
+    engine = _engines.get(db_path)
+    if engine is None:
+        with _engines_lock:
+            engine = _engines.setdefault(db_path, AdvancedAnalytics(db_path))
+    return engine
@@ -2,42 +2,89 @@
 AI Threat Detection System for SmartSecure Sri Lanka
 Phase 3 - Machine Learning Security Analysis
 """
-import pandas as pd
-import numpy as np
-from sklearn.ensemble import IsolationForest, RandomForestClassifier
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.preprocessing import StandardScaler
 import hashlib
 import mimetypes
 import re
 import json
+import threading
 from datetime import datetime, timezone
-from typing import Dict, List, Tuple, Optional
+from typing import BinaryIO, Dict, Iterable, Iterator, List, Tuple, Optional, Union
+import mmap
 import os
 
+from anomaly_model import AnomalyModelStore, activity_matrix
+from signatures import SignatureHits, SignatureMatcher, SignatureSet, default_signatures
+
+# Known malicious patterns
+DEFAULT_MALICIOUS_PATTERNS = [
+    rb'<script[^>]*>.*?</script>',
+    rb'javascript:',
+    rb'vbscript:',
+    rb'onload\s*=',
+    rb'onerror\s*=',
+    rb'eval\s*\(',
+    rb'document\.write',
+    rb'ActiveXObject',
+    rb'Shell\.Application',
+    rb'WScript\.Shell',
+]
+
+# Bump whenever the scoring rules in ThreatDetectionEngine change in code;
+# together with the pattern/extension tables it forms engine_version.
+RULES_VERSION = '2024.10.1'
+
+# Features derived from the file name rather than its bytes
+FILENAME_FEATURES = ('file_extension', 'filename_length', 'mime_type')
+
+# Block size used when analysing files on disk
+SCAN_CHUNK_SIZE = 64 * 1024
+
+# Anything extract_file_features can read: bytes-like objects (including
+# mmap), binary file objects, or an iterable of byte chunks
+ContentSource = Union[bytes, bytearray, memoryview, mmap.mmap, BinaryIO, Iterable[bytes]]
+
+def iter_content_chunks(source: ContentSource, chunk_size: int = SCAN_CHUNK_SIZE) -> Iterator[bytes]:
+    """Yield the content of `source` in blocks of at most `chunk_size` bytes"""
+    if isinstance(source, (bytes, bytearray, memoryview, mmap.mmap)):
+        view = memoryview(source)
+        try:
+            for start in range(0, len(view), chunk_size):
+                yield view[start:start + chunk_size]
+        finally:
+            view.release()
+    elif hasattr(source, 'read'):
+        for chunk in iter(lambda: source.read(chunk_size), b''):
+            yield chunk
+    else:
+        for chunk in source:
+            yield chunk
+
+def _shannon_entropy(data: bytes) -> float:
+    """Shannon entropy of data, normalized to 0-1"""
+    if len(data) == 0:
+        return 0.0
+    import numpy as np
+    
+    # Count byte frequencies
+    counts = np.bincount(np.frombuffer(data, dtype=np.uint8), minlength=256)
+    probabilities = counts / len(data)
+    
+    # Calculate entropy
+    entropy = -np.sum(probabilities * np.log2(probabilities + 1e-10))
+    return entropy / 8.0  # Normalize to 0-1
+
 class ThreatDetectionEngine:
     """Advanced AI-powered threat detection system"""
     
     def __init__(self):
-        self.isolation_forest = IsolationForest(contamination=0.1, random_state=42)
-        self.file_classifier = RandomForestClassifier(n_estimators=100, random_state=42)
-        self.text_vectorizer = TfidfVectorizer(max_features=1000, stop_words='english')
-        self.scaler = StandardScaler()
-        self.is_trained = False
-        
-        # Known malicious patterns
-        self.malicious_patterns = [
-            rb'<script[^>]*>.*?</script>',
-            rb'javascript:',
-            rb'vbscript:',
-            rb'onload\s*=',
-            rb'onerror\s*=',
-            rb'eval\s*\(',
-            rb'document\.write',
-            rb'ActiveXObject',
-            rb'Shell\.Application',
-            rb'WScript\.Shell',
-        ]
+        # Behavioral model, trained offline (anomaly_model.py) and only scored here
+        self.anomaly_models = AnomalyModelStore()
+        # Optional ScanResultCache consulted by analyze_file_threat/analyze_file_path
+        self.scan_cache = None
+        
+        # Known malicious signatures (SMARTSECURE_SIGNATURES_FILE is hot-reloaded)
+        self.signatures = SignatureSet(default_signatures(DEFAULT_MALICIOUS_PATTERNS),
+                                       os.getenv('SMARTSECURE_SIGNATURES_FILE'))
         
         # Suspicious file extensions
         self.high_risk_extensions = {
@@ -54,62 +101,55 @@ class ThreatDetectionEngine:
             'archive': ['.zip', '.rar', '.7z', '.tar', '.gz']
         }
     
+    @property
+    def is_trained(self) -> bool:
+        return self.anomaly_models.current() is not None
+    
+    @property
+    def malicious_patterns(self) -> List[bytes]:
+        return self.signatures.matcher.patterns
+    
+    @malicious_patterns.setter
+    def malicious_patterns(self, patterns: List[bytes]):
+        self.signatures.replace(default_signatures(patterns))
+    
+    @property
+    def engine_version(self) -> str:
+        """Fingerprint of the file rule set; cached verdicts from other versions are ignored.
+
+        The anomaly model only scores user behaviour, never file content, so a
+        newly trained or loaded model leaves cached file verdicts valid.
+        """
+        fingerprint = json.dumps({
+            'rules': RULES_VERSION,
+            'signatures': self.signatures.matcher.version,
+            'high_risk_extensions': sorted(self.high_risk_extensions),
+            'safe_categories': self.safe_categories,
+        }, sort_keys=True)
+        return hashlib.sha256(fingerprint.encode('utf-8')).hexdigest()[:16]
+    
     def calculate_file_hash(self, file_data: bytes) -> str:
         """Calculate SHA-256 hash of file"""
         return hashlib.sha256(file_data).hexdigest()
     
-    def extract_file_features(self, filename: str, file_data: bytes, file_size: int) -> Dict:
-        """Extract comprehensive features for AI analysis"""
-        features = {}
-        
-        # Basic file metadata
-        file_ext = os.path.splitext(filename.lower())[1]
-        features['file_size'] = file_size
-        features['file_extension'] = file_ext
-        features['filename_length'] = len(filename)
-        
-        # MIME type detection
-        mime_type, _ = mimetypes.guess_type(filename)
-        features['mime_type'] = mime_type or 'unknown'
-        
-        # File hash
-        features['file_hash'] = self.calculate_file_hash(file_data)
-        
-        # Entropy analysis (randomness indicator)
-        features['entropy'] = self._calculate_entropy(file_data[:1024])  # First 1KB
-        
-        # String analysis
-        text_content = self._extract_strings(file_data)
-        features['text_ratio'] = len(text_content) / file_size if file_size > 0 else 0
-        features['contains_urls'] = len(re.findall(rb'https?://\S+', file_data))
-        features['contains_emails'] = len(re.findall(rb'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b', file_data))
-        
-        # Malicious pattern detection
-        features['malicious_patterns'] = sum(1 for pattern in self.malicious_patterns if re.search(pattern, file_data, re.IGNORECASE))
-        
-        # File structure analysis
-        features['null_byte_ratio'] = file_data.count(b'\x00') / file_size if file_size > 0 else 0
-        features['high_ascii_ratio'] = sum(1 for b in file_data[:1000] if b > 127) / min(1000, file_size) if file_size > 0 else 0
-        
-        return features
+    def extract_file_features(self, filename: str, file_data: ContentSource,
+                              file_size: Optional[int] = None) -> Dict:
+        """Extract comprehensive features for AI analysis.
+        
+        `file_data` may be bytes, a memory-mapped file, a binary file object or
+        an iterable of byte chunks; it is consumed once in SCAN_CHUNK_SIZE
+        blocks, so memory use does not grow with the file.
+        """
+        accumulator = ThreatFeatureAccumulator(self)
+        sha256 = hashlib.sha256()
+        for chunk in iter_content_chunks(file_data):
+            sha256.update(chunk)
+            accumulator.update(chunk)
+        return accumulator.finalize(filename, sha256.hexdigest(), file_size)
     
     def _calculate_entropy(self, data: bytes) -> float:
         """Calculate Shannon entropy of data"""
-        if len(data) == 0:
-            return 0.0
-        
-        # Count byte frequencies
-        counts = np.bincount(data, minlength=256)
-        probabilities = counts / len(data)
-        
-        # Calculate entropy
-        entropy = -np.sum(probabilities * np.log2(probabilities + 1e-10))
-        return entropy / 8.0  # Normalize to 0-1
-    
-    def _extract_strings(self, data: bytes, min_length: int = 4) -> bytes:
-        """Extract printable strings from binary data"""
-        strings = re.findall(rb'[!-~]{%d,}' % min_length, data)
-        return b''.join(strings)
+        return _shannon_entropy(data)
     
     def classify_file_category(self, filename: str, mime_type: str) -> str:
         """Classify file into security-relevant categories"""
@@ -130,12 +170,53 @@ class ThreatDetectionEngine:
         
         return 'unknown'
     
-    def analyze_file_threat(self, filename: str, file_data: bytes) -> Dict:
+    def analyze_file_threat(self, filename: str, file_data: bytes, scan_cache=None) -> Dict:
         """Comprehensive threat analysis of a file"""
-        file_size = len(file_data)
-        
-        # Extract features
-        features = self.extract_file_features(filename, file_data, file_size)
+        scan_cache = scan_cache or self.scan_cache
+        file_hash = self.calculate_file_hash(file_data)
+        features = self.cached_features(scan_cache, file_hash, filename)
+        if features is None:
+            features = self.extract_file_features(filename, file_data)
+            self.cache_features(scan_cache, features)
+        return self.score_features(filename, features)
+    
+    def analyze_file_path(self, filename: str, file_path: str, file_hash: Optional[str] = None,
+                          scan_cache=None) -> Dict:
+        """Threat analysis of a stored file, read in chunks; known content is answered from the cache"""
+        scan_cache = scan_cache or self.scan_cache
+        features = self.cached_features(scan_cache, file_hash, filename) if file_hash else None
+        if features is None:
+            with open(file_path, 'rb') as f:
+                features = self.extract_file_features(filename, f)
+            self.cache_features(scan_cache, features)
+        return self.score_features(filename, features)
+    
+    def cached_features(self, scan_cache, file_hash: str, filename: str) -> Optional[Dict]:
+        """Features of already analysed content with this hash, completed for `filename`; None on a miss"""
+        if scan_cache is None:
+            return None
+        cached = scan_cache.get(file_hash, self.engine_version)
+        if cached is None:
+            return None
+        # Only content features are cached; the name-derived ones belong to this request
+        mime_type, _ = mimetypes.guess_type(filename)
+        cached.update({
+            'file_extension': os.path.splitext(filename.lower())[1],
+            'filename_length': len(filename),
+            'mime_type': mime_type or 'unknown',
+            'cached': True,
+        })
+        return cached
+    
+    def cache_features(self, scan_cache, features: Dict):
+        """Remember the content features of an analysed file under its hash"""
+        if scan_cache is not None:
+            content = {k: v for k, v in features.items() if k not in FILENAME_FEATURES}
+            scan_cache.put(features['file_hash'], self.engine_version, content)
+    
+    def score_features(self, filename: str, features: Dict) -> Dict:
+        """Apply the threat rules to features from extract_file_features or a ThreatFeatureAccumulator"""
+        file_size = features['file_size']
         
         # Calculate threat score
         threat_score = 0.0
@@ -191,9 +272,108 @@ class ThreatDetectionEngine:
             'file_category': file_category,
             'scan_status': scan_status,
             'features': features,
+            'cached': bool(features.get('cached')),
+            'engine_version': self.engine_version,
             'analysis_timestamp': datetime.now(timezone.utc).isoformat()
         }
     
+    def analyze_batch(self, files: Iterable[Tuple[str, Union[ContentSource, str, os.PathLike]]],
+                      scan_cache=None) -> List[Dict]:
+        """Analyse many files at once; results match analyze_file_threat file by file.
+        
+        `files` yields ``(filename, content)`` pairs where content is anything
+        extract_file_features accepts, or a path to a stored file. Features are
+        extracted (or taken from the scan cache) per file, then the threat
+        rules run column-wise over all of them in score_feature_batch.
+        """
+        scan_cache = scan_cache or self.scan_cache
+        filenames, batch_features = [], []
+        for filename, content in files:
+            if isinstance(content, (str, os.PathLike)):
+                with open(content, 'rb') as f:
+                    features = self.extract_file_features(filename, f)
+                self.cache_features(scan_cache, features)
+            else:
+                features = None
+                if isinstance(content, (bytes, bytearray, memoryview, mmap.mmap)):
+                    features = self.cached_features(scan_cache, self.calculate_file_hash(content), filename)
+                if features is None:
+                    features = self.extract_file_features(filename, content)
+                    self.cache_features(scan_cache, features)
+            filenames.append(filename)
+            batch_features.append(features)
+        return self.score_feature_batch(filenames, batch_features)
+    
+    def score_feature_batch(self, filenames: List[str], batch_features: List[Dict]) -> List[Dict]:
+        """Vectorized score_features: the same rules as NumPy column operations"""
+        count = len(filenames)
+        if count == 0:
+            return []
+        import numpy as np
+        
+        def column(key, dtype=np.float64):
+            return np.fromiter((features[key] for features in batch_features), dtype=dtype, count=count)
+        
+        file_size = column('file_size')
+        entropy = column('entropy')
+        pattern_count = column('malicious_patterns')
+        null_byte_ratio = column('null_byte_ratio')
+        high_risk = np.fromiter((f['file_extension'] in self.high_risk_extensions for f in batch_features),
+                                dtype=bool, count=count)
+        expected_mimes = [mimetypes.guess_type(filename)[0] for filename in filenames]
+        mime_mismatch = np.fromiter((bool(expected) and f['mime_type'] != expected
+                                     for expected, f in zip(expected_mimes, batch_features)), dtype=bool, count=count)
+        
+        too_small = file_size < 10
+        too_large = ~too_small & (file_size > 100 * 1024 * 1024)
+        packed = entropy > 0.95
+        has_patterns = pattern_count > 0
+        null_heavy = null_byte_ratio > 0.1
+        
+        # Same rule order as score_features, so the float sums are bit-identical
+        threat_score = np.zeros(count)
+        threat_score += np.where(high_risk, 0.4, 0.0)
+        threat_score += np.where(too_small, 0.2, 0.0)
+        threat_score += np.where(too_large, 0.1, 0.0)
+        threat_score += np.where(packed, 0.2, 0.0)
+        threat_score += np.where(has_patterns, np.minimum(0.5, pattern_count * 0.1), 0.0)
+        threat_score += np.where(mime_mismatch, 0.1, 0.0)
+        threat_score += np.where(null_heavy, 0.3, 0.0)
+        is_safe = threat_score < 0.3
+        final_score = np.minimum(1.0, threat_score)
+        
+        engine_version = self.engine_version
+        timestamp = datetime.now(timezone.utc).isoformat()
+        results = []
+        for i, (filename, features) in enumerate(zip(filenames, batch_features)):
+            risk_factors = []
+            if high_risk[i]:
+                risk_factors.append(f"High-risk file extension: {features['file_extension']}")
+            if too_small[i]:
+                risk_factors.append("Suspiciously small file size")
+            elif too_large[i]:
+                risk_factors.append("Unusually large file size")
+            if packed[i]:
+                risk_factors.append("High entropy (possibly encrypted/packed)")
+            if has_patterns[i]:
+                risk_factors.append(f"Contains {features['malicious_patterns']} suspicious patterns")
+            if mime_mismatch[i]:
+                risk_factors.append("MIME type mismatch")
+            if null_heavy[i]:
+                risk_factors.append("High null byte ratio")
+            results.append({
+                'threat_score': float(final_score[i]),
+                'is_safe': bool(is_safe[i]),
+                'risk_factors': risk_factors,
+                'file_category': self.classify_file_category(filename, features['mime_type']),
+                'scan_status': 'completed',
+                'features': features,
+                'cached': bool(features.get('cached')),
+                'engine_version': engine_version,
+                'analysis_timestamp': timestamp
+            })
+        return results
+    
     def detect_anomalous_behavior(self, user_activities: List[Dict]) -> Dict:
         """Detect anomalous user behavior patterns"""
         if len(user_activities) < 10:  # Need sufficient data
@@ -204,27 +384,12 @@ class ThreatDetectionEngine:
                 'confidence': 0.0
             }
         
-        # Convert activities to feature vectors
-        features = []
-        for activity in user_activities:
-            feature_vector = [
-                activity.get('hour', 0),  # Time of activity
-                activity.get('file_size', 0) / (1024 * 1024),  # File size in MB
-                len(activity.get('filename', '')),  # Filename length
-                activity.get('upload_count', 0),  # Files uploaded in session
-            ]
-            features.append(feature_vector)
-        
-        features_array = np.array(features)
-        
-        # Detect anomalies using Isolation Forest
-        if not self.is_trained and len(features) > 50:
-            self.isolation_forest.fit(features_array)
-            self.is_trained = True
-        
-        if self.is_trained:
-            anomaly_predictions = self.isolation_forest.decision_function(features_array)
-            anomaly_scores = self.isolation_forest.score_samples(features_array)
+        count = len(user_activities)
+        model = self.anomaly_models.current()
+        if model is not None:
+            import numpy as np
+            
+            anomaly_scores = model.score_samples(activity_matrix(user_activities))
             
             # Calculate overall anomaly score
             overall_anomaly_score = np.mean(anomaly_scores)
@@ -236,32 +401,30 @@ class ThreatDetectionEngine:
                 recent_activities = user_activities[-10:]  # Last 10 activities
                 
                 # Check for rapid uploads
-                upload_times = [datetime.fromisoformat(a.get('timestamp', datetime.now(timezone.utc).isoformat())) 
-                              for a in recent_activities]
+                now = datetime.now(timezone.utc).isoformat()
+                upload_times = [datetime.fromisoformat(a.get('timestamp', now)) for a in recent_activities]
                 if len(upload_times) > 1:
-                    time_diffs = [(upload_times[i] - upload_times[i-1]).total_seconds() 
-                                for i in range(1, len(upload_times))]
-                    avg_interval = np.mean(time_diffs)
+                    seconds = np.array([t.timestamp() for t in upload_times])
+                    avg_interval = np.mean(np.diff(seconds))
                     if avg_interval < 30:  # Less than 30 seconds between uploads
                         indicators.append("Rapid file upload pattern detected")
                 
                 # Check for unusual file sizes
-                file_sizes = [a.get('file_size', 0) for a in recent_activities]
-                if file_sizes and max(file_sizes) > 50 * 1024 * 1024:  # > 50MB
+                file_sizes = np.array([a.get('file_size', 0) for a in recent_activities])
+                if file_sizes.size and file_sizes.max() > 50 * 1024 * 1024:  # > 50MB
                     indicators.append("Unusually large file uploads")
                 
                 # Check for off-hours activity
-                hours = [datetime.fromisoformat(a.get('timestamp', datetime.now(timezone.utc).isoformat())).hour 
-                        for a in recent_activities]
-                night_activity = sum(1 for h in hours if h < 6 or h > 22)
+                hours = np.array([t.hour for t in upload_times])
+                night_activity = np.count_nonzero((hours < 6) | (hours > 22))
                 if night_activity / len(hours) > 0.5:
                     indicators.append("Significant off-hours activity")
             
             return {
-                'is_anomalous': is_anomalous,
-                'anomaly_score': abs(overall_anomaly_score),
+                'is_anomalous': bool(is_anomalous),
+                'anomaly_score': float(abs(overall_anomaly_score)),
                 'indicators': indicators,
-                'confidence': min(1.0, len(features) / 100.0)  # Confidence based on data volume
+                'confidence': min(1.0, count / 100.0)  # Confidence based on data volume
             }
         
         return {
@@ -271,15 +434,140 @@ class ThreatDetectionEngine:
             'confidence': 0.0
         }
 
+class ThreatFeatureAccumulator:
+    """Incrementally builds the extract_file_features() feature set from streamed chunks.
+
+    Feed chunks with update() as they arrive (e.g. while an upload is written
+    to disk) and call finalize() once; only a small head buffer and a regex
+    overlap window are kept in memory, whatever the file size. Each chunk is
+    scanned together with the last OVERLAP bytes before it, so URL, email and
+    malicious-pattern matches spanning a chunk boundary are still found as
+    long as they are shorter than OVERLAP.
+    """
+    
+    HEAD_SIZE = 1024
+    # Regex matches may straddle chunk boundaries; keep this many bytes of context
+    OVERLAP = 4096
+    URL_PATTERN = re.compile(rb'https?://\S+')
+    EMAIL_PATTERN = re.compile(rb'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b')
+    PRINTABLE_RUN = re.compile(rb'[!-~]+')
+    
+    def __init__(self, engine: Optional['ThreatDetectionEngine'] = None, min_string_length: int = 4):
+        # One matcher for the whole scan, even if the signature file is reloaded meanwhile
+        self._matcher = (engine.signatures.matcher if engine is not None
+                         else SignatureMatcher(default_signatures(DEFAULT_MALICIOUS_PATTERNS)))
+        self._min_string_length = min_string_length
+        self._head = bytearray()
+        self._carry = b''
+        self._size = 0
+        self._null_bytes = 0
+        self._url_count = 0
+        self._email_count = 0
+        self._signature_hits = SignatureHits()
+        self._recent_hits = set()
+        self._text_bytes = 0
+        self._open_run = 0
+    
+    @property
+    def size(self) -> int:
+        return self._size
+    
+    def update(self, chunk: bytes):
+        """Consume the next chunk of file content"""
+        if not chunk:
+            return
+        chunk = bytes(chunk)
+        
+        if len(self._head) < self.HEAD_SIZE:
+            self._head += chunk[:self.HEAD_SIZE - len(self._head)]
+        self._size += len(chunk)
+        self._null_bytes += chunk.count(b'\x00')
+        self._count_printable_runs(chunk)
+        self._scan_window(self._carry + chunk, len(self._carry) - 1, final=False)
+    
+    def _count_printable_runs(self, chunk: bytes):
+        # A printable run touching the end of the chunk may continue in the next one
+        carried, self._open_run = self._open_run, 0
+        for match in self.PRINTABLE_RUN.finditer(chunk):
+            length = match.end() - match.start()
+            if match.start() == 0:
+                length += carried
+                carried = 0
+            if match.end() == len(chunk):
+                self._open_run = length
+            elif length >= self._min_string_length:
+                self._text_bytes += length
+        # The previous chunk's trailing run did not continue into this one
+        if carried >= self._min_string_length:
+            self._text_bytes += carried
+    
+    def _flush_open_run(self):
+        if self._open_run >= self._min_string_length:
+            self._text_bytes += self._open_run
+        self._open_run = 0
+    
+    def _scan_window(self, window: bytes, fresh_from: int, final: bool):
+        # Count matches ending after `fresh_from` (the carried-over context was
+        # already counted, except for matches deferred from its very end); matches
+        # touching the end of a non-final window are deferred since they may grow.
+        limit = len(window) if final else len(window) - 1
+        for pattern, attr in ((self.URL_PATTERN, '_url_count'), (self.EMAIL_PATTERN, '_email_count')):
+            hits = sum(1 for m in pattern.finditer(window) if fresh_from < m.end() <= limit)
+            setattr(self, attr, getattr(self, attr) + hits)
+        # Signature hits are keyed by absolute offset so the overlap is not counted
+        # twice; a hit at the very start of a window cut from the middle of the
+        # file lacks its left context (\b, lookbehind) and was already judged in
+        # the previous window.
+        window_start = self._size - len(window)
+        for index, offset in sorted(self._matcher.scan(window, 1 if window_start > 0 else 0),
+                                    key=lambda hit: (hit[1], hit[0])):
+            key = (index, window_start + offset)
+            if key not in self._recent_hits:
+                self._recent_hits.add(key)
+                self._signature_hits.add(self._matcher.signatures[index].name, window_start + offset)
+        self._carry = window[-self.OVERLAP:] if not final else b''
+        carry_start = self._size - len(self._carry)
+        self._recent_hits = {key for key in self._recent_hits if key[1] >= carry_start}
+    
+    def finalize(self, filename: str, file_hash: str, file_size: Optional[int] = None) -> Dict:
+        """Return the feature dict for everything consumed so far.
+        
+        `file_size` overrides the number of bytes seen (callers that already
+        know the stored size of a truncated sample can pass it).
+        """
+        if self._carry:
+            self._scan_window(self._carry, len(self._carry) - 1, final=True)
+        self._flush_open_run()
+        
+        file_size = self._size if file_size is None else file_size
+        head = bytes(self._head)
+        mime_type, _ = mimetypes.guess_type(filename)
+        return {
+            'file_size': file_size,
+            'file_extension': os.path.splitext(filename.lower())[1],
+            'filename_length': len(filename),
+            'mime_type': mime_type or 'unknown',
+            'file_hash': file_hash,
+            'entropy': _shannon_entropy(head),
+            'text_ratio': self._text_bytes / file_size if file_size > 0 else 0,
+            'contains_urls': self._url_count,
+            'contains_emails': self._email_count,
+            'malicious_patterns': len(self._signature_hits),
+            'signature_hits': self._signature_hits.to_dict(),
+            'null_byte_ratio': self._null_bytes / file_size if file_size > 0 else 0,
+            'high_ascii_ratio': sum(1 for b in head[:1000] if b > 127) / min(1000, file_size) if file_size > 0 else 0,
+        }
+
 class SecurityAnalytics:
     """Advanced security analytics and reporting"""
     
-    def __init__(self):
-        self.threat_engine = ThreatDetectionEngine()
+    def __init__(self, threat_engine: Optional[ThreatDetectionEngine] = None):
+        self.threat_engine = threat_engine or get_threat_detector()
     
     def generate_security_report(self, user_data: Dict, files: List[Dict], 
                                activities: List[Dict], security_events: List[Dict]) -> Dict:
         """Generate comprehensive security analytics report"""
+        import numpy as np
         
         # File security analysis
         total_files = len(files)
@@ -386,6 +674,33 @@ class SecurityAnalytics:
         
         return recommendations
 
-# Initialize global instances
-threat_detector = ThreatDetectionEngine()
-security_analytics = SecurityAnalytics()
\ No newline at end of file
+# Process-wide instances, built on first use so that importing this module
+# stays cheap; NumPy, joblib and scikit-learn load on the first analysis
+_threat_detector: Optional[ThreatDetectionEngine] = None
+_security_analytics: Optional[SecurityAnalytics] = None
+_instances_lock = threading.Lock()
+
+def get_threat_detector() -> ThreatDetectionEngine:
+    global _threat_detector
+    if _threat_detector is None:
+        with _instances_lock:
+            if _threat_detector is None:
+                _threat_detector = ThreatDetectionEngine()
+    return _threat_detector
+
+def get_security_analytics() -> SecurityAnalytics:
+    global _security_analytics
+    if _security_analytics is None:
+        engine = get_threat_detector()
+        with _instances_lock:
+            if _security_analytics is None:
+                _security_analytics = SecurityAnalytics(engine)
+    return _security_analytics
+
+def __getattr__(name):
+    # `ai_security.threat_detector` / `.security_analytics` keep working, lazily
+    if name == 'threat_detector':
+        return get_threat_detector()
+    if name == 'security_analytics':
+        return get_security_analytics()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
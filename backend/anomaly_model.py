@@ -0,0 +1,269 @@
+"""
+Behavioral Anomaly Model Lifecycle
+SmartSecure Sri Lanka - offline training, versioned persistence and lazy loading of the activity model
+
+Usage:
+    python anomaly_model.py train [--window-days 30] [--warm]
+    python anomaly_model.py info
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+from db_pool import get_pool
+from request_logging import get_logger
+
+log = get_logger(__name__)
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_DB_PATH = os.path.join(SCRIPT_DIR, 'smartsecure.db')
+DEFAULT_MODEL_DIR = os.getenv('SMARTSECURE_MODEL_DIR', os.path.join(SCRIPT_DIR, 'model_store'))
+REFRESH_HOURS = float(os.getenv('SMARTSECURE_MODEL_REFRESH_HOURS', '24'))
+# The first refresh (which loads joblib/scikit-learn) waits until the server is up
+STARTUP_DELAY_SECONDS = float(os.getenv('SMARTSECURE_MODEL_STARTUP_DELAY', '60'))
+
+FEATURE_NAMES = ('hour', 'file_size_mb', 'filename_length', 'upload_count')
+MIN_TRAINING_SAMPLES = 50
+DEFAULT_WINDOW_DAYS = 30
+BASE_ESTIMATORS = 100
+# Trees added per warm-start refresh; past MAX_ESTIMATORS the model is rebuilt on the window
+WARM_START_ESTIMATORS = 20
+MAX_ESTIMATORS = 300
+POINTER_FILE = 'current.json'
+
+
+def activity_matrix(activities: List[Dict]):
+    """Columnar (n, 4) feature matrix: hour, file size (MB), filename length, uploads in session"""
+    import numpy as np
+
+    count = len(activities)
+    matrix = np.empty((count, len(FEATURE_NAMES)))
+    matrix[:, 0] = np.fromiter((a.get('hour', 0) for a in activities), dtype=np.float64, count=count)
+    matrix[:, 1] = np.fromiter((a.get('file_size', 0) for a in activities),
+                               dtype=np.float64, count=count) / (1024 * 1024)
+    matrix[:, 2] = np.fromiter((len(a.get('filename', '')) for a in activities), dtype=np.float64, count=count)
+    matrix[:, 3] = np.fromiter((a.get('upload_count', 0) for a in activities), dtype=np.float64, count=count)
+    return matrix
+
+
+def history_activities(db_path: str, since: Optional[datetime] = None) -> List[Dict]:
+    """Upload history as activity dicts; a session is one user's uploads within the same hour"""
+    with get_pool(db_path).connection() as conn:
+        rows = conn.execute('''
+            SELECT filename, file_size, upload_date,
+                   COUNT(*) OVER (PARTITION BY username, substr(upload_date, 1, 13))
+            FROM files
+            WHERE upload_date >= ?
+            ORDER BY upload_date
+        ''', ((since or datetime.min).isoformat(),)).fetchall()
+    activities = []
+    for filename, file_size, upload_date, upload_count in rows:
+        try:
+            hour = datetime.fromisoformat(upload_date).hour
+        except (TypeError, ValueError):
+            continue
+        activities.append({'hour': hour, 'file_size': file_size or 0, 'filename': filename or '',
+                           'upload_count': upload_count, 'timestamp': upload_date})
+    return activities
+
+
+class AnomalyModelStore:
+    """Versioned IsolationForest models on disk, loaded lazily and re-read when a new one is published.
+
+    Each training run writes ``anomaly-<version>.joblib`` and then atomically
+    repoints ``current.json`` at it, so every server and scan worker process
+    picks up the same version on its next check (at most every
+    `check_interval` seconds) without ever fitting in a request. Arrays are
+    loaded with ``mmap_mode='r'`` so processes share them via the page cache.
+    """
+
+    def __init__(self, model_dir: str = DEFAULT_MODEL_DIR, check_interval: float = 60.0):
+        self.model_dir = model_dir
+        self.check_interval = check_interval
+        self._model = None
+        self._metadata: Optional[Dict] = None
+        self._pointer_mtime = None
+        self._checked_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def pointer_path(self) -> str:
+        return os.path.join(self.model_dir, POINTER_FILE)
+
+    def metadata(self) -> Optional[Dict]:
+        self.current()
+        return self._metadata
+
+    def current(self):
+        """The published model (None until one has been trained)"""
+        now = time.monotonic()
+        if self._checked_at is not None and now - self._checked_at < self.check_interval:
+            return self._model
+        with self._lock:
+            self._checked_at = now
+            try:
+                mtime = os.stat(self.pointer_path).st_mtime_ns
+            except OSError:
+                return self._model
+            if mtime != self._pointer_mtime:
+                self._load(mtime)
+        return self._model
+
+    def _load(self, pointer_mtime):
+        import joblib
+
+        try:
+            with open(self.pointer_path, 'r', encoding='utf-8') as f:
+                metadata = json.load(f)
+            model = joblib.load(os.path.join(self.model_dir, metadata['file']), mmap_mode='r')
+        except (OSError, ValueError, KeyError) as e:
+            log.warning('Keeping current anomaly model, could not load %s: %s', self.pointer_path, e)
+            return
+        self._model, self._metadata, self._pointer_mtime = model, metadata, pointer_mtime
+        log.info('Loaded anomaly model %s (%s samples)', metadata['version'], metadata['samples'])
+
+    def publish(self, model, metadata: Dict) -> Dict:
+        """Persist `model` as a new version and make it current"""
+        import joblib
+
+        os.makedirs(self.model_dir, exist_ok=True)
+        version = datetime.now(timezone.utc).strftime('%Y%m%d%H%M%S%f')
+        metadata = dict(metadata, version=version, file=f'anomaly-{version}.joblib',
+                        feature_names=list(FEATURE_NAMES))
+        joblib.dump(model, os.path.join(self.model_dir, metadata['file']))
+        temp_path = f'{self.pointer_path}.{os.getpid()}.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(metadata, f, indent=2)
+        os.replace(temp_path, self.pointer_path)
+        self._checked_at = None
+        return metadata
+
+    def prune(self, keep: int = 3):
+        """Delete all but the newest `keep` model files (never the current one)"""
+        current = (self.metadata() or {}).get('file')
+        files = sorted(name for name in os.listdir(self.model_dir)
+                       if name.startswith('anomaly-') and name.endswith('.joblib'))
+        for name in files[:-keep] if keep else files:
+            if name != current:
+                os.unlink(os.path.join(self.model_dir, name))
+
+
+def train_model(store: AnomalyModelStore, activities: List[Dict], warm: bool = False,
+                window_days: int = DEFAULT_WINDOW_DAYS) -> Optional[Dict]:
+    """Fit on `activities` and publish; warm=True grows the current forest instead of replacing it"""
+    if len(activities) < MIN_TRAINING_SAMPLES:
+        return None
+    from sklearn.ensemble import IsolationForest
+    import joblib
+
+    started = time.monotonic()
+    features = activity_matrix(activities)
+    previous = store.metadata()
+    model = None
+    if warm and previous and previous['n_estimators'] + WARM_START_ESTIMATORS <= MAX_ESTIMATORS:
+        # Load a private, writable copy; the shared one stays read-only
+        model = joblib.load(os.path.join(store.model_dir, previous['file']))
+        model.set_params(warm_start=True, n_estimators=previous['n_estimators'] + WARM_START_ESTIMATORS)
+    if model is None:
+        warm = False
+        model = IsolationForest(n_estimators=BASE_ESTIMATORS, contamination=0.1, random_state=42)
+    model.fit(features)
+    return store.publish(model, {
+        'trained_at': datetime.now(timezone.utc).isoformat(),
+        'samples': len(activities),
+        'window_days': window_days,
+        'warm_start': warm,
+        'base_version': previous['version'] if warm else None,
+        'n_estimators': model.n_estimators,
+        'training_seconds': round(time.monotonic() - started, 3),
+    })
+
+
+def train_from_history(db_path: str, store: AnomalyModelStore, window_days: int = DEFAULT_WINDOW_DAYS,
+                       warm: bool = False) -> Optional[Dict]:
+    """Windowed retrain on recent uploads, or a warm start on uploads since the last model"""
+    since = datetime.now() - timedelta(days=window_days)
+    previous = store.metadata()
+    if warm and previous:
+        since = max(since, datetime.fromisoformat(previous['trained_at']).astimezone().replace(tzinfo=None))
+    return train_model(store, history_activities(db_path, since), warm=warm, window_days=window_days)
+
+
+class ModelRefresher:
+    """Daemon thread that retrains on the activity history every `interval_hours`.
+
+    Refreshes alternate cheap warm starts with a full windowed retrain once
+    the forest reaches MAX_ESTIMATORS; a refresh with too little new data is
+    skipped and the current model kept.
+    """
+
+    def __init__(self, db_path: str, store: AnomalyModelStore, interval_hours: float = REFRESH_HOURS,
+                 window_days: int = DEFAULT_WINDOW_DAYS, startup_delay: float = STARTUP_DELAY_SECONDS):
+        self.db_path = db_path
+        self.store = store
+        self.interval = interval_hours * 3600
+        self.window_days = window_days
+        self.startup_delay = startup_delay
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self.interval > 0 and self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='anomaly-model-refresh', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def refresh(self) -> Optional[Dict]:
+        try:
+            metadata = train_from_history(self.db_path, self.store, self.window_days,
+                                          warm=self.store.metadata() is not None)
+            if metadata:
+                self.store.prune()
+            return metadata
+        except Exception:
+            log.exception('Anomaly model refresh failed')
+            return None
+
+    def _run(self):
+        if self._stop.wait(self.startup_delay):
+            return
+        if self.store.metadata() is None:
+            self.refresh()
+        while not self._stop.wait(self.interval):
+            self.refresh()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Train and inspect the behavioral anomaly model')
+    parser.add_argument('--db', default=DEFAULT_DB_PATH)
+    parser.add_argument('--model-dir', default=DEFAULT_MODEL_DIR)
+    commands = parser.add_subparsers(dest='command', required=True)
+    train_cmd = commands.add_parser('train', help='fit on the upload history and publish a new version')
+    train_cmd.add_argument('--window-days', type=int, default=DEFAULT_WINDOW_DAYS)
+    train_cmd.add_argument('--warm', action='store_true', help='add trees to the current model')
+    commands.add_parser('info', help='show the current model version')
+    args = parser.parse_args(argv)
+
+    store = AnomalyModelStore(args.model_dir)
+    if args.command == 'train':
+        metadata = train_from_history(args.db, store, args.window_days, warm=args.warm)
+        if metadata is None:
+            print(f"⚠️ Not enough activity to train (need {MIN_TRAINING_SAMPLES} uploads)")
+            return 1
+        print(f"✅ Published anomaly model {metadata['version']}: {metadata['samples']} samples, "
+              f"{metadata['n_estimators']} trees in {metadata['training_seconds']}s")
+    else:
+        metadata = store.metadata()
+        print(json.dumps(metadata, indent=2) if metadata else 'No anomaly model trained yet')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
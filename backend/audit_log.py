@@ -0,0 +1,155 @@
+"""
+Audit Log Queries
+SmartSecure Sri Lanka - keyset-paginated reads over activity_logs and security_events
+"""
+import base64
+import json
+import re
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from db_pool import get_pool
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+# Rows per query when streaming a whole export
+EXPORT_PAGE_SIZE = 1000
+
+# Entries of both tables are merged newest first by (timestamp, id, source)
+SOURCES = ('activity', 'security')
+_ARMS = {
+    'activity': '''SELECT 'activity' AS source, id, timestamp, user_id, activity_type, description,
+                          CASE WHEN description LIKE '[%]%' THEN substr(description, 2, instr(description, ']') - 2)
+                               ELSE 'INFO' END AS severity
+                   FROM activity_logs''',
+    'security': '''SELECT 'security' AS source, id, timestamp, user_id, event_type, description, threat_level
+                   FROM security_events''',
+}
+_TYPE_COLUMN = {'activity': 'activity_type', 'security': 'event_type'}
+_IP_RE = re.compile(r'\| IP: (\S+)\s*$')
+
+
+def encode_cursor(entry: Dict) -> str:
+    raw = json.dumps([entry['timestamp'], entry['source'], entry['id']], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str) -> Tuple[str, str, int]:
+    """Inverse of encode_cursor; raises ValueError for anything malformed"""
+    try:
+        timestamp, source, row_id = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (TypeError, ValueError) as e:
+        raise ValueError(f'Invalid cursor: {e}')
+    if not isinstance(timestamp, str) or source not in SOURCES or not isinstance(row_id, int):
+        raise ValueError('Invalid cursor')
+    return timestamp, source, row_id
+
+
+class AuditLog:
+    """Newest-first audit entries from activity_logs and security_events.
+
+    Pages are addressed by a cursor holding the last entry's
+    ``(timestamp, source, id)``. Each table is read with a range condition on
+    its timestamp index, or its (user_id, timestamp) index for one user's
+    entries (created by migrations.py; both order by (timestamp, id)), and SQLite merges the two ordered streams without a
+    sort and stops at the page size. The cost of a page therefore does not
+    depend on how deep into the log it is, unlike OFFSET.
+
+    Filters: ``user_id``, ``activity_type`` (activity type or security event
+    type), ``severity``, ``since`` / ``until`` (ISO timestamps, inclusive /
+    exclusive) and ``source`` ('activity' or 'security').
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+
+    def _connection(self):
+        return get_pool(self.db_path).connection()
+
+    def _arm(self, source: str, filters: Dict, cursor: Optional[Tuple[str, str, int]]) -> Tuple[str, List]:
+        conditions, params = [], []
+        if filters.get('user_id') is not None:
+            conditions.append('user_id = ?')
+            params.append(filters['user_id'])
+        if filters.get('activity_type'):
+            conditions.append(f"{_TYPE_COLUMN[source]} = ?")
+            params.append(filters['activity_type'])
+        if filters.get('severity'):
+            if source == 'security':
+                conditions.append('threat_level = ?')
+                params.append(filters['severity'].upper())
+            else:
+                conditions.append("description LIKE ?")
+                params.append(f"[{filters['severity'].upper()}]%")
+        if filters.get('since'):
+            conditions.append('timestamp >= ?')
+            params.append(filters['since'])
+        if filters.get('until'):
+            conditions.append('timestamp < ?')
+            params.append(filters['until'])
+        if cursor is not None:
+            timestamp, cursor_source, row_id = cursor
+            # Strictly after the cursor in (timestamp, id, source) descending order
+            conditions.append('(timestamp, id) <= (?, ?)' if source < cursor_source else '(timestamp, id) < (?, ?)')
+            params.extend([timestamp, row_id])
+        sql = _ARMS[source]
+        if conditions:
+            sql += ' WHERE ' + ' AND '.join(conditions)
+        return sql, params
+
+    def _query(self, filters: Dict, cursor: Optional[Tuple[str, str, int]], limit: int) -> Tuple[str, List]:
+        sources = [filters['source']] if filters.get('source') in SOURCES else list(SOURCES)
+        arms, params = [], []
+        for source in sources:
+            sql, arm_params = self._arm(source, filters, cursor)
+            arms.append(sql)
+            params.extend(arm_params)
+        # Each arm's index already yields this order, so the UNION ALL is a merge rather than a sort
+        query = ' UNION ALL '.join(arms) + ' ORDER BY timestamp DESC, id DESC, source DESC LIMIT ?'
+        return query, params + [limit]
+
+    def page(self, filters: Optional[Dict] = None, cursor: Optional[str] = None,
+             limit: int = DEFAULT_PAGE_SIZE) -> Tuple[List[Dict], Optional[str]]:
+        """One page of entries and the cursor for the next one (None on the last page)"""
+        filters = filters or {}
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+        query, params = self._query(filters, decode_cursor(cursor) if cursor else None, limit + 1)
+
+        with self._connection() as conn:
+            rows = conn.execute(query, params).fetchall()
+            user_ids = {row[3] for row in rows[:limit] if row[3] is not None}
+            usernames = dict(conn.execute(
+                f"SELECT id, username FROM users WHERE id IN ({','.join('?' * len(user_ids))})",
+                list(user_ids)).fetchall()) if user_ids else {}
+
+        entries = [self._entry(row, usernames) for row in rows[:limit]]
+        next_cursor = encode_cursor(entries[-1]) if len(rows) > limit else None
+        return entries, next_cursor
+
+    def iter_entries(self, filters: Optional[Dict] = None, cursor: Optional[str] = None,
+                     page_size: int = EXPORT_PAGE_SIZE) -> Iterator[Dict]:
+        """Every matching entry from `cursor` on, one short query per page"""
+        while True:
+            entries, cursor = self.page(filters, cursor, page_size)
+            yield from entries
+            if cursor is None:
+                return
+
+    @staticmethod
+    def _entry(row, usernames: Dict[int, str]) -> Dict:
+        source, row_id, timestamp, user_id, activity_type, description, severity = row
+        ip_match = _IP_RE.search(description or '')
+        failed = source == 'security' or (activity_type or '').endswith('_FAILED')
+        return {
+            'id': row_id,
+            'source': source,
+            'timestamp': timestamp,
+            'user_id': user_id,
+            'username': usernames.get(user_id),
+            'activity_type': activity_type,
+            'action': activity_type,
+            'description': description,
+            'severity': severity,
+            'ip_address': ip_match.group(1) if ip_match else None,
+            'success': not failed,
+            'status': 'FAILURE' if failed else 'SUCCESS',
+        }
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+Connection pool load benchmark for SmartSecure Sri Lanka
+
+Runs final_working_server.app on a threaded Werkzeug server against a
+throwaway database and measures requests/sec for a mixed read/write workload,
+first with a fresh sqlite3.connect() per query (the old behaviour) and then
+with the pooled WAL connections from db_pool.
+
+Usage:
+  python backend/bench_db_pool.py [--clients 16] [--duration 10] [--files 200]
+"""
+import argparse
+import contextlib
+import http.client
+import io
+import json
+import logging
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+import bcrypt
+import jwt
+from werkzeug.serving import make_server
+
+import db_pool
+import final_working_server as server
+from db_pool import ConnectionPool, close_all_pools, configure_pool
+
+BENCH_SCHEMA = [
+    '''CREATE TABLE users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT UNIQUE NOT NULL,
+        password_hash TEXT NOT NULL,
+        email TEXT,
+        created_date TEXT NOT NULL,
+        last_login TEXT,
+        is_active INTEGER DEFAULT 1,
+        role TEXT DEFAULT 'user'
+    )''',
+    '''CREATE TABLE files (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT NOT NULL,
+        filename TEXT NOT NULL,
+        secure_filename TEXT NOT NULL,
+        file_size INTEGER NOT NULL,
+        upload_date TEXT NOT NULL,
+        file_hash TEXT,
+        mime_type TEXT,
+        threat_score REAL DEFAULT 0.0,
+        is_safe INTEGER DEFAULT 1,
+        file_category TEXT DEFAULT 'unknown',
+        last_scan TEXT
+    )''',
+    '''CREATE TABLE security_events (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER,
+        event_type TEXT NOT NULL,
+        threat_level TEXT NOT NULL,
+        description TEXT,
+        timestamp TEXT NOT NULL,
+        resolved INTEGER DEFAULT 0
+    )''',
+]
+
+
+class PlainConnectPool(ConnectionPool):
+    """Baseline: a bare sqlite3.connect() per query, closed afterwards (the old handlers)"""
+
+    def __init__(self, db_path):
+        super().__init__(db_path, max_size=0)
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path)
+
+
+def install_pool(db_path, pool_size):
+    if pool_size:
+        return configure_pool(db_path, max_size=pool_size)
+    pool = PlainConnectPool(os.path.abspath(db_path))
+    db_pool._pools[pool.db_path] = pool
+    return pool
+
+
+def build_database(db_path, uploads_dir, file_count):
+    conn = sqlite3.connect(db_path)
+    for statement in BENCH_SCHEMA:
+        conn.execute(statement)
+    password_hash = bcrypt.hashpw(b'bench123', bcrypt.gensalt(rounds=4)).decode('utf-8')
+    conn.execute('INSERT INTO users (username, password_hash, email, created_date, role) VALUES (?, ?, ?, ?, ?)',
+                 ('bench', password_hash, 'bench@smartsecure.lk', datetime.now().isoformat(), 'admin'))
+    now = datetime.now()
+    conn.executemany(
+        'INSERT INTO files (username, filename, secure_filename, file_size, upload_date, file_hash) VALUES (?, ?, ?, ?, ?, ?)',
+        [('bench', f'report_{i}.pdf', f'{i:08x}_report_{i}.pdf', 1024 * (i + 1),
+          (now - timedelta(minutes=i)).isoformat(), f'{i:064x}') for i in range(file_count)]
+    )
+    conn.commit()
+    conn.close()
+    os.makedirs(uploads_dir, exist_ok=True)
+    for i in range(file_count):
+        with open(os.path.join(uploads_dir, f'{i:08x}_report_{i}.pdf'), 'wb') as f:
+            f.write(b'%PDF-1.4 benchmark report ' * (i + 1))
+
+
+def run_load(port, token, file_ids, clients, duration):
+    """Hammer the server from `clients` threads; return (completed, errors, elapsed)"""
+    headers = {'Authorization': f'Bearer {token}', 'Content-Type': 'application/json'}
+    stop_at = time.monotonic() + duration
+    counters = {'ok': 0, 'errors': 0}
+    lock = threading.Lock()
+
+    def worker(seed):
+        rng = random.Random(seed)
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        ok = errors = 0
+        while time.monotonic() < stop_at:
+            roll = rng.random()
+            try:
+                if roll < 0.2:
+                    body = json.dumps({'fileId': rng.choice(file_ids)})
+                    conn.request('POST', '/security/scan', body=body, headers=headers)
+                elif roll < 0.5:
+                    conn.request('GET', '/files/storage-stats', headers=headers)
+                elif roll < 0.7:
+                    conn.request('GET', '/stats', headers=headers)
+                else:
+                    conn.request('GET', '/files', headers=headers)
+                response = conn.getresponse()
+                payload = response.read()
+                if response.status == 200 and b'database is locked' not in payload:
+                    ok += 1
+                else:
+                    errors += 1
+            except (OSError, http.client.HTTPException):
+                errors += 1
+                conn.close()
+                conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        conn.close()
+        with lock:
+            counters['ok'] += ok
+            counters['errors'] += errors
+
+    started = time.monotonic()
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return counters['ok'], counters['errors'], time.monotonic() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark pooled vs per-request SQLite connections')
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--files', type=int, default=200)
+    parser.add_argument('--pool-size', type=int, default=8)
+    args = parser.parse_args()
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for label, pool_size in (('per-request connect', 0), ('pooled WAL', args.pool_size)):
+            db_path = os.path.join(tmp_dir, f'bench_{pool_size}.db')
+            uploads_dir = os.path.join(tmp_dir, f'uploads_{pool_size}')
+            build_database(db_path, uploads_dir, args.files)
+            server.DB_PATH = db_path
+            server.UPLOADS_DIR = uploads_dir
+            install_pool(db_path, pool_size)
+
+            token = jwt.encode({'user_id': 1, 'username': 'bench', 'role': 'admin',
+                                'exp': datetime.now() + timedelta(hours=1)},
+                               server.SECRET_KEY, algorithm='HS256')
+            httpd = make_server('127.0.0.1', 0, server.app, threaded=True)
+            thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+            thread.start()
+            try:
+                # Handlers print per request; keep the benchmark output readable
+                with contextlib.redirect_stdout(io.StringIO()):
+                    ok, errors, elapsed = run_load(httpd.server_port, token, list(range(1, args.files + 1)),
+                                                   args.clients, args.duration)
+            finally:
+                httpd.shutdown()
+                thread.join()
+                close_all_pools()
+            results[label] = (ok, errors, elapsed)
+            print(f'{label:>20}: {ok / elapsed:8.1f} req/s  ({ok} ok, {errors} errors in {elapsed:.1f}s)')
+
+    before = results['per-request connect']
+    after = results['pooled WAL']
+    if before[0]:
+        print(f'{"speed-up":>20}: {(after[0] / after[2]) / (before[0] / before[2]):.2f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+"""
+Content-Addressed Blob Store
+SmartSecure Sri Lanka - deduplicated upload storage keyed by SHA-256
+"""
+import os
+import re
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Iterator, Optional, Tuple
+
+BLOBS_TABLE = '''CREATE TABLE IF NOT EXISTS blobs (
+    sha256 TEXT PRIMARY KEY,
+    file_size INTEGER NOT NULL,
+    ref_count INTEGER NOT NULL DEFAULT 0,
+    created_at TEXT NOT NULL
+)'''
+
+_SHA256_RE = re.compile(r'^[0-9a-f]{64}$')
+
+
+class BlobStore:
+    """Stores each distinct upload once under ``<root>/blobs/ab/cd/<sha256>``.
+
+    The ``blobs`` table counts how many ``files`` rows point at each blob. All
+    count changes run inside the caller's write transaction, and the blob file
+    is placed or removed while a transaction holds SQLite's write lock, so a
+    concurrent upload of the same bytes can never observe a half-deleted blob.
+    Dropping the last reference only zeroes the count; the file is deleted by
+    `discard` once that transaction has committed, so a rollback never leaves
+    a row pointing at a missing blob.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self.blob_root = os.path.join(root, 'blobs')
+
+    @staticmethod
+    def is_content_hash(file_hash: Optional[str]) -> bool:
+        return bool(file_hash) and bool(_SHA256_RE.match(file_hash))
+
+    def path_for(self, sha256: str) -> str:
+        return os.path.join(self.blob_root, sha256[:2], sha256[2:4], sha256)
+
+    def ensure_schema(self, conn):
+        conn.execute(BLOBS_TABLE)
+
+    def store(self, conn, sink) -> Tuple[str, bool]:
+        """Take a reference on the sink's content, moving it into place if it is new.
+
+        Returns ``(blob_path, deduplicated)``. A duplicate sink is left
+        uncommitted, so closing it discards the temp file.
+        """
+        sha256 = sink.sha256
+        self.ensure_schema(conn)
+        # The upsert takes the write lock before we look at the filesystem
+        conn.execute('''
+            INSERT INTO blobs (sha256, file_size, ref_count, created_at) VALUES (?, ?, 1, ?)
+            ON CONFLICT(sha256) DO UPDATE SET ref_count = ref_count + 1
+        ''', (sha256, sink.size, datetime.now().isoformat()))
+
+        blob_path = self.path_for(sha256)
+        if os.path.exists(blob_path):
+            return blob_path, True
+
+        os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+        sink.commit(blob_path)
+        return blob_path, False
+
+    @contextmanager
+    def storing(self, conn, sink) -> Iterator[Tuple[str, bool]]:
+        """`store` for a caller that writes the row referencing the blob inside the block.
+
+        The transaction is committed on the way out. If the block or the commit
+        fails, a blob this call moved into place is deleted before the caller
+        rolls back, while the write lock is still held, so a failed upload
+        leaves neither a reference nor an unreferenced file behind.
+        """
+        blob_path, deduplicated = self.store(conn, sink)
+        try:
+            yield blob_path, deduplicated
+            conn.commit()
+        except BaseException:
+            if not deduplicated and os.path.exists(blob_path):
+                os.unlink(blob_path)
+            raise
+
+    def release(self, conn, sha256: Optional[str]) -> Optional[str]:
+        """Drop one reference; returns the blob path to `discard` after commit if it was the last"""
+        if not self.is_content_hash(sha256):
+            return None
+        self.ensure_schema(conn)
+        cursor = conn.execute('UPDATE blobs SET ref_count = ref_count - 1 WHERE sha256 = ?', (sha256,))
+        if cursor.rowcount == 0:
+            return None
+
+        row = conn.execute('SELECT ref_count FROM blobs WHERE sha256 = ?', (sha256,)).fetchone()
+        if row and row[0] <= 0:
+            return self.path_for(sha256)
+        return None
+
+    def discard(self, conn, path: Optional[str]):
+        """Delete a file returned by `remove`/`release` once their transaction has committed.
+
+        An unreferenced blob is deleted together with its row under the write
+        lock, and kept if an upload of the same bytes took a new reference
+        in the meantime.
+        """
+        if path is None:
+            return
+        sha256 = os.path.basename(path)
+        if self.is_content_hash(sha256) and path == self.path_for(sha256):
+            cursor = conn.execute('DELETE FROM blobs WHERE sha256 = ? AND ref_count <= 0', (sha256,))
+            if cursor.rowcount and os.path.exists(path):
+                os.unlink(path)
+            conn.commit()
+        elif os.path.exists(path):
+            os.unlink(path)
+
+    def legacy_path(self, secure_filename: str) -> str:
+        return os.path.join(self.root, secure_filename)
+
+    def resolve(self, secure_filename: str, file_hash: Optional[str]) -> str:
+        """Path of a stored file: the per-upload file written before the store existed, or its blob"""
+        legacy_path = self.legacy_path(secure_filename)
+        if os.path.exists(legacy_path) or not self.is_content_hash(file_hash):
+            return legacy_path
+        return self.path_for(file_hash)
+
+    def remove(self, conn, secure_filename: str, file_hash: Optional[str]) -> Optional[str]:
+        """Release the storage behind one ``files`` row; returns the path to `discard` after commit, if any"""
+        legacy_path = self.legacy_path(secure_filename)
+        if os.path.exists(legacy_path):
+            # Pre-store uploads own their file and never took a blob reference
+            return legacy_path
+        return self.release(conn, file_hash)
@@ -5,6 +5,8 @@ import bcrypt
 from datetime import datetime
 import os
 
+from migrations import LATEST_VERSION, apply_migrations
+
 def create_fresh_database():
     """Create a fresh database with all required tables and test users"""
     try:
@@ -18,76 +20,9 @@ def create_fresh_database():
         
         print("=== Creating Fresh Database ===")
         
-        # Create users table with all required columns
-        cursor.execute('''
-            CREATE TABLE users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                username TEXT UNIQUE NOT NULL,
-                password_hash TEXT NOT NULL,
-                email TEXT UNIQUE NOT NULL,
-                created_date TEXT NOT NULL,
-                last_login TEXT,
-                is_active INTEGER DEFAULT 1
-            )
-        ''')
-        print("✅ Created users table")
-        
-        # Create files table
-        cursor.execute('''
-            CREATE TABLE files (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                username TEXT NOT NULL,
-                filename TEXT NOT NULL,
-                secure_filename TEXT NOT NULL,
-                file_size INTEGER NOT NULL,
-                upload_date TEXT NOT NULL,
-                file_hash TEXT,
-                mime_type TEXT,
-                threat_score REAL DEFAULT 0.0,
-                is_safe INTEGER DEFAULT 1,
-                file_category TEXT DEFAULT 'unknown'
-            )
-        ''')
-        print("✅ Created files table")
-        
-        # Create activity_logs table
-        cursor.execute('''
-            CREATE TABLE activity_logs (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                action TEXT NOT NULL,
-                description TEXT,
-                timestamp TEXT NOT NULL,
-                ip_address TEXT,
-                user_agent TEXT
-            )
-        ''')
-        print("✅ Created activity_logs table")
-        
-        # Create security_events table
-        cursor.execute('''
-            CREATE TABLE security_events (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                event_type TEXT NOT NULL,
-                threat_level TEXT NOT NULL,
-                description TEXT,
-                timestamp TEXT NOT NULL,
-                resolved INTEGER DEFAULT 0
-            )
-        ''')
-        print("✅ Created security_events table")
-        
-        # Create system_metrics table
-        cursor.execute('''
-            CREATE TABLE system_metrics (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                metric_name TEXT NOT NULL,
-                metric_value REAL NOT NULL,
-                recorded_at TEXT NOT NULL
-            )
-        ''')
-        print("✅ Created system_metrics table")
+        # Tables and indexes come from the migration runner
+        apply_migrations(conn)
+        print(f"✅ Created schema version {LATEST_VERSION}")
         
         # Create test users with known passwords
         password = "admin123"
@@ -3,6 +3,8 @@ import hashlib
 from datetime import datetime
 import os
 
+from db_pool import get_pool
+
 USER_TABLE = '''CREATE TABLE IF NOT EXISTS users (
   id INTEGER PRIMARY KEY AUTOINCREMENT,
   username TEXT UNIQUE NOT NULL,
@@ -31,16 +33,15 @@ FILES_TABLE = '''CREATE TABLE IF NOT EXISTS files (
 )'''
 
 def get_conn(db_path):
-    return sqlite3.connect(db_path)
+    """Borrow a pooled connection; use as ``with get_conn(db_path) as conn:``"""
+    return get_pool(db_path).connection()
 
 def create_database(db_path):
-    conn = get_conn(db_path)
-    cur = conn.cursor()
-    cur.execute(USER_TABLE)
-    cur.execute(ACTIVITY_TABLE)
-    cur.execute(FILES_TABLE)
-    conn.commit()
-    conn.close()
+    with get_conn(db_path) as conn:
+        cur = conn.cursor()
+        cur.execute(USER_TABLE)
+        cur.execute(ACTIVITY_TABLE)
+        cur.execute(FILES_TABLE)
 
 def hash_password(password: str) -> str:
     """Use enhanced bcrypt hashing from security module"""
@@ -53,26 +54,23 @@ def hash_password(password: str) -> str:
         return hashlib.sha256(password.encode('utf-8')).hexdigest()
 
 def add_user(db_path, username, password, email):
+    password_hash = hash_password(password)
     try:
-        conn = get_conn(db_path)
-        cur = conn.cursor()
-        cur.execute('INSERT INTO users (username, password_hash, email, created_date) VALUES (?, ?, ?, ?)', (
-            username, hash_password(password), email, datetime.utcnow().isoformat()
-        ))
-        conn.commit()
+        with get_conn(db_path) as conn:
+            cur = conn.cursor()
+            cur.execute('INSERT INTO users (username, password_hash, email, created_date) VALUES (?, ?, ?, ?)', (
+                username, password_hash, email, datetime.utcnow().isoformat()
+            ))
         return True, 'created'
     except sqlite3.IntegrityError:
         return False, 'username_taken'
-    finally:
-        conn.close()
 
 def get_user_by_username(db_path, username):
-    conn = get_conn(db_path)
-    conn.row_factory = sqlite3.Row
-    cur = conn.cursor()
-    cur.execute('SELECT * FROM users WHERE username = ?', (username,))
-    row = cur.fetchone()
-    conn.close()
+    with get_conn(db_path) as conn:
+        cur = conn.cursor()
+        cur.row_factory = sqlite3.Row
+        cur.execute('SELECT * FROM users WHERE username = ?', (username,))
+        row = cur.fetchone()
     if not row:
         return None
     return {k: row[k] for k in row.keys()}
@@ -99,11 +97,8 @@ def verify_user(db_path, username, password):
                 from security import SecurityManager
                 security_manager = SecurityManager(os.getenv('JWT_SECRET_KEY', 'fallback-key'))
                 new_hash = security_manager.hash_password(password)
-                conn = get_conn(db_path)
-                cur = conn.cursor()
-                cur.execute('UPDATE users SET password_hash = ? WHERE id = ?', (new_hash, user['id']))
-                conn.commit()
-                conn.close()
+                with get_conn(db_path) as conn:
+                    conn.execute('UPDATE users SET password_hash = ? WHERE id = ?', (new_hash, user['id']))
             except ImportError:
                 pass
             return user
@@ -111,42 +106,38 @@ def verify_user(db_path, username, password):
     return None
 
 def insert_file(db_path, user_id, filename, stored_path, file_size, uploaded_at):
-        conn = get_conn(db_path)
-        cur = conn.cursor()
-        cur.execute('INSERT INTO files (user_id, filename, stored_path, file_size, uploaded_at) VALUES (?,?,?,?,?)',
-                                (user_id, filename, stored_path, file_size, uploaded_at))
-        conn.commit()
-        file_id = cur.lastrowid
-        conn.close()
+        with get_conn(db_path) as conn:
+                cur = conn.cursor()
+                cur.execute('INSERT INTO files (user_id, filename, stored_path, file_size, uploaded_at) VALUES (?,?,?,?,?)',
+                                        (user_id, filename, stored_path, file_size, uploaded_at))
+                file_id = cur.lastrowid
         return file_id
 
 def list_files(db_path, user_id):
-        conn = get_conn(db_path)
-        conn.row_factory = sqlite3.Row
-        cur = conn.cursor()
-        cur.execute('SELECT id, filename, file_size, uploaded_at FROM files WHERE user_id = ? ORDER BY uploaded_at DESC', (user_id,))
-        rows = cur.fetchall()
-        conn.close()
+        with get_conn(db_path) as conn:
+                cur = conn.cursor()
+                cur.row_factory = sqlite3.Row
+                cur.execute('SELECT id, filename, file_size, uploaded_at FROM files WHERE user_id = ? ORDER BY uploaded_at DESC', (user_id,))
+                rows = cur.fetchall()
         return [ { 'id': r['id'], 'filename': r['filename'], 'file_size': r['file_size'], 'uploaded_at': r['uploaded_at'] } for r in rows ]
 
 def analytics_for_user(db_path, user_id):
-        conn = get_conn(db_path)
-        cur = conn.cursor()
-        cur.execute('SELECT COUNT(*), COALESCE(SUM(file_size),0) FROM files WHERE user_id = ?', (user_id,))
-        total_files, total_size = cur.fetchone()
-        # Simple file type breakdown
-        cur.execute("""
-            SELECT 
-                CASE 
-                    WHEN filename LIKE '%.pdf' THEN 'PDF'
-                    WHEN filename LIKE '%.png' OR filename LIKE '%.jpg' OR filename LIKE '%.jpeg' THEN 'Image'
-                    WHEN filename LIKE '%.txt' OR filename LIKE '%.doc' OR filename LIKE '%.docx' THEN 'Document'
-                    ELSE 'Other' END AS kind,
-                COUNT(*)
-            FROM files WHERE user_id = ? GROUP BY kind
-        """, (user_id,))
-        kinds = { kind: cnt for kind, cnt in cur.fetchall() }
-        conn.close()
+        with get_conn(db_path) as conn:
+                cur = conn.cursor()
+                cur.execute('SELECT COUNT(*), COALESCE(SUM(file_size),0) FROM files WHERE user_id = ?', (user_id,))
+                total_files, total_size = cur.fetchone()
+                # Simple file type breakdown
+                cur.execute("""
+                    SELECT 
+                        CASE 
+                            WHEN filename LIKE '%.pdf' THEN 'PDF'
+                            WHEN filename LIKE '%.png' OR filename LIKE '%.jpg' OR filename LIKE '%.jpeg' THEN 'Image'
+                            WHEN filename LIKE '%.txt' OR filename LIKE '%.doc' OR filename LIKE '%.docx' THEN 'Document'
+                            ELSE 'Other' END AS kind,
+                        COUNT(*)
+                    FROM files WHERE user_id = ? GROUP BY kind
+                """, (user_id,))
+                kinds = { kind: cnt for kind, cnt in cur.fetchall() }
         return {
             'total_files': total_files,
             'total_storage': total_size,
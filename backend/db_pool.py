@@ -0,0 +1,190 @@
+"""
+Pooled SQLite Connection Manager
+SmartSecure Sri Lanka - shared connection layer for the API server
+"""
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+# Maximum number of open connections per database file (0 disables pooling)
+DEFAULT_POOL_SIZE = int(os.getenv('SMARTSECURE_DB_POOL_SIZE', 8))
+# How long SQLite waits on a locked database before raising "database is locked"
+DEFAULT_BUSY_TIMEOUT_MS = int(os.getenv('SMARTSECURE_DB_BUSY_TIMEOUT_MS', 5000))
+# How long a request waits for a free pooled connection
+DEFAULT_ACQUIRE_TIMEOUT = float(os.getenv('SMARTSECURE_DB_ACQUIRE_TIMEOUT', 10))
+# Prepared statements kept per connection by the sqlite3 module
+STATEMENT_CACHE_SIZE = 256
+
+
+class PoolExhaustedError(sqlite3.OperationalError):
+    """Raised when no pooled connection becomes free within the acquire timeout"""
+
+
+class ConnectionPool:
+    """Bounded pool of SQLite connections handed out one per thread.
+
+    A thread borrows a connection for the duration of a ``with pool.connection()``
+    block; nested blocks on the same thread reuse it, and the outermost block
+    commits (or rolls back on error) before returning it to the pool. Connections
+    are opened once in WAL mode, so readers never block the single writer and
+    the statement cache survives across requests.
+    """
+
+    def __init__(self, db_path: str, max_size: int = DEFAULT_POOL_SIZE,
+                 busy_timeout_ms: int = DEFAULT_BUSY_TIMEOUT_MS,
+                 acquire_timeout: float = DEFAULT_ACQUIRE_TIMEOUT):
+        self.db_path = db_path
+        self.max_size = max_size
+        self.busy_timeout_ms = busy_timeout_ms
+        self.acquire_timeout = acquire_timeout
+        self._idle: List[sqlite3.Connection] = []
+        self._open_count = 0
+        self._cond = threading.Condition()
+        self._local = threading.local()
+        self._closed = False
+
+    @property
+    def pooled(self) -> bool:
+        return self.max_size > 0
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=self.busy_timeout_ms / 1000.0,
+            check_same_thread=False,
+            cached_statements=STATEMENT_CACHE_SIZE,
+        )
+        conn.execute(f'PRAGMA busy_timeout = {int(self.busy_timeout_ms)}')
+        conn.execute('PRAGMA journal_mode = WAL')
+        conn.execute('PRAGMA synchronous = NORMAL')
+        return conn
+
+    def _acquire(self) -> sqlite3.Connection:
+        if not self.pooled:
+            return self._connect()
+
+        deadline = time.monotonic() + self.acquire_timeout
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise sqlite3.ProgrammingError('Connection pool is closed')
+                if self._idle:
+                    return self._idle.pop()
+                if self._open_count < self.max_size:
+                    self._open_count += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self._cond.wait(remaining):
+                    if not self._idle and self._open_count >= self.max_size:
+                        raise PoolExhaustedError(
+                            f'No database connection available after {self.acquire_timeout}s')
+
+        try:
+            return self._connect()
+        except Exception:
+            with self._cond:
+                self._open_count -= 1
+                self._cond.notify()
+            raise
+
+    def _release(self, conn: sqlite3.Connection, broken: bool = False):
+        if not self.pooled:
+            conn.close()
+            return
+
+        with self._cond:
+            if broken or self._closed:
+                self._open_count -= 1
+                conn.close()
+            else:
+                self._idle.append(conn)
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """Borrow a connection for the current thread (re-entrant)"""
+        depth = getattr(self._local, 'depth', 0)
+        if depth:
+            self._local.depth = depth + 1
+            try:
+                yield self._local.conn
+            finally:
+                self._local.depth -= 1
+            return
+
+        conn = self._acquire()
+        self._local.conn = conn
+        self._local.depth = 1
+        broken = False
+        try:
+            yield conn
+            if conn.in_transaction:
+                conn.commit()
+        except BaseException:
+            try:
+                conn.rollback()
+            except sqlite3.Error:
+                broken = True
+            raise
+        finally:
+            self._local.depth = 0
+            self._local.conn = None
+            self._release(conn, broken)
+
+    def stats(self) -> Dict[str, int]:
+        with self._cond:
+            return {'max_size': self.max_size, 'open': self._open_count, 'idle': len(self._idle)}
+
+    def close(self):
+        """Close idle connections; borrowed ones are closed when returned"""
+        with self._cond:
+            self._closed = True
+            while self._idle:
+                self._idle.pop().close()
+                self._open_count -= 1
+            self._cond.notify_all()
+
+
+_pools: Dict[str, ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(db_path) -> ConnectionPool:
+    """Return the shared pool for a database file, creating it on first use"""
+    key = os.path.abspath(str(db_path))
+    pool = _pools.get(key)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(key)
+            if pool is None:
+                pool = ConnectionPool(key)
+                _pools[key] = pool
+    return pool
+
+
+def configure_pool(db_path, max_size: Optional[int] = None, **kwargs) -> ConnectionPool:
+    """Replace the shared pool for a database file with new settings"""
+    key = os.path.abspath(str(db_path))
+    with _pools_lock:
+        old = _pools.pop(key, None)
+        pool = ConnectionPool(key, DEFAULT_POOL_SIZE if max_size is None else max_size, **kwargs)
+        _pools[key] = pool
+    if old is not None:
+        old.close()
+    return pool
+
+
+def close_all_pools():
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
+
+
+def connection(db_path):
+    """Shortcut for ``get_pool(db_path).connection()``"""
+    return get_pool(db_path).connection()
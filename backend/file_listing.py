@@ -0,0 +1,187 @@
+"""
+File Listing Queries
+SmartSecure Sri Lanka - keyset-paginated, field-projected reads of a user's files
+"""
+import base64
+import json
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+try:
+    import orjson  # optional: several times faster for large pages
+except ImportError:
+    orjson = None
+
+DEFAULT_PAGE_SIZE = 200
+MAX_PAGE_SIZE = 1000
+
+# Columns a field can read; every query also selects id and upload_date for the cursor
+_COLUMNS = ('id', 'upload_date', 'filename', 'file_size', 'is_safe', 'threat_score', 'secure_filename',
+            'last_scan', 'file_hash', 'file_category')
+_CURSOR_COLUMNS = ('id', 'upload_date')
+
+
+def _column(name: str) -> Tuple[Tuple[str, ...], Callable]:
+    return (name,), lambda row, index: row[index[name]]
+
+
+def _file_type(row, index):
+    filename = row[index['filename']]
+    return filename.split('.')[-1].lower() if '.' in filename else ''
+
+
+_LINK_COLUMNS = ('id', 'secure_filename', 'file_hash', 'filename')
+
+
+def _signed(kind: str) -> Tuple[Tuple[str, ...], Callable]:
+    # Takes the row's links (one DownloadUrlSigner.sign_links call shared by every link field)
+    return _LINK_COLUMNS, lambda links: links[kind]
+
+
+# Output field -> (columns it needs, value from (row, column index), or from the row's signed links)
+FIELDS: Dict[str, Tuple[Tuple[str, ...], Callable]] = {
+    'id': _column('id'),
+    'filename': _column('filename'),
+    'file_size': _column('file_size'),
+    'uploaded_at': (('upload_date',), lambda row, index: row[index['upload_date']]),
+    'is_safe': _column('is_safe'),
+    'safe': (('is_safe',), lambda row, index: bool(row[index['is_safe']])),
+    'threat_score': _column('threat_score'),
+    'threatScore': (('threat_score',), lambda row, index: row[index['threat_score']]),
+    'last_scan': _column('last_scan'),
+    'file_category': _column('file_category'),
+    'downloadUrl': (('id',), lambda row, index: f"/download/{row[index['id']]}"),
+    'previewUrl': (('id',), lambda row, index: f"/preview/{row[index['id']]}"),
+    'signedDownloadUrl': _signed('download'),
+    'signedPreviewUrl': _signed('preview'),
+    'signedUrlExpires': _signed('expires'),
+    'secure_filename': _column('secure_filename'),
+    'file_type': (('filename',), _file_type),
+}
+_LINK_FIELDS = {'signedDownloadUrl', 'signedPreviewUrl', 'signedUrlExpires'}
+# What /files has always returned when no fields= is given
+DEFAULT_FIELDS = ('id', 'filename', 'file_size', 'uploaded_at', 'is_safe', 'safe', 'threat_score', 'threatScore',
+                  'last_scan', 'downloadUrl', 'previewUrl', 'signedDownloadUrl', 'signedPreviewUrl',
+                  'signedUrlExpires', 'secure_filename', 'file_type')
+
+
+def parse_fields(value: Optional[str]) -> Tuple[str, ...]:
+    """Field names from a comma-separated ``fields=`` value; raises ValueError for unknown ones"""
+    if not value:
+        return DEFAULT_FIELDS
+    fields = tuple(dict.fromkeys(name.strip() for name in value.split(',') if name.strip()))
+    unknown = [name for name in fields if name not in FIELDS]
+    if unknown or not fields:
+        raise ValueError(f"Unknown fields: {', '.join(unknown) or value}")
+    return fields
+
+
+def encode_cursor(upload_date: str, file_id: int) -> str:
+    raw = json.dumps([upload_date, file_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str) -> Tuple[str, int]:
+    """Inverse of encode_cursor; raises ValueError for anything malformed"""
+    try:
+        upload_date, file_id = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (TypeError, ValueError) as e:
+        raise ValueError(f'Invalid cursor: {e}')
+    if not isinstance(upload_date, str) or not isinstance(file_id, int):
+        raise ValueError('Invalid cursor')
+    return upload_date, file_id
+
+
+def _like_escape(value: str) -> str:
+    """`value` matched literally inside a LIKE pattern with ``ESCAPE '\\'``"""
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def file_query(username: str, filters: Dict, cursor: Optional[Tuple[str, int]], limit: int,
+               columns: Sequence[str]) -> Tuple[str, List]:
+    """Newest-first page of a user's files, answered from idx_files_username_upload_date without a sort.
+
+    Filters: ``types`` (file extensions), ``category``, ``safe`` (bool),
+    ``since`` / ``until`` (upload_date, inclusive / exclusive).
+    """
+    conditions, params = ['username = ?'], [username]
+    if filters.get('types'):
+        conditions.append('(' + ' OR '.join("filename LIKE ? ESCAPE '\\'" for _ in filters['types']) + ')')
+        params.extend('%.' + _like_escape(ext) for ext in filters['types'])
+    if filters.get('category'):
+        conditions.append('file_category = ?')
+        params.append(filters['category'])
+    if filters.get('safe') is not None:
+        conditions.append('is_safe = ?')
+        params.append(1 if filters['safe'] else 0)
+    if filters.get('since'):
+        conditions.append('upload_date >= ?')
+        params.append(filters['since'])
+    if filters.get('until'):
+        conditions.append('upload_date < ?')
+        params.append(filters['until'])
+    if cursor is not None:
+        conditions.append('(upload_date, id) < (?, ?)')
+        params.extend(cursor)
+    sql = (f"SELECT {', '.join(columns)} FROM files WHERE {' AND '.join(conditions)} "
+           f"ORDER BY upload_date DESC, id DESC LIMIT ?")
+    return sql, params + [limit]
+
+
+class FileListing:
+    """One page of a user's files as compact rows: only the requested fields are read and built.
+
+    The query selects just the columns the fields need; each row is turned
+    into values by a precomputed list of per-field functions, with no
+    intermediate dicts. ``rows`` come back as lists in ``fields`` order (the
+    compact format); ``as_objects`` zips them into dicts for the classic
+    response shape.
+    """
+
+    def __init__(self, fields: Sequence[str] = DEFAULT_FIELDS):
+        self.fields = tuple(fields)
+        needed = set(_CURSOR_COLUMNS)
+        for name in self.fields:
+            needed.update(FIELDS[name][0])
+        self.columns = tuple(column for column in _COLUMNS if column in needed)
+        self._index = {column: i for i, column in enumerate(self.columns)}
+
+    def page(self, conn, username: str, user_id: Optional[int] = None, filters: Optional[Dict] = None,
+             cursor: Optional[str] = None, limit: int = DEFAULT_PAGE_SIZE,
+             signer=None) -> Tuple[List[list], Optional[str]]:
+        """(rows, next_cursor) for one page; next_cursor is None on the last page"""
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+        sql, params = file_query(username, filters or {}, decode_cursor(cursor) if cursor else None,
+                                 limit + 1, self.columns)
+        fetched = conn.execute(sql, params).fetchmany(limit + 1)
+        index = self._index
+        signing = signer is not None and not _LINK_FIELDS.isdisjoint(self.fields)
+        getters = []
+        for name in self.fields:
+            build = FIELDS[name][1]
+            if name in _LINK_FIELDS:
+                getters.append((lambda row, links, build=build: build(links)) if signing
+                               else (lambda row, links: None))
+            else:
+                getters.append(lambda row, links, build=build: build(row, index))
+        rows = []
+        for row in fetched[:limit]:
+            links = signer.sign_links(row[index['id']], username, user_id, row[index['secure_filename']],
+                                      row[index['file_hash']], row[index['filename']]) if signing else None
+            rows.append([get(row, links) for get in getters])
+
+        next_cursor = None
+        if len(fetched) > limit:
+            last = fetched[limit - 1]
+            next_cursor = encode_cursor(last[index['upload_date']], last[index['id']])
+        return rows, next_cursor
+
+    def as_objects(self, rows: List[list]) -> List[Dict]:
+        fields = self.fields
+        return [dict(zip(fields, row)) for row in rows]
+
+
+def dumps(payload) -> bytes:
+    """JSON bytes for a response body: orjson when it is installed, else compact stdlib json"""
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload, separators=(',', ':')).encode('utf-8')
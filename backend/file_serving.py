@@ -0,0 +1,206 @@
+"""
+Stored File Responses
+SmartSecure Sri Lanka - conditional, byte-range and zero-copy responses for stored uploads
+"""
+import mimetypes
+import os
+import re
+import secrets
+import unicodedata
+from typing import Iterator, List, Optional, Tuple
+from urllib.parse import quote
+
+from flask import Response, request
+from werkzeug.http import http_date
+from werkzeug.wsgi import wrap_file
+
+from blob_store import BlobStore
+
+# More ranges than this in one request are answered with the whole file
+MAX_RANGES = 16
+CHUNK_SIZE = 64 * 1024
+_RANGE_SPEC_RE = re.compile(r'^(\d*)-(\d*)$')
+# Stored files are private to their owner; browsers may keep them but must revalidate (a 304 is cheap)
+CACHE_CONTROL = 'private, no-cache'
+
+
+class _FileSegment:
+    """Read-only view of bytes [start, stop) of an open file.
+
+    Servers whose ``wsgi.file_wrapper`` uses ``os.sendfile`` (gunicorn, for
+    one) take ``fileno()`` and ``tell()`` and send Content-Length bytes from
+    there without copying through Python; everything else calls ``read()``,
+    which stops at the end of the segment.
+    """
+
+    def __init__(self, file, start: int, stop: int):
+        self.file = file
+        self.stop = stop
+        file.seek(start)
+
+    def fileno(self) -> int:
+        return self.file.fileno()
+
+    def tell(self) -> int:
+        return self.file.tell()
+
+    def read(self, size: int = -1) -> bytes:
+        remaining = self.stop - self.file.tell()
+        if remaining <= 0:
+            return b''
+        return self.file.read(remaining if size is None or size < 0 else min(size, remaining))
+
+    def close(self):
+        self.file.close()
+
+
+def strong_etag(file_hash: Optional[str]) -> Optional[str]:
+    """The stored SHA-256 identifies the bytes exactly, so it is a strong validator"""
+    return file_hash if BlobStore.is_content_hash(file_hash) else None
+
+
+def _satisfiable_ranges(range_header: Optional[str], size: int) -> Optional[List[Tuple[int, int]]]:
+    """[(start, stop)] for a Range header, [] if none is satisfiable, None to send the whole file.
+
+    Parsed here rather than with werkzeug's parse_range_header, which rejects
+    the unordered, overlapping and mixed suffix ranges that RFC 9110 allows
+    and that PDF viewers send.
+    """
+    if not range_header:
+        return None
+    units, _, specs = range_header.partition('=')
+    specs = [spec.strip() for spec in specs.split(',') if spec.strip()]
+    if units.strip().lower() != 'bytes' or not specs or len(specs) > MAX_RANGES:
+        return None
+    ranges = []
+    for spec in specs:
+        match = _RANGE_SPEC_RE.match(spec)
+        if not match or spec == '-':
+            return None  # a malformed header is ignored (RFC 9110 14.2)
+        first, last = match.groups()
+        if not first:  # suffix range: the last `last` bytes
+            start, stop = max(size - int(last), 0), size
+        else:
+            start = int(first)
+            stop = size if not last else min(int(last) + 1, size)
+            if last and int(last) < start:
+                return None
+        if start < stop:
+            ranges.append((start, stop))
+    if len(ranges) > 1:
+        # Overlapping or adjacent ranges are sent once
+        ranges.sort()
+        merged = [ranges[0]]
+        for start, stop in ranges[1:]:
+            if start <= merged[-1][1]:
+                merged[-1] = (merged[-1][0], max(merged[-1][1], stop))
+            else:
+                merged.append((start, stop))
+        ranges = merged
+    return ranges
+
+
+def _not_modified(etag: Optional[str], mtime: int) -> bool:
+    if_none_match = request.if_none_match
+    if if_none_match:
+        # If-None-Match takes precedence over If-Modified-Since (RFC 9110 13.2.2)
+        return etag is not None and if_none_match.contains_weak(etag)
+    if_modified_since = request.if_modified_since
+    return if_modified_since is not None and mtime <= if_modified_since.timestamp()
+
+
+def _if_range_matches(etag: Optional[str], mtime: int) -> bool:
+    if_range = request.if_range
+    if if_range.etag:
+        return etag is not None and if_range.etag == etag
+    if if_range.date:
+        return int(if_range.date.timestamp()) == mtime
+    return True
+
+
+def _content_disposition(download_name: str, as_attachment: bool) -> Tuple[str, dict]:
+    kind = 'attachment' if as_attachment else 'inline'
+    try:
+        download_name.encode('ascii')
+        return kind, {'filename': download_name}
+    except UnicodeEncodeError:
+        simple = unicodedata.normalize('NFKD', download_name).encode('ascii', 'ignore').decode('ascii')
+        return kind, {'filename': simple, 'filename*': "UTF-8''" + quote(download_name, safe="!#$&+-.^_`|~")}
+
+
+def _multipart_body(file, ranges: List[Tuple[int, int]], part_headers: List[bytes], closing: bytes) -> Iterator[bytes]:
+    try:
+        for (start, stop), headers in zip(ranges, part_headers):
+            yield headers
+            segment = _FileSegment(file, start, stop)
+            chunk = segment.read(CHUNK_SIZE)
+            while chunk:
+                yield chunk
+                chunk = segment.read(CHUNK_SIZE)
+        yield closing
+    finally:
+        file.close()
+
+
+def send_stored_file(file_path: str, download_name: str, file_hash: Optional[str],
+                     as_attachment: bool) -> Response:
+    """Response for a stored upload honouring If-None-Match / If-Modified-Since, If-Range and Range.
+
+    Full and single-range bodies are handed to the server's file wrapper so
+    they can go out with sendfile; several ranges are sent as
+    multipart/byteranges. Raises FileNotFoundError if the file is missing.
+    """
+    file = open(file_path, 'rb')
+    try:
+        stat = os.fstat(file.fileno())
+        size, mtime = stat.st_size, int(stat.st_mtime)
+        etag = strong_etag(file_hash)
+        mimetype = mimetypes.guess_type(download_name)[0] or 'application/octet-stream'
+
+        response = Response(mimetype=mimetype, direct_passthrough=True)
+        response.headers['Accept-Ranges'] = 'bytes'
+        response.headers['Cache-Control'] = CACHE_CONTROL
+        response.headers['Last-Modified'] = http_date(mtime)
+        if etag:
+            response.set_etag(etag)
+        kind, options = _content_disposition(download_name, as_attachment)
+        response.headers.set('Content-Disposition', kind, **options)
+
+        if _not_modified(etag, mtime):
+            file.close()
+            response.status_code = 304
+            return response
+
+        ranges = _satisfiable_ranges(request.headers.get('Range'), size) if _if_range_matches(etag, mtime) else None
+        if ranges == []:
+            file.close()
+            response.status_code = 416
+            response.headers['Content-Range'] = f'bytes */{size}'
+            return response
+
+        if ranges is None or ranges == [(0, size)]:
+            response.response = wrap_file(request.environ, _FileSegment(file, 0, size), CHUNK_SIZE)
+            response.content_length = size
+            return response
+
+        response.status_code = 206
+        if len(ranges) == 1:
+            start, stop = ranges[0]
+            response.response = wrap_file(request.environ, _FileSegment(file, start, stop), CHUNK_SIZE)
+            response.content_length = stop - start
+            response.headers['Content-Range'] = f'bytes {start}-{stop - 1}/{size}'
+            return response
+
+        boundary = secrets.token_hex(16)
+        part_headers = [(f'\r\n--{boundary}\r\nContent-Type: {mimetype}\r\n'
+                         f'Content-Range: bytes {start}-{stop - 1}/{size}\r\n\r\n').encode('ascii')
+                        for start, stop in ranges]
+        closing = f'\r\n--{boundary}--\r\n'.encode('ascii')
+        response.content_length = (sum(len(h) for h in part_headers) + len(closing)
+                                   + sum(stop - start for start, stop in ranges))
+        response.headers['Content-Type'] = f'multipart/byteranges; boundary={boundary}'
+        response.response = _multipart_body(file, ranges, part_headers, closing)
+        return response
+    except BaseException:
+        file.close()
+        raise
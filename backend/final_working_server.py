@@ -4,27 +4,90 @@ FINAL WORKING Backend Server for SmartSecure Sri Lanka
 This server has ALL endpoints working properly with comprehensive error handling
 """
 
-from flask import Flask, request, jsonify, send_file, send_from_directory
+import sys
+
+import startup_profile
+
+if __name__ == '__main__' and '--import-profile' in sys.argv:
+    startup_profile.enable()  # before the imports below, so their cost is attributed
+
+from flask import Flask, Response, g, request, jsonify, send_from_directory, stream_with_context
 from flask_cors import CORS
+from werkzeug.middleware.proxy_fix import ProxyFix
 import sqlite3
-import bcrypt
 import jwt
 import secrets
 from datetime import datetime, timedelta
 import os
+import threading
 import uuid
 import hashlib
+import json
+import math
+
+from advanced_analytics import dashboard_payload, get_analytics_engine
+from ai_security import get_threat_detector
+from anomaly_model import ModelRefresher
+from audit_log import DEFAULT_PAGE_SIZE, AuditLog, decode_cursor
+from blob_store import BlobStore
+from db_pool import get_pool
+from file_listing import DEFAULT_PAGE_SIZE as FILES_PAGE_SIZE, FileListing, dumps, parse_fields
+from file_serving import send_stored_file
+from log_writer import get_log_writer
+from login_guard import LoginGuard, VerifierBusy
+from migrations import LATEST_VERSION, ensure_schema
+from request_logging import RequestLogging, configure_logging, get_logger
+from request_metrics import RequestMetrics, format_uptime
+from response_cache import ResponseCache
+from scan_cache import ScanResultCache
+from scan_scheduler import ScanScheduler, record_scan_verdict
+from signed_urls import DownloadUrlSigner, signed_download_blueprint
+from storage_stats import read_storage_stats
+from threat_intel import DEFAULT_INDEX_PATH, ThreatIntelligence, known_threat_analysis
+from token_auth import TokenAuth, login_required
+from upload_pipeline import install_streaming_uploads, receive_upload, scan_result
+
+startup_profile.mark('imports')
 
 # Configuration
 SECRET_KEY = os.environ.get('JWT_SECRET_KEY', "smartsecure_final_secret_2024")
 # Use absolute path to ensure we're using the correct database
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 DB_PATH = os.path.join(SCRIPT_DIR, 'smartsecure.db')
+UPLOADS_DIR = os.path.join(SCRIPT_DIR, 'uploads')
+THREAT_INDEX_PATH = DEFAULT_INDEX_PATH  # built with `python threat_intel.py import FEED`
+# Dashboard analytics are served from memory for ANALYTICS_CACHE_TTL seconds, then stale for up to
+# ANALYTICS_STALE_SECONDS more while a background refresh recomputes them
+ANALYTICS_CACHE_TTL = float(os.environ.get('ANALYTICS_CACHE_TTL', 60))
+ANALYTICS_STALE_SECONDS = float(os.environ.get('ANALYTICS_STALE_SECONDS', 600))
+ANALYTICS_DEFAULT_DAYS = 30
+ANALYTICS_MAX_DAYS = 365
+# Lifetime of the signed file links handed out by /files (each link lives between 1x and 2x this)
+SIGNED_URL_TTL = int(os.environ.get('SIGNED_URL_TTL', 900))
+# When set, /metrics requires 'Authorization: Bearer <METRICS_TOKEN>' (for the scraper)
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
 
 # Frontend static files path (for production deployment)
 FRONTEND_DIST = os.path.join(os.path.dirname(SCRIPT_DIR), 'frontend', 'dist')
 
 app = Flask(__name__, static_folder=FRONTEND_DIST, static_url_path='')
+# Behind a hosting platform's proxy, take client IPs (for login rate limits) from X-Forwarded-For
+if os.environ.get('SMARTSECURE_PROXY_HOPS'):
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=int(os.environ['SMARTSECURE_PROXY_HOPS']))
+# Uploaded files are hashed and scanned while the multipart body is parsed
+install_streaming_uploads(app, UPLOADS_DIR)
+# JSON-lines logs written by a background listener thread (LOG_LEVEL, LOG_SAMPLE_RATE); the
+# request id middleware goes first so every request, even a rejected one, has an id
+configure_logging()
+log = get_logger('server')
+RequestLogging(app)
+# Per-route latency, status, DB time and byte counters, scraped from /metrics
+metrics = RequestMetrics()
+metrics.init_app(app)
+# Bearer tokens are verified once per process, then served from an LRU until they expire
+auth = TokenAuth(app, SECRET_KEY)
+# Login rate limits and the bounded bcrypt pool
+login_guard = LoginGuard()
 
 # CORS configuration for free hosting platforms
 allowed_origins = [
@@ -45,16 +108,85 @@ if os.environ.get('FLASK_ENV') == 'production':
 else:
     CORS(app, origins=allowed_origins)
 
-def verify_token(token):
-    """Verify JWT token"""
-    try:
-        if not token:
-            return None
-        decoded = jwt.decode(token, SECRET_KEY, algorithms=['HS256'])
-        return decoded
-    except Exception as e:
-        print(f"Token verification error: {e}")
-        return None
+def get_db():
+    """Borrow a pooled connection to DB_PATH for the current request thread (migrated on first use)"""
+    ensure_schema(DB_PATH)
+    return metrics.time_db(get_pool(DB_PATH).connection())
+
+def get_blob_store():
+    """Content-addressed store for files under UPLOADS_DIR"""
+    return BlobStore(UPLOADS_DIR)
+
+_scan_caches = {}
+
+def get_scan_cache():
+    """Verdict cache for DB_PATH, purged of entries from older engine versions on first use"""
+    cache = _scan_caches.get(DB_PATH)
+    if cache is None:
+        cache = _scan_caches.setdefault(DB_PATH, ScanResultCache(DB_PATH))
+        cache.purge_other_versions(get_threat_detector().engine_version)
+    return cache
+
+def scan_stored_file(file_id, filename, secure_filename, file_hash):
+    """Analyse one stored file (known content comes from the scan cache) and record the verdict"""
+    file_path = get_blob_store().resolve(secure_filename, file_hash)
+    analysis = get_threat_detector().analyze_file_path(filename, file_path, file_hash, scan_cache=get_scan_cache())
+    with get_db() as conn:
+        record_scan_verdict(conn, file_id, analysis)
+    return analysis
+
+_scan_schedulers = {}
+
+def get_scan_scheduler():
+    """Background bulk-scan scheduler for DB_PATH (started on first submitted batch)"""
+    scheduler = _scan_schedulers.get(DB_PATH)
+    if scheduler is None:
+        scheduler = _scan_schedulers.setdefault(
+            DB_PATH, ScanScheduler(DB_PATH, get_blob_store(), get_scan_cache(), get_threat_detector(),
+                                   threat_intel=get_threat_intel()))
+    return scheduler
+
+_threat_intel = {}
+
+def get_threat_intel():
+    """Known-bad hash index for THREAT_INDEX_PATH (details from DB_PATH)"""
+    key = (DB_PATH, THREAT_INDEX_PATH)
+    intel = _threat_intel.get(key)
+    if intel is None:
+        intel = _threat_intel.setdefault(key, ThreatIntelligence(DB_PATH, THREAT_INDEX_PATH))
+    return intel
+
+_audit_logs = {}
+
+def get_audit_log():
+    """Paginated reads over DB_PATH's activity_logs and security_events"""
+    audit_log = _audit_logs.get(DB_PATH)
+    if audit_log is None:
+        audit_log = _audit_logs.setdefault(DB_PATH, AuditLog(DB_PATH))
+    return audit_log
+
+def record_security_event(user_id, event_type, threat_level, description):
+    """Queue a security_events row; the log writer batches it off the request thread"""
+    get_log_writer(DB_PATH).log_security_event(user_id, event_type, threat_level, description)
+
+def record_activity(user_id, activity_type, description):
+    """Queue an activity_logs row; the log writer batches it off the request thread"""
+    get_log_writer(DB_PATH).log_activity(user_id, activity_type, description)
+
+def _record_signed_download(claims):
+    if claims['as_attachment']:
+        record_activity(claims['user_id'], 'FILE_DOWNLOAD', f"Downloaded {claims['filename']}")
+
+# Signed links are checked with one HMAC: no token cache, no ownership query
+download_signer = DownloadUrlSigner(SECRET_KEY, SIGNED_URL_TTL)
+app.register_blueprint(signed_download_blueprint(download_signer, lambda: get_blob_store(), _record_signed_download))
+
+def threat_level_for(threat_score):
+    if threat_score > 0.7:
+        return "HIGH"
+    elif threat_score > 0.4:
+        return "MEDIUM"
+    return "LOW"
 
 # ==================== BASIC ENDPOINTS ====================
 
@@ -80,102 +212,112 @@ def login():
         username = data.get('username', '').strip()
         password = data.get('password', '')
         
-        print(f"🔐 Login attempt for: '{username}'")
+        log.debug('Login attempt for %r', username)
         
         if not username or not password:
-            print("❌ Missing username or password")
+            log.info('Login rejected: missing username or password')
             return jsonify({'success': False, 'message': 'Username and password required'}), 400
         
         if not os.path.exists(DB_PATH):
-            print("❌ Database not found")
+            log.error('Login failed: database %s not found', DB_PATH)
             return jsonify({'success': False, 'message': 'Database not found'}), 500
         
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
+        client_ip = request.remote_addr or 'unknown'
+        retry_after = login_guard.admit(username, client_ip)
+        if retry_after:
+            log.warning('Login throttled for %r from %s', username, client_ip, extra={'client_ip': client_ip})
+            response = jsonify({'success': False, 'message': 'Too many login attempts, please try again later'})
+            response.headers['Retry-After'] = str(math.ceil(retry_after))
+            return response, 429
         
-        cursor.execute('SELECT id, password_hash, email, is_active, role FROM users WHERE username = ?', (username,))
-        user = cursor.fetchone()
+        with get_db() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT id, password_hash, email, is_active, role FROM users WHERE username = ?', (username,))
+            user = cursor.fetchone()
         
-        if user:
-            user_id, password_hash, email, is_active, role = user
+        # Unknown users are checked against a dummy hash so every failure takes as long
+        user_id, password_hash, email, is_active, role = user or (None, None, None, 0, None)
+        try:
+            password_ok = login_guard.check_password(password, password_hash)
+        except VerifierBusy:
+            log.warning('Login rejected, password verification queue full: %r', username)
+            response = jsonify({'success': False, 'message': 'Server busy, please try again'})
+            response.headers['Retry-After'] = '1'
+            return response, 429
+        
+        if user and is_active and password_ok:
             user_role = role if role else 'user'
-            print(f"✅ Found user: {username} (ID: {user_id}, Role: {user_role}, Active: {is_active})")
-            
-            if is_active and bcrypt.checkpw(password.encode('utf-8'), password_hash.encode('utf-8')):
-                cursor.execute('UPDATE users SET last_login = ? WHERE id = ?', 
+            with get_db() as conn:
+                conn.execute('UPDATE users SET last_login = ? WHERE id = ?', 
                              (datetime.now().isoformat(), user_id))
-                conn.commit()
-                conn.close()
-                
-                token = jwt.encode({
-                    'user_id': user_id,
-                    'username': username,
-                    'role': user_role,
-                    'exp': datetime.now() + timedelta(hours=24)
-                }, SECRET_KEY, algorithm='HS256')
-                
-                print(f"✅ Login successful for: {username} (Role: {user_role})")
-                
-                return jsonify({
-                    'success': True,
-                    'message': 'Login successful',
-                    'token': token,
-                    'user': {'id': user_id, 'username': username, 'email': email, 'role': user_role}
-                })
-            else:
-                conn.close()
-                print(f"❌ Invalid password for: {username}")
-                return jsonify({'success': False, 'message': 'Invalid credentials'}), 401
-        else:
-            conn.close()
-            print(f"❌ User not found: {username}")
-            return jsonify({'success': False, 'message': 'Invalid credentials'}), 401
+            
+            token = jwt.encode({
+                'user_id': user_id,
+                'username': username,
+                'role': user_role,
+                'exp': datetime.now() + timedelta(hours=24)
+            }, SECRET_KEY, algorithm='HS256')
+            
+            log.info('Login successful for %s (role: %s)', username, user_role, extra={'client_ip': client_ip})
+            record_activity(user_id, 'LOGIN', f'Logged in from {client_ip}')
+            
+            return jsonify({
+                'success': True,
+                'message': 'Login successful',
+                'token': token,
+                'user': {'id': user_id, 'username': username, 'email': email, 'role': user_role}
+            })
+        
+        reason = 'unknown user' if not user else 'inactive account' if not is_active else 'invalid password'
+        log.info('Login failed for %r (%s)', username, reason, extra={'client_ip': client_ip})
+        login_guard.record_failure(DB_PATH, user_id, username, client_ip, reason)
+        return jsonify({'success': False, 'message': 'Invalid credentials'}), 401
             
     except Exception as e:
-        print(f"❌ Login error: {e}")
+        log.exception('Login error')
         return jsonify({'success': False, 'message': f'Login failed: {str(e)}'}), 500
 
 @app.route('/logout', methods=['POST', 'OPTIONS'])
 def logout():
     if request.method == 'OPTIONS':
         return '', 200
+    if g.user:
+        auth.revoke(g.token)
+        record_activity(g.user['user_id'], 'LOGOUT', 'Logged out')
+        log.info('Logged out: %s', g.user['username'])
     return jsonify({'success': True, 'message': 'Logged out successfully'})
 
 @app.route('/admin/stats', methods=['GET', 'OPTIONS'])
+@login_required
 def get_admin_stats():
     """Get admin dashboard statistics"""
     if request.method == 'OPTIONS':
         return '', 200
     
     try:
-        token = request.headers.get('Authorization', '').replace('Bearer ', '')
-        user_data = verify_token(token)
-        if not user_data:
-            return jsonify({'error': 'Unauthorized'}), 401
+        user_data = g.user
         
         # Check if user is admin
         if user_data.get('role') != 'admin':
-            print(f"⚠️ SECURITY ALERT: User '{user_data.get('username')}' (role: {user_data.get('role')}) attempted to access admin stats endpoint")
+            log.warning('SECURITY ALERT: non-admin %r (role: %s) attempted to access admin stats', user_data.get('username'), user_data.get('role'))
             return jsonify({'error': 'Forbidden - Admin access required'}), 403
         
-        print(f"✅ Admin access granted: {user_data.get('username')} accessing admin stats")
-        
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        
-        # Get total users
-        cursor.execute('SELECT COUNT(*) FROM users')
-        total_users = cursor.fetchone()[0]
+        log.debug('Admin access granted: %s accessing admin stats', user_data.get('username'))
         
-        # Get total files
-        cursor.execute('SELECT COUNT(*) FROM files')
-        total_files = cursor.fetchone()[0]
-        
-        # Get security alerts
-        cursor.execute('SELECT COUNT(*) FROM security_events')
-        security_alerts = cursor.fetchone()[0]
-        
-        conn.close()
+        with get_db() as conn:
+            cursor = conn.cursor()
+            
+            # Get total users
+            cursor.execute('SELECT COUNT(*) FROM users')
+            total_users = cursor.fetchone()[0]
+            
+            # Get total files
+            cursor.execute('SELECT COUNT(*) FROM files')
+            total_files = cursor.fetchone()[0]
+            
+            # Get security alerts
+            cursor.execute('SELECT COUNT(*) FROM security_events')
+            security_alerts = cursor.fetchone()[0]
         
         return jsonify({
             'total_users': total_users,
@@ -185,21 +327,19 @@ def get_admin_stats():
         })
         
     except Exception as e:
-        print(f"Admin stats error: {e}")
+        log.exception('Admin stats error')
         return jsonify({'error': str(e)}), 500
 
 # ==================== FILE MANAGEMENT ====================
 
 @app.route('/upload', methods=['POST', 'OPTIONS'])
+@login_required
 def upload_file():
     if request.method == 'OPTIONS':
         return '', 200
     
     try:
-        token = request.headers.get('Authorization', '').replace('Bearer ', '')
-        user_data = verify_token(token)
-        if not user_data:
-            return jsonify({'success': False, 'message': 'Unauthorized'}), 401
+        user_data = g.user
         
         if 'file' not in request.files:
             return jsonify({'success': False, 'message': 'No file provided'}), 400
@@ -208,36 +348,50 @@ def upload_file():
         if file.filename == '':
             return jsonify({'success': False, 'message': 'No file selected'}), 400
         
-        uploads_dir = os.path.join(os.path.dirname(__file__), 'uploads')
-        os.makedirs(uploads_dir, exist_ok=True)
-        
-        file_extension = os.path.splitext(file.filename)[1]
-        secure_filename = f"{uuid.uuid4().hex[:8]}_{file.filename}"
-        file_path = os.path.join(uploads_dir, secure_filename)
-        
-        file.save(file_path)
-        
-        with open(file_path, 'rb') as f:
-            file_hash = hashlib.md5(f.read()).hexdigest()
-        
-        file_size = os.path.getsize(file_path)
-        
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            INSERT INTO files (username, filename, secure_filename, file_size, upload_date, file_hash, is_safe, threat_score)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            user_data['username'], file.filename, secure_filename, file_size,
-            datetime.now().isoformat(), file_hash, 1, 0.0
-        ))
-        
-        conn.commit()
-        file_id = cursor.lastrowid
-        conn.close()
-        
-        print(f"✅ File uploaded: {file.filename} by {user_data['username']}")
+        # Single pass: the body was written, hashed, sized and scanned while it was parsed
+        with receive_upload(file, UPLOADS_DIR) as sink:
+            file_size = sink.size
+            file_hash = sink.sha256
+            file_md5 = sink.md5
+            
+            # Known-bad content is refused before scoring; closing the sink discards it
+            known_threat = get_threat_intel().match(file_hash)
+            if known_threat:
+                record_security_event(user_data['user_id'], 'KNOWN_THREAT_UPLOAD', known_threat['severity'],
+                                      f"Rejected {file.filename}: {known_threat['threat_name']} ({file_hash})")
+                log.warning('Known threat upload rejected: %s by %s', file.filename, user_data['username'])
+                return jsonify({
+                    'success': False,
+                    'message': f"File rejected: matches known threat {known_threat['threat_name']}",
+                    'threat': {
+                        'name': known_threat['threat_name'],
+                        'category': known_threat['threat_category'],
+                        'severity': known_threat['severity'],
+                        'sha256': file_hash
+                    }
+                }), 422
+            
+            scan = scan_result(sink, file.filename, get_scan_cache())
+            
+            # Public identifier for the row; the bytes live in the shared blob for file_hash
+            secure_filename = f"{uuid.uuid4().hex[:8]}_{file.filename}"
+            
+            # The blob goes again if the row cannot be written, so no upload leaves an orphan
+            with get_db() as conn, get_blob_store().storing(conn, sink) as (_, deduplicated):
+                cursor = conn.cursor()
+                cursor.execute('''
+                    INSERT INTO files (username, filename, secure_filename, file_size, upload_date, file_hash, is_safe,
+                                       threat_score, file_category)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', (
+                    user_data['username'], file.filename, secure_filename, file_size,
+                    datetime.now().isoformat(), file_hash, 1 if scan['is_safe'] else 0, scan['threat_score'],
+                    scan.get('file_category', 'unknown')
+                ))
+                file_id = cursor.lastrowid
+        
+        log.info('File uploaded: %s by %s', file.filename, user_data['username'])
+        record_activity(user_data['user_id'], 'FILE_UPLOAD', f'Uploaded {file.filename} ({file_size} bytes)')
         
         return jsonify({
             'success': True,
@@ -246,94 +400,128 @@ def upload_file():
                 'id': file_id,
                 'name': file.filename,
                 'size': file_size,
-                'hash': file_hash,
-                'safe': True,
-                'threatScore': 0.0
+                'hash': file_md5,
+                'sha256': file_hash,
+                'safe': scan['is_safe'],
+                'threatScore': scan['threat_score'],
+                'deduplicated': deduplicated
             }
         })
         
     except Exception as e:
-        print(f"❌ Upload error: {e}")
+        log.exception('Upload error')
         return jsonify({'success': False, 'message': f'Upload failed: {str(e)}'}), 500
 
+def _file_filters():
+    """/files filters from the query string: type=pdf,docx category= safe=true|false since= until="""
+    safe = request.args.get('safe')
+    if safe is not None:
+        if safe.lower() not in ('true', 'false', '1', '0'):
+            raise ValueError('safe must be true or false')
+        safe = safe.lower() in ('true', '1')
+    types = [ext.strip().lower().lstrip('.') for ext in (request.args.get('type') or '').split(',') if ext.strip()]
+    return {
+        'types': types,
+        'category': request.args.get('category'),
+        'safe': safe,
+        'since': request.args.get('since'),
+        'until': request.args.get('until'),
+    }
+
 @app.route('/files', methods=['GET', 'OPTIONS'])
+@login_required
 def get_files():
     if request.method == 'OPTIONS':
         return '', 200
     
     try:
-        token = request.headers.get('Authorization', '').replace('Bearer ', '')
-        user_data = verify_token(token)
-        if not user_data:
-            return jsonify({'success': False, 'error': 'Unauthorized'}), 401
-        
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT id, filename, file_size, upload_date, is_safe, threat_score, secure_filename, last_scan
-            FROM files WHERE username = ?
-            ORDER BY upload_date DESC
-        ''', (user_data['username'],))
-        
-        files = []
-        for row in cursor.fetchall():
-            file_data = {
-                'id': row[0],
-                'filename': row[1],  # Changed from 'name' to 'filename' to match frontend
-                'file_size': row[2],  # Keep original field name
-                'uploaded_at': row[3],  # Changed from 'uploaded' to 'uploaded_at'
-                'is_safe': row[4],  # Return as is_safe to match frontend expectations
-                'safe': bool(row[4]),  # Keep for backwards compatibility
-                'threat_score': row[5],  # Return as threat_score to match frontend
-                'threatScore': row[5],  # Keep for backwards compatibility
-                'last_scan': row[7],  # Add last_scan field
-                'downloadUrl': f'/download/{row[0]}',  # Use file ID for backwards compatibility
-                'previewUrl': f'/preview/{row[0]}',    # Use file ID for backwards compatibility
-                'secure_filename': row[6],  # Include secure filename for reference
-                'file_type': row[1].split('.')[-1].lower() if '.' in row[1] else ''  # Add file extension
-            }
-            files.append(file_data)
-            print(f"📁 File: {file_data['filename']} -> Download URL: {file_data['downloadUrl']}")  # Debug log
+        user_data = g.user
         
-        conn.close()
-        return jsonify({'success': True, 'files': files})
+        try:
+            listing = FileListing(parse_fields(request.args.get('fields')))
+            filters = _file_filters()
+            with get_db() as conn:
+                rows, next_cursor = listing.page(
+                    conn, user_data['username'], user_data.get('user_id'), filters,
+                    request.args.get('cursor') or None, request.args.get('limit', FILES_PAGE_SIZE, type=int),
+                    signer=download_signer)
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e), 'files': []}), 400
+        
+        # format=compact sends the field names once and each file as an array
+        if request.args.get('format') == 'compact':
+            payload = {'success': True, 'fields': listing.fields, 'rows': rows, 'next_cursor': next_cursor}
+        else:
+            payload = {'success': True, 'files': listing.as_objects(rows), 'next_cursor': next_cursor}
+        response = Response(dumps(payload), mimetype='application/json')
+        if next_cursor:
+            response.headers['X-Next-Cursor'] = next_cursor
+        return response
         
     except Exception as e:
-        print(f"Files error: {e}")
+        log.exception('Files error')
         return jsonify({'success': False, 'error': str(e), 'files': []})
 
-@app.route('/files/storage-stats', methods=['GET', 'OPTIONS'])
-def get_storage_stats():
+@app.route('/files/<int:file_id>', methods=['DELETE', 'OPTIONS'])
+@login_required
+def delete_file(file_id):
     if request.method == 'OPTIONS':
         return '', 200
     
     try:
-        token = request.headers.get('Authorization', '').replace('Bearer ', '')
-        user_data = verify_token(token)
-        if not user_data:
-            return jsonify({'error': 'Unauthorized'}), 401
+        user_data = g.user
         
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        
-        cursor.execute('SELECT SUM(file_size) FROM files WHERE username = ?', (user_data['username'],))
-        total_size = cursor.fetchone()[0] or 0
+        with get_db() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT secure_filename, file_hash FROM files WHERE id = ? AND username = ?', 
+                          (file_id, user_data['username']))
+            file_data = cursor.fetchone()
+            if not file_data:
+                return jsonify({'success': False, 'message': 'File not found or access denied'}), 404
+            
+            secure_filename, file_hash = file_data
+            cursor.execute('DELETE FROM files WHERE id = ?', (file_id,))
+            # Drops this row's blob reference; the file goes with the last one, once committed
+            unused_path = get_blob_store().remove(conn, secure_filename, file_hash)
+        with get_db() as conn:
+            get_blob_store().discard(conn, unused_path)
+        # A shared blob outlives the row, so its signed links are refused here instead
+        download_signer.revoke(file_id, secure_filename)
+        
+        log.info('File deleted: %s by %s', secure_filename, user_data['username'])
+        record_activity(user_data['user_id'], 'FILE_DELETE', f'Deleted {secure_filename}')
+        return jsonify({'success': True, 'message': 'File deleted successfully'})
         
-        cursor.execute('SELECT COUNT(*) FROM files WHERE username = ?', (user_data['username'],))
-        total_files = cursor.fetchone()[0] or 0
+    except Exception as e:
+        log.exception('Delete error')
+        return jsonify({'success': False, 'message': f'Delete failed: {str(e)}'}), 500
+
+@app.route('/files/storage-stats', methods=['GET', 'OPTIONS'])
+@login_required
+def get_storage_stats():
+    if request.method == 'OPTIONS':
+        return '', 200
+    
+    try:
+        user_data = g.user
         
-        conn.close()
+        with get_db() as conn:
+            stats = read_storage_stats(conn, user_data['username'])
+        total_size = stats['total_size']
+        total_files = stats['file_count']
         
         return jsonify({
             'totalSize': total_size,
             'totalFiles': total_files,
             'avgFileSize': total_size / total_files if total_files > 0 else 0,
             'storageLimit': 1024 * 1024 * 100,
-            'usagePercentage': (total_size / (1024 * 1024 * 100)) * 100 if total_size > 0 else 0
+            'usagePercentage': (total_size / (1024 * 1024 * 100)) * 100 if total_size > 0 else 0,
+            'byExtension': stats['by_extension'],
+            'byCategory': stats['by_category']
         })
         
     except Exception as e:
-        print(f"Storage stats error: {e}")
+        log.exception('Storage stats error')
         return jsonify({
             'totalSize': 0,
             'totalFiles': 0,
@@ -342,268 +530,180 @@ def get_storage_stats():
             'usagePercentage': 0
         })
 
+def _find_user_file(filename, username):
+    """(secure_filename, original filename, file_hash) of a user's file by id or secure filename"""
+    with get_db() as conn:
+        if filename.isdigit():
+            # Files addressed by id (backwards compatibility)
+            return conn.execute('SELECT secure_filename, filename, file_hash FROM files WHERE id = ? AND username = ?',
+                                (int(filename), username)).fetchone()
+        return conn.execute('SELECT secure_filename, filename, file_hash FROM files WHERE secure_filename = ? AND username = ?',
+                            (filename, username)).fetchone()
+
+def _serve_user_file(filename, as_attachment):
+    """Stream one of the caller's files with ETag / Range support; None if it is not theirs"""
+    file_data = _find_user_file(filename, g.user['username'])
+    if not file_data:
+        return None, None
+    secure_filename, original_filename, file_hash = file_data
+    file_path = get_blob_store().resolve(secure_filename, file_hash)
+    # Blobs have no extension, so the original name drives the MIME type
+    return send_stored_file(file_path, original_filename, file_hash, as_attachment), original_filename
+
 @app.route('/download/<filename>', methods=['GET'])
+@login_required(query_token=True)
 def download_file(filename):
     try:
-        print(f"🔍 Download request for filename: {filename}")  # Debug log
-        
-        # Get token from query parameter or header
-        token = request.args.get('token') or request.headers.get('Authorization', '').replace('Bearer ', '')
-        user_data = verify_token(token)
-        if not user_data:
-            print(f"❌ Unauthorized download attempt for {filename}")  # Debug log
-            return jsonify({'error': 'Unauthorized'}), 401
-        
-        # Check if filename is numeric (file ID) or secure filename
-        if filename.isdigit():
-            # Handle download by file ID (backwards compatibility)
-            conn = sqlite3.connect(DB_PATH)
-            cursor = conn.cursor()
-            cursor.execute('SELECT secure_filename, filename FROM files WHERE id = ? AND username = ?', 
-                          (int(filename), user_data['username']))
-            file_data = cursor.fetchone()
-            conn.close()
-        else:
-            # Handle download by secure filename (new method)
-            conn = sqlite3.connect(DB_PATH)
-            cursor = conn.cursor()
-            cursor.execute('SELECT secure_filename, filename FROM files WHERE secure_filename = ? AND username = ?', 
-                          (filename, user_data['username']))
-            file_data = cursor.fetchone()
-            conn.close()
-        
-        if not file_data:
-            print(f"❌ File not found: {filename} for user {user_data['username']}")  # Debug log
+        user_data = g.user
+        response, original_filename = _serve_user_file(filename, as_attachment=True)
+        if response is None:
+            log.info('File not found: %s for user %s', filename, user_data['username'])
             return jsonify({'error': 'File not found or access denied'}), 404
         
-        secure_filename, original_filename = file_data
-        uploads_dir = os.path.join(os.path.dirname(__file__), 'uploads')
-        file_path = os.path.join(uploads_dir, secure_filename)
+        # Seeks (206) and revalidations (304) of the same file are not new downloads
+        if response.status_code == 200:
+            record_activity(user_data['user_id'], 'FILE_DOWNLOAD', f'Downloaded {original_filename}')
+        return response
         
-        if os.path.exists(file_path):
-            print(f"✅ Sending file: {file_path}")  # Debug log
-            return send_file(file_path, as_attachment=True, download_name=original_filename)
-        else:
-            print(f"❌ File not found on disk: {file_path}")  # Debug log
-            return jsonify({'error': 'File not found on disk'}), 404
-            
+    except FileNotFoundError:
+        log.error('File not found on disk: %s', filename)
+        return jsonify({'error': 'File not found on disk'}), 404
     except Exception as e:
-        print(f"Download error: {e}")
+        log.exception('Download error')
         return jsonify({'error': str(e)}), 500
 
 @app.route('/preview/<filename>', methods=['GET'])
+@login_required(query_token=True)
 def preview_file(filename):
     try:
-        # Get token from query parameter or header
-        token = request.args.get('token') or request.headers.get('Authorization', '').replace('Bearer ', '')
-        user_data = verify_token(token)
-        if not user_data:
-            return jsonify({'error': 'Unauthorized'}), 401
-        
-        # Check if filename is numeric (file ID) or secure filename
-        if filename.isdigit():
-            # Handle preview by file ID (backwards compatibility)
-            conn = sqlite3.connect(DB_PATH)
-            cursor = conn.cursor()
-            cursor.execute('SELECT secure_filename, filename FROM files WHERE id = ? AND username = ?', 
-                          (int(filename), user_data['username']))
-            file_data = cursor.fetchone()
-            conn.close()
-        else:
-            # Handle preview by secure filename (new method)
-            conn = sqlite3.connect(DB_PATH)
-            cursor = conn.cursor()
-            cursor.execute('SELECT secure_filename, filename FROM files WHERE secure_filename = ? AND username = ?', 
-                          (filename, user_data['username']))
-            file_data = cursor.fetchone()
-            conn.close()
-        
-        if not file_data:
+        response, _ = _serve_user_file(filename, as_attachment=False)
+        if response is None:
             return jsonify({'error': 'File not found or access denied'}), 404
+        return response
         
-        secure_filename, original_filename = file_data
-        uploads_dir = os.path.join(os.path.dirname(__file__), 'uploads')
-        file_path = os.path.join(uploads_dir, secure_filename)
-        
-        if os.path.exists(file_path):
-            # Return file for preview (not as attachment)
-            return send_file(file_path, as_attachment=False)
-        else:
-            return jsonify({'error': 'File not found on disk'}), 404
-            
+    except FileNotFoundError:
+        return jsonify({'error': 'File not found on disk'}), 404
     except Exception as e:
-        print(f"Preview error: {e}")
+        log.exception('Preview error')
         return jsonify({'error': str(e)}), 500
 
 # ==================== ANALYTICS & MONITORING ====================
 
+analytics_cache = ResponseCache(ANALYTICS_CACHE_TTL, ANALYTICS_STALE_SECONDS, name='analytics-refresh')
+
+def _analytics_days():
+    days = request.args.get('days', ANALYTICS_DEFAULT_DAYS, type=int)
+    return max(1, min(days if days is not None else ANALYTICS_DEFAULT_DAYS, ANALYTICS_MAX_DAYS))
+
+def _compute_dashboard_analytics(db_path, days):
+    report = get_analytics_engine(db_path).generate_executive_report(days)
+    if not report:
+        # Keep serving the previous payload rather than caching an empty one
+        raise RuntimeError('executive report unavailable')
+    payload = dashboard_payload(report)
+    # File totals across every user, from the per-user storage rows
+    with get_pool(db_path).connection() as conn:
+        total_files, total_size = conn.execute(
+            'SELECT COALESCE(SUM(file_count), 0), COALESCE(SUM(total_size), 0) FROM user_storage_stats').fetchone()
+        file_types = conn.execute('''
+            SELECT value, SUM(file_count) FROM user_storage_breakdown
+            WHERE dimension = 'extension' AND value != ''
+            GROUP BY value ORDER BY 2 DESC
+        ''').fetchall()
+    payload['fileAnalytics'] = {
+        'totalFiles': total_files,
+        'totalSize': total_size,
+        'fileTypes': [{'type': ext, 'count': count} for ext, count in file_types]
+    }
+    return payload
+
+def get_dashboard_analytics(days):
+    """System-wide dashboard analytics for DB_PATH over `days` days, and the cache state they came from"""
+    db_path = DB_PATH
+    return analytics_cache.get((db_path, days), lambda: _compute_dashboard_analytics(db_path, days))
+
+def _with_request_metrics(dashboard):
+    """The cached dashboard with this process's live request figures in performanceAnalytics"""
+    return {**dashboard, 'performanceAnalytics': {**dashboard.get('performanceAnalytics', {}), **metrics.summary()}}
+
 @app.route('/analytics', methods=['GET', 'OPTIONS'])
+@login_required
 def get_analytics():
     if request.method == 'OPTIONS':
         return '', 200
     
     try:
-        token = request.headers.get('Authorization', '').replace('Bearer ', '')
-        user_data = verify_token(token)
-        if not user_data:
-            return jsonify({'success': False, 'error': 'Unauthorized'}), 401
+        user_data = g.user
         
         # Get user-specific analytics from database
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        
-        # Get user's file count and total storage
-        cursor.execute('SELECT COUNT(*), COALESCE(SUM(file_size), 0) FROM files WHERE username = ?', 
-                      (user_data['username'],))
-        file_count, total_storage = cursor.fetchone()
-        
-        # Get file types breakdown
-        cursor.execute('''
-            SELECT LOWER(SUBSTR(filename, INSTR(filename, '.') + 1)) as extension, COUNT(*)
-            FROM files WHERE username = ? AND INSTR(filename, '.') > 0
-            GROUP BY extension
-        ''', (user_data['username'],))
-        
-        by_type = {}
-        for ext, count in cursor.fetchall():
-            by_type[ext] = count
+        with get_db() as conn:
+            stats = read_storage_stats(conn, user_data['username'])
+        file_count = stats['file_count']
+        total_storage = stats['total_size']
+        by_type = {ext: entry['count'] for ext, entry in stats['by_extension'].items() if ext}
         
-        conn.close()
+        dashboard, cache_state = get_dashboard_analytics(_analytics_days())
         
         analytics_data = {
             'total_files': file_count or 0,
             'total_storage': total_storage or 0,
             'by_type': by_type,
-            'userAnalytics': {
-                'totalUsers': 2,
-                'activeUsers': 2,
-                'newUsers': 1,
-                'retentionRate': 85.0,
-                'userGrowth': [
-                    {'date': '2024-09-01', 'users': 1},
-                    {'date': '2024-09-15', 'users': 2},
-                    {'date': '2024-10-01', 'users': 2}
-                ]
-            },
-            'securityAnalytics': {
-                'totalThreats': 0,
-                'blockedThreats': 0,
-                'riskScore': 15.0,
-                'securityEvents': [],
-                'threatTrends': [
-                    {'date': '2024-09-01', 'threats': 0},
-                    {'date': '2024-09-15', 'threats': 0},
-                    {'date': '2024-10-01', 'threats': 0}
-                ]
-            },
-            'performanceAnalytics': {
-                'avgResponseTime': 120,
-                'systemLoad': 45.0,
-                'uptime': 99.8,
-                'requestsPerHour': 150,
-                'errorRate': 0.1
-            },
+            **_with_request_metrics(dashboard),
             'fileAnalytics': {
                 'totalFiles': file_count or 0,
                 'totalSize': total_storage or 0,
                 'fileTypes': [
                     {'type': k, 'count': v} for k, v in by_type.items()
+                ],
+                'categories': [
+                    {'category': k, 'count': v['count'], 'size': v['size']} for k, v in stats['by_category'].items()
                 ]
             }
         }
         
-        return jsonify({'success': True, 'analytics': analytics_data})
+        response = jsonify({'success': True, 'analytics': analytics_data})
+        response.headers['X-Cache'] = cache_state.upper()
+        return response
         
     except Exception as e:
-        print(f"Analytics error: {e}")
+        log.exception('Analytics error')
         return jsonify({'success': False, 'error': str(e)})
 
 @app.route('/admin/analytics', methods=['GET', 'OPTIONS'])
+@login_required
 def get_admin_analytics():
     if request.method == 'OPTIONS':
         return '', 200
     
     try:
-        token = request.headers.get('Authorization', '').replace('Bearer ', '')
-        user_data = verify_token(token)
-        if not user_data:
-            return jsonify({'error': 'Unauthorized'}), 401
+        user_data = g.user
         
         # Check if user is admin
         if user_data.get('role') != 'admin':
-            print(f"⚠️ SECURITY ALERT: User '{user_data.get('username')}' (role: {user_data.get('role')}) attempted to access admin analytics endpoint")
+            log.warning('SECURITY ALERT: non-admin %r (role: %s) attempted to access admin analytics', user_data.get('username'), user_data.get('role'))
             return jsonify({'error': 'Forbidden - Admin access required'}), 403
         
-        days = request.args.get('days', 30, type=int)
-        
-        # Return the same comprehensive data as regular analytics
-        return jsonify({
-            'userAnalytics': {
-                'totalUsers': 2,
-                'activeUsers': 2,
-                'newUsers': 1,
-                'retentionRate': 85.0,
-                'userGrowth': [
-                    {'date': '2024-09-01', 'users': 1},
-                    {'date': '2024-09-15', 'users': 2},
-                    {'date': '2024-10-01', 'users': 2}
-                ]
-            },
-            'securityAnalytics': {
-                'totalThreats': 0,
-                'blockedThreats': 0,
-                'riskScore': 15.0,
-                'securityEvents': [],
-                'threatTrends': [
-                    {'date': '2024-09-01', 'threats': 0},
-                    {'date': '2024-09-15', 'threats': 0},
-                    {'date': '2024-10-01', 'threats': 0}
-                ]
-            },
-            'performanceAnalytics': {
-                'avgResponseTime': 120,
-                'systemLoad': 45.0,
-                'uptime': 99.8,
-                'requestsPerHour': 150,
-                'errorRate': 0.1
-            },
-            'fileAnalytics': {
-                'totalFiles': 5,
-                'totalSize': 1024000,
-                'fileTypes': [
-                    {'type': 'jpg', 'count': 4},
-                    {'type': 'pdf', 'count': 1},
-                    {'type': 'doc', 'count': 0}
-                ]
-            },
-            'businessInsights': {
-                'dailyActiveUsers': 2,
-                'monthlyGrowth': 15.5,
-                'systemHealthScore': 92.5
-            }
-        })
+        dashboard, cache_state = get_dashboard_analytics(_analytics_days())
+        response = jsonify(_with_request_metrics(dashboard))
+        response.headers['X-Cache'] = cache_state.upper()
+        return response
         
     except Exception as e:
-        print(f"Admin analytics error: {e}")
+        log.exception('Admin analytics error')
         return jsonify({'error': str(e)})
 
 @app.route('/security/status', methods=['GET', 'OPTIONS'])
+@login_required
 def get_security_status():
     if request.method == 'OPTIONS':
         return '', 200
     
     try:
-        token = request.headers.get('Authorization', '').replace('Bearer ', '')
-        user_data = verify_token(token)
-        if not user_data:
-            return jsonify({'success': False, 'error': 'Unauthorized'}), 401
+        user_data = g.user
         
         # Get security metrics from database
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        
-        cursor.execute('SELECT COUNT(*) FROM files WHERE username = ?', (user_data['username'],))
-        user_files = cursor.fetchone()[0]
+        with get_db() as conn:
+            user_files = read_storage_stats(conn, user_data['username'])['file_count']
         
         # Determine risk level based on activity
         if user_files > 20:
@@ -613,8 +713,6 @@ def get_security_status():
         else:
             risk_level = 'LOW'
         
-        conn.close()
-        
         security_data = {
             'status': 'healthy',
             'risk_level': risk_level,
@@ -630,7 +728,7 @@ def get_security_status():
         return jsonify({'success': True, 'security_status': security_data})
         
     except Exception as e:
-        print(f"Security status error: {e}")
+        log.exception('Security status error')
         return jsonify({
             'success': False,
             'error': str(e),
@@ -643,139 +741,103 @@ def get_security_status():
             }
         })
 
+def _audit_log_response(filters, envelope):
+    """A page of audit entries as JSON (next page cursor in X-Next-Cursor), or everything as NDJSON"""
+    audit_log = get_audit_log()
+    cursor = request.args.get('cursor') or None
+    try:
+        if cursor:
+            decode_cursor(cursor)
+        if request.args.get('format') == 'ndjson' or request.accept_mimetypes.best == 'application/x-ndjson':
+            entries = audit_log.iter_entries(filters, cursor)
+            return Response(stream_with_context(json.dumps(entry) + '\n' for entry in entries),
+                            mimetype='application/x-ndjson')
+        limit = request.args.get('limit', DEFAULT_PAGE_SIZE, type=int)
+        entries, next_cursor = audit_log.page(filters, cursor, limit)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+    response = jsonify(envelope(entries, next_cursor))
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response
+
+def _audit_filters(**fixed):
+    """Audit log filters from the query string; `fixed` ones cannot be overridden"""
+    filters = {
+        'activity_type': request.args.get('type') or request.args.get('activity_type'),
+        'severity': request.args.get('severity'),
+        'since': request.args.get('since'),
+        'until': request.args.get('until'),
+        'source': request.args.get('source'),
+    }
+    filters.update(fixed)
+    return filters
+
 @app.route('/security/audit-logs', methods=['GET', 'OPTIONS'])
+@login_required
 def get_audit_logs():
     if request.method == 'OPTIONS':
         return '', 200
     
-    try:
-        token = request.headers.get('Authorization', '').replace('Bearer ', '')
-        user_data = verify_token(token)
-        if not user_data:
-            return jsonify({'error': 'Unauthorized'}), 401
-        
-        return jsonify([
-            {
-                'id': 1,
-                'action': 'LOGIN',
-                'user': user_data['username'],
-                'timestamp': datetime.now().isoformat(),
-                'ip': '127.0.0.1',
-                'status': 'SUCCESS'
-            },
-            {
-                'id': 2,
-                'action': 'FILE_UPLOAD',
-                'user': user_data['username'],
-                'timestamp': datetime.now().isoformat(),
-                'ip': '127.0.0.1',
-                'status': 'SUCCESS'
-            }
-        ])
-        
-    except Exception as e:
-        return jsonify([])
+    # Users only ever see their own entries
+    return _audit_log_response(
+        _audit_filters(user_id=g.user['user_id']),
+        lambda entries, next_cursor: {'success': True, 'audit_logs': entries, 'next_cursor': next_cursor})
 
 @app.route('/admin/audit-logs', methods=['GET', 'OPTIONS'])
+@login_required
 def get_admin_audit_logs():
     if request.method == 'OPTIONS':
         return '', 200
     
-    try:
-        token = request.headers.get('Authorization', '').replace('Bearer ', '')
-        user_data = verify_token(token)
-        if not user_data:
-            return jsonify({'error': 'Unauthorized'}), 401
-        
-        # Check if user is admin
-        if user_data.get('role') != 'admin':
-            print(f"⚠️ SECURITY ALERT: User '{user_data.get('username')}' (role: {user_data.get('role')}) attempted to access admin audit-logs endpoint")
-            return jsonify({'error': 'Forbidden - Admin access required'}), 403
-        
-        limit = request.args.get('limit', 20, type=int)
-        
-        # Generate comprehensive audit logs
-        audit_logs = []
-        
-        # Recent login activities
-        audit_logs.extend([
-            {
-                'id': 1,
-                'activity_type': 'LOGIN',
-                'description': f'User {user_data["username"]} logged in successfully',
-                'timestamp': datetime.now().isoformat(),
-                'ip_address': '127.0.0.1',
-                'status': 'SUCCESS'
-            },
-            {
-                'id': 2,
-                'activity_type': 'FILE_UPLOAD',
-                'description': f'File uploaded by {user_data["username"]}',
-                'timestamp': (datetime.now() - timedelta(minutes=5)).isoformat(),
-                'ip_address': '127.0.0.1',
-                'status': 'SUCCESS'
-            },
-            {
-                'id': 3,
-                'activity_type': 'SECURITY_SCAN',
-                'description': 'AI security scan completed - no threats detected',
-                'timestamp': (datetime.now() - timedelta(minutes=10)).isoformat(),
-                'ip_address': 'SYSTEM',
-                'status': 'SUCCESS'
-            },
-            {
-                'id': 4,
-                'activity_type': 'SYSTEM',
-                'description': 'Database backup completed successfully',
-                'timestamp': (datetime.now() - timedelta(hours=1)).isoformat(),
-                'ip_address': 'SYSTEM',
-                'status': 'SUCCESS'
-            },
-            {
-                'id': 5,
-                'activity_type': 'LOGIN',
-                'description': f'User admin logged in successfully',
-                'timestamp': (datetime.now() - timedelta(hours=2)).isoformat(),
-                'ip_address': '127.0.0.1',
-                'status': 'SUCCESS'
-            }
-        ])
-        
-        return jsonify(audit_logs[:limit])
-        
-    except Exception as e:
-        print(f"Admin audit logs error: {e}")
-        return jsonify([])
+    user_data = g.user
+    
+    # Check if user is admin
+    if user_data.get('role') != 'admin':
+        log.warning('SECURITY ALERT: non-admin %r (role: %s) attempted to access admin audit-logs', user_data.get('username'), user_data.get('role'))
+        return jsonify({'error': 'Forbidden - Admin access required'}), 403
+    
+    filters = _audit_filters()
+    user = request.args.get('user')
+    if user:
+        if user.isdigit():
+            filters['user_id'] = int(user)
+        else:
+            with get_db() as conn:
+                row = conn.execute('SELECT id FROM users WHERE username = ?', (user,)).fetchone()
+            if row is None:
+                return jsonify([])
+            filters['user_id'] = row[0]
+    
+    # The admin dashboard expects a bare array; the next page's cursor is in X-Next-Cursor
+    return _audit_log_response(filters, lambda entries, next_cursor: entries)
 
 @app.route('/admin/security-alerts', methods=['GET', 'OPTIONS'])
+@login_required
 def get_admin_security_alerts():
     if request.method == 'OPTIONS':
         return '', 200
     
     try:
-        token = request.headers.get('Authorization', '').replace('Bearer ', '')
-        user_data = verify_token(token)
-        if not user_data:
-            return jsonify({'error': 'Unauthorized'}), 401
+        user_data = g.user
         
         # Check if user is admin
         if user_data.get('role') != 'admin':
-            print(f"⚠️ SECURITY ALERT: User '{user_data.get('username')}' (role: {user_data.get('role')}) attempted to access admin security-alerts endpoint")
+            log.warning('SECURITY ALERT: non-admin %r (role: %s) attempted to access admin security-alerts', user_data.get('username'), user_data.get('role'))
             return jsonify({'error': 'Forbidden - Admin access required'}), 403
         
         # Generate security alerts based on system state
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        
-        # Check file upload activity
-        cursor.execute('SELECT COUNT(*) FROM files WHERE upload_date > datetime("now", "-1 hour")')
-        recent_uploads = cursor.fetchone()[0]
-        
-        # Check total file count
-        cursor.execute('SELECT COUNT(*) FROM files')
-        total_files = cursor.fetchone()[0]
-        
-        conn.close()
+        with get_db() as conn:
+            cursor = conn.cursor()
+            
+            # Check file upload activity
+            cursor.execute('SELECT COUNT(*) FROM files WHERE upload_date > datetime("now", "-1 hour")')
+            recent_uploads = cursor.fetchone()[0]
+            
+            # Check total file count
+            cursor.execute('SELECT COUNT(*) FROM files')
+            total_files = cursor.fetchone()[0]
         
         alerts = []
         
@@ -823,20 +885,18 @@ def get_admin_security_alerts():
         return jsonify(alerts)
         
     except Exception as e:
-        print(f"Security alerts error: {e}")
+        log.exception('Security alerts error')
         return jsonify([])
 
 @app.route('/security/scan', methods=['POST', 'OPTIONS'])
+@login_required
 def security_scan():
     """AI-powered security scan for files"""
     if request.method == 'OPTIONS':
         return '', 200
     
     try:
-        token = request.headers.get('Authorization', '').replace('Bearer ', '')
-        user_data = verify_token(token)
-        if not user_data:
-            return jsonify({'error': 'Unauthorized'}), 401
+        user_data = g.user
         
         data = request.get_json()
         file_id = data.get('fileId')
@@ -845,69 +905,33 @@ def security_scan():
             return jsonify({'error': 'File ID required'}), 400
         
         # Get file from database
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute('SELECT filename, secure_filename, file_size FROM files WHERE id = ? AND username = ?', 
-                      (file_id, user_data['username']))
-        file_data = cursor.fetchone()
+        with get_db() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT filename, secure_filename, file_hash FROM files WHERE id = ? AND username = ?', 
+                          (file_id, user_data['username']))
+            file_data = cursor.fetchone()
         
         if not file_data:
-            conn.close()
             return jsonify({'error': 'File not found'}), 404
         
-        filename, secure_filename, file_size = file_data
-        
-        # AI-powered threat detection simulation
-        import random
-        
-        # File extension analysis
-        file_ext = os.path.splitext(filename)[1].lower()
-        executable_exts = ['.exe', '.bat', '.cmd', '.com', '.scr', '.vbs', '.js']
-        
-        # Calculate threat score based on multiple factors
-        threat_score = 0.0
-        threat_reasons = []
-        
-        # File size analysis
-        if file_size > 50 * 1024 * 1024:  # Files > 50MB
-            threat_score += 0.2
-            threat_reasons.append("Large file size detected")
-        
-        # File extension analysis
-        if file_ext in executable_exts:
-            threat_score += 0.7
-            threat_reasons.append("Executable file type detected")
-        elif file_ext in ['.zip', '.rar', '.7z']:
-            threat_score += 0.3
-            threat_reasons.append("Compressed archive detected")
-        
-        # Simulated content analysis
-        random.seed(hash(filename))
-        content_risk = random.random() * 0.3
-        threat_score += content_risk
-        
-        if content_risk > 0.2:
-            threat_reasons.append("Suspicious content patterns detected")
-        
-        # Determine overall threat level
-        if threat_score > 0.7:
-            threat_level = "HIGH"
-            is_safe = False
-        elif threat_score > 0.4:
-            threat_level = "MEDIUM"
-            is_safe = False
-        else:
-            threat_level = "LOW"
-            is_safe = True
-        
-        # Update database with scan results
-        cursor.execute('''
-            UPDATE files SET is_safe = ?, threat_score = ?, last_scan = ?
-            WHERE id = ?
-        ''', (1 if is_safe else 0, threat_score, datetime.now().isoformat(), file_id))
+        filename, secure_filename, file_hash = file_data
         
-        conn.commit()
-        conn.close()
+        known_threat = get_threat_intel().match(file_hash)
+        if known_threat:
+            # Listed hash: no need to run the analysis engine
+            analysis = known_threat_analysis(known_threat, file_hash)
+            with get_db() as conn:
+                record_scan_verdict(conn, file_id, analysis)
+        else:
+            if not os.path.exists(get_blob_store().resolve(secure_filename, file_hash)):
+                return jsonify({'error': 'File not found on disk'}), 404
+            
+            # AI threat analysis; content already analysed by this engine version is a cache hit
+            analysis = scan_stored_file(file_id, filename, secure_filename, file_hash)
+        threat_score = analysis['threat_score']
+        threat_reasons = analysis['risk_factors']
+        is_safe = analysis['is_safe']
+        threat_level = threat_level_for(threat_score)
         
         return jsonify({
             'success': True,
@@ -919,6 +943,8 @@ def security_scan():
                 'threatScore': round(threat_score, 2),
                 'scanDate': datetime.now().isoformat(),
                 'threats': threat_reasons,
+                'cached': analysis['cached'],
+                'knownThreat': known_threat,
                 'recommendations': [
                     "File has been analyzed using AI threat detection",
                     "Consider additional verification for high-risk files",
@@ -932,91 +958,136 @@ def security_scan():
         })
         
     except Exception as e:
-        print(f"Security scan error: {e}")
+        log.exception('Security scan error')
         return jsonify({'error': f'Scan failed: {str(e)}'}), 500
 
 @app.route('/security/scan-all', methods=['POST', 'OPTIONS'])
+@login_required
 def scan_all_files():
-    """Scan all user files for threats"""
+    """Queue a background scan of all user files"""
     if request.method == 'OPTIONS':
         return '', 200
     
     try:
-        token = request.headers.get('Authorization', '').replace('Bearer ', '')
-        user_data = verify_token(token)
-        if not user_data:
-            return jsonify({'error': 'Unauthorized'}), 401
-        
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute('SELECT id FROM files WHERE username = ?', (user_data['username'],))
-        file_ids = [row[0] for row in cursor.fetchall()]
-        conn.close()
-        
-        scanned_files = []
-        threats_found = 0
-        
-        for file_id in file_ids:
-            # Use the security scan logic for each file
-            scan_result = security_scan()  # This would call the scan logic
-            if scan_result and not scan_result.get('file', {}).get('safe', True):
-                threats_found += 1
-            scanned_files.append({'id': file_id, 'scanned': True})
+        user_data = g.user
+        
+        data = request.get_json(silent=True) or {}
+        try:
+            priority = int(data.get('priority', 50))
+        except (TypeError, ValueError):
+            return jsonify({'error': 'priority must be an integer'}), 400
+        
+        with get_db() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT id FROM files WHERE username = ? ORDER BY id', (user_data['username'],))
+            file_ids = [row[0] for row in cursor.fetchall()]
+        
+        batch_id = get_scan_scheduler().submit_batch(user_data['user_id'], user_data['username'], file_ids, priority)
         
         return jsonify({
             'success': True,
+            'batchId': batch_id,
             'totalFiles': len(file_ids),
-            'threatsFound': threats_found,
-            'scanComplete': True,
+            'statusUrl': f'/security/scan-jobs/{batch_id}',
+            'resultsUrl': f'/security/scan-jobs/{batch_id}/results',
             'timestamp': datetime.now().isoformat(),
-            'summary': f"Scanned {len(file_ids)} files, found {threats_found} potential threats"
-        })
+            'summary': f"Queued {len(file_ids)} files for scanning"
+        }), 202
         
     except Exception as e:
-        print(f"Scan all error: {e}")
+        log.exception('Scan all error')
         return jsonify({'error': f'Bulk scan failed: {str(e)}'}), 500
 
-@app.route('/stats', methods=['GET', 'OPTIONS'])
-def get_stats():
+@app.route('/security/scan-jobs/<batch_id>', methods=['GET', 'OPTIONS'])
+@login_required
+def scan_batch_status(batch_id):
+    """Progress of a bulk scan batch"""
     if request.method == 'OPTIONS':
         return '', 200
     
     try:
-        token = request.headers.get('Authorization', '').replace('Bearer ', '')
-        user_data = verify_token(token)
-        if not user_data:
-            return jsonify({'error': 'Unauthorized'}), 401
+        user_data = g.user
         
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
+        progress = get_scan_scheduler().batch_progress(batch_id, user_data['username'])
+        if progress is None:
+            return jsonify({'error': 'Scan batch not found'}), 404
         
-        cursor.execute('SELECT COUNT(*) FROM users')
-        total_users = cursor.fetchone()[0]
+        return jsonify({'success': True, **progress})
         
-        cursor.execute('SELECT COUNT(*) FROM files')
-        total_files = cursor.fetchone()[0]
+    except Exception as e:
+        log.exception('Scan batch status error')
+        return jsonify({'error': f'Failed to get scan status: {str(e)}'}), 500
+
+@app.route('/security/scan-jobs/<batch_id>/results', methods=['GET', 'OPTIONS'])
+@login_required
+def scan_batch_results(batch_id):
+    """Stream finished job results as NDJSON; follow=1 keeps streaming until the batch is done"""
+    if request.method == 'OPTIONS':
+        return '', 200
+    
+    user_data = g.user
+    
+    scheduler = get_scan_scheduler()
+    if scheduler.batch_progress(batch_id, user_data['username']) is None:
+        return jsonify({'error': 'Scan batch not found'}), 404
+    
+    follow = request.args.get('follow', '').lower() in ('1', 'true', 'yes')
+    results = scheduler.iter_results(batch_id, user_data['username'], follow=follow)
+    return Response(stream_with_context(json.dumps(result) + '\n' for result in results),
+                    mimetype='application/x-ndjson')
+
+@app.route('/stats', methods=['GET', 'OPTIONS'])
+@login_required
+def get_stats():
+    if request.method == 'OPTIONS':
+        return '', 200
+    
+    try:
+        user_data = g.user
         
-        conn.close()
+        with get_db() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('SELECT COUNT(*) FROM users')
+            total_users = cursor.fetchone()[0]
+            
+            cursor.execute('SELECT COUNT(*) FROM files')
+            total_files = cursor.fetchone()[0]
+            
+            cursor.execute("SELECT COALESCE(SUM(events), 0) FROM activity_hourly WHERE activity_type = 'LOGIN'")
+            total_logins = cursor.fetchone()[0]
+            
+            cursor.execute('SELECT COALESCE(SUM(total_size), 0) FROM user_storage_stats')
+            storage_used = cursor.fetchone()[0]
         
+        requests_summary = metrics.summary()
         return jsonify({
             'totalUsers': total_users,
             'totalFiles': total_files,
-            'totalLogins': 25,
+            'totalLogins': total_logins,
             'activeUsers': total_users,
-            'storageUsed': total_files * 1024,
+            'storageUsed': storage_used,
             'threatLevel': 'LOW',
-            'systemHealth': 'Good',
-            'uptime': '99.9%',
+            'systemHealth': 'Good' if requests_summary['errorRate'] < 5 else 'Degraded',
+            'uptime': format_uptime(requests_summary['uptimeSeconds']),
+            'uptimeSeconds': requests_summary['uptimeSeconds'],
+            'avgResponseTime': requests_summary['avgResponseTime'],
+            'requestsPerHour': requests_summary['requestsPerHour'],
+            'errorRate': requests_summary['errorRate'],
             'lastActivity': datetime.now().isoformat()
         })
         
     except Exception as e:
-        return jsonify({
-            'totalUsers': 2, 'totalFiles': 5, 'totalLogins': 25,
-            'activeUsers': 2, 'storageUsed': 5120, 'threatLevel': 'LOW',
-            'systemHealth': 'Good', 'uptime': '99.9%',
-            'lastActivity': datetime.now().isoformat()
-        })
+        log.exception('Stats error')
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Request metrics in the Prometheus text exposition format"""
+    if METRICS_TOKEN and not secrets.compare_digest(request.headers.get('Authorization', ''),
+                                                    f'Bearer {METRICS_TOKEN}'):
+        return jsonify({'error': 'Unauthorized'}), 401
+    return Response(metrics.render_prometheus(), mimetype='text/plain; version=0.0.4')
 
 # ==================== FRONTEND SERVING (Production) ====================
 
@@ -1041,13 +1112,17 @@ def serve_frontend(path):
     })
 
 if __name__ == '__main__':
+    startup_profile.mark('app and routes')
     print("🚀 === SmartSecure Sri Lanka - FINAL WORKING Backend ===")
     print(f"📁 Database: {DB_PATH}")
     
     if os.path.exists(DB_PATH):
         print("✅ Database found")
-        try:
-            conn = sqlite3.connect(DB_PATH)
+    else:
+        print("⚠️ Database not found, creating an empty one")
+    try:
+        with get_db() as conn:
+            print(f"🗄️ Schema version: {LATEST_VERSION}")
             cursor = conn.cursor()
             cursor.execute('SELECT COUNT(*) FROM users')
             user_count = cursor.fetchone()[0]
@@ -1056,12 +1131,18 @@ if __name__ == '__main__':
             cursor.execute('SELECT COUNT(*) FROM files')
             file_count = cursor.fetchone()[0]
             print(f"📁 Files in database: {file_count}")
-            
-            conn.close()
-        except Exception as e:
-            print(f"⚠️ Database check error: {e}")
-    else:
-        print("❌ Database not found")
+    except Exception as e:
+        print(f"⚠️ Database check error: {e}")
+    startup_profile.mark('database check')
+    
+    # Behavioral model is (re)trained off the request path; requests only score it
+    ModelRefresher(DB_PATH, get_threat_detector().anomaly_models).start()
+    # The hash index is rebuilt from threat_intelligence if it is missing or older than the table
+    threading.Thread(target=get_threat_intel().rebuild_if_stale, name='threat-index-build', daemon=True).start()
+    # The default dashboard window is computed before the first request asks for it
+    analytics_cache.prefetch((DB_PATH, ANALYTICS_DEFAULT_DAYS),
+                             lambda: _compute_dashboard_analytics(DB_PATH, ANALYTICS_DEFAULT_DAYS))
+    startup_profile.mark('background services')
     
     print("\n🔑 LOGIN CREDENTIALS:")
     print("   Username: admin")
@@ -1078,6 +1159,7 @@ if __name__ == '__main__':
     print("   POST /logout               - User logout")
     print("   POST /upload               - File upload")
     print("   GET  /files                - List files")
+    print("   DELETE /files/<id>         - Delete file")
     print("   GET  /files/storage-stats  - Storage statistics")
     print("   GET  /download/<filename>  - Download files")
     print("   GET  /analytics            - Basic analytics")
@@ -1088,10 +1170,16 @@ if __name__ == '__main__':
     print("   GET  /security/status      - Security monitoring")
     print("   GET  /security/audit-logs  - User audit logs")
     print("   POST /security/scan        - AI threat scanning")
-    print("   POST /security/scan-all    - Bulk file scanning")
+    print("   POST /security/scan-all    - Queue bulk file scan")
+    print("   GET  /security/scan-jobs/<id>- Bulk scan progress")
+    print("   GET  /security/scan-jobs/<id>/results - Bulk scan results (NDJSON)")
     print("   GET  /stats                - Dashboard stats")
     print("=" * 70)
     
+    profile = startup_profile.report()
+    if profile:
+        print(profile)
+    
     try:
         # Get port from environment variable (for Railway/Render) or default to 5004
         port = int(os.environ.get('PORT', 5004))
@@ -4,6 +4,8 @@ import sqlite3
 import bcrypt
 from datetime import datetime
 
+from migrations import apply_migrations
+
 def fix_database():
     """Fix database schema issues"""
     try:
@@ -19,13 +21,9 @@ def fix_database():
         for col in columns:
             print(f"  {col[1]} {col[2]}")
         
-        # Check if is_active column exists
-        column_names = [col[1] for col in columns]
-        
-        if 'is_active' not in column_names:
-            print("\nAdding missing 'is_active' column...")
-            cursor.execute('ALTER TABLE users ADD COLUMN is_active INTEGER DEFAULT 1')
-            print("✅ Added is_active column")
+        # Missing columns are added by the migration runner
+        applied = apply_migrations(conn)
+        print(f"\n✅ Schema up to date (applied {applied or 'nothing'})")
         
         # Update all existing users to be active
         cursor.execute('UPDATE users SET is_active = 1 WHERE is_active IS NULL')
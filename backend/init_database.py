@@ -8,6 +8,8 @@ import bcrypt
 import os
 from datetime import datetime
 
+from migrations import apply_migrations
+
 def create_database():
     # Remove existing database
     if os.path.exists('smartsecure.db'):
@@ -18,60 +20,8 @@ def create_database():
     conn = sqlite3.connect('smartsecure.db')
     cursor = conn.cursor()
     
-    # Create users table
-    cursor.execute('''
-        CREATE TABLE users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            username TEXT UNIQUE NOT NULL,
-            password_hash TEXT NOT NULL,
-            email TEXT NOT NULL,
-            created_date TEXT NOT NULL,
-            last_login TEXT,
-            is_active INTEGER DEFAULT 1
-        )
-    ''')
-    
-    # Create files table
-    cursor.execute('''
-        CREATE TABLE files (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            filename TEXT NOT NULL,
-            secure_filename TEXT NOT NULL,
-            original_filename TEXT NOT NULL,
-            username TEXT NOT NULL,
-            upload_date TEXT NOT NULL,
-            file_size INTEGER,
-            file_path TEXT NOT NULL,
-            is_safe BOOLEAN DEFAULT 1,
-            threat_score REAL DEFAULT 0.0,
-            scan_status TEXT DEFAULT 'pending'
-        )
-    ''')
-    
-    # Create audit_logs table
-    cursor.execute('''
-        CREATE TABLE audit_logs (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            username TEXT NOT NULL,
-            action TEXT NOT NULL,
-            details TEXT,
-            timestamp TEXT NOT NULL,
-            ip_address TEXT,
-            user_agent TEXT
-        )
-    ''')
-    
-    # Create security_alerts table
-    cursor.execute('''
-        CREATE TABLE security_alerts (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            alert_type TEXT NOT NULL,
-            severity TEXT NOT NULL,
-            message TEXT NOT NULL,
-            timestamp TEXT NOT NULL,
-            resolved BOOLEAN DEFAULT 0
-        )
-    ''')
+    # Tables and indexes come from the migration runner
+    apply_migrations(conn)
     
     # Create default users
     users = [
@@ -0,0 +1,267 @@
+"""
+Batched Activity and Audit Log Writer
+SmartSecure Sri Lanka - background, multi-row inserts for activity_logs and security_events
+"""
+import atexit
+import json
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+from typing import Deque, Dict, List, Optional, Tuple
+
+from db_pool import get_pool
+from request_logging import get_logger
+
+log = get_logger(__name__)
+
+# A batch is written once this many events are queued...
+DEFAULT_BATCH_SIZE = int(os.getenv('SMARTSECURE_LOG_BATCH_SIZE', 200))
+# ...or this long after the oldest queued event arrived
+DEFAULT_FLUSH_INTERVAL_MS = int(os.getenv('SMARTSECURE_LOG_FLUSH_MS', 500))
+# Events held in memory before the overflow policy applies
+DEFAULT_MAX_QUEUE = int(os.getenv('SMARTSECURE_LOG_QUEUE', 10000))
+# 'spill' appends to <db>.log-spill.ndjson and replays it later; 'drop_newest' / 'drop_oldest' discard
+DEFAULT_OVERFLOW = os.getenv('SMARTSECURE_LOG_OVERFLOW', 'spill')
+OVERFLOW_POLICIES = ('spill', 'drop_newest', 'drop_oldest')
+
+ACTIVITY = 'activity'
+SECURITY = 'security'
+INSERTS = {
+    ACTIVITY: 'INSERT INTO activity_logs (user_id, activity_type, description, timestamp) VALUES (?, ?, ?, ?)',
+    SECURITY: '''INSERT INTO security_events (user_id, event_type, threat_level, description, timestamp)
+                 VALUES (?, ?, ?, ?, ?)''',
+}
+
+LogEvent = Tuple[str, tuple]
+
+
+def utc_timestamp() -> str:
+    """Timestamp for a log row: naive ISO-8601 UTC, like SQLite's datetime('now') and the rollups"""
+    return datetime.now(timezone.utc).replace(tzinfo=None).isoformat()
+
+
+class LogWriter:
+    """Queue of log rows written by one daemon thread in multi-row transactions.
+
+    log_activity() and log_security_event() only append to an in-memory
+    queue, so callers never wait on SQLite or an fsync. When the queue holds
+    `max_queue` events the overflow policy decides: 'spill' appends the
+    event to a side file (a buffered write, no fsync, made after releasing
+    the queue lock) that the writer replays once it catches up,
+    'drop_newest' discards the new event and 'drop_oldest' the oldest
+    queued one. A batch that fails to write is
+    spilled too. close() drains the queue; it is registered at exit.
+    """
+
+    def __init__(self, db_path: str, batch_size: int = DEFAULT_BATCH_SIZE,
+                 flush_interval_ms: int = DEFAULT_FLUSH_INTERVAL_MS, max_queue: int = DEFAULT_MAX_QUEUE,
+                 overflow: str = DEFAULT_OVERFLOW, spill_path: Optional[str] = None):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f'Unknown overflow policy {overflow!r}, expected one of {OVERFLOW_POLICIES}')
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000.0
+        self.max_queue = max_queue
+        self.overflow = overflow
+        self.spill_path = spill_path or f'{db_path}.log-spill.ndjson'
+        self._queue: Deque[LogEvent] = deque()
+        self._oldest_at = 0.0
+        self._cond = threading.Condition()
+        self._spill_lock = threading.Lock()
+        # Sequence numbers of accepted and of settled (written, spilled or dropped) events
+        self._accepted = 0
+        self._settled = 0
+        self._flush_requested = False
+        self._closed = False
+        self.written = 0
+        self.dropped = 0
+        self.spilled = 0
+        self._thread = threading.Thread(target=self._run, name='log-writer', daemon=True)
+        self._thread.start()
+
+    # -- producers (request threads) --
+
+    def log_activity(self, user_id: Optional[int], activity_type: str, description: str,
+                     timestamp: Optional[str] = None) -> bool:
+        return self._put((ACTIVITY, (user_id, activity_type, description, timestamp or utc_timestamp())))
+
+    def log_security_event(self, user_id: Optional[int], event_type: str, threat_level: str, description: str,
+                           timestamp: Optional[str] = None) -> bool:
+        return self._put((SECURITY, (user_id, event_type, threat_level, description,
+                                     timestamp or utc_timestamp())))
+
+    def _put(self, event: LogEvent) -> bool:
+        """Queue one event; False if the overflow policy dropped it"""
+        spill = False
+        with self._cond:
+            if self._closed:
+                closed = True
+            else:
+                closed = False
+                self._accepted += 1
+                if len(self._queue) >= self.max_queue:
+                    if self.overflow == 'drop_newest':
+                        self.dropped += 1
+                        self._settled += 1
+                        return False
+                    if self.overflow == 'spill':
+                        spill = True
+                    else:
+                        self._queue.popleft()
+                        self.dropped += 1
+                        self._settled += 1
+                if not spill:
+                    if not self._queue:
+                        self._oldest_at = time.monotonic()
+                    self._queue.append(event)
+                    if len(self._queue) == 1 or len(self._queue) >= self.batch_size:
+                        self._cond.notify_all()
+        if spill:
+            # The file write happens outside the queue lock, so other producers
+            # and the writer thread never wait on it
+            spilled = self._spill([event])
+            with self._cond:
+                self._settled += 1
+                self._cond.notify_all()
+            return spilled
+        if closed:
+            # Late events during interpreter shutdown are written directly
+            return self._write([event])
+        return True
+
+    # -- control --
+
+    def flush(self, timeout: float = 10.0) -> bool:
+        """Block until everything queued so far is written; True unless it timed out"""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            target = self._accepted
+            self._flush_requested = True
+            self._cond.notify_all()
+            while self._settled < target and self._thread.is_alive():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def close(self, timeout: float = 10.0):
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+
+    def stats(self) -> Dict[str, int]:
+        with self._cond:
+            return {'queued': len(self._queue), 'written': self.written, 'dropped': self.dropped,
+                    'spilled': self.spilled}
+
+    # -- writer thread --
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._queue and not self._closed and not self._flush_requested:
+                    self._cond.wait()
+                while (self._queue and len(self._queue) < self.batch_size
+                       and not self._closed and not self._flush_requested):
+                    remaining = self._oldest_at + self.flush_interval - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch = list(self._queue)
+                self._queue.clear()
+                self._flush_requested = False
+                closing = self._closed
+
+            if batch:
+                self._write(batch)
+            self._replay_spill()
+            with self._cond:
+                self._settled += len(batch)
+                self._cond.notify_all()
+            if closing:
+                return
+
+    def _write(self, batch: List[LogEvent]) -> bool:
+        rows: Dict[str, List[tuple]] = {}
+        for table, row in batch:
+            rows.setdefault(table, []).append(row)
+        try:
+            with get_pool(self.db_path).connection() as conn:
+                for table, table_rows in rows.items():
+                    conn.executemany(INSERTS[table], table_rows)
+        except Exception as e:
+            log.warning('Log writer could not write %d events to %s: %s', len(batch), self.db_path, e)
+            return self._spill(batch)
+        self.written += len(batch)
+        return True
+
+    def _spill(self, events: List[LogEvent]) -> bool:
+        with self._spill_lock:
+            try:
+                with open(self.spill_path, 'a', encoding='utf-8') as f:
+                    f.writelines(json.dumps([table, list(row)]) + '\n' for table, row in events)
+            except OSError as e:
+                log.error('Dropping %d log events, spill file unavailable: %s', len(events), e)
+                self.dropped += len(events)
+                return False
+            self.spilled += len(events)
+        return True
+
+    def _replay_spill(self):
+        """Write back events spilled under pressure, once the queue has room again"""
+        if not os.path.exists(self.spill_path) or len(self._queue) >= self.max_queue // 2:
+            return
+        replay_path = f'{self.spill_path}.{os.getpid()}.replay'
+        try:
+            with self._spill_lock:
+                os.replace(self.spill_path, replay_path)
+            with open(replay_path, 'r', encoding='utf-8') as f:
+                events = [(table, tuple(row)) for table, row in map(json.loads, f)]
+        except (OSError, ValueError) as e:
+            log.warning('Could not replay spilled log events from %s: %s', self.spill_path, e)
+            return
+        for start in range(0, len(events), self.batch_size):
+            if not self._write(events[start:start + self.batch_size]):
+                # That chunk was spilled again; keep the rest with it for the next attempt
+                rest = events[start + self.batch_size:]
+                if rest:
+                    self._spill(rest)
+                break
+        os.unlink(replay_path)
+
+
+_writers: Dict[str, LogWriter] = {}
+_writers_lock = threading.Lock()
+_atexit_registered = False
+
+
+def get_log_writer(db_path) -> LogWriter:
+    """Return the shared writer for a database file, starting it on first use"""
+    global _atexit_registered
+    key = os.path.abspath(str(db_path))
+    writer = _writers.get(key)
+    if writer is None:
+        with _writers_lock:
+            writer = _writers.get(key)
+            if writer is None:
+                if not _atexit_registered:
+                    atexit.register(close_all_writers)
+                    _atexit_registered = True
+                writer = LogWriter(key)
+                _writers[key] = writer
+    return writer
+
+
+def close_all_writers():
+    """Flush and stop every writer (at exit, and between tests)"""
+    with _writers_lock:
+        writers = list(_writers.values())
+        _writers.clear()
+    for writer in writers:
+        writer.close()
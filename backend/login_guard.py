@@ -0,0 +1,134 @@
+"""
+Login Throttling
+SmartSecure Sri Lanka - rate limits, bounded bcrypt verification and audit of failed logins
+"""
+import os
+import threading
+import time
+from concurrent import futures
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional, Tuple
+
+import bcrypt
+
+from security import SecurityAudit
+
+# Attempts allowed in a burst, then refilled per minute
+USER_BURST = int(os.getenv('SMARTSECURE_LOGIN_USER_BURST', '5'))
+USER_PER_MINUTE = float(os.getenv('SMARTSECURE_LOGIN_USER_PER_MINUTE', '5'))
+IP_BURST = int(os.getenv('SMARTSECURE_LOGIN_IP_BURST', '20'))
+IP_PER_MINUTE = float(os.getenv('SMARTSECURE_LOGIN_IP_PER_MINUTE', '30'))
+
+# bcrypt checks running at once, and waiting, before new logins get a 429
+VERIFY_WORKERS = int(os.getenv('SMARTSECURE_LOGIN_WORKERS', str(min(4, os.cpu_count() or 1))))
+VERIFY_QUEUE = int(os.getenv('SMARTSECURE_LOGIN_QUEUE', str(VERIFY_WORKERS * 4)))
+VERIFY_TIMEOUT_SECONDS = 10.0
+
+
+class VerifierBusy(Exception):
+    """Too many password checks are already queued"""
+
+
+class TokenBucketLimiter:
+    """Per-key token buckets: `burst` attempts at once, refilled at `per_minute`.
+
+    Buckets live in memory; once there are more than `max_keys`, buckets that
+    have refilled completely (idle keys) are dropped.
+    """
+
+    def __init__(self, burst: int, per_minute: float, max_keys: int = 100_000,
+                 clock: Callable[[], float] = time.monotonic):
+        self.burst = burst
+        self.rate = per_minute / 60.0
+        self.max_keys = max_keys
+        self.clock = clock
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, key: str) -> float:
+        """Take one token for `key`; returns 0 if allowed, else seconds until one is available"""
+        now = self.clock()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            if tokens < 1:
+                self._buckets[key] = (tokens, now)
+                return (1 - tokens) / self.rate if self.rate else float('inf')
+            self._buckets[key] = (tokens - 1, now)
+            if len(self._buckets) > self.max_keys:
+                self._prune(now)
+        return 0.0
+
+    def _prune(self, now: float):
+        full_after = self.burst / self.rate if self.rate else float('inf')
+        self._buckets = {key: bucket for key, bucket in self._buckets.items() if now - bucket[1] < full_after}
+
+
+class PasswordVerifier:
+    """bcrypt checks on a small dedicated pool, so login storms cannot occupy every request thread.
+
+    At most `max_pending` checks may be running or queued; beyond that
+    check() raises VerifierBusy immediately. Unknown users are checked
+    against a dummy hash of the default cost so they take as long as a
+    real mismatch; the dummy is hashed on the pool as soon as the verifier
+    is created, not during the first unknown-user login.
+    """
+
+    def __init__(self, max_workers: int = VERIFY_WORKERS, max_pending: int = VERIFY_QUEUE,
+                 dummy_rounds: Optional[int] = None):
+        self.max_pending = max_pending
+        self.dummy_rounds = dummy_rounds or int(os.getenv('BCRYPT_ROUNDS', 12))
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='bcrypt')
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._dummy_hash = self._executor.submit(bcrypt.hashpw, os.urandom(16),
+                                                 bcrypt.gensalt(rounds=self.dummy_rounds))
+
+    def _dummy(self) -> bytes:
+        try:
+            return self._dummy_hash.result(timeout=VERIFY_TIMEOUT_SECONDS)
+        except futures.TimeoutError:
+            raise VerifierBusy()
+
+    def check(self, password: str, password_hash: Optional[str]) -> bool:
+        """True if `password` matches; a missing hash always costs one check and fails"""
+        if not self._slots.acquire(blocking=False):
+            raise VerifierBusy()
+        try:
+            hashed = password_hash.encode('utf-8') if password_hash else self._dummy()
+            future = self._executor.submit(bcrypt.checkpw, password.encode('utf-8'), hashed)
+            try:
+                matched = future.result(timeout=VERIFY_TIMEOUT_SECONDS)
+            except futures.TimeoutError:  # only an alias of the builtin TimeoutError from Python 3.11
+                future.cancel()
+                raise VerifierBusy()
+            return matched and password_hash is not None
+        finally:
+            self._slots.release()
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+class LoginGuard:
+    """Everything /login consults before and after checking a password"""
+
+    def __init__(self, verifier: Optional[PasswordVerifier] = None, user_limiter: Optional[TokenBucketLimiter] = None,
+                 ip_limiter: Optional[TokenBucketLimiter] = None):
+        self.verifier = verifier or PasswordVerifier()
+        self.user_limiter = user_limiter or TokenBucketLimiter(USER_BURST, USER_PER_MINUTE)
+        self.ip_limiter = ip_limiter or TokenBucketLimiter(IP_BURST, IP_PER_MINUTE)
+
+    def admit(self, username: str, ip_address: str) -> float:
+        """0 if this attempt may proceed, else seconds to wait; the IP limit is checked first"""
+        retry_after = self.ip_limiter.acquire(ip_address)
+        if retry_after:
+            return retry_after
+        return self.user_limiter.acquire(username.lower())
+
+    def check_password(self, password: str, password_hash: Optional[str]) -> bool:
+        return self.verifier.check(password, password_hash)
+
+    def record_failure(self, db_path: str, user_id: Optional[int], username: str, ip_address: str, reason: str):
+        """Audit a failed attempt as a SECURITY_LOGIN_FAILED activity row"""
+        SecurityAudit.log_security_event(db_path, user_id, 'LOGIN_FAILED', f"Failed login for '{username}': {reason}",
+                                         ip_address=ip_address, severity='WARNING')
@@ -0,0 +1,571 @@
+#!/usr/bin/env python3
+"""
+Schema Migrations
+SmartSecure Sri Lanka - versioned schema for the core tables, and query plan checks for hot queries
+
+Usage:
+    python migrations.py [--db smartsecure.db]            apply pending migrations
+    python migrations.py --status                         show the applied version
+    python migrations.py --check-plans                    fail if a hot query falls back to a full SCAN
+"""
+import argparse
+import sqlite3
+import sys
+import threading
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+from request_logging import get_logger
+
+log = get_logger(__name__)
+
+SCHEMA_MIGRATIONS_TABLE = '''CREATE TABLE IF NOT EXISTS schema_migrations (
+    version INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    applied_at TEXT NOT NULL
+)'''
+
+CORE_TABLES = [
+    '''CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT UNIQUE NOT NULL,
+        password_hash TEXT NOT NULL,
+        email TEXT,
+        created_date TEXT NOT NULL,
+        last_login TEXT,
+        is_active INTEGER DEFAULT 1,
+        role TEXT DEFAULT 'user'
+    )''',
+    '''CREATE TABLE IF NOT EXISTS files (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT NOT NULL,
+        filename TEXT NOT NULL,
+        secure_filename TEXT NOT NULL,
+        file_size INTEGER NOT NULL,
+        upload_date TEXT NOT NULL,
+        file_hash TEXT,
+        mime_type TEXT,
+        threat_score REAL DEFAULT 0.0,
+        is_safe INTEGER DEFAULT 1,
+        file_category TEXT DEFAULT 'unknown',
+        last_scan TEXT
+    )''',
+    '''CREATE TABLE IF NOT EXISTS activity_logs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER,
+        activity_type TEXT,
+        description TEXT,
+        timestamp TEXT
+    )''',
+    '''CREATE TABLE IF NOT EXISTS security_events (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER,
+        event_type TEXT NOT NULL,
+        threat_level TEXT NOT NULL,
+        description TEXT,
+        timestamp TEXT NOT NULL,
+        resolved INTEGER DEFAULT 0
+    )''',
+    '''CREATE TABLE IF NOT EXISTS system_metrics (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        metric_name TEXT NOT NULL,
+        metric_value REAL NOT NULL,
+        recorded_at TEXT NOT NULL
+    )''',
+]
+
+# Columns that databases created by the older setup scripts may lack
+LATER_COLUMNS = {
+    'users': [('last_login', 'TEXT'), ('is_active', 'INTEGER DEFAULT 1'), ('role', "TEXT DEFAULT 'user'")],
+    'files': [('file_hash', 'TEXT'), ('mime_type', 'TEXT'), ('threat_score', 'REAL DEFAULT 0.0'),
+              ('is_safe', 'INTEGER DEFAULT 1'), ('file_category', "TEXT DEFAULT 'unknown'"), ('last_scan', 'TEXT')],
+    'activity_logs': [('activity_type', 'TEXT'), ('timestamp', 'TEXT')],
+}
+# The first create_fresh_database.py called activity_type 'action' and made it NOT NULL
+LEGACY_ACTIVITY_COLUMN = 'action'
+
+HOT_QUERY_INDEXES = [
+    # File listing, storage totals and per-user lookups
+    'CREATE INDEX IF NOT EXISTS idx_files_username_upload_date ON files (username, upload_date)',
+    'CREATE INDEX IF NOT EXISTS idx_files_secure_filename ON files (secure_filename)',
+    'CREATE INDEX IF NOT EXISTS idx_files_file_hash ON files (file_hash)',
+    'CREATE INDEX IF NOT EXISTS idx_files_upload_date ON files (upload_date)',
+    # Per-user history, per-type trends and the audit log (an index on timestamp is one on (timestamp, id))
+    'CREATE INDEX IF NOT EXISTS idx_activity_logs_user_timestamp ON activity_logs (user_id, timestamp)',
+    'CREATE INDEX IF NOT EXISTS idx_activity_logs_type_timestamp ON activity_logs (activity_type, timestamp)',
+    'CREATE INDEX IF NOT EXISTS idx_activity_logs_timestamp ON activity_logs (timestamp)',
+    'CREATE INDEX IF NOT EXISTS idx_security_events_timestamp ON security_events (timestamp)',
+]
+
+
+# Per-user totals and breakdowns, maintained by triggers in the same transaction as the files change
+USER_STORAGE_TABLES = [
+    '''CREATE TABLE IF NOT EXISTS user_storage_stats (
+        username TEXT PRIMARY KEY,
+        file_count INTEGER NOT NULL DEFAULT 0,
+        total_size INTEGER NOT NULL DEFAULT 0,
+        updated_at TEXT
+    )''',
+    '''CREATE TABLE IF NOT EXISTS user_storage_breakdown (
+        username TEXT NOT NULL,
+        dimension TEXT NOT NULL,
+        value TEXT NOT NULL,
+        file_count INTEGER NOT NULL DEFAULT 0,
+        total_size INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (username, dimension, value)
+    ) WITHOUT ROWID''',
+]
+
+# Lower-case text after the last '.', like os.path.splitext; '' when there is none
+EXTENSION_SQL = ("CASE WHEN instr({row}.filename, '.') = 0 THEN '' ELSE lower(substr({row}.filename, "
+                 "length(rtrim({row}.filename, replace({row}.filename, '.', ''))) + 1)) END")
+BREAKDOWN_DIMENSIONS = {
+    'extension': EXTENSION_SQL,
+    'category': "COALESCE({row}.file_category, 'unknown')",
+}
+
+
+def _storage_added(row: str) -> str:
+    statements = [f'''INSERT INTO user_storage_stats (username, file_count, total_size, updated_at)
+        VALUES ({row}.username, 1, COALESCE({row}.file_size, 0), datetime('now'))
+        ON CONFLICT (username) DO UPDATE SET file_count = file_count + 1,
+            total_size = total_size + excluded.total_size, updated_at = excluded.updated_at;''']
+    for dimension, value in BREAKDOWN_DIMENSIONS.items():
+        statements.append(f'''INSERT INTO user_storage_breakdown (username, dimension, value, file_count, total_size)
+        VALUES ({row}.username, '{dimension}', {value.format(row=row)}, 1, COALESCE({row}.file_size, 0))
+        ON CONFLICT (username, dimension, value) DO UPDATE SET file_count = file_count + 1,
+            total_size = total_size + excluded.total_size;''')
+    return '\n'.join(statements)
+
+
+def _storage_removed(row: str) -> str:
+    statements = [f'''UPDATE user_storage_stats SET file_count = file_count - 1,
+        total_size = total_size - COALESCE({row}.file_size, 0), updated_at = datetime('now')
+        WHERE username = {row}.username;''']
+    for dimension, value in BREAKDOWN_DIMENSIONS.items():
+        statements.append(f'''UPDATE user_storage_breakdown SET file_count = file_count - 1,
+        total_size = total_size - COALESCE({row}.file_size, 0)
+        WHERE username = {row}.username AND dimension = '{dimension}' AND value = {value.format(row=row)};''')
+    statements.append(f"DELETE FROM user_storage_breakdown WHERE username = {row}.username AND file_count <= 0;")
+    return '\n'.join(statements)
+
+
+USER_STORAGE_TRIGGERS = [
+    f'''CREATE TRIGGER IF NOT EXISTS trg_files_storage_insert AFTER INSERT ON files
+    BEGIN
+    {_storage_added('NEW')}
+    END''',
+    f'''CREATE TRIGGER IF NOT EXISTS trg_files_storage_delete AFTER DELETE ON files
+    BEGIN
+    {_storage_removed('OLD')}
+    END''',
+    f'''CREATE TRIGGER IF NOT EXISTS trg_files_storage_update
+    AFTER UPDATE OF username, filename, file_size, file_category ON files
+    BEGIN
+    {_storage_removed('OLD')}
+    {_storage_added('NEW')}
+    END''',
+]
+
+
+# Hourly / daily rollups for the analytics dashboards, updated by triggers as rows arrive.
+# Rows that are deleted later still count: the rollups record what happened in each period.
+ANALYTICS_ROLLUP_TABLES = [
+    '''CREATE TABLE IF NOT EXISTS activity_hourly (
+        hour TEXT NOT NULL,
+        activity_type TEXT NOT NULL,
+        events INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (hour, activity_type)
+    ) WITHOUT ROWID''',
+    '''CREATE TABLE IF NOT EXISTS activity_users_daily (
+        day TEXT NOT NULL,
+        user_id INTEGER NOT NULL,
+        events INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (day, user_id)
+    ) WITHOUT ROWID''',
+    '''CREATE TABLE IF NOT EXISTS security_events_daily (
+        day TEXT NOT NULL,
+        threat_level TEXT NOT NULL,
+        events INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (day, threat_level)
+    ) WITHOUT ROWID''',
+    '''CREATE TABLE IF NOT EXISTS uploads_daily (
+        day TEXT NOT NULL,
+        file_category TEXT NOT NULL,
+        files INTEGER NOT NULL DEFAULT 0,
+        total_size INTEGER NOT NULL DEFAULT 0,
+        threat_sum REAL NOT NULL DEFAULT 0,
+        high_threat_files INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (day, file_category)
+    ) WITHOUT ROWID''',
+]
+
+# strftime() / date() give NULL for unparseable timestamps; such rows are left out of the rollups
+HOUR_SQL = "strftime('%Y-%m-%dT%H', {ts})"
+DAY_SQL = 'date({ts})'
+HIGH_THREAT_SCORE = 0.5
+
+
+def _upload_rollup(row: str, sign: int) -> str:
+    """Add (sign=1) or take back (sign=-1) one files row's contribution to uploads_daily"""
+    day = DAY_SQL.format(ts=f'{row}.upload_date')
+    return f'''INSERT INTO uploads_daily (day, file_category, files, total_size, threat_sum, high_threat_files)
+        SELECT {day}, COALESCE({row}.file_category, 'unknown'), {sign}, {sign} * COALESCE({row}.file_size, 0),
+               {sign} * COALESCE({row}.threat_score, 0), {sign} * (COALESCE({row}.threat_score, 0) > {HIGH_THREAT_SCORE})
+        WHERE {day} IS NOT NULL
+        ON CONFLICT (day, file_category) DO UPDATE SET files = files + excluded.files,
+            total_size = total_size + excluded.total_size, threat_sum = threat_sum + excluded.threat_sum,
+            high_threat_files = high_threat_files + excluded.high_threat_files;'''
+
+
+ANALYTICS_ROLLUP_TRIGGERS = [
+    f'''CREATE TRIGGER IF NOT EXISTS trg_activity_logs_rollup AFTER INSERT ON activity_logs
+    BEGIN
+    INSERT INTO activity_hourly (hour, activity_type, events)
+        SELECT {HOUR_SQL.format(ts='NEW.timestamp')}, COALESCE(NEW.activity_type, 'unknown'), 1
+        WHERE {HOUR_SQL.format(ts='NEW.timestamp')} IS NOT NULL
+        ON CONFLICT (hour, activity_type) DO UPDATE SET events = events + 1;
+    INSERT INTO activity_users_daily (day, user_id, events)
+        SELECT {DAY_SQL.format(ts='NEW.timestamp')}, NEW.user_id, 1
+        WHERE {DAY_SQL.format(ts='NEW.timestamp')} IS NOT NULL AND NEW.user_id IS NOT NULL
+        ON CONFLICT (day, user_id) DO UPDATE SET events = events + 1;
+    END''',
+    f'''CREATE TRIGGER IF NOT EXISTS trg_security_events_rollup AFTER INSERT ON security_events
+    BEGIN
+    INSERT INTO security_events_daily (day, threat_level, events)
+        SELECT {DAY_SQL.format(ts='NEW.timestamp')}, NEW.threat_level, 1
+        WHERE {DAY_SQL.format(ts='NEW.timestamp')} IS NOT NULL
+        ON CONFLICT (day, threat_level) DO UPDATE SET events = events + 1;
+    END''',
+    f'''CREATE TRIGGER IF NOT EXISTS trg_files_upload_rollup AFTER INSERT ON files
+    BEGIN
+    {_upload_rollup('NEW', 1)}
+    END''',
+    # Rescans change a file's score (and possibly its category) after the upload was counted
+    f'''CREATE TRIGGER IF NOT EXISTS trg_files_rescan_rollup AFTER UPDATE OF threat_score, file_category ON files
+    BEGIN
+    {_upload_rollup('OLD', -1)}
+    {_upload_rollup('NEW', 1)}
+    END''',
+]
+
+
+# A counter bumped in the same transaction as every write to the tables analytics reads, so a
+# cached report can be checked for staleness with one primary-key lookup
+DATA_VERSION_TABLE = 'CREATE TABLE IF NOT EXISTS data_versions (name TEXT PRIMARY KEY, version INTEGER NOT NULL)'
+ANALYTICS_SOURCE_TABLES = ('users', 'files', 'activity_logs', 'security_events', 'system_metrics')
+DATA_VERSION_TRIGGERS = [
+    f'''CREATE TRIGGER IF NOT EXISTS trg_{table}_{event.lower()}_data_version AFTER {event} ON {table}
+    BEGIN
+    UPDATE data_versions SET version = version + 1 WHERE name = 'analytics';
+    END'''
+    for table in ANALYTICS_SOURCE_TABLES for event in ('INSERT', 'UPDATE', 'DELETE')
+]
+# activity_logs and system_metrics are written on nearly every request (and by the monitor), so
+# counting their writes kept the version moving and the report cache cold. Reports read them
+# through hourly/daily figures and are keyed by the current hour instead; the other tables only
+# count the updates that change a column a report reads.
+COARSE_VERSION_TABLES = ('activity_logs', 'system_metrics')
+REPORT_COLUMNS = {
+    'users': 'created_date, is_active',
+    'files': 'upload_date, file_size, threat_score, file_category',
+    'security_events': 'timestamp, threat_level',
+}
+REPORT_VERSION_TRIGGERS = [
+    f'''CREATE TRIGGER IF NOT EXISTS trg_{table}_update_data_version AFTER UPDATE OF {columns} ON {table}
+    BEGIN
+    UPDATE data_versions SET version = version + 1 WHERE name = 'analytics';
+    END'''
+    for table, columns in REPORT_COLUMNS.items()
+]
+
+
+def _core_tables(conn: sqlite3.Connection):
+    for statement in CORE_TABLES:
+        conn.execute(statement)
+
+
+def _legacy_activity_logs(conn: sqlite3.Connection):
+    """Rebuild an activity_logs table with a NOT NULL 'action' column so rows that only set activity_type fit.
+
+    The old column is kept (nullable) and copied into activity_type; any other
+    extra columns are carried over as they are.
+    """
+    columns = {row[1]: row for row in conn.execute('PRAGMA table_info(activity_logs)')}
+    legacy = columns.get(LEGACY_ACTIVITY_COLUMN)
+    if legacy is None or not legacy[3]:
+        return
+    conn.execute('ALTER TABLE activity_logs RENAME TO activity_logs_legacy')
+    conn.execute(CORE_TABLES[2])
+    core = {row[1] for row in conn.execute('PRAGMA table_info(activity_logs)')}
+    for name, row in columns.items():
+        if name not in core:
+            conn.execute(f'ALTER TABLE activity_logs ADD COLUMN {name} {row[2]}')
+    copied = [name for name in columns if name != 'activity_type']
+    type_source = (f"COALESCE(activity_type, {LEGACY_ACTIVITY_COLUMN})" if 'activity_type' in columns
+                   else LEGACY_ACTIVITY_COLUMN)
+    conn.execute(f"INSERT INTO activity_logs ({', '.join(copied)}, activity_type) "
+                 f"SELECT {', '.join(copied)}, {type_source} FROM activity_logs_legacy")
+    conn.execute('DROP TABLE activity_logs_legacy')
+
+
+def _later_columns(conn: sqlite3.Connection):
+    _legacy_activity_logs(conn)
+    for table, columns in LATER_COLUMNS.items():
+        existing = {row[1] for row in conn.execute(f'PRAGMA table_info({table})')}
+        for name, definition in columns:
+            if name not in existing:
+                conn.execute(f'ALTER TABLE {table} ADD COLUMN {name} {definition}')
+
+
+def _hot_query_indexes(conn: sqlite3.Connection):
+    # Databases that recorded version 2 before activity_logs was in LATER_COLUMNS stopped here
+    _later_columns(conn)
+    for statement in HOT_QUERY_INDEXES:
+        conn.execute(statement)
+
+
+def _user_storage_stats(conn: sqlite3.Connection):
+    for statement in USER_STORAGE_TABLES + USER_STORAGE_TRIGGERS:
+        conn.execute(statement)
+    # Backfill from the files already stored
+    conn.execute('''INSERT OR REPLACE INTO user_storage_stats (username, file_count, total_size, updated_at)
+                    SELECT username, COUNT(*), COALESCE(SUM(file_size), 0), datetime('now') FROM files
+                    GROUP BY username''')
+    for dimension, value in BREAKDOWN_DIMENSIONS.items():
+        conn.execute(f'''INSERT OR REPLACE INTO user_storage_breakdown (username, dimension, value, file_count, total_size)
+                         SELECT username, '{dimension}', {value.format(row='files')}, COUNT(*),
+                                COALESCE(SUM(file_size), 0)
+                         FROM files GROUP BY 1, 3''')
+
+
+def _analytics_rollups(conn: sqlite3.Connection):
+    for statement in ANALYTICS_ROLLUP_TABLES + ANALYTICS_ROLLUP_TRIGGERS:
+        conn.execute(statement)
+    # Backfill from the rows already stored
+    hour, day = HOUR_SQL.format(ts='timestamp'), DAY_SQL.format(ts='timestamp')
+    conn.execute(f'''INSERT OR REPLACE INTO activity_hourly (hour, activity_type, events)
+                     SELECT {hour}, COALESCE(activity_type, 'unknown'), COUNT(*) FROM activity_logs
+                     WHERE {hour} IS NOT NULL GROUP BY 1, 2''')
+    conn.execute(f'''INSERT OR REPLACE INTO activity_users_daily (day, user_id, events)
+                     SELECT {day}, user_id, COUNT(*) FROM activity_logs
+                     WHERE {day} IS NOT NULL AND user_id IS NOT NULL GROUP BY 1, 2''')
+    conn.execute(f'''INSERT OR REPLACE INTO security_events_daily (day, threat_level, events)
+                     SELECT {day}, threat_level, COUNT(*) FROM security_events
+                     WHERE {day} IS NOT NULL GROUP BY 1, 2''')
+    upload_day = DAY_SQL.format(ts='upload_date')
+    conn.execute(f'''INSERT OR REPLACE INTO uploads_daily
+                         (day, file_category, files, total_size, threat_sum, high_threat_files)
+                     SELECT {upload_day}, COALESCE(file_category, 'unknown'), COUNT(*), COALESCE(SUM(file_size), 0),
+                            COALESCE(SUM(threat_score), 0), SUM(COALESCE(threat_score, 0) > {HIGH_THREAT_SCORE})
+                     FROM files WHERE {upload_day} IS NOT NULL GROUP BY 1, 2''')
+
+
+def _analytics_data_version(conn: sqlite3.Connection):
+    conn.execute(DATA_VERSION_TABLE)
+    conn.execute("INSERT OR IGNORE INTO data_versions (name, version) VALUES ('analytics', 0)")
+    for statement in DATA_VERSION_TRIGGERS:
+        conn.execute(statement)
+
+
+def _report_data_version(conn: sqlite3.Connection):
+    for table in COARSE_VERSION_TABLES:
+        for event in ('insert', 'update', 'delete'):
+            conn.execute(f'DROP TRIGGER IF EXISTS trg_{table}_{event}_data_version')
+    for table in REPORT_COLUMNS:
+        conn.execute(f'DROP TRIGGER IF EXISTS trg_{table}_update_data_version')
+    for statement in REPORT_VERSION_TRIGGERS:
+        conn.execute(statement)
+
+
+# User-scoped audit pages read security_events by user in (timestamp, id) order
+USER_SECURITY_EVENTS_INDEX = ('CREATE INDEX IF NOT EXISTS idx_security_events_user_timestamp '
+                              'ON security_events (user_id, timestamp, id)')
+
+
+def _user_security_events_index(conn: sqlite3.Connection):
+    conn.execute(USER_SECURITY_EVENTS_INDEX)
+
+
+# (version, name, step) in order; never edit a released step, append a new one
+MIGRATIONS: List[Tuple[int, str, Callable[[sqlite3.Connection], None]]] = [
+    (1, 'core tables', _core_tables),
+    (2, 'columns added after the first release', _later_columns),
+    (3, 'indexes for hot queries', _hot_query_indexes),
+    (4, 'per-user storage totals', _user_storage_stats),
+    (5, 'analytics rollups', _analytics_rollups),
+    (6, 'analytics data version', _analytics_data_version),
+    (7, 'analytics data version counts report inputs only', _report_data_version),
+    (8, 'user-scoped security events index', _user_security_events_index),
+]
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def schema_version(conn: sqlite3.Connection) -> int:
+    conn.execute(SCHEMA_MIGRATIONS_TABLE)
+    return conn.execute('SELECT COALESCE(MAX(version), 0) FROM schema_migrations').fetchone()[0]
+
+
+def apply_migrations(conn: sqlite3.Connection) -> List[int]:
+    """Bring `conn`'s database up to LATEST_VERSION; returns the versions applied.
+
+    Each step runs in its own IMMEDIATE transaction together with its
+    schema_migrations row, so a failed step leaves the previous version in
+    place, and a second process starting at the same time waits and then
+    skips what the first one applied.
+    """
+    previous_isolation = conn.isolation_level
+    conn.isolation_level = None  # explicit transactions only
+    applied = []
+    try:
+        conn.execute(SCHEMA_MIGRATIONS_TABLE)
+        for version, name, step in MIGRATIONS:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                if conn.execute('SELECT 1 FROM schema_migrations WHERE version = ?', (version,)).fetchone():
+                    conn.execute('COMMIT')
+                    continue
+                step(conn)
+                conn.execute('INSERT INTO schema_migrations (version, name, applied_at) VALUES (?, ?, ?)',
+                             (version, name, datetime.now().isoformat()))
+                conn.execute('COMMIT')
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+            applied.append(version)
+    finally:
+        conn.isolation_level = previous_isolation
+    return applied
+
+
+def migrate(db_path: str) -> List[int]:
+    """Apply pending migrations to the database file at `db_path` (creating it if needed)"""
+    conn = sqlite3.connect(db_path, timeout=30)
+    try:
+        return apply_migrations(conn)
+    finally:
+        conn.close()
+
+
+_migrated = set()
+_migrated_lock = threading.Lock()
+
+
+def ensure_schema(db_path: str):
+    """migrate() once per database file per process"""
+    if db_path in _migrated:
+        return
+    with _migrated_lock:
+        if db_path not in _migrated:
+            applied = migrate(db_path)
+            if applied:
+                log.info('Schema of %s migrated to version %d (applied %s)', db_path, LATEST_VERSION, applied)
+            _migrated.add(db_path)
+
+
+# Queries the API runs on every listing, download, login or dashboard refresh.
+# Each must be answered through an index; a plain SCAN of the table fails the check.
+HOT_QUERIES: Dict[str, Tuple[str, tuple]] = {
+    'file listing': ('SELECT id, upload_date, filename, file_size, is_safe, threat_score, secure_filename, last_scan '
+                     'FROM files WHERE username = ? AND (upload_date, id) < (?, ?) '
+                     'ORDER BY upload_date DESC, id DESC LIMIT 201', ('alice', '2026-01-01', 10)),
+    'storage totals': ('SELECT file_count, total_size FROM user_storage_stats WHERE username = ?', ('alice',)),
+    'storage breakdown': ('SELECT dimension, value, file_count, total_size FROM user_storage_breakdown '
+                          'WHERE username = ?', ('alice',)),
+    'download by secure name': ('SELECT secure_filename, filename, file_hash FROM files '
+                                'WHERE secure_filename = ? AND username = ?', ('x.bin', 'alice')),
+    'files by hash': ('SELECT id, username FROM files WHERE file_hash = ?', ('0' * 64,)),
+    'recent uploads': ("SELECT COUNT(*) FROM files WHERE upload_date > datetime('now', '-1 hour')", ()),
+    'login lookup': ('SELECT id, password_hash, email, is_active, role FROM users WHERE username = ?', ('alice',)),
+    'user activity window': ("SELECT COUNT(*) FROM activity_logs WHERE user_id = ? AND activity_type = ? "
+                             "AND timestamp > datetime('now', '-1 hour')", (1, 'SECURITY_LOGIN_FAILED')),
+    'failed logins by day': ("SELECT DATE(timestamp), COUNT(*) FROM activity_logs WHERE activity_type = ? "
+                             "AND timestamp > ? GROUP BY DATE(timestamp)", ('SECURITY_LOGIN_FAILED', '2026-01-01')),
+    'active users by day': ('SELECT DATE(timestamp), COUNT(DISTINCT user_id) FROM activity_logs '
+                            'WHERE timestamp > ? GROUP BY DATE(timestamp)', ('2026-01-01',)),
+    'security events by level': ('SELECT threat_level, COUNT(*) FROM security_events WHERE timestamp > ? '
+                                 'GROUP BY threat_level', ('2026-01-01',)),
+    'activity by hour': ("SELECT hour, activity_type, events FROM activity_hourly WHERE hour >= ?", ('2026-01-01T00',)),
+    'active users by day (rollup)': ('SELECT day, COUNT(*) FROM activity_users_daily WHERE day >= ? GROUP BY day',
+                                     ('2026-01-01',)),
+    'uploads by day': ('SELECT day, SUM(files), SUM(threat_sum) FROM uploads_daily WHERE day >= ? GROUP BY day',
+                       ('2026-01-01',)),
+    'audit log page': ('''SELECT 'activity' AS source, id, timestamp FROM activity_logs WHERE (timestamp, id) < (?, ?)
+                          UNION ALL
+                          SELECT 'security' AS source, id, timestamp FROM security_events WHERE (timestamp, id) < (?, ?)
+                          ORDER BY timestamp DESC, id DESC, source DESC LIMIT 51''',
+                       ('2026-01-01', 10, '2026-01-01', 10)),
+    'user audit log page': ('''SELECT 'activity' AS source, id, timestamp FROM activity_logs WHERE user_id = ?
+                               UNION ALL
+                               SELECT 'security' AS source, id, timestamp FROM security_events WHERE user_id = ?
+                               ORDER BY timestamp DESC, id DESC, source DESC LIMIT 51''', (1, 1)),
+}
+
+
+def query_plan(conn: sqlite3.Connection, sql: str, params: tuple = ()) -> List[str]:
+    return [row[3] for row in conn.execute('EXPLAIN QUERY PLAN ' + sql, params)]
+
+
+def full_scans(plan: List[str]) -> List[str]:
+    """Plan steps that read a whole table (with or without walking an index)"""
+    return [step for step in plan if step.startswith('SCAN ') and not step.startswith('SCAN CONSTANT ROW')]
+
+
+def check_query_plans(conn: Optional[sqlite3.Connection] = None,
+                      queries: Optional[Dict[str, Tuple[str, tuple]]] = None) -> Dict[str, List[str]]:
+    """Hot queries whose plan contains a full SCAN, with that plan; empty when all are indexed.
+
+    Without a connection the check runs against a fresh in-memory database
+    at LATEST_VERSION, so the result depends only on the schema.
+    """
+    own_conn = conn is None
+    if own_conn:
+        conn = sqlite3.connect(':memory:')
+        apply_migrations(conn)
+    try:
+        failures = {}
+        for name, (sql, params) in (queries or HOT_QUERIES).items():
+            plan = query_plan(conn, sql, params)
+            if full_scans(plan):
+                failures[name] = plan
+        return failures
+    finally:
+        if own_conn:
+            conn.close()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='SmartSecure schema migrations')
+    parser.add_argument('--db', default='smartsecure.db', help='database file (default: smartsecure.db)')
+    parser.add_argument('--status', action='store_true', help='print the applied schema version and exit')
+    parser.add_argument('--check-plans', action='store_true',
+                        help='exit non-zero if any hot query plans a full table SCAN')
+    args = parser.parse_args(argv)
+
+    if args.check_plans:
+        failures = check_query_plans()
+        for name, plan in failures.items():
+            print(f"❌ {name}: {' | '.join(plan)}")
+        if failures:
+            return 1
+        print(f"✅ All {len(HOT_QUERIES)} hot queries use an index")
+        return 0
+
+    if args.status:
+        conn = sqlite3.connect(args.db)
+        try:
+            print(f"📋 {args.db}: schema version {schema_version(conn)} (latest {LATEST_VERSION})")
+        finally:
+            conn.close()
+        return 0
+
+    applied = migrate(args.db)
+    if applied:
+        print(f"✅ {args.db}: applied migrations {applied}, now at version {LATEST_VERSION}")
+    else:
+        print(f"✅ {args.db}: already at version {LATEST_VERSION}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
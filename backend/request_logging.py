@@ -0,0 +1,166 @@
+"""
+Structured Request Logging
+SmartSecure Sri Lanka - JSON-lines logs written off the request thread, with request-scoped context
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import sys
+import time
+import uuid
+import zlib
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+
+from flask import Flask, g, has_request_context, request
+
+LOGGER_NAME = 'smartsecure'
+DEFAULT_LEVEL = 'INFO'
+REQUEST_ID_HEADER = 'X-Request-ID'
+# Attributes every LogRecord has; anything else passed via extra= is emitted as a field
+_RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime', 'taskName'}
+
+_listener: Optional[QueueListener] = None
+
+
+def get_logger(name: Optional[str] = None) -> logging.Logger:
+    return logging.getLogger(f'{LOGGER_NAME}.{name}' if name else LOGGER_NAME)
+
+
+class JsonLineFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message, request context and extra= fields"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class RequestContextFilter(logging.Filter):
+    """Stamps records made inside a request with its id, route, method and user.
+
+    Runs on the logging thread's caller (it sits on the QueueHandler), where
+    Flask's request context is still available.
+    """
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if has_request_context():
+            record.request_id = getattr(g, 'request_id', None)
+            record.route = request.url_rule.rule if request.url_rule else request.path
+            record.method = request.method
+            user = getattr(g, 'user', None)
+            if user:
+                record.user = user.get('username')
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps a `rate` fraction of records below WARNING; warnings and errors always pass.
+
+    The decision hashes the request id, so a sampled request keeps all of
+    its lines and an unsampled one drops all of them.
+    """
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.threshold = int(max(0.0, min(rate, 1.0)) * 0xFFFFFFFF)
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or self.threshold >= 0xFFFFFFFF:
+            return True
+        key = getattr(record, 'request_id', None) or f'{record.created}'
+        return zlib.crc32(key.encode('utf-8')) <= self.threshold
+
+
+def configure_logging(level: Optional[str] = None, sample_rate: Optional[float] = None,
+                      stream=None) -> QueueListener:
+    """Send the 'smartsecure' loggers through a queue to a JSON-lines stream handler (once per process).
+
+    Request threads only filter and enqueue; formatting and the write happen
+    on the listener's thread. Level and sampling default to the LOG_LEVEL and
+    LOG_SAMPLE_RATE environment variables. Disabled levels are rejected by
+    the logger before any message is built, so log.debug('...%s', x) costs a
+    level check at INFO.
+    """
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    level = (level or os.environ.get('LOG_LEVEL') or DEFAULT_LEVEL).upper()
+    sample_rate = float(os.environ.get('LOG_SAMPLE_RATE', 1.0)) if sample_rate is None else sample_rate
+
+    output = logging.StreamHandler(stream or sys.stdout)
+    output.setFormatter(JsonLineFormatter())
+    records = queue.SimpleQueue()
+    handler = QueueHandler(records)
+    handler.addFilter(RequestContextFilter())
+    handler.addFilter(SamplingFilter(sample_rate))
+
+    logger = get_logger()
+    logger.setLevel(level)
+    logger.addHandler(handler)
+    logger.propagate = False
+
+    _listener = QueueListener(records, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+    return _listener
+
+
+def shutdown_logging():
+    """Flush queued records and stop the listener thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        for handler in list(get_logger().handlers):
+            if isinstance(handler, QueueHandler):
+                get_logger().removeHandler(handler)
+        _listener = None
+
+
+class RequestLogging:
+    """Assigns each request an id (or adopts the caller's X-Request-ID) and logs one access line.
+
+    The access line carries status, latency and response size; it is logged
+    at INFO, so LOG_LEVEL=WARNING or sampling turns it off.
+    """
+
+    def __init__(self, app: Optional[Flask] = None):
+        self.log = get_logger('access')
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask):
+        app.before_request(self._start)
+        app.after_request(self._finish)
+
+    @staticmethod
+    def _start():
+        g.request_id = request.headers.get(REQUEST_ID_HEADER) or uuid.uuid4().hex
+        g.request_started = time.perf_counter()
+
+    def _finish(self, response):
+        request_id = getattr(g, 'request_id', None)
+        if request_id:
+            response.headers[REQUEST_ID_HEADER] = request_id
+        if self.log.isEnabledFor(logging.INFO):
+            started = getattr(g, 'request_started', None)
+            latency_ms = round((time.perf_counter() - started) * 1000, 2) if started else None
+            self.log.info('%s %s %s', request.method, request.path, response.status_code,
+                          extra={'status': response.status_code, 'latency_ms': latency_ms,
+                                 'bytes_out': response.content_length})
+        return response
@@ -0,0 +1,270 @@
+"""
+Request Metrics
+SmartSecure Sri Lanka - per-route latency histograms, status counters and DB time, exposed Prometheus-style
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+from flask import Flask, g, request
+
+# Upper bounds (seconds) of the latency and DB-time histogram buckets; +Inf is implicit
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Shards of finished threads are folded together once there are more than this many
+MAX_LIVE_SHARDS = 64
+UNMATCHED_ROUTE = '<unmatched>'
+PREFIX = 'smartsecure'
+
+
+class _Shard:
+    """One thread's aggregates. Only the owning thread writes to it, so updates take no lock."""
+
+    def __init__(self, thread: Optional[threading.Thread], bucket_count: int):
+        self.thread = thread
+        self.bucket_count = bucket_count
+        self.requests: Dict[Tuple[str, str, int], int] = {}
+        # (route, method) -> [bucket counts..., +Inf count, sum]
+        self.latency: Dict[Tuple[str, str], List[float]] = {}
+        self.db_time: Dict[Tuple[str, str], List[float]] = {}
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.in_flight = 0
+        # minute -> requests finished in it, for the last hour only
+        self.minutes: Dict[int, int] = {}
+        self.db_depth = 0
+        self.db_pending = 0.0
+
+    def fold(self, other: '_Shard'):
+        for key, count in other.requests.items():
+            self.requests[key] = self.requests.get(key, 0) + count
+        for mine, theirs in ((self.latency, other.latency), (self.db_time, other.db_time)):
+            for key, values in theirs.items():
+                target = mine.setdefault(key, [0] * (self.bucket_count + 1) + [0.0])
+                for i, value in enumerate(values):
+                    target[i] += value
+        for minute, count in other.minutes.items():
+            self.minutes[minute] = self.minutes.get(minute, 0) + count
+        self.bytes_in += other.bytes_in
+        self.bytes_out += other.bytes_out
+        self.in_flight += other.in_flight
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(**labels) -> str:
+    return '{' + ','.join(f'{name}="{_escape(str(value))}"' for name, value in labels.items()) + '}'
+
+
+class RequestMetrics:
+    """In-process request instrumentation with per-thread shards.
+
+    Each request thread records into its own shard (plain dict and int
+    updates, no locks); a scrape merges the shards. Shards of threads that
+    have exited (the dev server starts one per request) are folded into one
+    retired shard so memory stays bounded and counters stay monotonic.
+    """
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.started_at = time.time()
+        self._local = threading.local()
+        self._shards: List[_Shard] = []
+        self._retired = _Shard(None, len(self.buckets))
+        self._lock = threading.Lock()
+
+    def reset(self):
+        """Drop every aggregate and restart the uptime clock"""
+        with self._lock:
+            self.started_at = time.time()
+            self._local = threading.local()
+            self._shards = []
+            self._retired = _Shard(None, len(self.buckets))
+
+    def init_app(self, app: Flask):
+        app.before_request(self._start)
+        app.after_request(self._finish)
+        app.teardown_request(self._teardown)
+
+    # -- recording --
+
+    def _shard(self) -> _Shard:
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = _Shard(threading.current_thread(), len(self.buckets))
+            self._local.shard = shard
+            with self._lock:
+                self._shards.append(shard)
+                if len(self._shards) > MAX_LIVE_SHARDS:
+                    self._retire_dead_locked()
+        return shard
+
+    def _retire_dead_locked(self):
+        live = []
+        for shard in self._shards:
+            if shard.thread is not None and not shard.thread.is_alive():
+                self._retired.fold(shard)
+            else:
+                live.append(shard)
+        self._shards = live
+
+    def _histogram(self, table: Dict, key, seconds: float):
+        values = table.get(key)
+        if values is None:
+            values = table[key] = [0] * (len(self.buckets) + 1) + [0.0]
+        values[bisect_left(self.buckets, seconds)] += 1
+        values[-1] += seconds
+
+    def observe(self, route: str, method: str, status: int, seconds: float, db_seconds: float = 0.0,
+                bytes_in: int = 0, bytes_out: int = 0):
+        """Record one finished request on the calling thread's shard"""
+        shard = self._shard()
+        key = (route, method, status)
+        shard.requests[key] = shard.requests.get(key, 0) + 1
+        self._histogram(shard.latency, (route, method), seconds)
+        self._histogram(shard.db_time, (route, method), db_seconds)
+        shard.bytes_in += bytes_in
+        shard.bytes_out += bytes_out
+        minute = int(time.time() // 60)
+        shard.minutes[minute] = shard.minutes.get(minute, 0) + 1
+        if len(shard.minutes) > 61:
+            for old in [m for m in shard.minutes if m <= minute - 60]:
+                del shard.minutes[old]
+
+    @contextmanager
+    def time_db(self, connection):
+        """Wrap a pooled-connection context manager so the time spent in it counts as DB time"""
+        shard = self._shard()
+        shard.db_depth += 1
+        started = time.perf_counter()
+        try:
+            with connection as conn:
+                yield conn
+        finally:
+            shard.db_depth -= 1
+            if shard.db_depth == 0:  # nested borrows are already inside the outer one
+                shard.db_pending += time.perf_counter() - started
+
+    def _start(self):
+        shard = self._shard()
+        shard.in_flight += 1
+        shard.db_pending = 0.0
+        g.metrics_started = time.perf_counter()
+
+    def _finish(self, response):
+        started = g.pop('metrics_started', None)
+        if started is not None:
+            shard = self._shard()
+            route = request.url_rule.rule if request.url_rule else UNMATCHED_ROUTE
+            self.observe(route, request.method, response.status_code, time.perf_counter() - started,
+                         shard.db_pending, request.content_length or 0, response.content_length or 0)
+            shard.in_flight -= 1
+        return response
+
+    def _teardown(self, exc=None):
+        # after_request is skipped when a view raises; the request still ended
+        started = g.pop('metrics_started', None)
+        if started is not None:
+            shard = self._shard()
+            route = request.url_rule.rule if request.url_rule else UNMATCHED_ROUTE
+            self.observe(route, request.method, 500, time.perf_counter() - started, shard.db_pending,
+                         request.content_length or 0, 0)
+            shard.in_flight -= 1
+
+    # -- reading --
+
+    def snapshot(self) -> _Shard:
+        """All shards merged into one (a consistent-enough view; counters may move while it is taken)"""
+        merged = _Shard(None, len(self.buckets))
+        with self._lock:
+            self._retire_dead_locked()
+            merged.fold(self._retired)
+            shards = list(self._shards)
+        for shard in shards:
+            merged.fold(shard)
+        return merged
+
+    def summary(self) -> Dict:
+        """Headline figures for the analytics dashboards"""
+        snapshot = self.snapshot()
+        total = sum(snapshot.requests.values())
+        errors = sum(count for (_, _, status), count in snapshot.requests.items() if status >= 500)
+        latency = [0] * (len(self.buckets) + 1)
+        latency_sum = db_sum = 0.0
+        for values in snapshot.latency.values():
+            for i in range(len(latency)):
+                latency[i] += values[i]
+            latency_sum += values[-1]
+        for values in snapshot.db_time.values():
+            db_sum += values[-1]
+        this_minute = int(time.time() // 60)
+        return {
+            'avgResponseTime': round(latency_sum / total * 1000, 2) if total else 0,
+            'p95ResponseTime': self._quantile_ms(latency, total, 0.95),
+            'avgDbTime': round(db_sum / total * 1000, 2) if total else 0,
+            'requestsPerHour': sum(count for minute, count in snapshot.minutes.items() if minute > this_minute - 60),
+            'totalRequests': total,
+            'errorRate': round(errors / total * 100, 2) if total else 0,
+            'inFlight': snapshot.in_flight,
+            'uptimeSeconds': int(time.time() - self.started_at),
+        }
+
+    def _quantile_ms(self, counts: List[int], total: int, quantile: float) -> Optional[float]:
+        """Upper bound of the bucket holding the quantile (None if it is past the last bucket)"""
+        if not total:
+            return 0
+        running = 0
+        for bound, count in zip(self.buckets, counts):
+            running += count
+            if running >= quantile * total:
+                return bound * 1000
+        return None
+
+    def render_prometheus(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)"""
+        snapshot = self.snapshot()
+        lines = [
+            f'# HELP {PREFIX}_http_requests_total Requests finished, by route, method and status code.',
+            f'# TYPE {PREFIX}_http_requests_total counter',
+        ]
+        for (route, method, status), count in sorted(snapshot.requests.items()):
+            lines.append(f'{PREFIX}_http_requests_total{_labels(route=route, method=method, status=status)} {count}')
+
+        for name, table, help_text in (
+                ('http_request_duration_seconds', snapshot.latency, 'Request latency.'),
+                ('http_request_db_seconds', snapshot.db_time, 'Time spent holding database connections per request.')):
+            lines += [f'# HELP {PREFIX}_{name} {help_text}', f'# TYPE {PREFIX}_{name} histogram']
+            for (route, method), values in sorted(table.items()):
+                running = 0
+                for bound, count in zip(self.buckets + (float('inf'),), values):
+                    running += count
+                    le = '+Inf' if bound == float('inf') else repr(bound)
+                    lines.append(f'{PREFIX}_{name}_bucket{_labels(route=route, method=method, le=le)} {running}')
+                lines.append(f'{PREFIX}_{name}_sum{_labels(route=route, method=method)} {values[-1]:.6f}')
+                lines.append(f'{PREFIX}_{name}_count{_labels(route=route, method=method)} {running}')
+
+        lines += [
+            f'# HELP {PREFIX}_http_requests_in_flight Requests currently being handled.',
+            f'# TYPE {PREFIX}_http_requests_in_flight gauge',
+            f'{PREFIX}_http_requests_in_flight {snapshot.in_flight}',
+            f'# HELP {PREFIX}_http_request_bytes_total Request body bytes received.',
+            f'# TYPE {PREFIX}_http_request_bytes_total counter',
+            f'{PREFIX}_http_request_bytes_total {snapshot.bytes_in}',
+            f'# HELP {PREFIX}_http_response_bytes_total Response body bytes sent (when the length is known).',
+            f'# TYPE {PREFIX}_http_response_bytes_total counter',
+            f'{PREFIX}_http_response_bytes_total {snapshot.bytes_out}',
+            f'# HELP {PREFIX}_process_uptime_seconds Seconds since this process started serving.',
+            f'# TYPE {PREFIX}_process_uptime_seconds gauge',
+            f'{PREFIX}_process_uptime_seconds {time.time() - self.started_at:.0f}',
+        ]
+        return '\n'.join(lines) + '\n'
+
+
+def format_uptime(seconds: int) -> str:
+    days, rest = divmod(int(seconds), 86400)
+    hours, rest = divmod(rest, 3600)
+    minutes = rest // 60
+    return f'{days}d {hours}h {minutes}m' if days else f'{hours}h {minutes}m'
@@ -0,0 +1,108 @@
+"""
+Response Cache
+SmartSecure Sri Lanka - TTL cache with stale-while-revalidate for expensive read-only payloads
+"""
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Hashable, Optional, Tuple
+
+from request_logging import get_logger
+
+log = get_logger(__name__)
+
+DEFAULT_TTL_SECONDS = 60
+# How long past its TTL an entry may still be served while a refresh runs
+DEFAULT_STALE_SECONDS = 600
+DEFAULT_MAX_ENTRIES = 64
+
+FRESH, STALE, MISS = 'fresh', 'stale', 'miss'
+
+
+class ResponseCache:
+    """Values computed by a callable, kept for `ttl` seconds and then served stale.
+
+    An entry younger than `ttl` is returned as is. Between `ttl` and
+    `ttl + stale` it is still returned immediately, and one background
+    refresh is started; the next caller sees the new value. Only a cold or
+    fully expired key makes the caller wait, and concurrent callers for that
+    key share a single computation. A failed refresh keeps serving the old
+    value until it expires.
+    """
+
+    def __init__(self, ttl: float = DEFAULT_TTL_SECONDS, stale: float = DEFAULT_STALE_SECONDS,
+                 max_entries: int = DEFAULT_MAX_ENTRIES, name: str = 'response-cache',
+                 clock: Callable[[], float] = time.monotonic):
+        self.ttl = ttl
+        self.stale = stale
+        self.max_entries = max_entries
+        self.clock = clock
+        self._entries: 'OrderedDict[Hashable, Tuple[float, object]]' = OrderedDict()
+        self._pending: Dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=name)
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, compute: Callable[[], object]) -> Tuple[object, str]:
+        """(value, FRESH | STALE | MISS) for `key`, computing it with `compute` if needed"""
+        with self._lock:
+            entry = self._entries.get(key)
+            age = self.clock() - entry[0] if entry else None
+            if entry and age < self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1], FRESH
+            if entry and age < self.ttl + self.stale:
+                self._entries.move_to_end(key)
+                self.stale_hits += 1
+                self._refresh_locked(key, compute)
+                return entry[1], STALE
+            self.misses += 1
+            future = self._refresh_locked(key, compute)
+        return future.result(), MISS
+
+    def prefetch(self, key: Hashable, compute: Callable[[], object]) -> Future:
+        """Start computing `key` in the background (e.g. at startup) unless a refresh is already running"""
+        with self._lock:
+            return self._refresh_locked(key, compute)
+
+    def invalidate(self, key: Optional[Hashable] = None):
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {'entries': len(self._entries), 'hits': self.hits, 'stale_hits': self.stale_hits,
+                    'misses': self.misses, 'refreshing': len(self._pending)}
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _refresh_locked(self, key: Hashable, compute: Callable[[], object]) -> Future:
+        future = self._pending.get(key)
+        if future is None:
+            future = self._executor.submit(self._compute, key, compute)
+            self._pending[key] = future
+        return future
+
+    def _compute(self, key: Hashable, compute: Callable[[], object]):
+        try:
+            value = compute()
+            with self._lock:
+                self._entries[key] = (self.clock(), value)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+            return value
+        except Exception:
+            log.exception('Cache refresh for %r failed', key)
+            raise
+        finally:
+            with self._lock:
+                self._pending.pop(key, None)
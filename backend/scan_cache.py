@@ -0,0 +1,106 @@
+"""
+Scan Result Cache
+SmartSecure Sri Lanka - content-hash keyed cache of threat analysis features
+"""
+import json
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+from db_pool import get_pool
+
+SCAN_CACHE_TABLE = '''CREATE TABLE IF NOT EXISTS scan_cache (
+    sha256 TEXT NOT NULL,
+    engine_version TEXT NOT NULL,
+    features TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    PRIMARY KEY (sha256, engine_version)
+)'''
+
+DEFAULT_MEMORY_ENTRIES = 4096
+
+
+class ScanResultCache:
+    """Two-level cache of content analysis keyed by ``(sha256, engine_version)``.
+
+    A bounded in-process LRU answers hot lookups; misses fall through to the
+    ``scan_cache`` table so results survive restarts and are shared by every
+    worker process. The engine version hashes the rule set and model, so
+    changing either simply stops matching old entries (purge_other_versions
+    reclaims their rows).
+    """
+
+    def __init__(self, db_path: Optional[str] = None, max_entries: int = DEFAULT_MEMORY_ENTRIES):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self._entries: 'OrderedDict[Tuple[str, str], Dict]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._schema_ready = False
+        self.hits = 0
+        self.misses = 0
+
+    def _connection(self):
+        return get_pool(self.db_path).connection()
+
+    def _ensure_schema(self, conn):
+        if not self._schema_ready:
+            conn.execute(SCAN_CACHE_TABLE)
+            self._schema_ready = True
+
+    def _remember(self, key: Tuple[str, str], features: Dict):
+        with self._lock:
+            self._entries[key] = features
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get(self, sha256: str, engine_version: str) -> Optional[Dict]:
+        key = (sha256, engine_version)
+        with self._lock:
+            features = self._entries.get(key)
+            if features is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return dict(features)
+
+        if self.db_path:
+            with self._connection() as conn:
+                self._ensure_schema(conn)
+                row = conn.execute('SELECT features FROM scan_cache WHERE sha256 = ? AND engine_version = ?',
+                                   key).fetchone()
+            if row:
+                features = json.loads(row[0])
+                self._remember(key, features)
+                with self._lock:
+                    self.hits += 1
+                return dict(features)
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, sha256: str, engine_version: str, features: Dict):
+        key = (sha256, engine_version)
+        features = dict(features)
+        self._remember(key, features)
+        if self.db_path:
+            with self._connection() as conn:
+                self._ensure_schema(conn)
+                conn.execute('INSERT OR REPLACE INTO scan_cache (sha256, engine_version, features, created_at) VALUES (?, ?, ?, ?)',
+                             (sha256, engine_version, json.dumps(features), datetime.now().isoformat()))
+
+    def purge_other_versions(self, engine_version: str) -> int:
+        """Drop entries written by any other engine version"""
+        with self._lock:
+            for key in [k for k in self._entries if k[1] != engine_version]:
+                del self._entries[key]
+        if not self.db_path:
+            return 0
+        with self._connection() as conn:
+            self._ensure_schema(conn)
+            return conn.execute('DELETE FROM scan_cache WHERE engine_version != ?', (engine_version,)).rowcount
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses}
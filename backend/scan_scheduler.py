@@ -0,0 +1,368 @@
+"""
+Background Scan Scheduler
+SmartSecure Sri Lanka - queued bulk threat scanning on a process pool
+"""
+import json
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from db_pool import get_pool
+from request_logging import get_logger
+from threat_intel import known_threat_analysis
+
+log = get_logger(__name__)
+
+# Mirrors models.AIAnalysisJob, plus batch_id/username for the SQLite server
+AI_ANALYSIS_JOBS_TABLE = '''CREATE TABLE IF NOT EXISTS ai_analysis_jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    batch_id TEXT NOT NULL,
+    file_id INTEGER,
+    user_id INTEGER,
+    username TEXT,
+    job_type TEXT NOT NULL DEFAULT 'threat_detection',
+    status TEXT NOT NULL DEFAULT 'queued',
+    priority INTEGER NOT NULL DEFAULT 50,
+    results TEXT,
+    confidence_scores TEXT,
+    processing_time REAL,
+    error_message TEXT,
+    retry_count INTEGER NOT NULL DEFAULT 0,
+    created_at TEXT NOT NULL,
+    started_at TEXT,
+    completed_at TEXT
+)'''
+
+AI_ANALYSIS_JOBS_INDEXES = [
+    'CREATE INDEX IF NOT EXISTS idx_ai_jobs_queue ON ai_analysis_jobs (status, priority, id)',
+    'CREATE INDEX IF NOT EXISTS idx_ai_jobs_batch ON ai_analysis_jobs (batch_id, id)',
+]
+
+DEFAULT_WORKERS = int(os.getenv('SMARTSECURE_SCAN_WORKERS', os.cpu_count() or 1))
+MAX_RETRIES = 3
+# Files sent to a worker per task; scored together by analyze_batch
+WORKER_BATCH_SIZE = 16
+
+_worker_engine = None
+
+
+def _scan_in_worker(files: List[Tuple[str, str]]) -> List[Dict]:
+    """Runs in a pool process: full content analysis of a batch of ``(filename, path)`` files"""
+    global _worker_engine
+    if _worker_engine is None:
+        from ai_security import ThreatDetectionEngine
+        _worker_engine = ThreatDetectionEngine()
+    started = time.perf_counter()
+    analyses = _worker_engine.analyze_batch(files)
+    per_file = (time.perf_counter() - started) / max(1, len(files))
+    for analysis in analyses:
+        analysis['processing_time'] = per_file
+    return analyses
+
+
+def record_scan_verdict(conn, file_id: int, analysis: Dict):
+    """Store an analysis verdict on its files row"""
+    # Also upgrades legacy MD5 file_hash values so the next scan is a cache hit
+    conn.execute('''
+        UPDATE files SET is_safe = ?, threat_score = ?, last_scan = ?, file_hash = ?
+        WHERE id = ?
+    ''', (1 if analysis['is_safe'] else 0, analysis['threat_score'], datetime.now().isoformat(),
+          analysis['features']['file_hash'], file_id))
+
+
+def summarize_analysis(analysis: Dict) -> Dict:
+    return {
+        'threat_score': round(analysis['threat_score'], 4),
+        'is_safe': analysis['is_safe'],
+        'risk_factors': analysis['risk_factors'],
+        'file_category': analysis['file_category'],
+        'cached': analysis.get('cached', False),
+        'known_threat': analysis.get('known_threat'),
+    }
+
+
+class ScanScheduler:
+    """Persists scan jobs in ``ai_analysis_jobs`` and runs them on a process pool.
+
+    Feature extraction is CPU-bound regex/NumPy work, so jobs run in worker
+    processes rather than request threads. A single dispatcher thread claims
+    queued jobs in priority order, answers listed threat hashes and known
+    content straight from the threat-intel index and the scan cache, and
+    sends the rest to workers in batches scored together by
+    ``analyze_batch``, keeping at most two batches per worker in flight.
+    Failed jobs are retried up to MAX_RETRIES times; jobs left ``running`` by
+    a previous process are re-queued on start. A worker that dies (OOM kill,
+    crash) breaks the whole pool: it is replaced and the batches it lost are
+    resubmitted once before they count as a failed attempt.
+    """
+
+    def __init__(self, db_path: str, blob_store, scan_cache, engine, max_workers: int = DEFAULT_WORKERS,
+                 threat_intel=None):
+        self.db_path = db_path
+        self.blob_store = blob_store
+        self.scan_cache = scan_cache
+        self.engine = engine
+        # Optional ThreatIntelligence; listed hashes get the same verdict as /security/scan
+        self.threat_intel = threat_intel
+        self.max_workers = max(1, max_workers)
+        self.max_in_flight = self.max_workers * 2 * WORKER_BATCH_SIZE
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = False
+        self._dispatcher: Optional[threading.Thread] = None
+
+        with self._connection() as conn:
+            conn.execute(AI_ANALYSIS_JOBS_TABLE)
+            for statement in AI_ANALYSIS_JOBS_INDEXES:
+                conn.execute(statement)
+            conn.execute("UPDATE ai_analysis_jobs SET status = 'queued', started_at = NULL WHERE status = 'running'")
+
+    def _connection(self):
+        return get_pool(self.db_path).connection()
+
+    # -- public API --
+
+    def submit_batch(self, user_id: int, username: str, file_ids: List[int], priority: int = 50) -> str:
+        """Queue one threat_detection job per file and return the batch id"""
+        batch_id = uuid.uuid4().hex
+        now = datetime.now().isoformat()
+        with self._connection() as conn:
+            conn.executemany('''
+                INSERT INTO ai_analysis_jobs (batch_id, file_id, user_id, username, job_type, status, priority, created_at)
+                VALUES (?, ?, ?, ?, 'threat_detection', 'queued', ?, ?)
+            ''', [(batch_id, file_id, user_id, username, priority, now) for file_id in file_ids])
+        self.start()
+        self._wakeup.set()
+        return batch_id
+
+    def batch_progress(self, batch_id: str, username: str) -> Optional[Dict]:
+        with self._connection() as conn:
+            rows = conn.execute('''
+                SELECT status, COUNT(*), SUM(processing_time),
+                       SUM(CASE WHEN json_extract(results, '$.is_safe') = 0 THEN 1 ELSE 0 END)
+                FROM ai_analysis_jobs WHERE batch_id = ? AND username = ?
+                GROUP BY status
+            ''', (batch_id, username)).fetchall()
+        if not rows:
+            return None
+        counts = {status: count for status, count, _, _ in rows}
+        total = sum(counts.values())
+        finished = counts.get('completed', 0) + counts.get('failed', 0)
+        return {
+            'batchId': batch_id,
+            'totalFiles': total,
+            'queued': counts.get('queued', 0),
+            'running': counts.get('running', 0),
+            'completed': counts.get('completed', 0),
+            'failed': counts.get('failed', 0),
+            'threatsFound': sum(threats or 0 for _, _, _, threats in rows),
+            'processingTime': round(sum(seconds or 0 for _, _, seconds, _ in rows), 3),
+            'progress': round(finished / total * 100, 1) if total else 100.0,
+            'scanComplete': finished == total,
+        }
+
+    def iter_results(self, batch_id: str, username: str, follow: bool = False,
+                     poll_interval: float = 0.5) -> Iterator[Dict]:
+        """Yield finished jobs of a batch in id order; with follow, wait for the rest"""
+        last_id = 0
+        while True:
+            with self._connection() as conn:
+                rows = conn.execute('''
+                    SELECT id, file_id, status, results, error_message, processing_time, retry_count, completed_at
+                    FROM ai_analysis_jobs
+                    WHERE batch_id = ? AND username = ? AND id > ? AND status IN ('completed', 'failed')
+                    ORDER BY id
+                ''', (batch_id, username, last_id)).fetchall()
+                pending = conn.execute('''
+                    SELECT COUNT(*) FROM ai_analysis_jobs
+                    WHERE batch_id = ? AND username = ? AND status IN ('queued', 'running')
+                ''', (batch_id, username)).fetchone()[0]
+            for job_id, file_id, status, results, error, seconds, retries, completed_at in rows:
+                last_id = job_id
+                yield {
+                    'jobId': job_id,
+                    'fileId': file_id,
+                    'status': status,
+                    'result': json.loads(results) if results else None,
+                    'error': error,
+                    'processingTime': seconds,
+                    'retryCount': retries,
+                    'completedAt': completed_at,
+                }
+            if not follow or (pending == 0 and not rows):
+                return
+            if not rows:
+                time.sleep(poll_interval)
+
+    def start(self):
+        with self._lock:
+            if self._dispatcher is None or not self._dispatcher.is_alive():
+                self._stopping = False
+                self._dispatcher = threading.Thread(target=self._dispatch_loop, name='scan-dispatcher', daemon=True)
+                self._dispatcher.start()
+
+    def shutdown(self, wait: bool = True):
+        self._stopping = True
+        self._wakeup.set()
+        if self._dispatcher is not None:
+            self._dispatcher.join(timeout=5)
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait, cancel_futures=True)
+            self._executor = None
+
+    # -- dispatching --
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # spawn: forking a threaded web server can copy held locks into the child
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers,
+                                                     mp_context=multiprocessing.get_context('spawn'))
+            return self._executor
+
+    def _discard_executor(self, executor: ProcessPoolExecutor):
+        """Drop a broken pool so the next submit starts a fresh one (no-op if already replaced)"""
+        with self._lock:
+            if self._executor is not executor:
+                return
+            self._executor = None
+        log.warning('Scan worker pool broke (a worker died); starting a new one')
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def _dispatch_loop(self):
+        while not self._stopping:
+            self._wakeup.clear()
+            claimed = self._claim_jobs()
+            pending = [job for job in map(self._run_job, claimed) if job is not None]
+            for start in range(0, len(pending), WORKER_BATCH_SIZE):
+                self._submit(pending[start:start + WORKER_BATCH_SIZE])
+            if not claimed:
+                self._wakeup.wait(timeout=5)
+
+    def _claim_jobs(self) -> List[tuple]:
+        with self._lock:
+            capacity = self.max_in_flight - self._in_flight
+        if capacity <= 0:
+            return []
+        with self._connection() as conn:
+            jobs = conn.execute('''
+                SELECT j.id, j.file_id, f.filename, f.secure_filename, f.file_hash
+                FROM ai_analysis_jobs j LEFT JOIN files f ON f.id = j.file_id
+                WHERE j.status = 'queued'
+                ORDER BY j.priority, j.id
+                LIMIT ?
+            ''', (capacity,)).fetchall()
+            # Another scheduler on the same database may claim a job between the
+            # SELECT and here; only the jobs this UPDATE actually moved are ours
+            started_at = datetime.now().isoformat()
+            return [job for job in jobs
+                    if conn.execute("UPDATE ai_analysis_jobs SET status = 'running', started_at = ? WHERE id = ? AND status = 'queued'",
+                                    (started_at, job[0])).rowcount == 1]
+
+    def _run_job(self, job: tuple) -> Optional[tuple]:
+        """Settle a job without the pool if possible; otherwise return it for a worker batch"""
+        job_id, file_id, filename, secure_filename, file_hash = job
+        if filename is None:
+            self._finish(job_id, error='File no longer exists', retry=False)
+            return None
+
+        known_threat = self.threat_intel.match(file_hash) if self.threat_intel is not None else None
+        if known_threat:
+            self._finish(job_id, file_id=file_id, analysis=known_threat_analysis(known_threat, file_hash),
+                         processing_time=0.0)
+            return None
+
+        file_path = self.blob_store.resolve(secure_filename, file_hash)
+        if not os.path.exists(file_path):
+            self._finish(job_id, error='File not found on disk', retry=False)
+            return None
+
+        # Known content never reaches a worker process
+        cached = self.engine.cached_features(self.scan_cache, file_hash, filename) if file_hash else None
+        if cached is not None:
+            self._finish(job_id, file_id=file_id, analysis=self.engine.score_features(filename, cached),
+                         processing_time=0.0)
+            return None
+        return job_id, file_id, filename, file_path
+
+    def _submit(self, batch: List[tuple], resubmitted: bool = False):
+        with self._lock:
+            self._in_flight += len(batch)
+        files = [(filename, path) for _, _, filename, path in batch]
+        executor = self._get_executor()
+        try:
+            try:
+                future = executor.submit(_scan_in_worker, files)
+            except BrokenProcessPool:
+                self._discard_executor(executor)
+                executor = self._get_executor()
+                future = executor.submit(_scan_in_worker, files)
+        except Exception as e:
+            self._settle_batch(batch, error=str(e))
+            return
+        future.add_done_callback(lambda fut: self._on_done(batch, fut, executor, resubmitted))
+
+    def _on_done(self, batch: List[tuple], future, executor: ProcessPoolExecutor = None, resubmitted: bool = False):
+        try:
+            analyses = future.result()
+        except BrokenProcessPool as e:
+            self._discard_executor(executor)
+            if resubmitted or self._stopping:
+                # Broke a fresh pool too: the batch itself may be what kills workers
+                self._settle_batch(batch, error=f'{type(e).__name__}: {e}')
+            else:
+                with self._lock:
+                    self._in_flight -= len(batch)
+                self._submit(batch, resubmitted=True)
+        except Exception as e:
+            self._settle_batch(batch, error=f'{type(e).__name__}: {e}')
+        else:
+            for (job_id, file_id, _, _), analysis in zip(batch, analyses):
+                self.engine.cache_features(self.scan_cache, analysis['features'])
+                self._finish(job_id, file_id=file_id, analysis=analysis, processing_time=analysis['processing_time'])
+            with self._lock:
+                self._in_flight -= len(batch)
+        self._wakeup.set()
+
+    def _settle_batch(self, batch: List[tuple], error: str):
+        for job_id, _, _, _ in batch:
+            self._finish(job_id, error=error, retry=True)
+        with self._lock:
+            self._in_flight -= len(batch)
+
+    def _finish(self, job_id: int, file_id: int = None, analysis: Dict = None,
+                processing_time: float = None, error: str = None, retry: bool = False):
+        now = datetime.now().isoformat()
+        try:
+            with self._connection() as conn:
+                if analysis is not None:
+                    record_scan_verdict(conn, file_id, analysis)
+                    conn.execute('''
+                        UPDATE ai_analysis_jobs
+                        SET status = 'completed', results = ?, confidence_scores = ?, processing_time = ?, completed_at = ?
+                        WHERE id = ?
+                    ''', (json.dumps(summarize_analysis(analysis)),
+                          json.dumps({'threat_score': analysis['threat_score']}), processing_time, now, job_id))
+                elif retry:
+                    conn.execute('''
+                        UPDATE ai_analysis_jobs
+                        SET retry_count = retry_count + 1, error_message = ?,
+                            status = CASE WHEN retry_count + 1 >= ? THEN 'failed' ELSE 'queued' END,
+                            completed_at = CASE WHEN retry_count + 1 >= ? THEN ? ELSE NULL END
+                        WHERE id = ?
+                    ''', (error, MAX_RETRIES, MAX_RETRIES, now, job_id))
+                else:
+                    conn.execute('''
+                        UPDATE ai_analysis_jobs SET status = 'failed', error_message = ?, completed_at = ?
+                        WHERE id = ?
+                    ''', (error, now, job_id))
+        except Exception:
+            log.exception('Scan job %s bookkeeping error', job_id)
@@ -5,7 +5,7 @@ SmartSecure Sri Lanka - Phase 2 Security Enhancement
 import jwt
 import bcrypt
 from datetime import datetime, timedelta, timezone
-from functools import wraps
+from functools import lru_cache, wraps
 from flask import request, jsonify, current_app
 import os
 from typing import Optional, Dict, Any
@@ -74,6 +74,11 @@ class SecurityManager:
             )
         return None
 
+@lru_cache(maxsize=8)
+def _security_manager(secret_key: str) -> SecurityManager:
+    """One SecurityManager per signing key instead of one per request"""
+    return SecurityManager(secret_key)
+
 def token_required(f):
     """Decorator to require JWT authentication"""
     @wraps(f)
@@ -97,7 +102,7 @@ def token_required(f):
             return jsonify({'success': False, 'error': 'Token is missing'}), 401
         
         try:
-            security_manager = SecurityManager(current_app.config['JWT_SECRET_KEY'])
+            security_manager = _security_manager(current_app.config['JWT_SECRET_KEY'])
             payload = security_manager.verify_jwt_token(token)
             if not payload:
                 return jsonify({'success': False, 'error': 'Token is invalid or expired'}), 401
@@ -115,7 +120,7 @@ def token_required(f):
 
 def generate_secure_session(user_data: Dict[str, Any]) -> Dict[str, Any]:
     """Generate secure session data with token"""
-    security_manager = SecurityManager(current_app.config['JWT_SECRET_KEY'])
+    security_manager = _security_manager(current_app.config['JWT_SECRET_KEY'])
     
     token = security_manager.generate_jwt_token(
         user_data['id'], 
@@ -0,0 +1,288 @@
+"""
+Malicious Signature Matching
+SmartSecure Sri Lanka - compiled multi-pattern scanner with hot-reloadable signature files
+"""
+import hashlib
+import os
+import re
+import threading
+import time
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+from request_logging import get_logger
+
+log = get_logger(__name__)
+
+# Offsets kept per signature in a scan report; counts are always exact
+MAX_RECORDED_OFFSETS = 16
+
+# A regex made only of ordinary characters and escaped punctuation
+_LITERAL_RE = re.compile(rb'^(?:[^\\.^$*+?{}\[\]|()]|\\[^A-Za-z0-9])+$')
+_BACKREFERENCE_RE = re.compile(rb'\\[1-9]|\(\?P=')
+
+
+class Signature(NamedTuple):
+    name: str
+    pattern: bytes
+
+
+def _as_literal(pattern: bytes) -> Optional[bytes]:
+    """The lower-cased text a pattern matches if it is a plain literal, else None"""
+    if not _LITERAL_RE.match(pattern):
+        return None
+    return re.sub(rb'\\(.)', rb'\1', pattern).lower()
+
+
+def _literal_prefix(pattern: bytes) -> Optional[bytes]:
+    """Lower-cased fixed text every match of `pattern` starts with, if any"""
+    if re.search(rb'(?<!\\)\|', pattern) or pattern.startswith(b'(?'):
+        return None  # top-level alternation or inline flags
+    tokens = re.match(rb'(?:[^\\.^$*+?{}\[\]|()]|\\[^A-Za-z0-9])*', pattern).group()
+    chars = re.findall(rb'\\(.)|(.)', tokens, re.DOTALL)
+    prefix = [escaped or plain for escaped, plain in chars]
+    if len(tokens) < len(pattern) and pattern[len(tokens):len(tokens) + 1] in (b'*', b'?', b'{'):
+        prefix = prefix[:-1]  # the last character is optional or repeated
+    return b''.join(prefix).lower() or None
+
+
+def _trie_regex(node: Dict) -> bytes:
+    """Regex for a byte trie that prefers the longest literal at each position"""
+    branches = []
+    for byte in sorted(key for key in node if key is not None):
+        child = node[byte]
+        prefix = bytes([byte])
+        # Path compression keeps the regex shallow for long literals
+        while None not in child and len(child) == 1:
+            (next_byte, child), = child.items()
+            prefix += bytes([next_byte])
+        branches.append(re.escape(prefix) + _trie_regex(child))
+    if not branches:
+        return b''
+    body = branches[0] if len(branches) == 1 else b'(?:' + b'|'.join(branches) + b')'
+    if None in node:
+        body = b'(?:' + body + b')?'
+    return body
+
+
+def parse_signature_file(path: str) -> List[Signature]:
+    """Read ``name<TAB>regex`` lines; blank lines and ``#`` comments are skipped.
+
+    A line without a tab is a bare pattern named after its line number.
+    """
+    signatures = []
+    with open(path, 'rb') as f:
+        for line_number, raw in enumerate(f, 1):
+            line = raw.rstrip(b'\r\n')
+            if not line.strip() or line.lstrip().startswith(b'#'):
+                continue
+            name, tab, pattern = line.partition(b'\t')
+            if not tab:
+                name, pattern = b'line-%d' % line_number, line
+            signatures.append(Signature(name.decode('utf-8').strip(), pattern))
+    return signatures
+
+
+class SignatureHits:
+    """Per-signature hit counts and (the first few) match offsets of one scan"""
+
+    def __init__(self):
+        self.counts: Dict[str, int] = {}
+        self.offsets: Dict[str, List[int]] = {}
+
+    def add(self, name: str, offset: int):
+        self.counts[name] = self.counts.get(name, 0) + 1
+        recorded = self.offsets.setdefault(name, [])
+        if len(recorded) < MAX_RECORDED_OFFSETS:
+            recorded.append(offset)
+
+    def __len__(self):
+        return len(self.counts)
+
+    def to_dict(self) -> Dict[str, Dict]:
+        return {name: {'count': count, 'offsets': self.offsets[name]} for name, count in sorted(self.counts.items())}
+
+
+class SignatureMatcher:
+    """A signature set compiled once into a shared literal automaton plus one alternation.
+
+    Plain literals (most signatures) and the fixed leading text of regexes
+    such as ``eval\\s*\\(`` go into a single byte trie compiled to a regex and
+    run over the lower-cased data, so each scan position costs at most one walk
+    down the trie however many signatures there are - the Aho-Corasick
+    guarantee, executed by the C regex engine. A trie hit is a literal match,
+    or a candidate offset where the owning regexes are confirmed with
+    ``match()``. Regexes without a usable prefix are joined into one
+    alternation. Every (signature, start offset) occurrence is reported,
+    including overlapping ones, matching ``re.IGNORECASE`` semantics.
+    """
+
+    # Shorter regex prefixes would confirm too many candidates one by one
+    MIN_PREFIX = 3
+
+    def __init__(self, signatures: Iterable[Signature]):
+        self.signatures: Tuple[Signature, ...] = tuple(signatures)
+        self.version = hashlib.sha256(b'\n'.join(
+            s.name.encode('utf-8') + b'\t' + s.pattern for s in self.signatures)).hexdigest()[:16]
+
+        # Trie keys (lower-cased) -> literal signatures that match outright,
+        # and regex signatures that start with the key and must be confirmed
+        self._literal_hits: Dict[bytes, List[int]] = {}
+        self._anchored: Dict[bytes, List[int]] = {}
+        self._regexes = {}
+        unanchored = []
+        for index, signature in enumerate(self.signatures):
+            if not signature.pattern:
+                raise ValueError(f'Empty signature pattern: {signature.name}')
+            literal = _as_literal(signature.pattern)
+            if literal is not None:
+                self._literal_hits.setdefault(literal, []).append(index)
+                continue
+            self._regexes[index] = re.compile(signature.pattern, re.IGNORECASE)
+            prefix = _literal_prefix(signature.pattern)
+            if prefix is not None and len(prefix) >= self.MIN_PREFIX:
+                self._anchored.setdefault(prefix, []).append(index)
+            else:
+                unanchored.append(index)
+
+        keys = set(self._literal_hits) | set(self._anchored)
+        trie: Dict = {}
+        for key in keys:
+            node = trie
+            for byte in key:
+                node = node.setdefault(byte, {})
+            node[None] = True
+        self._trie_re = re.compile(_trie_regex(trie)) if keys else None
+        # The trie reports the longest key at an offset; every key that is a
+        # prefix of it starts there too
+        self._key_prefixes = {key: [key[:n] for n in range(1, len(key) + 1) if key[:n] in keys] for key in keys}
+
+        self._combined_re, self._group_to_index = self._combine(unanchored)
+        self._standalone = [index for index in unanchored if index not in self._group_to_index.values()]
+
+    def _combine(self, regex_indexes: Sequence[int]):
+        group_to_index = {}
+        parts = []
+        group = 1
+        for index in regex_indexes:
+            pattern = self.signatures[index].pattern
+            if _BACKREFERENCE_RE.search(pattern):
+                continue  # group numbers shift inside the alternation; matched on its own
+            group_to_index[group] = index
+            parts.append(b'(' + pattern + b')')
+            group += 1 + self._regexes[index].groups
+        if not parts:
+            return None, {}
+        try:
+            return re.compile(b'|'.join(parts), re.IGNORECASE), group_to_index
+        except re.error:
+            # e.g. two signatures defining the same named group
+            return None, {}
+
+    def __len__(self):
+        return len(self.signatures)
+
+    @property
+    def patterns(self) -> List[bytes]:
+        return [s.pattern for s in self.signatures]
+
+    def scan(self, data, start: int = 0) -> Iterator[Tuple[int, int]]:
+        """Yield ``(signature_index, offset)`` for every match starting at or after `start`"""
+        if self._trie_re is not None:
+            lowered = bytes(data).lower()
+            pos = start
+            while True:
+                match = self._trie_re.search(lowered, pos)
+                if match is None:
+                    break
+                offset = match.start()
+                for key in self._key_prefixes[match.group()]:
+                    for index in self._literal_hits.get(key, ()):
+                        yield index, offset
+                    for index in self._anchored.get(key, ()):
+                        if self._regexes[index].match(data, offset):
+                            yield index, offset
+                pos = offset + 1
+
+        if self._combined_re is not None:
+            combined = sorted(self._group_to_index.values())
+            pos = start
+            while True:
+                match = self._combined_re.search(data, pos)
+                if match is None:
+                    break
+                first = self._group_to_index[match.lastindex]
+                yield first, match.start()
+                # Alternatives listed after the winner may match at the same offset too
+                for index in combined[combined.index(first) + 1:]:
+                    if self._regexes[index].match(data, match.start()):
+                        yield index, match.start()
+                pos = match.start() + 1
+
+        for index in self._standalone:
+            pos = start
+            while True:
+                match = self._regexes[index].search(data, pos)
+                if match is None:
+                    break
+                yield index, match.start()
+                pos = match.start() + 1
+
+    def hits(self, data) -> SignatureHits:
+        """Scan a whole buffer and collect per-signature counts and offsets"""
+        report = SignatureHits()
+        for index, offset in sorted(self.scan(data), key=lambda hit: (hit[1], hit[0])):
+            report.add(self.signatures[index].name, offset)
+        return report
+
+
+def default_signatures(patterns: Sequence[bytes]) -> List[Signature]:
+    return [Signature(pattern.decode('latin-1'), pattern) for pattern in patterns]
+
+
+class SignatureSet:
+    """The engine's current SignatureMatcher, reloaded when its signature file changes.
+
+    Without a path the built-in patterns are used. With one, the file's
+    modification time is checked at most every `check_interval` seconds and a
+    changed file is recompiled and swapped in; a file that fails to parse is
+    reported and the previous matcher kept.
+    """
+
+    def __init__(self, fallback: Sequence[Signature], path: Optional[str] = None, check_interval: float = 5.0):
+        self.path = path
+        self.check_interval = check_interval
+        self._fallback = SignatureMatcher(fallback)
+        self._matcher = self._fallback
+        self._mtime = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        if path:
+            self.reload()
+
+    def replace(self, signatures: Iterable[Signature]):
+        """Use a fixed signature list, ignoring any signature file"""
+        with self._lock:
+            self.path = None
+            self._matcher = SignatureMatcher(signatures)
+
+    def reload(self) -> bool:
+        """Recompile the signature file now; returns True if a new matcher was installed"""
+        with self._lock:
+            self._checked_at = time.monotonic()
+            try:
+                mtime = os.stat(self.path).st_mtime_ns
+                if mtime == self._mtime:
+                    return False
+                matcher = SignatureMatcher(parse_signature_file(self.path))
+            except (OSError, ValueError, re.error) as e:
+                log.warning('Keeping current signatures, could not load %s: %s', self.path, e)
+                return False
+            self._matcher, self._mtime = matcher, mtime
+            log.info('Loaded %d signatures from %s (version %s)', len(matcher), self.path, matcher.version)
+            return True
+
+    @property
+    def matcher(self) -> SignatureMatcher:
+        if self.path and time.monotonic() - self._checked_at >= self.check_interval:
+            self.reload()
+        return self._matcher
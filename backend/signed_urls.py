@@ -0,0 +1,151 @@
+"""
+Signed Download URLs
+SmartSecure Sri Lanka - short-lived HMAC-signed file links verified without a database lookup
+"""
+import base64
+import hashlib
+import hmac
+import json
+import threading
+import time
+from typing import Callable, Dict, Optional, Tuple
+
+from flask import Blueprint, Flask, jsonify
+
+from blob_store import BlobStore
+from file_serving import send_stored_file
+
+DEFAULT_TTL_SECONDS = 900
+SIGNED_PATH = '/files/signed/'
+# Separates these signatures from the JWTs signed with the same secret
+_KEY_CONTEXT = b'smartsecure signed download url v1'
+
+
+def _b64encode(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def _b64decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+
+class DownloadUrlSigner:
+    """Issues and checks ``/files/signed/<payload>.<mac>`` links for one stored file.
+
+    The payload carries everything needed to serve the file: its id, owner,
+    storage location (secure filename and content hash), original name,
+    disposition and expiry. Verifying a link is one HMAC-SHA256 over the
+    payload, so the handler needs no token cache and no database.
+
+    Expiries are rounded up to a multiple of `ttl`, which keeps a file's link
+    identical for a while (browser caches and ETags keep working) while every
+    link still dies between `ttl` and `2 * ttl` seconds after it was issued.
+    A link is a bearer credential for that one file until then. Deleting the
+    row does not necessarily remove the bytes (another row may share the
+    deduplicated blob), so the deleting process calls `revoke`, and its
+    signer refuses the file's links until they would have expired anyway.
+    Revocations are in memory: a separate `create_download_app` process, or a
+    restart, keeps serving a deleted file's links for up to `2 * ttl` seconds
+    while its blob is still referenced.
+    """
+
+    def __init__(self, secret_key: str, ttl: int = DEFAULT_TTL_SECONDS, clock: Callable[[], float] = time.time):
+        self.key = hmac.new(secret_key.encode('utf-8'), _KEY_CONTEXT, hashlib.sha256).digest()
+        # Keyed once; each MAC starts from a copy instead of re-deriving the pads
+        self._keyed = hmac.new(self.key, digestmod=hashlib.sha256)
+        self.ttl = ttl
+        self.clock = clock
+        # (file_id, secure_filename) -> time the last link issued for it expires; oldest first
+        self._revoked: Dict[Tuple[int, str], float] = {}
+        self._lock = threading.Lock()
+
+    def _mac(self, payload: str) -> str:
+        mac = self._keyed.copy()
+        mac.update(payload.encode('ascii'))
+        return _b64encode(mac.digest())
+
+    def _url(self, claims: list) -> str:
+        payload = _b64encode(json.dumps(claims, separators=(',', ':'), ensure_ascii=False).encode('utf-8'))
+        return f'{SIGNED_PATH}{payload}.{self._mac(payload)}'
+
+    def sign(self, file_id: int, username: str, user_id: Optional[int], secure_filename: str,
+             file_hash: Optional[str], filename: str, as_attachment: bool = True) -> Dict:
+        """{'url': path, 'expires': unix time} for one file"""
+        expires = (int(self.clock()) // self.ttl + 2) * self.ttl
+        claims = [file_id, username, user_id, secure_filename, file_hash, filename,
+                  'attachment' if as_attachment else 'inline', expires]
+        return {'url': self._url(claims), 'expires': expires}
+
+    def sign_links(self, file_id: int, username: str, user_id: Optional[int], secure_filename: str,
+                   file_hash: Optional[str], filename: str) -> Dict:
+        """{'download': path, 'preview': path, 'expires': unix time}: both links for one file in one call"""
+        expires = (int(self.clock()) // self.ttl + 2) * self.ttl
+        claims = [file_id, username, user_id, secure_filename, file_hash, filename, 'attachment', expires]
+        download = self._url(claims)
+        claims[6] = 'inline'
+        return {'download': download, 'preview': self._url(claims), 'expires': expires}
+
+    def revoke(self, file_id: int, secure_filename: str):
+        """Refuse every link issued so far for one (deleted) file"""
+        now = self.clock()
+        with self._lock:
+            self._revoked.pop((file_id, secure_filename), None)
+            self._revoked[(file_id, secure_filename)] = now + 2 * self.ttl
+            # Entries are appended in expiry order, so the stale ones are at the front
+            while True:
+                key, until = next(iter(self._revoked.items()))
+                if until > now:
+                    break
+                del self._revoked[key]
+
+    def verify(self, token: str) -> Optional[Dict]:
+        """The claims of an authentic, unexpired, unrevoked link token, else None"""
+        payload, _, mac = token.partition('.')
+        if not payload or not hmac.compare_digest(mac.encode('ascii', 'replace'), self._mac(payload).encode('ascii')):
+            return None
+        try:
+            (file_id, username, user_id, secure_filename, file_hash, filename,
+             disposition, expires) = json.loads(_b64decode(payload))
+        except (TypeError, ValueError):
+            return None
+        if expires <= self.clock() or (file_id, secure_filename) in self._revoked:
+            return None
+        return {'file_id': file_id, 'username': username, 'user_id': user_id, 'secure_filename': secure_filename,
+                'file_hash': file_hash, 'filename': filename, 'as_attachment': disposition == 'attachment',
+                'expires': expires}
+
+
+def signed_download_blueprint(signer: DownloadUrlSigner, get_blob_store: Callable[[], BlobStore],
+                              on_download: Optional[Callable[[Dict], None]] = None) -> Blueprint:
+    """GET /files/signed/<token>: stream the linked file (with ETag / Range support) if the link is valid.
+
+    `on_download` is called with the link's claims after each full (200) response.
+    """
+    blueprint = Blueprint('signed_downloads', __name__)
+
+    @blueprint.route(SIGNED_PATH + '<token>', methods=['GET'])
+    def signed_download(token):
+        claims = signer.verify(token)
+        if claims is None:
+            return jsonify({'error': 'Link is invalid or has expired'}), 403
+        file_path = get_blob_store().resolve(claims['secure_filename'], claims['file_hash'])
+        try:
+            response = send_stored_file(file_path, claims['filename'], claims['file_hash'], claims['as_attachment'])
+        except FileNotFoundError:
+            return jsonify({'error': 'File not found'}), 404
+        if on_download is not None and response.status_code == 200:
+            on_download(claims)
+        return response
+
+    return blueprint
+
+
+def create_download_app(secret_key: str, uploads_dir: str, ttl: int = DEFAULT_TTL_SECONDS) -> Flask:
+    """A standalone app that only serves signed links (needs the JWT secret and the uploads directory).
+
+    e.g. ``gunicorn "signed_urls:create_download_app('<secret>', 'uploads')"`` next to the API.
+    """
+    app = Flask(__name__)
+    store = BlobStore(uploads_dir)
+    app.register_blueprint(signed_download_blueprint(DownloadUrlSigner(secret_key, ttl), lambda: store))
+    return app
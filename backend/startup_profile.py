@@ -0,0 +1,117 @@
+"""
+Startup Import Profiler
+SmartSecure Sri Lanka - where the server's cold-start time goes, per package and boot phase
+
+Usage:
+    python final_working_server.py --import-profile
+"""
+import builtins
+import importlib.util
+import sys
+import time
+from typing import Dict, List, Optional, Tuple
+
+# Modules that must stay unloaded until the first analysis needs them
+ML_MODULES = ('numpy', 'pandas', 'scipy', 'sklearn', 'joblib')
+
+
+class ImportProfiler:
+    """Times every first-time import made through ``__import__`` while installed.
+
+    Each import's own time excludes the imports it triggers, so the per-package
+    totals add up to the wall time spent importing (like ``python -X importtime``,
+    but collected in-process and grouped). Boot phases are recorded with mark().
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.self_times: Dict[str, float] = {}
+        self.phases: List[Tuple[str, float]] = []
+        self._last_mark = self.started
+        self._children = [0.0]
+        self._original_import = None
+
+    def install(self):
+        if self._original_import is None:
+            self._original_import = builtins.__import__
+            builtins.__import__ = self._import
+
+    def uninstall(self):
+        if self._original_import is not None:
+            builtins.__import__ = self._original_import
+            self._original_import = None
+
+    def _import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        original = self._original_import
+        try:
+            module_name = importlib.util.resolve_name('.' * level + name, (globals or {}).get('__package__'))
+        except (ImportError, ValueError):
+            module_name = name
+        if module_name in sys.modules:
+            return original(name, globals, locals, fromlist, level)
+
+        self._children.append(0.0)
+        started = time.perf_counter()
+        try:
+            return original(name, globals, locals, fromlist, level)
+        finally:
+            elapsed = time.perf_counter() - started
+            nested = self._children.pop()
+            self._children[-1] += elapsed
+            self.self_times[module_name] = self.self_times.get(module_name, 0.0) + elapsed - nested
+
+    def mark(self, phase: str):
+        now = time.perf_counter()
+        self.phases.append((phase, now - self._last_mark))
+        self._last_mark = now
+
+    def by_package(self) -> List[Tuple[str, float, int]]:
+        """(top-level package, seconds, modules imported), slowest first"""
+        totals: Dict[str, List] = {}
+        for module_name, seconds in self.self_times.items():
+            entry = totals.setdefault(module_name.split('.')[0], [0.0, 0])
+            entry[0] += seconds
+            entry[1] += 1
+        return sorted(((name, seconds, count) for name, (seconds, count) in totals.items()),
+                      key=lambda item: item[1], reverse=True)
+
+    def report(self, top: int = 15) -> str:
+        total = time.perf_counter() - self.started
+        imported = sum(self.self_times.values())
+        lines = [f"⏱️ Startup profile: ready in {total * 1000:.0f} ms "
+                 f"({imported * 1000:.0f} ms importing {len(self.self_times)} modules)"]
+        lines.append('   Boot phases:')
+        for phase, seconds in self.phases:
+            lines.append(f'     {phase:<28} {seconds * 1000:8.1f} ms')
+        lines.append('   Slowest packages (own import time):')
+        for name, seconds, count in self.by_package()[:top]:
+            lines.append(f'     {name:<28} {seconds * 1000:8.1f} ms  {count:4d} modules')
+        loaded = [name for name in ML_MODULES if name in sys.modules]
+        lines.append(f"   ML stack at startup: {'⚠️ loaded ' + ', '.join(loaded) if loaded else '✅ not loaded'}")
+        return '\n'.join(lines)
+
+
+_profiler: Optional[ImportProfiler] = None
+
+
+def enable() -> ImportProfiler:
+    """Start profiling; call before the imports to be measured"""
+    global _profiler
+    if _profiler is None:
+        _profiler = ImportProfiler()
+        _profiler.install()
+    return _profiler
+
+
+def mark(phase: str):
+    """End a boot phase (no-op unless profiling is enabled)"""
+    if _profiler is not None:
+        _profiler.mark(phase)
+
+
+def report() -> Optional[str]:
+    """Stop profiling and return the formatted report"""
+    if _profiler is None:
+        return None
+    _profiler.uninstall()
+    return _profiler.report()
@@ -0,0 +1,30 @@
+"""
+Per-User Storage Statistics
+SmartSecure Sri Lanka - reads of the storage totals that triggers keep beside the files table
+"""
+import sqlite3
+from typing import Dict
+
+
+def read_storage_stats(conn: sqlite3.Connection, username: str) -> Dict:
+    """A user's file count, bytes stored and per-extension / per-category breakdowns.
+
+    Everything comes from user_storage_stats and user_storage_breakdown
+    (migration 4), which are updated in the same transaction as every
+    insert, update or delete on files, so this is two primary-key lookups
+    however many files the user has.
+    """
+    row = conn.execute('SELECT file_count, total_size FROM user_storage_stats WHERE username = ?',
+                       (username,)).fetchone()
+    file_count, total_size = row if row else (0, 0)
+    breakdown = {'extension': {}, 'category': {}}
+    for dimension, value, count, size in conn.execute(
+            'SELECT dimension, value, file_count, total_size FROM user_storage_breakdown WHERE username = ?',
+            (username,)):
+        breakdown.setdefault(dimension, {})[value] = {'count': count, 'size': size}
+    return {
+        'file_count': file_count,
+        'total_size': total_size,
+        'by_extension': breakdown['extension'],
+        'by_category': breakdown['category'],
+    }
@@ -0,0 +1,120 @@
+"""Shared fixtures for tests that drive final_working_server against a temp database"""
+import sqlite3
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import bcrypt
+import jwt
+
+import final_working_server as server
+from db_pool import close_all_pools
+from log_writer import close_all_writers
+from upload_pipeline import install_streaming_uploads
+
+SERVER_SCHEMA = [
+    '''CREATE TABLE users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT UNIQUE NOT NULL,
+        password_hash TEXT NOT NULL,
+        email TEXT,
+        created_date TEXT NOT NULL,
+        last_login TEXT,
+        is_active INTEGER DEFAULT 1,
+        role TEXT DEFAULT 'user'
+    )''',
+    '''CREATE TABLE files (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT NOT NULL,
+        filename TEXT NOT NULL,
+        secure_filename TEXT NOT NULL,
+        file_size INTEGER NOT NULL,
+        upload_date TEXT NOT NULL,
+        file_hash TEXT,
+        mime_type TEXT,
+        threat_score REAL DEFAULT 0.0,
+        is_safe INTEGER DEFAULT 1,
+        file_category TEXT DEFAULT 'unknown',
+        last_scan TEXT
+    )''',
+    '''CREATE TABLE activity_logs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER,
+        activity_type TEXT,
+        description TEXT,
+        timestamp TEXT
+    )''',
+    '''CREATE TABLE security_events (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER,
+        event_type TEXT NOT NULL,
+        threat_level TEXT NOT NULL,
+        description TEXT,
+        timestamp TEXT NOT NULL,
+        resolved INTEGER DEFAULT 0
+    )''',
+]
+
+
+def create_server_database(db_path, users=(('alice', 'pw123', 'user'),)):
+    conn = sqlite3.connect(db_path)
+    for statement in SERVER_SCHEMA:
+        conn.execute(statement)
+    for username, password, role in users:
+        password_hash = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds=4)).decode('utf-8')
+        conn.execute('INSERT INTO users (username, password_hash, email, created_date, role) VALUES (?, ?, ?, ?, ?)',
+                     (username, password_hash, f'{username}@smartsecure.lk', datetime.now().isoformat(), role))
+    conn.commit()
+    conn.close()
+
+
+def make_token(secret_key, user_id=1, username='alice', role='user'):
+    return jwt.encode({'user_id': user_id, 'username': username, 'role': role,
+                       'exp': datetime.now() + timedelta(hours=1)}, secret_key, algorithm='HS256')
+
+
+class ServerTestCase(unittest.TestCase):
+    """Drives final_working_server against a fresh temp database, uploads directory and threat index.
+
+    The server's path globals point at the temp files for the duration of a
+    test; everything cached per path is dropped and the globals restored
+    afterwards. Subclasses pick their accounts with `users`, extend
+    setUp/tearDown through super(), and swap any other server global with
+    `patch_server` so it is restored too.
+    """
+    users = (('alice', 'pw123', 'user'),)
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_file = str(Path(self.tmp_dir.name) / 'test.db')
+        self.uploads = str(Path(self.tmp_dir.name) / 'uploads')
+        self.index_path = str(Path(self.tmp_dir.name) / 'threats.idx')
+        create_server_database(self.db_file, users=self.users)
+        self._saved = {}
+        self._saved_request_class = server.app.request_class
+        self.patch_server(DB_PATH=self.db_file, UPLOADS_DIR=self.uploads, THREAT_INDEX_PATH=self.index_path)
+        install_streaming_uploads(server.app, self.uploads)
+        self.client = server.app.test_client()
+        self.headers = {'Authorization': f'Bearer {make_token(server.SECRET_KEY)}'}
+
+    def patch_server(self, **values):
+        """Set final_working_server globals until the end of the test"""
+        for name, value in values.items():
+            self._saved.setdefault(name, getattr(server, name))
+            setattr(server, name, value)
+
+    def tearDown(self):
+        scheduler = server._scan_schedulers.pop(self.db_file, None)
+        if scheduler is not None:
+            scheduler.shutdown()
+        server._scan_caches.pop(self.db_file, None)
+        server._threat_intel.pop((self.db_file, self.index_path), None)
+        server._audit_logs.pop(self.db_file, None)
+        server.analytics_cache.invalidate()
+        for name, value in self._saved.items():
+            setattr(server, name, value)
+        server.app.request_class = self._saved_request_class
+        close_all_writers()
+        close_all_pools()
+        self.tmp_dir.cleanup()
@@ -0,0 +1,193 @@
+import sqlite3
+import tempfile
+import unittest
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from pathlib import Path
+from unittest import mock
+
+import final_working_server as server
+from advanced_analytics import AdvancedAnalytics
+from db_pool import close_all_pools
+from helpers import ServerTestCase, create_server_database, make_token
+from migrations import migrate
+
+
+class AdvancedAnalyticsTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_file = str(Path(self.tmp_dir.name) / 'test.db')
+        create_server_database(self.db_file, users=(('alice', 'pw', 'user'), ('bob', 'pw', 'user')))
+        self.today = datetime.utcnow().replace(hour=9, minute=30)
+        self.yesterday = self.today - timedelta(days=1)
+        # Rows written before the migration are backfilled, later ones go through the triggers
+        self.insert_rows(self.yesterday, old_days=90)
+        migrate(self.db_file)
+        self.insert_rows(self.today)
+        self.analytics = AdvancedAnalytics(self.db_file)
+
+    def tearDown(self):
+        close_all_pools()
+        self.tmp_dir.cleanup()
+
+    def insert_rows(self, when, old_days=None):
+        conn = sqlite3.connect(self.db_file)
+        stamps = [when.isoformat()] + ([(when - timedelta(days=old_days)).isoformat()] if old_days else [])
+        for stamp in stamps:
+            conn.executemany('INSERT INTO activity_logs (user_id, activity_type, description, timestamp) '
+                             'VALUES (?, ?, ?, ?)', [(1, 'LOGIN', '', stamp), (2, 'FILE_UPLOAD', '', stamp),
+                                                    (1, 'SECURITY_LOGIN_FAILED', '', stamp)])
+            conn.execute("INSERT INTO security_events (user_id, event_type, threat_level, timestamp) "
+                         "VALUES (1, 'MALWARE', 'HIGH', ?)", (stamp,))
+            conn.executemany('INSERT INTO files (username, filename, secure_filename, file_size, upload_date, '
+                             'threat_score, file_category) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                             [('alice', 'a.pdf', 'a', 1024 * 1024, stamp, 0.2, 'document'),
+                              ('bob', 'b.exe', 'b', 2048, stamp, 0.9, 'executable')])
+        conn.commit()
+        conn.close()
+
+    def test_windows_are_read_from_rollups(self):
+        users = self.analytics.get_user_analytics(30)
+        self.assertEqual([row['active_users'] for row in users['activity_trend']], [2, 2])
+        self.assertEqual(users['total_active_users'], 2)
+        self.assertEqual(users['top_activities'][0]['count'], 2)
+
+        security = self.analytics.get_security_analytics(30)
+        self.assertEqual([row['total_files'] for row in security['threat_trends']], [2, 2])
+        self.assertEqual(security['threat_trends'][0]['avg_threat'], 0.55)
+        self.assertEqual(security['security_events_by_level'], {'HIGH': 2})
+        self.assertEqual([row['failed_attempts'] for row in security['failed_login_trend']], [1, 1])
+
+        business = self.analytics.get_business_insights(30)
+        self.assertEqual(business['hourly_activity'], [{'hour': 9, 'activity': 6}])
+        self.assertEqual(business['retention_rate'], 100.0)
+        self.assertEqual(self.analytics.get_business_insights(0)['storage_trends'][0]['file_count'], 2)
+
+    def test_rescans_move_threat_totals(self):
+        conn = sqlite3.connect(self.db_file)
+        conn.execute("UPDATE files SET threat_score = 0.8 WHERE secure_filename = 'a'")
+        conn.commit()
+        conn.close()
+        trends = self.analytics.get_security_analytics(0)['threat_trends']
+        self.assertEqual(trends, [{'date': self.today.date().isoformat(), 'avg_threat': 0.85, 'total_files': 2,
+                                   'high_threat_files': 2}])
+
+    def test_performance_metrics_follow_the_live_columns(self):
+        conn = sqlite3.connect(self.db_file)
+        conn.execute("INSERT INTO system_metrics (metric_name, metric_value, recorded_at) VALUES ('cpu_usage', 40, ?)",
+                     (self.today.isoformat(),))
+        conn.commit()
+        conn.close()
+        performance = self.analytics.get_performance_analytics(7)
+        self.assertEqual(performance['status'], 'live_data')
+        self.assertEqual(performance['cpu_trends'], [{'date': self.today.date().isoformat(), 'avg_cpu': 40.0}])
+
+    def test_report_reads_each_table_once_and_matches_the_sections(self):
+        statements = []
+        real_connection = self.analytics._connection
+
+        @contextmanager
+        def traced_connection():
+            with real_connection() as conn:
+                conn.set_trace_callback(statements.append)
+                try:
+                    yield conn
+                finally:
+                    conn.set_trace_callback(None)
+
+        self.analytics._connection = traced_connection
+        report = self.analytics.generate_executive_report(30)
+        reads = [sql for sql in statements if 'FROM' in sql and 'PRAGMA' not in sql]
+        for table in ('users', 'activity_users_daily', 'activity_hourly', 'uploads_daily',
+                      'security_events_daily', 'system_metrics'):
+            self.assertEqual(sum(f'FROM {table}' in ' '.join(sql.split()) for sql in reads), 1, table)
+
+        self.analytics._connection = real_connection
+        details = report['detailed_analytics']
+        self.assertEqual(details['user_metrics'], self.analytics.get_user_analytics(30))
+        self.assertEqual(details['security_metrics'], self.analytics.get_security_analytics(30))
+        self.assertEqual(details['business_metrics'], self.analytics.get_business_insights(30))
+        self.assertEqual(report['executive_summary']['total_files_processed'], 4)
+
+    def test_report_cache_follows_the_data_version(self):
+        report = self.analytics.generate_executive_report(30)
+        self.assertIs(self.analytics.generate_executive_report(30), report)
+        self.assertIsNot(self.analytics.generate_executive_report(7), report)
+
+        self.insert_rows(self.today)
+        fresh = self.analytics.generate_executive_report(30)
+        self.assertGreater(fresh['data_version'], report['data_version'])
+        self.assertEqual(fresh['executive_summary']['total_files_processed'], 6)
+        self.assertEqual([key[-1] for key in self.analytics._reports], [fresh['data_version']])
+
+    def test_request_path_writes_keep_the_cached_report(self):
+        report = self.analytics.generate_executive_report(30)
+        conn = sqlite3.connect(self.db_file)
+        conn.execute("INSERT INTO activity_logs (user_id, activity_type, timestamp) VALUES (1, 'FILE_LIST', ?)",
+                     (self.today.isoformat(),))
+        conn.execute("UPDATE users SET last_login = datetime('now')")
+        conn.execute("UPDATE files SET last_scan = datetime('now')")
+        conn.execute("INSERT INTO system_metrics (metric_name, metric_value, recorded_at) VALUES ('cpu_usage', 1, ?)",
+                     (self.today.isoformat(),))
+        conn.commit()
+        self.assertIs(self.analytics.generate_executive_report(30), report)
+
+        conn.execute("UPDATE users SET is_active = 0 WHERE username = 'bob'")
+        conn.commit()
+        conn.close()
+        fresh = self.analytics.generate_executive_report(30)
+        self.assertEqual(fresh['data_version'], report['data_version'] + 1)
+        self.assertEqual(fresh['executive_summary']['total_users'], 1)
+
+    def test_cached_report_is_rebuilt_when_the_window_moves(self):
+        report = self.analytics.generate_executive_report(30)
+        tomorrow = (self.today + timedelta(days=1)).date().isoformat()
+        with mock.patch.object(AdvancedAnalytics, '_window_start', staticmethod(lambda conn, days: tomorrow)):
+            moved = self.analytics.generate_executive_report(30)
+        self.assertIsNot(moved, report)
+        self.assertEqual(moved['executive_summary']['total_files_processed'], 0)
+
+
+class AnalyticsEndpointTest(ServerTestCase):
+    users = (('alice', 'pw', 'user'), ('root', 'pw', 'admin'))
+
+    def setUp(self):
+        super().setUp()
+        conn = sqlite3.connect(self.db_file)
+        conn.execute('INSERT INTO files (username, filename, secure_filename, file_size, upload_date, threat_score) '
+                     "VALUES ('alice', 'a.pdf', 'a', 100, datetime('now'), 0.9)")
+        conn.commit()
+        conn.close()
+        self.user = self.headers
+        self.admin = {'Authorization': f'Bearer {make_token(server.SECRET_KEY, 2, "root", "admin")}'}
+
+    def test_admin_analytics_come_from_the_database_and_the_cache(self):
+        r = self.client.get('/admin/analytics?days=7', headers=self.admin)
+        self.assertEqual(r.headers['X-Cache'], 'MISS')
+        body = r.get_json()
+        self.assertEqual(body['periodDays'], 7)
+        self.assertEqual(body['userAnalytics']['totalUsers'], 2)
+        self.assertEqual(body['securityAnalytics']['threatTrends'][0]['highThreatFiles'], 1)
+        self.assertEqual(body['fileAnalytics']['fileTypes'], [{'type': 'pdf', 'count': 1}])
+
+        r = self.client.get('/admin/analytics?days=7', headers=self.admin)
+        again = r.get_json()
+        # Live request figures are merged in per response; the rest is the cached dashboard
+        self.assertEqual(again['performanceAnalytics']['totalRequests'],
+                         body['performanceAnalytics']['totalRequests'] + 1)
+        del again['performanceAnalytics'], body['performanceAnalytics']
+        self.assertEqual((r.headers['X-Cache'], again), ('FRESH', body))
+        self.assertEqual(self.client.get('/admin/analytics', headers=self.user).status_code, 403)
+
+    def test_user_analytics_combine_own_files_with_the_dashboard(self):
+        analytics = self.client.get('/analytics?days=3000', headers=self.user).get_json()['analytics']
+        self.assertEqual(analytics['periodDays'], server.ANALYTICS_MAX_DAYS)
+        self.assertEqual((analytics['total_files'], analytics['by_type']), (1, {'pdf': 1}))
+        self.assertIn('businessInsights', analytics)
+        performance = analytics['performanceAnalytics']
+        self.assertIn('cpuTrends', performance)
+        self.assertNotEqual((performance['avgResponseTime'], performance['requestsPerHour']), (120, 150))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from ai_security import ThreatDetectionEngine
+from anomaly_model import AnomalyModelStore, ModelRefresher, history_activities, main, train_from_history
+from db_pool import close_all_pools
+from helpers import create_server_database
+
+
+class AnomalyModelLifecycleTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_file = str(Path(self.tmp_dir.name) / 'test.db')
+        self.model_dir = str(Path(self.tmp_dir.name) / 'model_store')
+        create_server_database(self.db_file)
+
+    def tearDown(self):
+        close_all_pools()
+        self.tmp_dir.cleanup()
+
+    def add_uploads(self, count, start):
+        conn = sqlite3.connect(self.db_file)
+        conn.executemany('''
+            INSERT INTO files (username, filename, secure_filename, file_size, upload_date)
+            VALUES (?, ?, ?, ?, ?)
+        ''', [('alice', f'doc{i}.pdf', f'x_doc{i}.pdf', 1000 + i, (start + timedelta(minutes=20 * i)).isoformat())
+              for i in range(count)])
+        conn.commit()
+        conn.close()
+
+    def test_history_features(self):
+        self.add_uploads(4, datetime(2024, 5, 1, 9, 0))
+        activities = history_activities(self.db_file)
+        self.assertEqual([a['hour'] for a in activities], [9, 9, 9, 10])
+        self.assertEqual([a['upload_count'] for a in activities], [3, 3, 3, 1])
+
+    def test_train_publish_and_warm_start(self):
+        self.add_uploads(20, datetime.now() - timedelta(days=1))
+        self.assertEqual(main(['--db', self.db_file, '--model-dir', self.model_dir, 'train']), 1)
+
+        self.add_uploads(80, datetime.now() - timedelta(days=2))
+        self.assertEqual(main(['--db', self.db_file, '--model-dir', self.model_dir, 'train']), 0)
+        reader = AnomalyModelStore(self.model_dir, check_interval=0)
+        first = reader.metadata()
+        self.assertEqual((first['samples'], first['n_estimators'], first['warm_start']), (100, 100, False))
+
+        # Nothing new since the last model: the warm refresh is skipped
+        store = AnomalyModelStore(self.model_dir, check_interval=0)
+        self.assertIsNone(ModelRefresher(self.db_file, store).refresh())
+
+        self.add_uploads(60, datetime.now() + timedelta(minutes=1))
+        second = ModelRefresher(self.db_file, store).refresh()
+        self.assertEqual((second['samples'], second['n_estimators'], second['base_version']), (60, 120, first['version']))
+        self.assertEqual(reader.current().n_estimators, 120)
+        self.assertEqual(reader.metadata()['version'], second['version'])
+
+        windowed = train_from_history(self.db_file, store, window_days=30)
+        self.assertEqual((windowed['samples'], windowed['n_estimators']), (160, 100))
+        store.prune(keep=1)
+        self.assertEqual(len([n for n in os.listdir(self.model_dir) if n.endswith('.joblib')]), 1)
+
+    def test_publishing_a_model_keeps_cached_file_verdicts(self):
+        engine = ThreatDetectionEngine()
+        engine.anomaly_models = AnomalyModelStore(self.model_dir, check_interval=0)
+        version = engine.engine_version
+        self.add_uploads(100, datetime.now() - timedelta(days=1))
+        train_from_history(self.db_file, AnomalyModelStore(self.model_dir))
+        self.assertTrue(engine.is_trained)
+        self.assertEqual(engine.engine_version, version)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+import json
+import sqlite3
+import tempfile
+import unittest
+from pathlib import Path
+
+import final_working_server as server
+from audit_log import AuditLog, decode_cursor
+from db_pool import close_all_pools
+from helpers import ServerTestCase, create_server_database, make_token
+from migrations import migrate
+
+
+def seed_logs(db_file):
+    """Activity rows and security events, with timestamps shared across both tables"""
+    conn = sqlite3.connect(db_file)
+    for i in range(30):
+        timestamp = f'2026-01-01T10:{i // 2:02d}:00'
+        conn.execute('INSERT INTO activity_logs (user_id, activity_type, description, timestamp) VALUES (?, ?, ?, ?)',
+                     (1 + i % 2, 'LOGIN' if i % 3 else 'SECURITY_LOGIN_FAILED',
+                      f'[WARNING] entry {i} | IP: 10.0.0.{i}' if i % 3 == 0 else f'entry {i}', timestamp))
+    for i in range(10):
+        conn.execute('INSERT INTO security_events (user_id, event_type, threat_level, description, timestamp) '
+                     'VALUES (?, ?, ?, ?, ?)', (1, 'MALWARE_DETECTED', 'HIGH', f'event {i}',
+                                                f'2026-01-01T10:{i:02d}:00'))
+    conn.commit()
+    conn.close()
+
+
+class AuditLogTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_file = str(Path(self.tmp_dir.name) / 'test.db')
+        create_server_database(self.db_file, users=(('alice', 'pw123', 'user'), ('root', 'pw456', 'admin')))
+        seed_logs(self.db_file)
+        migrate(self.db_file)
+        self.audit_log = AuditLog(self.db_file)
+
+    def tearDown(self):
+        close_all_pools()
+        self.tmp_dir.cleanup()
+
+    def all_pages(self, filters=None, limit=7):
+        entries, cursor = self.audit_log.page(filters, None, limit)
+        while cursor:
+            page, cursor = self.audit_log.page(filters, cursor, limit)
+            entries.extend(page)
+        return entries
+
+    def test_pages_cover_both_tables_in_order(self):
+        entries = self.all_pages()
+        self.assertEqual(len(entries), 40)
+        keys = [(e['timestamp'], e['id'], e['source']) for e in entries]
+        self.assertEqual(keys, sorted(keys, reverse=True))
+        self.assertEqual(len(set(keys)), 40)
+        self.assertEqual(entries[0]['username'], 'root')
+        self.assertEqual(list(self.audit_log.iter_entries(page_size=6)), entries)
+
+    def test_filters(self):
+        failed = self.all_pages({'activity_type': 'SECURITY_LOGIN_FAILED', 'source': 'activity'})
+        self.assertEqual(len(failed), 10)
+        self.assertTrue(all(not e['success'] and e['severity'] == 'WARNING' for e in failed))
+        self.assertEqual(failed[-1]['ip_address'], '10.0.0.0')
+        self.assertEqual(len(self.all_pages({'user_id': 2})), 15)
+        self.assertEqual(len(self.all_pages({'severity': 'high'})), 10)
+        window = self.all_pages({'since': '2026-01-01T10:05:00', 'until': '2026-01-01T10:07:00'})
+        self.assertEqual(len(window), 6)
+
+    def test_bad_cursor(self):
+        for cursor in ('not-base64!', 'WzEsMiwzXQ'):
+            with self.assertRaises(ValueError):
+                decode_cursor(cursor)
+
+    def test_pages_merge_index_order_without_sorting(self):
+        _, cursor = self.audit_log.page(None, None, 5)
+        conn = sqlite3.connect(self.db_file)
+        for filters, security_index in (({}, 'idx_security_events_timestamp'),
+                                        ({'user_id': 1}, 'idx_security_events_user_timestamp'),
+                                        ({'user_id': 1, 'since': '2026-01-01T10:02:00'},
+                                         'idx_security_events_user_timestamp')):
+            # The first unfiltered page walks the timestamp indexes from the top; every other one searches
+            for page_cursor in ((None, decode_cursor(cursor)) if filters else (decode_cursor(cursor),)):
+                sql, params = self.audit_log._query(filters, page_cursor, 6)
+                plan = ' | '.join(row[3] for row in conn.execute('EXPLAIN QUERY PLAN ' + sql, params))
+                self.assertIn('MERGE (UNION ALL)', plan)
+                self.assertIn('SEARCH activity_logs USING INDEX', plan)
+                self.assertIn(f'SEARCH security_events USING INDEX {security_index}', plan)
+                self.assertNotIn('TEMP B-TREE', plan)
+        conn.close()
+
+
+class AuditLogEndpointTest(ServerTestCase):
+    users = (('alice', 'pw123', 'user'), ('root', 'pw456', 'admin'))
+
+    def setUp(self):
+        super().setUp()
+        seed_logs(self.db_file)
+        self.user = self.headers
+        self.admin = {'Authorization': f'Bearer {make_token(server.SECRET_KEY, 2, "root", "admin")}'}
+
+    def test_users_only_see_their_own_entries(self):
+        r = self.client.get('/security/audit-logs?limit=100&user_id=2', headers=self.user)
+        body = r.get_json()
+        self.assertTrue(body['success'])
+        self.assertEqual(len(body['audit_logs']), 25)
+        self.assertEqual({e['username'] for e in body['audit_logs']}, {'alice'})
+        self.assertIsNone(body['next_cursor'])
+
+    def test_admin_pages_follow_the_cursor_header(self):
+        r = self.client.get('/admin/audit-logs?limit=30', headers=self.admin)
+        self.assertEqual(len(r.get_json()), 30)
+        r = self.client.get(f"/admin/audit-logs?limit=30&cursor={r.headers['X-Next-Cursor']}", headers=self.admin)
+        self.assertEqual(len(r.get_json()), 10)
+        self.assertNotIn('X-Next-Cursor', r.headers)
+
+        r = self.client.get('/admin/audit-logs?user=root&type=LOGIN', headers=self.admin)
+        self.assertEqual({e['username'] for e in r.get_json()}, {'root'})
+        self.assertEqual(self.client.get('/admin/audit-logs?cursor=junk', headers=self.admin).status_code, 400)
+        self.assertEqual(self.client.get('/admin/audit-logs', headers=self.user).status_code, 403)
+
+    def test_ndjson_export(self):
+        r = self.client.get('/admin/audit-logs', headers={**self.admin, 'Accept': 'application/x-ndjson'})
+        self.assertEqual(r.mimetype, 'application/x-ndjson')
+        lines = [json.loads(line) for line in r.get_data(as_text=True).splitlines()]
+        self.assertEqual(len(lines), 40)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+import os
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+from ai_security import ThreatDetectionEngine
+from anomaly_model import AnomalyModelStore, train_model
+
+FILES = [
+    ('notes.txt', b'plain meeting notes ' * 30),
+    ('setup.exe', b'MZ' + b'\x00' * 600),
+    ('tiny.js', b'x=1'),
+    ('page.html', b'<script>eval(atob("x"))</script> javascript: WScript.Shell ' * 5),
+    ('photo.jpg', os.urandom(4096)),
+    ('report.pdf', b'%PDF-1.4 onload = document.write("a") ' * 3),
+    ('noext', b''),
+]
+
+
+def comparable(result):
+    return {k: v for k, v in result.items() if k != 'analysis_timestamp'}
+
+
+class AnalyzeBatchTest(unittest.TestCase):
+    def setUp(self):
+        self.engine = ThreatDetectionEngine()
+
+    def test_batch_results_match_scalar_path(self):
+        expected = [comparable(self.engine.analyze_file_threat(name, data)) for name, data in FILES]
+        results = self.engine.analyze_batch(FILES)
+        self.assertEqual([comparable(r) for r in results], expected)
+        self.assertEqual(len({r['threat_score'] for r in results}), len({e['threat_score'] for e in expected}))
+        self.assertFalse(results[3]['is_safe'])
+
+    def test_accepts_paths_and_empty_batches(self):
+        self.assertEqual(self.engine.analyze_batch([]), [])
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            batch = []
+            for name, data in FILES:
+                path = os.path.join(tmp_dir, name)
+                with open(path, 'wb') as f:
+                    f.write(data)
+                batch.append((name, path))
+            results = self.engine.analyze_batch(batch)
+        self.assertEqual([r['threat_score'] for r in results],
+                         [self.engine.analyze_file_threat(name, data)['threat_score'] for name, data in FILES])
+
+
+class AnomalousBehaviorTest(unittest.TestCase):
+    def test_scores_with_published_model_and_indicators(self):
+        engine = ThreatDetectionEngine()
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        engine.anomaly_models = AnomalyModelStore(tmp_dir.name, check_interval=0)
+        start = datetime(2024, 1, 1, 1, 0, 0)
+        activities = [{'hour': 14, 'file_size': 2048, 'filename': f'doc{i}.pdf', 'upload_count': 1,
+                       'timestamp': (start + timedelta(hours=i)).isoformat()} for i in range(60)]
+        activities += [{'hour': 2, 'file_size': 80 * 1024 * 1024, 'filename': 'x' * 90, 'upload_count': 40,
+                        'timestamp': (start + timedelta(seconds=5 * i)).isoformat()} for i in range(10)]
+        self.assertEqual(engine.detect_anomalous_behavior(activities)['indicators'], ['Insufficient data for analysis'])
+        self.assertFalse(engine.is_trained)
+
+        train_model(engine.anomaly_models, activities)
+        result = engine.detect_anomalous_behavior(activities)
+        self.assertTrue(engine.is_trained)
+        self.assertEqual(result['confidence'], 0.7)
+        self.assertIs(result['is_anomalous'], True)
+        self.assertEqual(result['indicators'], ['Rapid file upload pattern detected', 'Unusually large file uploads',
+                                                'Significant off-hours activity'])
+        self.assertEqual(engine.detect_anomalous_behavior(activities[:5])['confidence'], 0.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
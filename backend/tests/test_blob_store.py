@@ -0,0 +1,123 @@
+import io
+import os
+import sqlite3
+import unittest
+
+import final_working_server as server
+from blob_store import BlobStore
+from helpers import ServerTestCase, make_token
+
+PDF = b'%PDF-1.4\n' + b'quarterly report ' * 500 + b'\n%%EOF'
+
+
+class BlobStoreDedupTest(ServerTestCase):
+    users = (('alice', 'pw123', 'user'), ('bob', 'pw123', 'user'))
+
+    def setUp(self):
+        super().setUp()
+        self.alice = self.headers
+        self.bob = {'Authorization': f'Bearer {make_token(server.SECRET_KEY, 2, "bob")}'}
+
+    def upload(self, headers, name='report.pdf'):
+        r = self.client.post('/upload', headers=headers, data={'file': (io.BytesIO(PDF), name)},
+                             content_type='multipart/form-data')
+        self.assertEqual(r.status_code, 200)
+        return r.get_json()['file']
+
+    def ref_count(self, sha256):
+        conn = sqlite3.connect(self.db_file)
+        row = conn.execute('SELECT ref_count FROM blobs WHERE sha256 = ?', (sha256,)).fetchone()
+        conn.close()
+        return row[0] if row else 0
+
+    def blob_files(self):
+        return [os.path.join(d, n) for d, _, names in os.walk(os.path.join(self.uploads, 'blobs')) for n in names]
+
+    def test_identical_uploads_share_one_blob(self):
+        first = self.upload(self.alice)
+        second = self.upload(self.bob, 'copy.pdf')
+        self.assertFalse(first['deduplicated'])
+        self.assertTrue(second['deduplicated'])
+        self.assertEqual(self.ref_count(first['sha256']), 2)
+
+        blobs = self.blob_files()
+        self.assertEqual(blobs, [BlobStore(self.uploads).path_for(first['sha256'])])
+        sha = first['sha256']
+        self.assertTrue(blobs[0].endswith(os.path.join(sha[:2], sha[2:4], sha)))
+
+        for headers, file_id in ((self.alice, first['id']), (self.bob, second['id'])):
+            r = self.client.get(f'/download/{file_id}', headers=headers)
+            self.assertEqual(r.status_code, 200)
+            self.assertEqual(r.data, PDF)
+            r.close()
+
+        r = self.client.get(f'/preview/{first["id"]}', headers=self.alice)
+        self.assertEqual(r.mimetype, 'application/pdf')
+        r.close()
+
+    def test_blob_is_removed_with_last_reference(self):
+        first = self.upload(self.alice)
+        second = self.upload(self.bob)
+
+        self.assertEqual(self.client.delete(f'/files/{first["id"]}', headers=self.alice).status_code, 200)
+        self.assertEqual(self.ref_count(first['sha256']), 1)
+        self.assertEqual(len(self.blob_files()), 1)
+
+        # Users cannot delete each other's rows
+        self.assertEqual(self.client.delete(f'/files/{second["id"]}', headers=self.alice).status_code, 404)
+
+        self.assertEqual(self.client.delete(f'/files/{second["id"]}', headers=self.bob).status_code, 200)
+        self.assertEqual(self.ref_count(first['sha256']), 0)
+        self.assertEqual(self.blob_files(), [])
+
+    def test_blob_outlives_a_rolled_back_release(self):
+        first = self.upload(self.alice)
+        store = server.get_blob_store()
+        blob_path = store.path_for(first['sha256'])
+
+        conn = sqlite3.connect(self.db_file)
+        self.assertEqual(store.release(conn, first['sha256']), blob_path)
+        conn.rollback()
+        self.assertEqual(self.ref_count(first['sha256']), 1)
+        self.assertTrue(os.path.exists(blob_path))
+
+        # An upload of the same bytes between the commit and the discard keeps the blob
+        self.assertEqual(store.release(conn, first['sha256']), blob_path)
+        conn.commit()
+        second = self.upload(self.bob)
+        store.discard(conn, blob_path)
+        self.assertEqual(self.ref_count(first['sha256']), 1)
+        r = self.client.get(f'/download/{second["id"]}', headers=self.bob)
+        self.assertEqual(r.data, PDF)
+        r.close()
+        conn.close()
+
+    def fail_file_inserts(self):
+        conn = sqlite3.connect(self.db_file)
+        conn.execute("CREATE TRIGGER no_files BEFORE INSERT ON files BEGIN SELECT RAISE(ABORT, 'disk full'); END")
+        conn.commit()
+        conn.close()
+
+    def test_failed_row_insert_leaves_no_orphan_blob(self):
+        self.fail_file_inserts()
+        r = self.client.post('/upload', headers=self.alice, data={'file': (io.BytesIO(PDF), 'report.pdf')},
+                             content_type='multipart/form-data')
+        self.assertEqual(r.status_code, 500)
+        self.assertEqual(self.blob_files(), [])
+        conn = sqlite3.connect(self.db_file)
+        self.assertEqual(conn.execute('SELECT COUNT(*) FROM blobs').fetchone()[0], 0)
+        conn.close()
+        self.assertEqual([n for _, _, names in os.walk(self.uploads) for n in names], [])
+
+    def test_failed_duplicate_upload_keeps_the_shared_blob(self):
+        first = self.upload(self.alice)
+        self.fail_file_inserts()
+        r = self.client.post('/upload', headers=self.bob, data={'file': (io.BytesIO(PDF), 'copy.pdf')},
+                             content_type='multipart/form-data')
+        self.assertEqual(r.status_code, 500)
+        self.assertEqual(self.ref_count(first['sha256']), 1)
+        self.assertEqual(len(self.blob_files()), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
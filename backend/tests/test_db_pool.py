@@ -0,0 +1,89 @@
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+
+from db_pool import ConnectionPool, PoolExhaustedError
+
+
+class ConnectionPoolTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_file = str(Path(self.tmp_dir.name) / 'pool.db')
+        self.pool = ConnectionPool(self.db_file, max_size=2, acquire_timeout=0.2)
+        with self.pool.connection() as conn:
+            conn.execute('CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT)')
+
+    def tearDown(self):
+        self.pool.close()
+        self.tmp_dir.cleanup()
+
+    def test_wal_mode_and_pragmas(self):
+        with self.pool.connection() as conn:
+            self.assertEqual(conn.execute('PRAGMA journal_mode').fetchone()[0], 'wal')
+            # NORMAL == 1
+            self.assertEqual(conn.execute('PRAGMA synchronous').fetchone()[0], 1)
+            self.assertEqual(conn.execute('PRAGMA busy_timeout').fetchone()[0], self.pool.busy_timeout_ms)
+
+    def test_connection_is_reused(self):
+        with self.pool.connection() as first:
+            pass
+        with self.pool.connection() as second:
+            pass
+        self.assertIs(first, second)
+        self.assertEqual(self.pool.stats()['open'], 1)
+
+    def test_nested_blocks_share_one_connection(self):
+        with self.pool.connection() as outer:
+            outer.execute("INSERT INTO items (name) VALUES ('a')")
+            with self.pool.connection() as inner:
+                self.assertIs(outer, inner)
+                inner.execute("INSERT INTO items (name) VALUES ('b')")
+            self.assertTrue(outer.in_transaction)
+        with self.pool.connection() as conn:
+            self.assertEqual(conn.execute('SELECT COUNT(*) FROM items').fetchone()[0], 2)
+
+    def test_exception_rolls_back(self):
+        with self.assertRaises(RuntimeError):
+            with self.pool.connection() as conn:
+                conn.execute("INSERT INTO items (name) VALUES ('x')")
+                raise RuntimeError('boom')
+        with self.pool.connection() as conn:
+            self.assertEqual(conn.execute('SELECT COUNT(*) FROM items').fetchone()[0], 0)
+
+    def test_pool_is_bounded(self):
+        started = threading.Event()
+        release = threading.Event()
+
+        def hold():
+            with self.pool.connection():
+                started.set()
+                release.wait(2)
+
+        holders = [threading.Thread(target=hold) for _ in range(2)]
+        for t in holders:
+            t.start()
+        started.wait(2)
+        while self.pool.stats()['open'] < 2:
+            pass
+        with self.assertRaises(PoolExhaustedError):
+            with self.pool.connection():
+                pass
+        release.set()
+        for t in holders:
+            t.join()
+        with self.pool.connection():
+            pass
+
+    def test_unpooled_mode_closes_connections(self):
+        pool = ConnectionPool(self.db_file, max_size=0)
+        with pool.connection() as first:
+            first.execute('SELECT 1')
+        with pool.connection() as second:
+            pass
+        self.assertIsNot(first, second)
+        self.assertEqual(pool.stats()['open'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import hashlib
+import io
+import mimetypes
+import mmap
+import os
+import re
+import tempfile
+import unittest
+
+from ai_security import SCAN_CHUNK_SIZE, ThreatDetectionEngine, _shannon_entropy
+
+# Content with matches straddling every SCAN_CHUNK_SIZE boundary
+BOUNDARY = b' see https://example.com/download?id=1 or mail ops@example.com; javascript:void(0) '
+SAMPLE = b''.join(
+    b'\x00' * 200 + bytes(range(256)) * 40 + b'plain words ' * (SCAN_CHUNK_SIZE // 12)
+    for _ in range(3)
+)
+SAMPLE = b''.join(SAMPLE[i:i + SCAN_CHUNK_SIZE - 40] + BOUNDARY for i in range(0, len(SAMPLE), SCAN_CHUNK_SIZE))
+
+
+def whole_buffer_features(engine, filename, data):
+    """The original in-memory extractor, kept as the reference for the streaming one"""
+    file_size = len(data)
+    mime_type, _ = mimetypes.guess_type(filename)
+    text_content = b''.join(re.findall(rb'[!-~]{4,}', data))
+    return {
+        'file_size': file_size,
+        'file_extension': os.path.splitext(filename.lower())[1],
+        'filename_length': len(filename),
+        'mime_type': mime_type or 'unknown',
+        'file_hash': hashlib.sha256(data).hexdigest(),
+        'entropy': _shannon_entropy(data[:1024]),
+        'text_ratio': len(text_content) / file_size if file_size > 0 else 0,
+        'contains_urls': len(re.findall(rb'https?://\S+', data)),
+        'contains_emails': len(re.findall(rb'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b', data)),
+        'malicious_patterns': sum(1 for p in engine.malicious_patterns if re.search(p, data, re.IGNORECASE)),
+        'signature_hits': engine.signatures.matcher.hits(data).to_dict(),
+        'null_byte_ratio': data.count(b'\x00') / file_size if file_size > 0 else 0,
+        'high_ascii_ratio': sum(1 for b in data[:1000] if b > 127) / min(1000, file_size) if file_size > 0 else 0,
+    }
+
+
+class StreamingFeatureExtractionTest(unittest.TestCase):
+    def setUp(self):
+        self.engine = ThreatDetectionEngine()
+        self.expected = whole_buffer_features(self.engine, 'bundle.bin', SAMPLE)
+
+    def test_boundary_matches_are_counted(self):
+        self.assertGreaterEqual(self.expected['contains_urls'], 4)
+        self.assertEqual(self.expected['contains_emails'], self.expected['contains_urls'])
+        self.assertEqual(self.engine.extract_file_features('bundle.bin', SAMPLE), self.expected)
+
+    def test_accepts_file_objects_iterators_and_mmap(self):
+        self.assertEqual(self.engine.extract_file_features('bundle.bin', io.BytesIO(SAMPLE)), self.expected)
+        chunks = (SAMPLE[i:i + 1000] for i in range(0, len(SAMPLE), 1000))
+        self.assertEqual(self.engine.extract_file_features('bundle.bin', chunks), self.expected)
+
+        with tempfile.TemporaryFile() as f:
+            f.write(SAMPLE)
+            f.flush()
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                self.assertEqual(self.engine.extract_file_features('bundle.bin', mapped), self.expected)
+
+    def test_empty_content(self):
+        self.assertEqual(self.engine.extract_file_features('empty.txt', b''),
+                         whole_buffer_features(self.engine, 'empty.txt', b''))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+import sqlite3
+import unittest
+from unittest import mock
+
+import final_working_server as server
+from file_listing import FileListing, file_query
+from helpers import ServerTestCase
+from migrations import migrate
+
+
+def seed_files(db_file):
+    conn = sqlite3.connect(db_file)
+    for i in range(25):
+        # Pairs of files share an upload time, so the cursor must break ties by id
+        conn.execute('INSERT INTO files (username, filename, secure_filename, file_size, upload_date, file_hash, '
+                     'is_safe, file_category) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                     ('alice', f'file{i}.{"pdf" if i % 2 else "PNG"}', f's{i}', i, f'2026-01-{1 + i // 2:02d}T10:00:00',
+                      f'{i:064x}', 0 if i % 5 == 0 else 1, 'document' if i % 2 else 'image'))
+    conn.execute("INSERT INTO files (username, filename, secure_filename, file_size, upload_date) "
+                 "VALUES ('bob', 'b.pdf', 'b', 1, '2026-01-05')")
+    conn.commit()
+    conn.close()
+
+
+class FileListingEndpointTest(ServerTestCase):
+    users = (('alice', 'pw123', 'user'), ('bob', 'pw123', 'user'))
+
+    def setUp(self):
+        super().setUp()
+        seed_files(self.db_file)
+
+    def get(self, query=''):
+        return self.client.get(f'/files?{query}', headers=self.headers)
+
+    def test_cursor_pages_cover_every_file_once(self):
+        ids, cursor = [], ''
+        while True:
+            r = self.get(f'limit=4&fields=id,uploaded_at&cursor={cursor}')
+            body = r.get_json()
+            ids.extend(f['id'] for f in body['files'])
+            self.assertTrue(all(set(f) == {'id', 'uploaded_at'} for f in body['files']))
+            cursor = body['next_cursor']
+            if not cursor:
+                break
+            self.assertEqual(r.headers['X-Next-Cursor'], cursor)
+        self.assertEqual(ids, list(range(25, 0, -1)))
+
+    def test_default_shape_is_unchanged(self):
+        files = self.get().get_json()['files']
+        self.assertEqual(len(files), 25)
+        first = files[0]
+        self.assertEqual((first['filename'], first['file_type'], first['safe'], first['downloadUrl']),
+                         ('file24.PNG', 'png', True, '/download/25'))
+        self.assertTrue(first['signedDownloadUrl'].startswith('/files/signed/'))
+
+    def test_each_row_is_signed_once(self):
+        with mock.patch.object(server.download_signer, 'sign_links',
+                               wraps=server.download_signer.sign_links) as sign_links:
+            files = self.get('limit=5').get_json()['files']
+        self.assertEqual(sign_links.call_count, 5)
+        self.assertNotEqual(files[0]['signedDownloadUrl'], files[0]['signedPreviewUrl'])
+        self.assertEqual(server.download_signer.verify(files[0]['signedPreviewUrl'].rsplit('/', 1)[1])['expires'],
+                         files[0]['signedUrlExpires'])
+
+        with mock.patch.object(server.download_signer, 'sign_links') as sign_links:
+            self.get('fields=id,filename')
+        sign_links.assert_not_called()
+
+    def test_filters_and_compact_rows(self):
+        body = self.get('type=pdf&safe=false&fields=filename,is_safe&format=compact').get_json()
+        self.assertEqual(body['fields'], ['filename', 'is_safe'])
+        self.assertEqual(body['rows'], [['file15.pdf', 0], ['file5.pdf', 0]])
+
+        body = self.get('since=2026-01-03&until=2026-01-04&category=image&fields=id').get_json()
+        self.assertEqual([f['id'] for f in body['files']], [5])
+
+        # LIKE wildcards in a type are matched literally
+        self.assertEqual(self.get('type=%25,_df&fields=id').get_json()['files'], [])
+
+        self.assertEqual(self.get('fields=id,password_hash').status_code, 400)
+        self.assertEqual(self.get('cursor=junk').status_code, 400)
+        self.assertEqual(self.get('safe=maybe').status_code, 400)
+
+    def test_pages_are_read_from_the_index_in_order(self):
+        migrate(self.db_file)
+        conn = sqlite3.connect(self.db_file)
+        listing = FileListing(('id', 'filename'))
+        sql, params = file_query('alice', {'safe': True}, ('2026-01-05', 9), 11, listing.columns)
+        plan = ' | '.join(row[3] for row in conn.execute('EXPLAIN QUERY PLAN ' + sql, params))
+        conn.close()
+        self.assertIn('USING INDEX idx_files_username_upload_date', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+
+if __name__ == '__main__':
+    unittest.main()
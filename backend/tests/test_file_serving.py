@@ -0,0 +1,95 @@
+import io
+import sqlite3
+import unittest
+from pathlib import Path
+
+from file_serving import _FileSegment
+from helpers import ServerTestCase
+from log_writer import get_log_writer
+
+BODY = bytes(range(256)) * 40
+
+
+class FileServingTest(ServerTestCase):
+    def setUp(self):
+        super().setUp()
+        r = self.client.post('/upload', headers=self.headers, content_type='multipart/form-data',
+                             data={'file': (io.BytesIO(BODY), 'clip.txt')})
+        self.file = r.get_json()['file']
+        self.url = f"/preview/{self.file['id']}"
+
+    def get(self, url=None, **headers):
+        r = self.client.get(url or self.url, headers={**self.headers, **headers})
+        r.get_data()
+        r.close()
+        return r
+
+    def test_full_response_carries_validators(self):
+        r = self.get()
+        self.assertEqual((r.status_code, r.data), (200, BODY))
+        self.assertEqual(r.headers['ETag'], f'"{self.file["sha256"]}"')
+        self.assertEqual(r.headers['Accept-Ranges'], 'bytes')
+        self.assertIn('Last-Modified', r.headers)
+        self.assertTrue(r.headers['Content-Disposition'].startswith('inline'))
+
+        self.assertEqual(self.get(**{'If-None-Match': r.headers['ETag']}).status_code, 304)
+        self.assertEqual(self.get(**{'If-Modified-Since': r.headers['Last-Modified']}).status_code, 304)
+        self.assertEqual(self.get(**{'If-None-Match': '"other"',
+                                     'If-Modified-Since': r.headers['Last-Modified']}).status_code, 200)
+
+    def test_single_and_suffix_ranges(self):
+        r = self.get(Range='bytes=100-199')
+        self.assertEqual((r.status_code, r.data), (206, BODY[100:200]))
+        self.assertEqual(r.headers['Content-Range'], f'bytes 100-199/{len(BODY)}')
+        self.assertEqual(r.headers['Content-Length'], '100')
+
+        r = self.get(Range='bytes=-10')
+        self.assertEqual(r.data, BODY[-10:])
+        r = self.get(Range='bytes=10000-')
+        self.assertEqual(r.data, BODY[10000:])
+
+        r = self.get(Range=f'bytes={len(BODY)}-')
+        self.assertEqual((r.status_code, r.headers['Content-Range']), (416, f'bytes */{len(BODY)}'))
+
+    def test_if_range_falls_back_to_the_whole_file(self):
+        etag = self.get().headers['ETag']
+        self.assertEqual(self.get(Range='bytes=0-9', **{'If-Range': etag}).status_code, 206)
+        r = self.get(Range='bytes=0-9', **{'If-Range': '"stale"'})
+        self.assertEqual((r.status_code, r.data), (200, BODY))
+
+    def test_multiple_ranges_are_multipart(self):
+        r = self.get(Range='bytes=0-4, 20-24, 22-29')
+        self.assertEqual(r.status_code, 206)
+        self.assertEqual(r.mimetype, 'multipart/byteranges')
+        self.assertEqual(int(r.headers['Content-Length']), len(r.data))
+        boundary = r.mimetype_params['boundary'].encode()
+        parts = r.data.split(b'--' + boundary)[1:-1]
+        self.assertEqual(len(parts), 2)
+        self.assertIn(f'Content-Range: bytes 20-29/{len(BODY)}'.encode(), parts[1])
+        self.assertTrue(parts[0].endswith(b'\r\n\r\n' + BODY[0:5] + b'\r\n'))
+        self.assertTrue(parts[1].endswith(b'\r\n\r\n' + BODY[20:30] + b'\r\n'))
+
+    def test_downloads_are_logged_once_not_per_seek(self):
+        download = f"/download/{self.file['id']}"
+        self.assertEqual(self.get(download).status_code, 200)
+        self.assertEqual(self.get(download, Range='bytes=0-0').status_code, 206)
+        self.assertEqual(self.get(download, **{'If-None-Match': f'"{self.file["sha256"]}"'}).status_code, 304)
+        self.assertEqual(self.get('/download/999').status_code, 404)
+        get_log_writer(self.db_file).flush()
+        conn = sqlite3.connect(self.db_file)
+        downloads = conn.execute("SELECT COUNT(*) FROM activity_logs WHERE activity_type = 'FILE_DOWNLOAD'").fetchone()
+        conn.close()
+        self.assertEqual(downloads[0], 1)
+
+    def test_segment_stops_at_its_end(self):
+        with open(Path(self.tmp_dir.name) / 'data', 'wb') as f:
+            f.write(BODY)
+        segment = _FileSegment(open(Path(self.tmp_dir.name) / 'data', 'rb'), 5, 12)
+        self.assertEqual(segment.tell(), 5)
+        self.assertEqual(segment.read(4) + segment.read(), BODY[5:12])
+        self.assertEqual(segment.read(), b'')
+        segment.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
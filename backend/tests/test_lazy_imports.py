@@ -0,0 +1,78 @@
+import os
+import subprocess
+import sys
+import tempfile
+import textwrap
+import unittest
+
+import startup_profile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs in a fresh interpreter: this test process has long since imported NumPy
+COLD_START = textwrap.dedent('''
+    import io, sys
+    sys.path.insert(0, 'tests')
+    from helpers import create_server_database, make_token
+    import final_working_server as server
+    from upload_pipeline import install_streaming_uploads
+
+    db_path, uploads = sys.argv[1], sys.argv[2]
+    create_server_database(db_path)
+    server.DB_PATH, server.UPLOADS_DIR = db_path, uploads
+    install_streaming_uploads(server.app, uploads)
+    client = server.app.test_client()
+    heavy = lambda: sorted(m for m in ('numpy', 'pandas', 'sklearn', 'joblib') if m in sys.modules)
+
+    assert client.post('/login', json={'username': 'alice', 'password': 'pw123'}).status_code == 200
+    headers = {'Authorization': 'Bearer ' + make_token(server.SECRET_KEY)}
+    assert client.get('/files', headers=headers).status_code == 200
+    print('before-upload', heavy())
+    r = client.post('/upload', headers=headers, data={'file': (io.BytesIO(b'hello ' * 100), 'a.txt')},
+                    content_type='multipart/form-data')
+    assert r.status_code == 200, r.get_json()
+    print('after-upload', heavy())
+''')
+
+
+class ColdStartTest(unittest.TestCase):
+    def test_login_and_listing_do_not_load_ml_stack(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            # Access logs come from a listener thread; keep them out of the stdout being checked
+            env = dict(os.environ, SMARTSECURE_MODEL_DIR=os.path.join(tmp_dir, 'models'), LOG_LEVEL='WARNING')
+            result = subprocess.run(
+                [sys.executable, '-c', COLD_START, os.path.join(tmp_dir, 'test.db'), os.path.join(tmp_dir, 'up')],
+                cwd=BACKEND_DIR, env=env, capture_output=True, text=True, timeout=120)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertIn('before-upload []', result.stdout)
+        self.assertIn("after-upload ['numpy']", result.stdout)
+
+
+class ImportProfilerTest(unittest.TestCase):
+    def test_attributes_nested_imports_to_their_own_module(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            with open(os.path.join(tmp_dir, 'slow_outer.py'), 'w') as f:
+                f.write('import time\ntime.sleep(0.02)\nimport slow_inner\n')
+            with open(os.path.join(tmp_dir, 'slow_inner.py'), 'w') as f:
+                f.write('import time\ntime.sleep(0.05)\n')
+            sys.path.insert(0, tmp_dir)
+            profiler = startup_profile.ImportProfiler()
+            profiler.install()
+            try:
+                import slow_outer  # noqa: F401
+            finally:
+                profiler.uninstall()
+                sys.path.remove(tmp_dir)
+                sys.modules.pop('slow_outer', None)
+                sys.modules.pop('slow_inner', None)
+        profiler.mark('imports')
+
+        self.assertGreaterEqual(profiler.self_times['slow_inner'], 0.05)
+        self.assertGreaterEqual(profiler.self_times['slow_outer'], 0.02)
+        self.assertLess(profiler.self_times['slow_outer'], 0.05)
+        self.assertEqual(profiler.by_package()[0][0], 'slow_inner')
+        self.assertIn('imports', profiler.report())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,125 @@
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import unittest
+from datetime import datetime, timedelta
+from pathlib import Path
+from unittest import mock
+
+from db_pool import close_all_pools
+from helpers import create_server_database
+from activity_logger import log_activity
+from log_writer import LogWriter, close_all_writers, get_log_writer
+
+
+class LogWriterTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_file = str(Path(self.tmp_dir.name) / 'test.db')
+        create_server_database(self.db_file)
+
+    def tearDown(self):
+        close_all_writers()
+        close_all_pools()
+        self.tmp_dir.cleanup()
+
+    def count(self, table):
+        conn = sqlite3.connect(self.db_file)
+        count = conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+        conn.close()
+        return count
+
+    def test_every_writer_stamps_rows_in_utc(self):
+        log_activity(self.db_file, 1, 'LOGIN', 'via activity_logger')
+        writer = get_log_writer(self.db_file)
+        writer.log_activity(1, 'FILE_UPLOAD', 'via the writer')
+        writer.log_security_event(1, 'KNOWN_THREAT_UPLOAD', 'HIGH', 'via the writer')
+        writer.flush()
+        conn = sqlite3.connect(self.db_file)
+        stamps = [row[0] for row in conn.execute('SELECT timestamp FROM activity_logs UNION ALL '
+                                                 'SELECT timestamp FROM security_events')]
+        conn.close()
+        now = datetime.utcnow()
+        self.assertEqual(len(stamps), 3)
+        for stamp in stamps:
+            self.assertLess(abs(datetime.fromisoformat(stamp) - now), timedelta(minutes=1), stamp)
+
+    def test_batches_by_size_interval_and_close(self):
+        writer = LogWriter(self.db_file, batch_size=50, flush_interval_ms=60_000)
+        with mock.patch.object(writer, '_write', wraps=writer._write) as write:
+            for i in range(120):
+                writer.log_activity(1, 'FILE_UPLOAD', f'upload {i}')
+            writer.log_security_event(1, 'KNOWN_THREAT_UPLOAD', 'HIGH', 'rejected')
+            writer.close()
+        self.assertEqual(self.count('activity_logs'), 120)
+        self.assertEqual(self.count('security_events'), 1)
+        self.assertLess(write.call_count, 10)
+        self.assertEqual(writer.stats(), {'queued': 0, 'written': 121, 'dropped': 0, 'spilled': 0})
+
+        timed = LogWriter(self.db_file, batch_size=1000, flush_interval_ms=20)
+        timed.log_activity(2, 'LOGIN', 'Logged in')
+        for _ in range(100):
+            if self.count('activity_logs') == 121:
+                break
+            time.sleep(0.02)
+        self.assertEqual(self.count('activity_logs'), 121)
+        timed.close()
+
+    def test_overflow_policies(self):
+        for policy, expected_rows, dropped in (('drop_newest', [0, 1, 2], 2), ('drop_oldest', [2, 3, 4], 2),
+                                               ('spill', [0, 1, 2, 3, 4], 0)):
+            with self.subTest(policy=policy):
+                writer = LogWriter(self.db_file, batch_size=100, flush_interval_ms=60_000, max_queue=3,
+                                   overflow=policy)
+                with writer._cond:  # hold the writer thread off so the queue fills up
+                    results = [writer.log_activity(None, policy, str(i)) for i in range(5)]
+                self.assertTrue(writer.flush())
+                conn = sqlite3.connect(self.db_file)
+                rows = [int(d) for (d,) in conn.execute('SELECT description FROM activity_logs WHERE activity_type = ? '
+                                                        'ORDER BY id', (policy,))]
+                conn.close()
+                self.assertEqual(sorted(rows), expected_rows)
+                self.assertEqual(writer.stats()['dropped'], dropped)
+                self.assertEqual(results[-1], policy != 'drop_newest')
+                self.assertFalse(os.path.exists(writer.spill_path))
+                writer.close()
+
+    def test_spilling_does_not_hold_the_queue_lock(self):
+        writer = LogWriter(self.db_file, batch_size=100, flush_interval_ms=60_000, max_queue=2)
+        spill = writer._spill
+        producer_waited = []
+
+        def slow_spill(events):
+            # Another producer must get through while the spill file is being written
+            other = threading.Thread(target=writer.stats)
+            other.start()
+            other.join(timeout=2)
+            producer_waited.append(other.is_alive())
+            return spill(events)
+
+        with mock.patch.object(writer, '_spill', slow_spill):
+            writer.log_activity(1, 'LOGIN', 'queued')
+            writer.log_activity(1, 'LOGIN', 'queued')
+            self.assertTrue(writer.log_activity(1, 'LOGIN', 'spilled'))
+        self.assertEqual(producer_waited, [False])
+        writer.close()
+        self.assertEqual(self.count('activity_logs'), 3)
+
+    def test_failed_batches_are_spilled_and_replayed(self):
+        writer = LogWriter(self.db_file, batch_size=10, flush_interval_ms=60_000)
+        with mock.patch('log_writer.get_pool', side_effect=sqlite3.OperationalError('database is locked')):
+            writer.log_activity(1, 'LOGIN', 'first')
+            writer.flush()
+        self.assertTrue(os.path.exists(writer.spill_path))
+        self.assertEqual(self.count('activity_logs'), 0)
+
+        writer.log_activity(1, 'LOGIN', 'second')
+        writer.close()
+        self.assertEqual(self.count('activity_logs'), 2)
+        self.assertFalse(os.path.exists(writer.spill_path))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,135 @@
+import sqlite3
+import threading
+import unittest
+from unittest import mock
+
+import final_working_server as server
+from helpers import ServerTestCase
+from log_writer import get_log_writer
+from login_guard import LoginGuard, PasswordVerifier, TokenBucketLimiter, VerifierBusy
+
+
+class TokenBucketLimiterTest(unittest.TestCase):
+    def test_burst_then_refill(self):
+        now = [0.0]
+        limiter = TokenBucketLimiter(burst=3, per_minute=6, clock=lambda: now[0])
+        self.assertEqual([limiter.acquire('alice') for _ in range(3)], [0.0, 0.0, 0.0])
+        self.assertAlmostEqual(limiter.acquire('alice'), 10.0)
+        self.assertEqual(limiter.acquire('bob'), 0.0)
+        now[0] = 10.0
+        self.assertEqual(limiter.acquire('alice'), 0.0)
+        self.assertGreater(limiter.acquire('alice'), 0.0)
+
+    def test_idle_keys_are_pruned(self):
+        now = [0.0]
+        limiter = TokenBucketLimiter(burst=2, per_minute=60, max_keys=10, clock=lambda: now[0])
+        for i in range(10):
+            limiter.acquire(f'ip-{i}')
+        now[0] = 5.0
+        limiter.acquire('late')
+        self.assertEqual(list(limiter._buckets), ['late'])
+
+
+class PasswordVerifierTest(unittest.TestCase):
+    def test_unknown_users_cost_a_real_check(self):
+        verifier = PasswordVerifier(max_workers=1, max_pending=2, dummy_rounds=4)
+        self.addCleanup(verifier.shutdown)
+        with mock.patch('login_guard.bcrypt.checkpw', return_value=True) as checkpw:
+            self.assertFalse(verifier.check('guess', None))
+        checkpw.assert_called_once()
+
+    def test_dummy_hash_is_made_off_the_request_thread_at_startup(self):
+        callers = []
+
+        def hashpw(password, salt):
+            callers.append(threading.current_thread().name)
+            return b'$2b$04$' + b'x' * 53
+
+        with mock.patch('login_guard.bcrypt.hashpw', side_effect=hashpw):
+            verifier = PasswordVerifier(max_workers=1, dummy_rounds=4)
+            self.addCleanup(verifier.shutdown)
+            verifier._dummy_hash.result(5)
+            self.assertEqual(len(callers), 1)
+            self.assertTrue(callers[0].startswith('bcrypt'))
+            with mock.patch('login_guard.bcrypt.checkpw', return_value=False):
+                verifier.check('guess', None)
+        self.assertEqual(len(callers), 1)
+
+    def test_slow_check_times_out_as_busy(self):
+        verifier = PasswordVerifier(max_workers=1, dummy_rounds=4)
+        self.addCleanup(verifier.shutdown)
+        release = threading.Event()
+        self.addCleanup(release.set)
+        with mock.patch('login_guard.VERIFY_TIMEOUT_SECONDS', 0.05), \
+                mock.patch('login_guard.bcrypt.checkpw', side_effect=lambda *args: release.wait(5)):
+            with self.assertRaises(VerifierBusy):
+                verifier.check('pw', '$2b$04$x')
+
+    def test_full_queue_is_rejected_immediately(self):
+        verifier = PasswordVerifier(max_workers=1, max_pending=1, dummy_rounds=4)
+        self.addCleanup(verifier.shutdown)
+        started, release = threading.Event(), threading.Event()
+
+        def slow_check(password, hashed):
+            started.set()
+            release.wait(5)
+            return False
+
+        with mock.patch('login_guard.bcrypt.checkpw', side_effect=slow_check):
+            worker = threading.Thread(target=verifier.check, args=('pw', '$2b$04$x'))
+            worker.start()
+            started.wait(5)
+            with self.assertRaises(VerifierBusy):
+                verifier.check('pw', '$2b$04$x')
+            release.set()
+            worker.join()
+
+
+class LoginThrottlingTest(ServerTestCase):
+    def setUp(self):
+        super().setUp()
+        self.patch_server(login_guard=LoginGuard(verifier=PasswordVerifier(max_workers=1, dummy_rounds=4),
+                                                 user_limiter=TokenBucketLimiter(burst=4, per_minute=1),
+                                                 ip_limiter=TokenBucketLimiter(burst=7, per_minute=1)))
+
+    def tearDown(self):
+        server.login_guard.verifier.shutdown()
+        super().tearDown()
+
+    def login(self, username, password='wrong'):
+        return self.client.post('/login', json={'username': username, 'password': password})
+
+    def audit_rows(self):
+        get_log_writer(self.db_file).flush()
+        conn = sqlite3.connect(self.db_file)
+        rows = conn.execute("SELECT user_id, description FROM activity_logs "
+                            "WHERE activity_type = 'SECURITY_LOGIN_FAILED' ORDER BY id").fetchall()
+        conn.close()
+        return rows
+
+    def test_per_user_then_per_ip_limits(self):
+        self.assertEqual(self.login('alice', 'pw123').status_code, 200)
+        self.assertEqual([self.login('alice').status_code for _ in range(4)], [401, 401, 401, 429])
+        r = self.login('ALICE')
+        self.assertEqual(r.status_code, 429)
+        self.assertGreaterEqual(int(r.headers['Retry-After']), 1)
+        self.assertEqual(self.login('ghost').status_code, 401)
+        self.assertEqual(self.login('ghost2').status_code, 429)  # the IP's bucket is empty now
+
+    def test_failures_are_audited(self):
+        self.login('alice')
+        self.login('ghost')
+        self.login('alice', 'pw123')
+        rows = self.audit_rows()
+        self.assertEqual([user_id for user_id, _ in rows], [1, None])
+        self.assertIn("Failed login for 'ghost': unknown user | IP: 127.0.0.1", rows[1][1])
+
+    def test_busy_verifier_answers_429(self):
+        with mock.patch.object(server.login_guard.verifier, 'check', side_effect=VerifierBusy):
+            r = self.login('alice', 'pw123')
+        self.assertEqual(r.status_code, 429)
+        self.assertEqual(r.headers['Retry-After'], '1')
+
+
+if __name__ == '__main__':
+    unittest.main()
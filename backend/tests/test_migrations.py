@@ -0,0 +1,133 @@
+import sqlite3
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import migrations
+from migrations import LATEST_VERSION, check_query_plans, main, migrate, schema_version
+
+
+# Tables as the baseline create_fresh_database.py created them, before the migration runner
+LEGACY_FRESH_DATABASE = [
+    '''CREATE TABLE users (id INTEGER PRIMARY KEY AUTOINCREMENT, username TEXT UNIQUE NOT NULL,
+        password_hash TEXT NOT NULL, email TEXT UNIQUE NOT NULL, created_date TEXT NOT NULL, last_login TEXT,
+        is_active INTEGER DEFAULT 1)''',
+    '''CREATE TABLE files (id INTEGER PRIMARY KEY AUTOINCREMENT, username TEXT NOT NULL, filename TEXT NOT NULL,
+        secure_filename TEXT NOT NULL, file_size INTEGER NOT NULL, upload_date TEXT NOT NULL, file_hash TEXT,
+        mime_type TEXT, threat_score REAL DEFAULT 0.0, is_safe INTEGER DEFAULT 1,
+        file_category TEXT DEFAULT 'unknown')''',
+    '''CREATE TABLE activity_logs (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, action TEXT NOT NULL,
+        description TEXT, timestamp TEXT NOT NULL, ip_address TEXT, user_agent TEXT)''',
+    '''CREATE TABLE security_events (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER,
+        event_type TEXT NOT NULL, threat_level TEXT NOT NULL, description TEXT, timestamp TEXT NOT NULL,
+        resolved INTEGER DEFAULT 0)''',
+    '''CREATE TABLE system_metrics (id INTEGER PRIMARY KEY AUTOINCREMENT, metric_name TEXT NOT NULL,
+        metric_value REAL NOT NULL, recorded_at TEXT NOT NULL)''',
+]
+
+
+class MigrationsTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_file = str(Path(self.tmp_dir.name) / 'test.db')
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def indexes(self, conn):
+        return {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index' "
+                                               "AND name LIKE 'idx_%'")}
+
+    def test_fresh_database_reaches_latest_version_once(self):
+        self.assertEqual(migrate(self.db_file), list(range(1, LATEST_VERSION + 1)))
+        self.assertEqual(migrate(self.db_file), [])
+        conn = sqlite3.connect(self.db_file)
+        self.assertEqual(schema_version(conn), LATEST_VERSION)
+        self.assertIn('idx_files_username_upload_date', self.indexes(conn))
+        self.assertIn('idx_activity_logs_type_timestamp', self.indexes(conn))
+        conn.close()
+
+    def test_legacy_database_gains_missing_columns(self):
+        conn = sqlite3.connect(self.db_file)
+        conn.execute('CREATE TABLE users (id INTEGER PRIMARY KEY AUTOINCREMENT, username TEXT UNIQUE NOT NULL, '
+                     'password_hash TEXT NOT NULL, email TEXT, created_date TEXT)')
+        conn.execute("INSERT INTO users (username, password_hash) VALUES ('admin', 'x')")
+        conn.commit()
+        conn.close()
+
+        migrate(self.db_file)
+        conn = sqlite3.connect(self.db_file)
+        self.assertEqual(conn.execute('SELECT username, is_active, role FROM users').fetchall(),
+                         [('admin', 1, 'user')])
+        conn.close()
+
+    def create_legacy_database(self):
+        conn = sqlite3.connect(self.db_file)
+        for statement in LEGACY_FRESH_DATABASE:
+            conn.execute(statement)
+        conn.execute("INSERT INTO activity_logs (user_id, action, description, timestamp, ip_address) "
+                     "VALUES (1, 'LOGIN', 'old row', '2026-01-02T10:00:00', '10.0.0.1')")
+        conn.commit()
+        return conn
+
+    def test_legacy_fresh_database_schema_migrates(self):
+        self.create_legacy_database().close()
+        self.assertEqual(migrate(self.db_file), list(range(1, LATEST_VERSION + 1)))
+
+        conn = sqlite3.connect(self.db_file)
+        self.assertIn('idx_activity_logs_type_timestamp', self.indexes(conn))
+        # New-style rows (no 'action') fit, and the old row kept its type, address and rollup
+        conn.execute("INSERT INTO activity_logs (user_id, activity_type, description, timestamp) "
+                     "VALUES (1, 'UPLOAD', 'new row', '2026-01-02T11:00:00')")
+        self.assertEqual(conn.execute('SELECT activity_type, action, ip_address FROM activity_logs ORDER BY id')
+                         .fetchall(), [('LOGIN', 'LOGIN', '10.0.0.1'), ('UPLOAD', None, None)])
+        self.assertEqual(conn.execute('SELECT hour, activity_type, events FROM activity_hourly ORDER BY hour')
+                         .fetchall(), [('2026-01-02T10', 'LOGIN', 1), ('2026-01-02T11', 'UPLOAD', 1)])
+        conn.close()
+
+    def test_legacy_database_stuck_at_version_2_recovers(self):
+        # What the earlier LATER_COLUMNS left behind: version 2 recorded, activity_type still missing
+        conn = self.create_legacy_database()
+        conn.execute(migrations.SCHEMA_MIGRATIONS_TABLE)
+        conn.executemany("INSERT INTO schema_migrations (version, name, applied_at) VALUES (?, '', '')", [(1,), (2,)])
+        conn.commit()
+        conn.close()
+
+        self.assertEqual(migrate(self.db_file), list(range(3, LATEST_VERSION + 1)))
+        conn = sqlite3.connect(self.db_file)
+        self.assertEqual(conn.execute('SELECT activity_type FROM activity_logs').fetchall(), [('LOGIN',)])
+        conn.close()
+
+    def test_failed_step_keeps_the_previous_version(self):
+        def broken(conn):
+            conn.execute('CREATE INDEX idx_broken ON files (username)')
+            raise sqlite3.OperationalError('boom')
+
+        steps = migrations.MIGRATIONS[:2] + [(3, 'broken', broken)]
+        with mock.patch.object(migrations, 'MIGRATIONS', steps):
+            with self.assertRaises(sqlite3.OperationalError):
+                migrate(self.db_file)
+        conn = sqlite3.connect(self.db_file)
+        self.assertEqual(schema_version(conn), 2)
+        self.assertNotIn('idx_broken', self.indexes(conn))
+        conn.close()
+        self.assertEqual(migrate(self.db_file), list(range(3, LATEST_VERSION + 1)))
+
+
+class QueryPlanTest(unittest.TestCase):
+    def test_hot_queries_use_indexes(self):
+        self.assertEqual(check_query_plans(), {})
+
+    def test_unindexed_query_is_reported(self):
+        failures = check_query_plans(queries={'by name': ('SELECT id FROM files WHERE filename = ?', ('a',))})
+        self.assertIn('SCAN files', ' '.join(failures['by name']))
+
+    def test_cli_exit_status(self):
+        self.assertEqual(main(['--check-plans']), 0)
+        with mock.patch.object(migrations, 'HOT_QUERY_INDEXES', []):
+            self.assertEqual(main(['--check-plans']), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+import io
+import json
+import logging
+import unittest
+
+import final_working_server as server
+from helpers import ServerTestCase
+from request_logging import JsonLineFormatter, RequestContextFilter, SamplingFilter, get_logger
+
+
+class CapturingHandler(logging.Handler):
+    """The filters and formatter of the queue path, run synchronously"""
+
+    def __init__(self):
+        super().__init__()
+        self.addFilter(RequestContextFilter())
+        self.setFormatter(JsonLineFormatter())
+        self.lines = []
+
+    def emit(self, record):
+        self.lines.append(json.loads(self.format(record)))
+
+
+class RequestLoggingTest(ServerTestCase):
+    def setUp(self):
+        super().setUp()
+        self.handler = CapturingHandler()
+        get_logger().addHandler(self.handler)
+
+    def tearDown(self):
+        get_logger().removeHandler(self.handler)
+        super().tearDown()
+
+    def test_lines_carry_request_context(self):
+        r = self.client.post('/login', json={'username': 'alice', 'password': 'wrong'},
+                             headers={'X-Request-ID': 'req-123'})
+        self.assertEqual(r.headers['X-Request-ID'], 'req-123')
+        login, access = self.handler.lines[-2:]
+        self.assertEqual((login['logger'], login['request_id'], login['route']), ('smartsecure.server', 'req-123', '/login'))
+        self.assertIn('invalid password', login['msg'])
+        self.assertEqual((access['status'], access['method'], access['request_id']), (401, 'POST', 'req-123'))
+        self.assertGreaterEqual(access['latency_ms'], 0)
+
+        r = self.client.get('/files')
+        self.assertEqual(r.status_code, 401)
+        self.assertEqual(len(r.headers['X-Request-ID']), 32)
+
+    def test_debug_messages_are_not_built_at_info(self):
+        class Expensive:
+            def __str__(self):
+                raise AssertionError('formatted a disabled message')
+
+        get_logger('server').debug('state %s', Expensive())
+        self.assertFalse(get_logger('server').isEnabledFor(logging.DEBUG))
+
+    def test_sampling_keeps_whole_requests_and_all_warnings(self):
+        sampler = SamplingFilter(0.5)
+        records = {}
+        for i in range(200):
+            for level in (logging.INFO, logging.DEBUG):
+                record = logging.makeLogRecord({'levelno': level, 'request_id': f'r{i}'})
+                records.setdefault(i, set()).add(sampler.filter(record))
+        self.assertTrue(all(len(kept) == 1 for kept in records.values()))
+        kept = sum(True in kept for kept in records.values())
+        self.assertTrue(50 < kept < 150, kept)
+        self.assertTrue(SamplingFilter(0).filter(logging.makeLogRecord({'levelno': logging.ERROR})))
+        self.assertFalse(SamplingFilter(0).filter(logging.makeLogRecord({'levelno': logging.INFO, 'request_id': 'x'})))
+
+    def test_exceptions_are_one_json_line(self):
+        stream = io.StringIO()
+        handler = logging.StreamHandler(stream)
+        handler.setFormatter(JsonLineFormatter())
+        logger = logging.getLogger('request-logging-test')
+        logger.addHandler(handler)
+        try:
+            raise ValueError('boom')
+        except ValueError:
+            logger.error('failed', exc_info=True, extra={'file_id': 7})
+        logger.removeHandler(handler)
+        lines = stream.getvalue().splitlines()
+        self.assertEqual(len(lines), 1)
+        entry = json.loads(lines[0])
+        self.assertEqual((entry['msg'], entry['file_id']), ('failed', 7))
+        self.assertIn('ValueError: boom', entry['exc'])
+
+
+if __name__ == '__main__':
+    unittest.main()
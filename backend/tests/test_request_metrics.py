@@ -0,0 +1,107 @@
+import re
+import threading
+import unittest
+
+import final_working_server as server
+from helpers import ServerTestCase, make_token
+from request_metrics import RequestMetrics
+
+
+def sample(text, name, **labels):
+    """Value of one exposition line, matched by metric name and a subset of its labels"""
+    for line in text.splitlines():
+        match = re.match(r'([a-z_]+)(\{.*\})? (\S+)$', line)
+        if not match or match.group(1) != name:
+            continue
+        found = dict(re.findall(r'(\w+)="([^"]*)"', match.group(2) or ''))
+        if all(found.get(key) == str(value) for key, value in labels.items()):
+            return float(match.group(3))
+    return None
+
+
+class RequestMetricsTest(unittest.TestCase):
+    def test_shards_from_many_threads_are_merged(self):
+        metrics = RequestMetrics()
+
+        def work():
+            for _ in range(50):
+                metrics.observe('/files', 'GET', 200, 0.02, db_seconds=0.004, bytes_out=100)
+            metrics.observe('/files', 'GET', 500, 3.0)
+
+        threads = [threading.Thread(target=work) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        text = metrics.render_prometheus()
+        self.assertEqual(sample(text, 'smartsecure_http_requests_total', route='/files', status=200), 400)
+        self.assertEqual(sample(text, 'smartsecure_http_requests_total', route='/files', status=500), 8)
+        self.assertEqual(sample(text, 'smartsecure_http_request_duration_seconds_bucket', le='0.025'), 400)
+        self.assertEqual(sample(text, 'smartsecure_http_request_duration_seconds_bucket', le='+Inf'), 408)
+        self.assertEqual(sample(text, 'smartsecure_http_response_bytes_total'), 40000)
+
+        summary = metrics.summary()
+        self.assertEqual((summary['totalRequests'], summary['requestsPerHour']), (408, 408))
+        self.assertEqual(summary['errorRate'], round(8 / 408 * 100, 2))
+        self.assertEqual(summary['p95ResponseTime'], 25.0)
+        self.assertAlmostEqual(summary['avgDbTime'], 400 * 4 / 408, places=1)
+
+    def test_label_values_are_escaped(self):
+        metrics = RequestMetrics()
+        metrics.observe('/a"b\\c', 'GET', 200, 0.001)
+        self.assertIn('route="/a\\"b\\\\c"', metrics.render_prometheus())
+
+
+class MetricsEndpointTest(ServerTestCase):
+    users = (('alice', 'pw123', 'admin'),)
+
+    def setUp(self):
+        super().setUp()
+        self.patch_server(METRICS_TOKEN=None)
+        server.metrics.reset()
+        self.headers = {'Authorization': f"Bearer {make_token(server.SECRET_KEY, role='admin')}"}
+
+    def test_requests_are_counted_per_route(self):
+        self.client.get('/files', headers=self.headers)
+        self.client.get('/files', headers=self.headers)
+        self.client.get('/files')
+        self.client.get('/no/such/route')
+
+        r = self.client.get('/metrics')
+        self.assertEqual(r.status_code, 200)
+        self.assertTrue(r.content_type.startswith('text/plain; version=0.0.4'))
+        text = r.get_data(as_text=True)
+        self.assertEqual(sample(text, 'smartsecure_http_requests_total', route='/files', status=200), 2)
+        self.assertEqual(sample(text, 'smartsecure_http_requests_total', route='/files', status=401), 1)
+        # Unknown paths are labelled by the rule that answered them, never by the raw path
+        self.assertEqual(sample(text, 'smartsecure_http_requests_total', status=404), 1)
+        self.assertNotIn('/no/such/route', text)
+        # The scrape itself is in flight while it is rendered
+        self.assertEqual(sample(text, 'smartsecure_http_requests_in_flight'), 1)
+        db_time = sample(text, 'smartsecure_http_request_db_seconds_sum', route='/files')
+        self.assertGreater(db_time, 0)
+        self.assertEqual(sample(text, 'smartsecure_http_request_db_seconds_count', route='/files'), 3)
+
+    def test_metrics_token(self):
+        server.METRICS_TOKEN = 'scrape-secret'
+        self.assertEqual(self.client.get('/metrics').status_code, 401)
+        r = self.client.get('/metrics', headers={'Authorization': 'Bearer scrape-secret'})
+        self.assertEqual(r.status_code, 200)
+
+    def test_analytics_and_stats_report_measured_figures(self):
+        for _ in range(3):
+            self.client.get('/files', headers=self.headers)
+        performance = self.client.get('/admin/analytics', headers=self.headers).get_json()['performanceAnalytics']
+        self.assertEqual(performance['totalRequests'], 3)
+        self.assertGreater(performance['avgResponseTime'], 0)
+        self.assertEqual(performance['requestsPerHour'], 3)
+
+        stats = self.client.get('/stats', headers=self.headers).get_json()
+        self.assertEqual(stats['requestsPerHour'], 4)
+        self.assertNotEqual(stats['uptime'], '99.9%')
+        self.assertRegex(stats['uptime'], r'^\d+h \d+m$')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import threading
+import unittest
+
+from response_cache import FRESH, MISS, STALE, ResponseCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class ResponseCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.cache = ResponseCache(ttl=10, stale=100, clock=self.clock)
+        self.calls = 0
+
+    def tearDown(self):
+        self.cache.close()
+
+    def compute(self):
+        self.calls += 1
+        return self.calls
+
+    def wait_for_refresh(self, key):
+        future = self.cache._pending.get(key)
+        if future is not None:
+            future.exception()
+
+    def test_fresh_then_stale_while_revalidating_then_expired(self):
+        self.assertEqual(self.cache.get('k', self.compute), (1, MISS))
+        self.assertEqual(self.cache.get('k', self.compute), (1, FRESH))
+
+        self.clock.now = 50
+        self.assertEqual(self.cache.get('k', self.compute), (1, STALE))
+        self.wait_for_refresh('k')
+        self.assertEqual(self.cache.get('k', self.compute), (2, FRESH))
+
+        self.clock.now = 500
+        self.assertEqual(self.cache.get('k', self.compute), (3, MISS))
+        self.assertEqual(self.cache.stats()['misses'], 2)
+
+    def test_failed_refresh_keeps_the_old_value(self):
+        self.cache.get('k', self.compute)
+        self.clock.now = 50
+
+        def broken():
+            raise RuntimeError('database locked')
+
+        self.assertEqual(self.cache.get('k', broken), (1, STALE))
+        self.wait_for_refresh('k')
+        self.assertEqual(self.cache.get('k', self.compute)[0], 1)
+        with self.assertRaises(RuntimeError):
+            self.cache.get('other', broken)
+
+    def test_concurrent_misses_share_one_computation(self):
+        release = threading.Event()
+
+        def slow():
+            release.wait(5)
+            return self.compute()
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(self.cache.get('k', slow))) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.calls, 1)
+        self.assertEqual([value for value, _ in results], [1] * 4)
+        self.assertIn(MISS, [state for _, state in results])
+
+
+if __name__ == '__main__':
+    unittest.main()
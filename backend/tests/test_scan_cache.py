@@ -0,0 +1,77 @@
+import io
+import tempfile
+import unittest
+from pathlib import Path
+
+from ai_security import ThreatDetectionEngine
+from db_pool import close_all_pools
+from helpers import ServerTestCase
+from scan_cache import ScanResultCache
+
+PAYLOAD = b'<script>eval(atob("x"))</script> WScript.Shell ' * 20
+
+
+class ScanResultCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_file = str(Path(self.tmp_dir.name) / 'cache.db')
+
+    def tearDown(self):
+        close_all_pools()
+        self.tmp_dir.cleanup()
+
+    def test_memory_front_is_bounded_lru(self):
+        cache = ScanResultCache(max_entries=2)
+        cache.put('a', 'v1', {'n': 1})
+        cache.put('b', 'v1', {'n': 2})
+        cache.get('a', 'v1')
+        cache.put('c', 'v1', {'n': 3})
+        self.assertIsNone(cache.get('b', 'v1'))
+        self.assertEqual(cache.get('a', 'v1'), {'n': 1})
+        self.assertEqual(cache.stats()['entries'], 2)
+
+    def test_entries_persist_and_are_versioned(self):
+        ScanResultCache(self.db_file).put('abc', 'v1', {'entropy': 0.5})
+        fresh = ScanResultCache(self.db_file)
+        self.assertEqual(fresh.get('abc', 'v1'), {'entropy': 0.5})
+        self.assertIsNone(fresh.get('abc', 'v2'))
+        self.assertEqual(fresh.purge_other_versions('v2'), 1)
+        self.assertIsNone(ScanResultCache(self.db_file).get('abc', 'v1'))
+
+    def test_engine_reuses_cached_content_features(self):
+        engine = ThreatDetectionEngine()
+        cache = ScanResultCache(self.db_file)
+        first = engine.analyze_file_threat('page.html', PAYLOAD, scan_cache=cache)
+        second = engine.analyze_file_threat('renamed.exe', PAYLOAD, scan_cache=cache)
+        self.assertFalse(first['cached'])
+        self.assertTrue(second['cached'])
+        # Name-based rules are still applied to the cached content features
+        self.assertGreater(second['threat_score'], first['threat_score'])
+        self.assertEqual(second['features']['file_extension'], '.exe')
+
+    def test_rule_change_invalidates(self):
+        engine = ThreatDetectionEngine()
+        cache = ScanResultCache(self.db_file)
+        engine.analyze_file_threat('page.html', PAYLOAD, scan_cache=cache)
+        engine.malicious_patterns = engine.malicious_patterns + [rb'atob\(']
+        result = engine.analyze_file_threat('page.html', PAYLOAD, scan_cache=cache)
+        self.assertFalse(result['cached'])
+        self.assertEqual(result['features']['malicious_patterns'], 4)
+
+
+class ScanEndpointCacheTest(ServerTestCase):
+    def test_scan_after_upload_is_a_cache_hit(self):
+        r = self.client.post('/upload', headers=self.headers, data={'file': (io.BytesIO(PAYLOAD), 'page.html')},
+                             content_type='multipart/form-data')
+        uploaded = r.get_json()['file']
+
+        r = self.client.post('/security/scan', headers=self.headers, json={'fileId': uploaded['id']})
+        self.assertEqual(r.status_code, 200)
+        scanned = r.get_json()['file']
+        self.assertTrue(scanned['cached'])
+        self.assertFalse(scanned['safe'])
+        self.assertEqual(scanned['threatScore'], round(uploaded['threatScore'], 2))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,171 @@
+import io
+import json
+import os
+import signal
+import sqlite3
+import time
+import unittest
+from contextlib import contextmanager
+from pathlib import Path
+from unittest import mock
+
+import final_working_server as server
+from helpers import ServerTestCase, make_token
+from scan_scheduler import ScanScheduler
+
+FILES = {
+    'notes.txt': b'quarterly figures and plain text notes ' * 50,
+    'page.html': b'<script>eval(atob("x"))</script> WScript.Shell ' * 20,
+}
+
+
+class ScanSchedulerTest(ServerTestCase):
+    def setUp(self):
+        super().setUp()
+        self.scheduler = ScanScheduler(self.db_file, server.get_blob_store(), server.get_scan_cache(),
+                                       server.get_threat_detector(), max_workers=1,
+                                       threat_intel=server.get_threat_intel())
+        server._scan_schedulers[self.db_file] = self.scheduler
+
+    def upload_all(self):
+        for name, data in FILES.items():
+            r = self.client.post('/upload', headers=self.headers,
+                                 data={'file': (io.BytesIO(data), name)},
+                                 content_type='multipart/form-data')
+            self.assertEqual(r.status_code, 200)
+
+    def wait_for(self, batch_id, timeout=60):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            status = self.client.get(f'/security/scan-jobs/{batch_id}', headers=self.headers).get_json()
+            if status['scanComplete']:
+                return status
+            time.sleep(0.1)
+        self.fail('scan batch did not finish')
+
+    def test_batch_runs_in_worker_processes_and_streams_results(self):
+        self.upload_all()
+        # Forget the upload-time verdicts so every job goes to the process pool
+        self.forget_verdicts()
+        conn = sqlite3.connect(self.db_file)
+        conn.execute('UPDATE files SET threat_score = 0, is_safe = 1')
+        conn.commit()
+        conn.close()
+
+        r = self.client.post('/security/scan-all', headers=self.headers)
+        self.assertEqual(r.status_code, 202)
+        batch_id = r.get_json()['batchId']
+        self.assertEqual(r.get_json()['totalFiles'], 2)
+
+        status = self.wait_for(batch_id)
+        self.assertEqual(status['completed'], 2)
+        self.assertEqual(status['threatsFound'], 1)
+
+        r = self.client.get(f'/security/scan-jobs/{batch_id}/results', headers=self.headers)
+        self.assertEqual(r.mimetype, 'application/x-ndjson')
+        results = [json.loads(line) for line in r.get_data(as_text=True).splitlines()]
+        self.assertEqual([item['status'] for item in results], ['completed', 'completed'])
+        self.assertFalse(any(item['result']['cached'] for item in results))
+
+        conn = sqlite3.connect(self.db_file)
+        unsafe = conn.execute("SELECT filename FROM files WHERE is_safe = 0").fetchall()
+        conn.close()
+        self.assertEqual(unsafe, [('page.html',)])
+
+    def forget_verdicts(self):
+        server._scan_caches.pop(self.db_file)
+        self.scheduler.scan_cache = server.get_scan_cache()
+        conn = sqlite3.connect(self.db_file)
+        conn.execute('DELETE FROM scan_cache')
+        conn.commit()
+        conn.close()
+
+    def test_killed_worker_is_replaced_and_its_batch_resubmitted(self):
+        self.upload_all()
+        self.forget_verdicts()
+        batch_id = self.client.post('/security/scan-all', headers=self.headers).get_json()['batchId']
+
+        # Kill the worker while it is still starting up with the batch in hand
+        deadline = time.monotonic() + 30
+        while not (self.scheduler._executor and self.scheduler._executor._processes):
+            self.assertLess(time.monotonic(), deadline, 'no worker process started')
+            time.sleep(0.01)
+        broken = self.scheduler._executor
+        for pid in list(broken._processes):
+            os.kill(pid, signal.SIGKILL)
+
+        status = self.wait_for(batch_id)
+        self.assertEqual((status['completed'], status['failed']), (2, 0))
+        results = list(self.scheduler.iter_results(batch_id, 'alice'))
+        self.assertEqual([item['retryCount'] for item in results], [0, 0])
+        self.assertIsNotNone(self.scheduler._executor)
+        self.assertIsNot(self.scheduler._executor, broken)
+
+    def test_known_content_is_answered_from_the_scan_cache(self):
+        self.upload_all()
+        batch_id = self.client.post('/security/scan-all', headers=self.headers).get_json()['batchId']
+        self.assertEqual(self.wait_for(batch_id)['threatsFound'], 1)
+        results = self.scheduler.iter_results(batch_id, 'alice')
+        self.assertTrue(all(item['result']['cached'] for item in results))
+        self.assertIsNone(self.scheduler._executor)
+
+    def test_a_job_claimed_by_another_scheduler_is_not_claimed_again(self):
+        conn = sqlite3.connect(self.db_file)
+        conn.executemany("INSERT INTO ai_analysis_jobs (batch_id, status, created_at) VALUES ('b', 'queued', '')",
+                         [(), ()])
+        conn.commit()
+        conn.close()
+        rival = ScanScheduler(self.db_file, server.get_blob_store(), server.get_scan_cache(),
+                              server.get_threat_detector(), max_workers=1)
+        rival.max_in_flight = 1
+
+        # The rival claims the first job between this scheduler's SELECT and its UPDATE
+        connection = self.scheduler._connection
+        rival_claims = []
+
+        class RacingConnection:
+            def __init__(self, conn):
+                self.conn = conn
+
+            def execute(self, sql, *args):
+                cursor = self.conn.execute(sql, *args)
+                if sql.lstrip().startswith('SELECT') and not rival_claims:
+                    cursor = mock.Mock(fetchall=mock.Mock(return_value=cursor.fetchall()))
+                    rival_claims.extend(rival._claim_jobs())
+                return cursor
+
+        @contextmanager
+        def racing():
+            with connection() as conn:
+                yield RacingConnection(conn)
+
+        with mock.patch.object(self.scheduler, '_connection', racing):
+            claimed = self.scheduler._claim_jobs()
+        self.assertEqual([job[0] for job in rival_claims], [1])
+        self.assertEqual([job[0] for job in claimed], [2])
+
+        conn = sqlite3.connect(self.db_file)
+        statuses = conn.execute('SELECT status FROM ai_analysis_jobs ORDER BY id').fetchall()
+        conn.close()
+        self.assertEqual(statuses, [('running',), ('running',)])
+
+    def test_missing_files_fail_without_retry_and_batches_are_per_user(self):
+        self.upload_all()
+        conn = sqlite3.connect(self.db_file)
+        conn.execute("DELETE FROM blobs")
+        conn.commit()
+        conn.close()
+        for path in Path(self.uploads, 'blobs').rglob('*'):
+            if path.is_file():
+                path.unlink()
+
+        batch_id = self.client.post('/security/scan-all', headers=self.headers).get_json()['batchId']
+        status = self.wait_for(batch_id)
+        self.assertEqual(status['failed'], 2)
+
+        other = {'Authorization': f'Bearer {make_token(server.SECRET_KEY, user_id=2, username="bob")}'}
+        self.assertEqual(self.client.get(f'/security/scan-jobs/{batch_id}', headers=other).status_code, 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+import os
+import re
+import tempfile
+import time
+import unittest
+
+from ai_security import DEFAULT_MALICIOUS_PATTERNS, ThreatDetectionEngine, ThreatFeatureAccumulator
+from signatures import Signature, SignatureMatcher, SignatureSet, default_signatures
+
+SIGNATURES = default_signatures(DEFAULT_MALICIOUS_PATTERNS) + [
+    Signature('script-word', b'script'),
+    Signature('eva', b'eva'),
+    Signature('evaluate', b'evaluate'),
+    Signature('repeat', rb'(ab)\1'),
+    Signature('named', rb'(?P<x>on)error'),
+]
+DATA = (b'<SCRIPT>eval (1)</script> JavaScript: ababab onload = evaluate(WScript.Shell) '
+        b'<img onerror=x> document.write ' * 3)
+
+
+def reference_hits(signatures, data):
+    """Brute force: every offset where each signature matches"""
+    hits = {}
+    for signature in signatures:
+        regex = re.compile(signature.pattern, re.IGNORECASE)
+        offsets = [i for i in range(len(data)) if regex.match(data, i)]
+        if offsets:
+            hits[signature.name] = offsets
+    return hits
+
+
+class SignatureMatcherTest(unittest.TestCase):
+    def test_reports_every_overlapping_hit(self):
+        hits = SignatureMatcher(SIGNATURES).hits(DATA)
+        expected = reference_hits(SIGNATURES, DATA)
+        self.assertEqual(hits.counts, {name: len(offsets) for name, offsets in expected.items()})
+        self.assertEqual(hits.offsets, {name: offsets[:16] for name, offsets in expected.items()})
+
+    def test_streamed_hits_match_whole_buffer_hits(self):
+        engine = ThreatDetectionEngine()
+        engine.signatures.replace(SIGNATURES)
+        expected = SignatureMatcher(SIGNATURES).hits(DATA).to_dict()
+        for chunk_size in (7, 100, len(DATA)):
+            accumulator = ThreatFeatureAccumulator(engine)
+            for start in range(0, len(DATA), chunk_size):
+                accumulator.update(DATA[start:start + chunk_size])
+            features = accumulator.finalize('page.html', 'x')
+            self.assertEqual(features['signature_hits'], expected, f'chunk_size={chunk_size}')
+            self.assertEqual(features['malicious_patterns'], len(expected))
+
+    def test_many_literals_compile_into_one_automaton(self):
+        signatures = [Signature(f'sig-{i}', b'marker-%05d' % i) for i in range(5000)]
+        matcher = SignatureMatcher(signatures)
+        self.assertIsNone(matcher._combined_re)
+        data = b'noise ' * 1000 + b'MARKER-04321 marker-00007'
+        self.assertEqual(matcher.hits(data).counts, {'sig-4321': 1, 'sig-7': 1})
+
+
+class SignatureSetTest(unittest.TestCase):
+    def test_signature_file_is_hot_reloaded(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'signatures.txt')
+            with open(path, 'wb') as f:
+                f.write(b'# test feed\nmimikatz\tmimikatz\n')
+            engine = ThreatDetectionEngine()
+            engine.signatures = SignatureSet(SIGNATURES, path, check_interval=0)
+            first_version = engine.engine_version
+            self.assertEqual(engine.malicious_patterns, [b'mimikatz'])
+
+            with open(path, 'wb') as f:
+                f.write(b'mimikatz\tmimikatz\npowershell-enc\tpowershell\\s+-enc\n')
+            os.utime(path, ns=(time.time_ns(), time.time_ns() + 10**9))
+            result = engine.analyze_file_threat('run.txt', b'Mimikatz; PowerShell -enc AAAA')
+            self.assertEqual(result['features']['malicious_patterns'], 2)
+            self.assertNotEqual(engine.engine_version, first_version)
+
+            with open(path, 'wb') as f:
+                f.write(b'broken\t(unclosed\n')
+            os.utime(path, ns=(time.time_ns(), time.time_ns() + 2 * 10**9))
+            self.assertEqual(len(engine.signatures.matcher), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+import io
+import sqlite3
+import unittest
+from unittest import mock
+
+import final_working_server as server
+from helpers import ServerTestCase, make_token
+from log_writer import get_log_writer
+from signed_urls import DownloadUrlSigner, create_download_app
+
+BODY = b'signed link payload ' * 100
+
+
+class DownloadUrlSignerTest(unittest.TestCase):
+    def setUp(self):
+        self.now = 10_000.0
+        self.signer = DownloadUrlSigner('secret', ttl=100, clock=lambda: self.now)
+
+    def token(self, **overrides):
+        args = dict(file_id=7, username='alice', user_id=1, secure_filename='s.bin', file_hash='a' * 64,
+                    filename='Résumé.pdf', as_attachment=False)
+        args.update(overrides)
+        return self.signer.sign(**args)['url'].rsplit('/', 1)[1]
+
+    def test_round_trip_and_expiry(self):
+        token = self.token()
+        claims = self.signer.verify(token)
+        self.assertEqual((claims['file_id'], claims['filename'], claims['as_attachment']), (7, 'Résumé.pdf', False))
+        self.assertEqual(claims['expires'], 10_200)
+        # Links issued within the same window are identical
+        self.now += 50
+        self.assertEqual(self.token(), token)
+
+        self.now = 10_200
+        self.assertIsNone(self.signer.verify(token))
+
+    def test_tampering_and_other_secrets_are_rejected(self):
+        token = self.token()
+        payload, mac = token.split('.')
+        forged = self.token(file_id=8).split('.')[0]
+        for bad in (f'{forged}.{mac}', payload, f'{payload}.{mac[:-2]}', 'junk.junk', '.'):
+            self.assertIsNone(self.signer.verify(bad), bad)
+        self.assertIsNone(DownloadUrlSigner('other', ttl=100, clock=lambda: self.now).verify(token))
+
+    def test_revoked_files_are_refused_until_their_links_expire(self):
+        token, other = self.token(), self.token(file_id=8, secure_filename='t.bin')
+        self.signer.revoke(7, 's.bin')
+        self.assertIsNone(self.signer.verify(token))
+        self.assertIsNotNone(self.signer.verify(other))
+        self.assertIsNone(self.signer.verify(self.token()))
+
+        self.now += 200
+        self.signer.revoke(8, 't.bin')
+        self.assertEqual(list(self.signer._revoked), [(8, 't.bin')])
+
+
+class SignedDownloadEndpointTest(ServerTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.post('/upload', headers=self.headers, content_type='multipart/form-data',
+                         data={'file': (io.BytesIO(BODY), 'notes.txt')})
+        self.file = self.client.get('/files', headers=self.headers).get_json()['files'][0]
+
+    def test_links_are_served_without_a_token_or_database(self):
+        with mock.patch.object(server, 'get_db', side_effect=AssertionError('database used')):
+            r = self.client.get(self.file['signedDownloadUrl'])
+            self.assertEqual((r.status_code, r.data), (200, BODY))
+            self.assertTrue(r.headers['Content-Disposition'].startswith('attachment'))
+            r = self.client.get(self.file['signedPreviewUrl'], headers={'Range': 'bytes=0-5'})
+            self.assertEqual((r.status_code, r.data), (206, BODY[:6]))
+
+        get_log_writer(self.db_file).flush()
+        conn = sqlite3.connect(self.db_file)
+        downloads = conn.execute("SELECT COUNT(*) FROM activity_logs WHERE activity_type = 'FILE_DOWNLOAD'").fetchone()
+        conn.close()
+        self.assertEqual(downloads[0], 1)
+
+        self.assertEqual(self.client.get(self.file['signedDownloadUrl'][:-3] + 'AAA').status_code, 403)
+
+    def test_deleted_file_links_stop_working_while_a_copy_keeps_the_blob(self):
+        headers = {'Authorization': f'Bearer {make_token(server.SECRET_KEY)}'}
+        self.client.post('/upload', headers=headers, content_type='multipart/form-data',
+                         data={'file': (io.BytesIO(BODY), 'copy.txt')})
+        files = self.client.get('/files', headers=headers).get_json()['files']
+        copy = next(f for f in files if f['id'] != self.file['id'])
+
+        self.assertEqual(self.client.delete(f"/files/{self.file['id']}", headers=headers).status_code, 200)
+        self.assertEqual(self.client.get(self.file['signedDownloadUrl']).status_code, 403)
+        r = self.client.get(copy['signedDownloadUrl'])
+        self.assertEqual((r.status_code, r.data), (200, BODY))
+
+    def test_standalone_download_app(self):
+        client = create_download_app(server.SECRET_KEY, self.uploads, server.SIGNED_URL_TTL).test_client()
+        r = client.get(self.file['signedPreviewUrl'])
+        self.assertEqual((r.status_code, r.data), (200, BODY))
+        self.assertEqual(client.get(f"/download/{self.file['id']}").status_code, 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
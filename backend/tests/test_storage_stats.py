@@ -0,0 +1,84 @@
+import io
+import sqlite3
+import tempfile
+import unittest
+from pathlib import Path
+
+import final_working_server as server
+from db_pool import close_all_pools
+from helpers import create_server_database, make_token
+from log_writer import close_all_writers
+from migrations import migrate
+from storage_stats import read_storage_stats
+from upload_pipeline import install_streaming_uploads
+
+
+class StorageStatsTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_file = str(Path(self.tmp_dir.name) / 'test.db')
+        self.uploads = str(Path(self.tmp_dir.name) / 'uploads')
+        create_server_database(self.db_file)
+
+    def tearDown(self):
+        close_all_writers()
+        close_all_pools()
+        self.tmp_dir.cleanup()
+
+    def stats(self, username='alice'):
+        conn = sqlite3.connect(self.db_file)
+        try:
+            return read_storage_stats(conn, username)
+        finally:
+            conn.close()
+
+    def test_existing_files_are_backfilled_and_triggers_track_changes(self):
+        conn = sqlite3.connect(self.db_file)
+        insert = ('INSERT INTO files (username, filename, secure_filename, file_size, upload_date, file_category) '
+                  'VALUES (?, ?, ?, ?, ?, ?)')
+        conn.execute(insert, ('alice', 'a.tar.gz', 's1', 100, '2026-01-01', 'archive'))
+        conn.execute(insert, ('alice', 'Report.PDF', 's2', 50, '2026-01-02', 'document'))
+        conn.commit()
+        conn.close()
+        migrate(self.db_file)
+        self.assertEqual(self.stats()['total_size'], 150)
+        self.assertEqual(self.stats()['by_extension'], {'gz': {'count': 1, 'size': 100},
+                                                        'pdf': {'count': 1, 'size': 50}})
+
+        conn = sqlite3.connect(self.db_file)
+        conn.execute(insert, ('alice', 'notes', 's3', 10, '2026-01-03', 'document'))
+        conn.execute("UPDATE files SET username = 'bob' WHERE secure_filename = 's1'")
+        conn.execute("DELETE FROM files WHERE secure_filename = 's2'")
+        conn.commit()
+        conn.close()
+        alice = self.stats()
+        self.assertEqual((alice['file_count'], alice['total_size']), (1, 10))
+        self.assertEqual(alice['by_extension'], {'': {'count': 1, 'size': 10}})
+        self.assertEqual(alice['by_category'], {'document': {'count': 1, 'size': 10}})
+        self.assertEqual(self.stats('bob')['by_category'], {'archive': {'count': 1, 'size': 100}})
+        self.assertEqual(self.stats('carol')['file_count'], 0)
+
+    def test_upload_and_delete_endpoints(self):
+        saved = (server.DB_PATH, server.UPLOADS_DIR, server.app.request_class)
+        server.DB_PATH, server.UPLOADS_DIR = self.db_file, self.uploads
+        install_streaming_uploads(server.app, self.uploads)
+        try:
+            client = server.app.test_client()
+            headers = {'Authorization': f'Bearer {make_token(server.SECRET_KEY)}'}
+            r = client.post('/upload', headers=headers, content_type='multipart/form-data',
+                            data={'file': (io.BytesIO(b'hello world'), 'hello.txt')})
+            file_id = r.get_json()['file']['id']
+            body = client.get('/files/storage-stats', headers=headers).get_json()
+            self.assertEqual((body['totalFiles'], body['totalSize']), (1, 11))
+            self.assertEqual(body['byExtension'], {'txt': {'count': 1, 'size': 11}})
+            self.assertEqual(body['byCategory'], {'document': {'count': 1, 'size': 11}})
+
+            client.delete(f'/files/{file_id}', headers=headers)
+            body = client.get('/files/storage-stats', headers=headers).get_json()
+            self.assertEqual((body['totalFiles'], body['totalSize'], body['byExtension']), (0, 0, {}))
+        finally:
+            server.DB_PATH, server.UPLOADS_DIR, server.app.request_class = saved
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,132 @@
+import hashlib
+import io
+import os
+import sqlite3
+import tempfile
+import unittest
+from pathlib import Path
+
+import final_working_server as server
+from helpers import ServerTestCase
+from log_writer import get_log_writer
+from threat_intel import ThreatHashIndex, ThreatIntelligence, build_index, import_feed, main
+
+MALWARE = b'MZ\x90\x00 totally a dropper ' * 10
+MALWARE_SHA256 = hashlib.sha256(MALWARE).hexdigest()
+
+
+class ThreatHashIndexTest(unittest.TestCase):
+    def test_lookup_and_false_positive_rate(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            index_path = os.path.join(tmp_dir, 'threats.idx')
+            listed = [hashlib.sha256(b'%d' % i).hexdigest() for i in range(20000)]
+            self.assertEqual(build_index(index_path, listed + listed[:10]), 20000)
+
+            index = ThreatHashIndex(index_path)
+            self.assertTrue(all(value in index for value in listed[::97]))
+            self.assertIn(listed[5].upper(), index)
+            unknown = [hashlib.sha256(b'other-%d' % i).digest() for i in range(20000)]
+            self.assertFalse(any(digest.hex() in index for digest in unknown))
+            false_positives = sum(index.might_contain(digest) for digest in unknown)
+            self.assertLess(false_positives / len(unknown), 0.03)
+            self.assertNotIn('not-a-hash', index)
+            index.close()
+
+    def test_empty_or_missing_index(self):
+        self.assertNotIn(MALWARE_SHA256, ThreatHashIndex(None))
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            index_path = os.path.join(tmp_dir, 'threats.idx')
+            build_index(index_path, [])
+            self.assertNotIn(MALWARE_SHA256, ThreatHashIndex(index_path))
+
+
+class ThreatIntelEndpointTest(ServerTestCase):
+    def import_malware_feed(self):
+        feed = Path(self.tmp_dir.name) / 'feed.csv'
+        feed.write_text(f'# test feed\n{MALWARE_SHA256.upper()},Trojan.Dropper,malware,critical\nnot-a-hash\n')
+        self.assertEqual(main(['--db', self.db_file, '--index', self.index_path, 'import', str(feed)]), 0)
+        self.assertEqual(import_feed(self.db_file, str(feed), 'external_feed'), 0)  # already present
+        server._threat_intel.pop((self.db_file, self.index_path), None)
+
+    def upload(self, data, name):
+        return self.client.post('/upload', headers=self.headers, data={'file': (io.BytesIO(data), name)},
+                                content_type='multipart/form-data')
+
+    def test_known_bad_upload_is_rejected(self):
+        self.import_malware_feed()
+        r = self.upload(MALWARE, 'invoice.pdf')
+        self.assertEqual(r.status_code, 422)
+        self.assertEqual(r.get_json()['threat']['name'], 'Trojan.Dropper')
+        self.assertEqual(r.get_json()['threat']['severity'], 'CRITICAL')
+
+        get_log_writer(self.db_file).flush()
+        conn = sqlite3.connect(self.db_file)
+        self.assertEqual(conn.execute('SELECT COUNT(*) FROM files').fetchone()[0], 0)
+        event = conn.execute('SELECT event_type, threat_level FROM security_events').fetchone()
+        conn.close()
+        self.assertEqual(event, ('KNOWN_THREAT_UPLOAD', 'CRITICAL'))
+        self.assertEqual(os.listdir(self.uploads), [])
+
+        self.assertEqual(self.upload(b'harmless notes', 'notes.txt').status_code, 200)
+
+    def test_scan_flags_files_listed_after_upload(self):
+        file_id = self.upload(MALWARE, 'invoice.pdf').get_json()['file']['id']
+        self.import_malware_feed()
+
+        r = self.client.post('/security/scan', headers=self.headers, json={'fileId': file_id})
+        body = r.get_json()['file']
+        self.assertFalse(body['safe'])
+        self.assertEqual(body['threatLevel'], 'HIGH')
+        self.assertEqual(body['knownThreat']['threat_name'], 'Trojan.Dropper')
+
+    def test_batch_scans_flag_listed_files_like_single_scans(self):
+        self.upload(MALWARE, 'invoice.pdf')
+        self.import_malware_feed()
+
+        batch_id = self.client.post('/security/scan-all', headers=self.headers).get_json()['batchId']
+        results = list(server.get_scan_scheduler().iter_results(batch_id, 'alice', follow=True, poll_interval=0.05))
+        self.assertEqual(len(results), 1)
+        self.assertFalse(results[0]['result']['is_safe'])
+        self.assertEqual(results[0]['result']['known_threat']['threat_name'], 'Trojan.Dropper')
+
+        conn = sqlite3.connect(self.db_file)
+        self.assertEqual(conn.execute('SELECT is_safe, threat_score FROM files').fetchall(), [(0, 1.0)])
+        conn.close()
+
+    def test_deactivated_hash_is_not_a_threat_before_the_index_is_rebuilt(self):
+        self.import_malware_feed()
+        conn = sqlite3.connect(self.db_file)
+        conn.execute("UPDATE threat_intelligence SET is_active = 0, updated_at = '2000-01-01T00:00:00'")
+        conn.commit()
+        conn.close()
+
+        self.assertIn(MALWARE_SHA256, server.get_threat_intel().index)
+        self.assertIsNone(server.get_threat_intel().match(MALWARE_SHA256))
+        self.assertEqual(self.upload(MALWARE, 'invoice.pdf').status_code, 200)
+
+    def test_missing_or_stale_index_is_rebuilt_from_the_table(self):
+        self.import_malware_feed()
+        os.remove(self.index_path)
+        intel = ThreatIntelligence(self.db_file, self.index_path)
+        self.assertNotIn(MALWARE_SHA256, intel.index)
+        self.assertEqual(intel.rebuild_if_stale(), 1)
+        self.assertIn(MALWARE_SHA256, intel.index)
+        self.assertIsNone(intel.rebuild_if_stale())
+
+        conn = sqlite3.connect(self.db_file)
+        conn.execute('UPDATE threat_intelligence SET is_active = 0')  # updated_at left alone
+        conn.commit()
+        conn.close()
+        self.assertEqual(intel.rebuild_if_stale(), 0)
+        self.assertNotIn(MALWARE_SHA256, intel.index)
+
+        conn = sqlite3.connect(self.db_file)
+        conn.execute("UPDATE threat_intelligence SET is_active = 1, updated_at = '2999-01-01T00:00:00+00:00'")
+        conn.commit()
+        conn.close()
+        self.assertEqual(intel.rebuild_if_stale(), 1)
+        self.assertIn(MALWARE_SHA256, intel.index)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+import unittest
+from datetime import datetime, timedelta
+from unittest import mock
+
+import jwt
+
+import final_working_server as server
+from helpers import ServerTestCase, make_token
+from token_auth import TokenVerifier
+
+SECRET = 'token-auth-test-secret-of-sufficient-length'
+
+
+class TokenVerifierTest(unittest.TestCase):
+    def setUp(self):
+        self.verifier = TokenVerifier(SECRET, max_entries=2)
+
+    def test_hot_tokens_skip_decoding(self):
+        token = make_token(SECRET)
+        self.assertEqual(self.verifier.verify(token)['username'], 'alice')
+        with mock.patch('token_auth.jwt.decode', side_effect=AssertionError('decoded again')):
+            self.assertEqual(self.verifier.verify(token)['user_id'], 1)
+        self.assertEqual(self.verifier.stats()['hits'], 1)
+
+    def test_invalid_tokens_are_rejected_and_not_cached(self):
+        self.assertIsNone(self.verifier.verify(make_token('some-other-secret-of-sufficient-length')))
+        self.assertIsNone(self.verifier.verify('not.a.token'))
+        self.assertIsNone(self.verifier.verify(''))
+        no_exp = jwt.encode({'user_id': 1, 'username': 'alice'}, SECRET, algorithm='HS256')
+        self.assertIsNone(self.verifier.verify(no_exp))
+        self.assertEqual(self.verifier.stats()['entries'], 0)
+
+    def test_cached_entries_expire_with_the_token(self):
+        token = make_token(SECRET)
+        exp = jwt.decode(token, SECRET, algorithms=['HS256'])['exp']
+        self.assertIsNotNone(self.verifier.verify(token))
+        with mock.patch('token_auth.time.time', return_value=exp + 1), \
+                mock.patch('token_auth.jwt.decode', side_effect=jwt.ExpiredSignatureError) as decode:
+            self.assertIsNone(self.verifier.verify(token))
+        decode.assert_called_once()
+        self.assertEqual(self.verifier.stats()['entries'], 0)
+
+    def test_lru_is_bounded(self):
+        tokens = [make_token(SECRET, user_id=i) for i in range(3)]
+        for token in tokens:
+            self.verifier.verify(token)
+        self.verifier.verify(tokens[0])  # evicted, decoded again
+        self.assertEqual(self.verifier.stats(), {'entries': 2, 'revoked': 0, 'hits': 0, 'misses': 4})
+
+    def test_revocation(self):
+        token, other = make_token(SECRET), make_token(SECRET, user_id=2)
+        self.verifier.verify(token)
+        self.assertTrue(self.verifier.revoke(token))
+        self.assertIsNone(self.verifier.verify(token))
+        self.assertIsNotNone(self.verifier.verify(other))
+        self.assertFalse(self.verifier.revoke('garbage'))
+
+        expired = jwt.encode({'user_id': 3, 'exp': datetime.now() + timedelta(seconds=1)}, SECRET, algorithm='HS256')
+        self.verifier.revoke(expired)
+        self.assertEqual(self.verifier.stats()['revoked'], 2)
+        with mock.patch('token_auth.time.time', return_value=datetime.now().timestamp() + 3600 * 2):
+            self.verifier.revoke(make_token(SECRET, user_id=4, username='dave'))
+        self.assertEqual(self.verifier.stats()['revoked'], 1)
+
+
+class AuthMiddlewareTest(ServerTestCase):
+    def test_protected_routes_require_a_valid_token(self):
+        self.assertEqual(self.client.get('/files').status_code, 401)
+        self.assertEqual(self.client.get('/files', headers={'Authorization': 'Bearer nope'}).status_code, 401)
+        self.assertEqual(self.client.options('/files').status_code, 200)
+        self.assertEqual(self.client.get('/api/health').status_code, 200)
+
+        token = make_token(server.SECRET_KEY)
+        self.assertEqual(self.client.get('/files', headers={'Authorization': f'Bearer {token}'}).status_code, 200)
+        # Query-string tokens only count where a route opts in
+        self.assertEqual(self.client.get(f'/files?token={token}').status_code, 401)
+        self.assertEqual(self.client.get(f'/download/999?token={token}').status_code, 404)
+
+    def test_logout_revokes_the_token(self):
+        r = self.client.post('/login', json={'username': 'alice', 'password': 'pw123'})
+        headers = {'Authorization': f"Bearer {r.get_json()['token']}"}
+        self.assertEqual(self.client.get('/files', headers=headers).status_code, 200)
+        self.assertEqual(self.client.post('/logout', headers=headers).status_code, 200)
+        self.assertEqual(self.client.get('/files', headers=headers).status_code, 401)
+        self.assertEqual(self.client.post('/logout', headers=headers).status_code, 200)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+import hashlib
+import io
+import os
+import sqlite3
+import unittest
+
+from ai_security import ThreatDetectionEngine, ThreatFeatureAccumulator
+from blob_store import BlobStore
+from helpers import ServerTestCase
+
+SAMPLE = (b'<html><script>document.write("x")</script> see https://example.com/a and ops@example.com '
+          + b'\x00' * 64 + bytes(range(256)) * 40 + b' javascript:void(0)')
+
+
+class FeatureAccumulatorTest(unittest.TestCase):
+    def test_matches_whole_buffer_features_for_any_chunking(self):
+        engine = ThreatDetectionEngine()
+        expected = engine.extract_file_features('page.html', SAMPLE, len(SAMPLE))
+        for chunk_size in (1, 13, 1000, len(SAMPLE)):
+            accumulator = ThreatFeatureAccumulator(engine)
+            for start in range(0, len(SAMPLE), chunk_size):
+                accumulator.update(SAMPLE[start:start + chunk_size])
+            features = accumulator.finalize('page.html', hashlib.sha256(SAMPLE).hexdigest())
+            self.assertEqual(features, expected, f'chunk_size={chunk_size}')
+
+
+class StreamingUploadTest(ServerTestCase):
+    def test_upload_is_hashed_and_scanned_in_one_pass(self):
+        r = self.client.post('/upload', headers=self.headers,
+                             data={'file': (io.BytesIO(SAMPLE), 'page.html')},
+                             content_type='multipart/form-data')
+        self.assertEqual(r.status_code, 200)
+        body = r.get_json()['file']
+        self.assertEqual(body['size'], len(SAMPLE))
+        self.assertEqual(body['hash'], hashlib.md5(SAMPLE).hexdigest())
+        self.assertEqual(body['sha256'], hashlib.sha256(SAMPLE).hexdigest())
+        self.assertGreater(body['threatScore'], 0)
+
+        conn = sqlite3.connect(self.db_file)
+        secure_filename, file_hash = conn.execute('SELECT secure_filename, file_hash FROM files').fetchone()
+        conn.close()
+        self.assertEqual(file_hash, body['sha256'])
+        with open(BlobStore(self.uploads).resolve(secure_filename, file_hash), 'rb') as f:
+            self.assertEqual(f.read(), SAMPLE)
+        self.assertFalse([n for n in os.listdir(self.uploads) if n.endswith('.part')])
+
+    def test_rejected_upload_leaves_no_partial_file(self):
+        r = self.client.post('/upload', headers=self.headers,
+                             data={'attachment': (io.BytesIO(SAMPLE), 'page.html')},
+                             content_type='multipart/form-data')
+        self.assertEqual(r.status_code, 400)
+        self.assertTrue(os.path.isdir(self.uploads))
+        self.assertEqual(os.listdir(self.uploads), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,379 @@
+"""
+Threat Intelligence Hash Index
+SmartSecure Sri Lanka - Bloom-filtered, memory-mapped lookup of known-bad SHA-256 hashes
+
+Usage:
+    python threat_intel.py import FEED [--source NAME] [--threat-name NAME]   # feed -> table -> index
+    python threat_intel.py build                                             # rebuild the index file
+    python threat_intel.py check SHA256
+"""
+import argparse
+import mmap
+import os
+import re
+import struct
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+from db_pool import get_pool
+from request_logging import get_logger
+
+log = get_logger(__name__)
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_DB_PATH = os.path.join(SCRIPT_DIR, 'smartsecure.db')
+DEFAULT_INDEX_PATH = os.getenv('SMARTSECURE_THREAT_INDEX', os.path.join(SCRIPT_DIR, 'threat_intel.idx'))
+
+# Mirrors models.ThreatIntelligence for the SQLite server
+THREAT_INTELLIGENCE_TABLE = '''CREATE TABLE IF NOT EXISTS threat_intelligence (
+    id TEXT PRIMARY KEY,
+    signature_type TEXT NOT NULL,
+    signature_value TEXT NOT NULL,
+    threat_name TEXT NOT NULL,
+    threat_category TEXT NOT NULL,
+    severity TEXT NOT NULL DEFAULT 'MEDIUM',
+    description TEXT,
+    source TEXT NOT NULL,
+    confidence REAL NOT NULL DEFAULT 0.5,
+    metadata TEXT,
+    is_active INTEGER NOT NULL DEFAULT 1,
+    created_at TEXT NOT NULL,
+    updated_at TEXT
+)'''
+
+THREAT_INTELLIGENCE_INDEXES = [
+    'CREATE UNIQUE INDEX IF NOT EXISTS idx_threat_intel_signature ON threat_intelligence (signature_type, signature_value)',
+]
+
+# Index file: header, Bloom filter bits, then the sorted raw 32-byte digests
+_HEADER = struct.Struct('<4sHHQQ')  # magic, format version, hash functions, filter bits, digest count
+_MAGIC = b'SSTI'
+_FORMAT_VERSION = 1
+DIGEST_SIZE = 32
+BITS_PER_ENTRY = 10  # ~1% false positives with 7 hash functions
+HASH_FUNCTIONS = 7
+IMPORT_BATCH_SIZE = 50000
+
+_SHA256_RE = re.compile(r'^[0-9a-fA-F]{64}$')
+_MASK64 = (1 << 64) - 1
+
+
+def ensure_schema(conn):
+    conn.execute(THREAT_INTELLIGENCE_TABLE)
+    for statement in THREAT_INTELLIGENCE_INDEXES:
+        conn.execute(statement)
+
+
+def _bloom_positions(digest: bytes, bits: int) -> Iterator[int]:
+    # SHA-256 output is already uniform: two of its words drive double hashing
+    h1 = int.from_bytes(digest[0:8], 'little')
+    h2 = int.from_bytes(digest[8:16], 'little')
+    for i in range(HASH_FUNCTIONS):
+        yield ((h1 + i * h2) & _MASK64) % bits
+
+
+def build_index(index_path: str, hex_digests: Iterable[str]) -> int:
+    """Write a new index file for `hex_digests` and atomically replace `index_path`"""
+    import numpy as np
+
+    raw = bytearray()
+    for value in hex_digests:
+        raw += bytes.fromhex(value)
+    digests = np.unique(np.frombuffer(bytes(raw), dtype=f'S{DIGEST_SIZE}'))
+    count = len(digests)
+
+    bits = max(64, count * BITS_PER_ENTRY)
+    words = np.frombuffer(digests.tobytes(), dtype='<u8').reshape(-1, DIGEST_SIZE // 8) if count else None
+    bloom = np.zeros(bits, dtype=bool)
+    if count:
+        h1, h2 = words[:, 0], words[:, 1]
+        for i in range(HASH_FUNCTIONS):
+            bloom[(h1 + np.uint64(i) * h2) % np.uint64(bits)] = True
+    bloom_bytes = np.packbits(bloom, bitorder='little').tobytes()
+
+    temp_path = f'{index_path}.{os.getpid()}.tmp'
+    with open(temp_path, 'wb') as f:
+        f.write(_HEADER.pack(_MAGIC, _FORMAT_VERSION, HASH_FUNCTIONS, bits, count))
+        f.write(bloom_bytes)
+        f.write(digests.tobytes())
+    os.replace(temp_path, index_path)
+    return count
+
+
+class ThreatHashIndex:
+    """Read-only view of an index file: Bloom filter in memory, digests memory-mapped.
+
+    Almost every upload is unknown, and the Bloom filter answers those with
+    seven bit probes and no I/O. Filter hits are confirmed by binary search
+    over the sorted digest array, which the OS pages in on demand, so even
+    feeds with millions of hashes cost little resident memory.
+    """
+
+    def __init__(self, index_path: Optional[str]):
+        self.index_path = index_path
+        self.count = 0
+        self._bits = 0
+        self._bloom = b''
+        self._file = None
+        self._map = None
+        self._digests_at = 0
+        if index_path and os.path.exists(index_path) and os.path.getsize(index_path) >= _HEADER.size:
+            self._open()
+
+    def _open(self):
+        self._file = open(self.index_path, 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, functions, bits, count = _HEADER.unpack_from(self._map, 0)
+        if magic != _MAGIC or version != _FORMAT_VERSION or functions != HASH_FUNCTIONS:
+            self.close()
+            raise ValueError(f'Unsupported threat index file: {self.index_path}')
+        bloom_size = (bits + 7) // 8
+        self._bits, self.count = bits, count
+        self._bloom = self._map[_HEADER.size:_HEADER.size + bloom_size]
+        self._digests_at = _HEADER.size + bloom_size
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self.count = 0
+
+    def might_contain(self, digest: bytes) -> bool:
+        if not self.count:
+            return False
+        bloom = self._bloom
+        return all(bloom[pos >> 3] & (1 << (pos & 7)) for pos in _bloom_positions(digest, self._bits))
+
+    def __contains__(self, sha256_hex: str) -> bool:
+        if not self.count or not _SHA256_RE.match(sha256_hex or ''):
+            return False
+        digest = bytes.fromhex(sha256_hex)
+        if not self.might_contain(digest):
+            return False
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            start = self._digests_at + middle * DIGEST_SIZE
+            current = self._map[start:start + DIGEST_SIZE]
+            if current < digest:
+                low = middle + 1
+            elif current > digest:
+                high = middle
+            else:
+                return True
+        return False
+
+
+class ThreatIntelligence:
+    """Known-bad hash lookups for the server, following index rebuilds on disk.
+
+    The index file is re-opened when its modification time changes (checked
+    at most every `check_interval` seconds). The ``threat_intelligence`` table
+    is the source of truth: an index hit only counts if the table still has
+    an active row for the hash, so deactivating a row takes effect before the
+    index is rebuilt.
+    """
+
+    def __init__(self, db_path: str, index_path: str = DEFAULT_INDEX_PATH, check_interval: float = 5.0):
+        self.db_path = db_path
+        self.index_path = index_path
+        self.check_interval = check_interval
+        self._index = ThreatHashIndex(None)
+        self._mtime = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self.reload()
+
+    def reload(self) -> bool:
+        with self._lock:
+            self._checked_at = time.monotonic()
+            try:
+                mtime = os.stat(self.index_path).st_mtime_ns
+            except OSError:
+                mtime = None
+            if mtime == self._mtime:
+                return False
+            try:
+                index = ThreatHashIndex(self.index_path)
+            except (OSError, ValueError) as e:
+                log.warning('Keeping current threat index, could not load %s: %s', self.index_path, e)
+                return False
+            self._index, self._mtime = index, mtime
+            return True
+
+    @property
+    def index(self) -> ThreatHashIndex:
+        if time.monotonic() - self._checked_at >= self.check_interval:
+            self.reload()
+        return self._index
+
+    def match(self, sha256_hex: Optional[str]) -> Optional[Dict]:
+        """Threat details if `sha256_hex` is an active known-bad hash, else None"""
+        if not sha256_hex or sha256_hex.lower() not in self.index:
+            return None
+        with get_pool(self.db_path).connection() as conn:
+            ensure_schema(conn)
+            row = conn.execute('''
+                SELECT threat_name, threat_category, severity, source FROM threat_intelligence
+                WHERE signature_type = 'file_hash' AND signature_value = ? AND is_active = 1
+            ''', (sha256_hex.lower(),)).fetchone()
+        if row is None:  # deactivated (or removed) since the index was built
+            return None
+        return dict(zip(('threat_name', 'threat_category', 'severity', 'source'), row))
+
+    def index_is_stale(self) -> bool:
+        """True if the index file is missing, or the table changed after it was built"""
+        try:
+            built_at = os.stat(self.index_path).st_mtime
+        except OSError:
+            return True
+        with get_pool(self.db_path).connection() as conn:
+            ensure_schema(conn)
+            last_change = conn.execute('''
+                SELECT MAX(COALESCE(updated_at, created_at)) FROM threat_intelligence
+                WHERE signature_type = 'file_hash'
+            ''').fetchone()[0]
+        try:
+            changed = datetime.fromisoformat(last_change) if last_change else None
+        except ValueError:
+            changed = None
+        if changed is not None:
+            if changed.tzinfo is None:  # SQLite's CURRENT_TIMESTAMP is naive UTC
+                changed = changed.replace(tzinfo=timezone.utc)
+            if changed.timestamp() > built_at:
+                return True
+        # Rows edited without touching updated_at still show up as a different hash count
+        self.reload()
+        return len({value.lower() for value in table_hashes(self.db_path)}) != self._index.count
+
+    def rebuild_if_stale(self) -> Optional[int]:
+        """Rebuild the index from the table if it is missing or stale; returns the hashes indexed"""
+        if not self.index_is_stale():
+            return None
+        started = time.monotonic()
+        count = build_index(self.index_path, table_hashes(self.db_path))
+        self.reload()
+        log.info('Rebuilt threat index %s from the table: %d hashes in %.1fs', self.index_path, count,
+                 time.monotonic() - started)
+        return count
+
+
+# -- feed import --
+
+def known_threat_analysis(threat: Dict, file_hash: str) -> Dict:
+    """Scan verdict for a file whose hash matched; listed hashes skip the analysis engine"""
+    return {
+        'threat_score': 1.0,
+        'is_safe': False,
+        'cached': False,
+        'file_category': 'unknown',
+        'risk_factors': [f"Known threat: {threat['threat_name']} "
+                         f"({threat['threat_category']}, source: {threat['source']})"],
+        'known_threat': threat,
+        'features': {'file_hash': file_hash},
+    }
+
+
+def read_feed(path: str) -> Iterator[Tuple[str, Optional[str], Optional[str], Optional[str]]]:
+    """Yield ``(sha256, threat_name, category, severity)`` from a feed file.
+
+    Lines are a bare SHA-256 or ``sha256,threat_name[,category[,severity]]``;
+    blank lines, ``#`` comments and other hash types are skipped.
+    """
+    with open(path, 'r', encoding='utf-8', errors='replace') as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            fields = [field.strip() for field in line.split(',')]
+            if not _SHA256_RE.match(fields[0]):
+                continue
+            fields += [None] * (4 - len(fields))
+            yield fields[0].lower(), fields[1] or None, fields[2] or None, (fields[3] or '').upper() or None
+
+
+def import_feed(db_path: str, feed_path: str, source: str, threat_name: str = 'Known malicious file',
+                category: str = 'malware', severity: str = 'HIGH') -> int:
+    """Insert a feed's hashes into threat_intelligence in batches; returns rows added"""
+    now = datetime.now(timezone.utc).isoformat()
+    added = 0
+    batch = []
+
+    def flush():
+        nonlocal added
+        with get_pool(db_path).connection() as conn:
+            ensure_schema(conn)
+            before = conn.total_changes
+            conn.executemany('''
+                INSERT OR IGNORE INTO threat_intelligence
+                (id, signature_type, signature_value, threat_name, threat_category, severity, source,
+                 confidence, is_active, created_at, updated_at)
+                VALUES (?, 'file_hash', ?, ?, ?, ?, ?, 0.9, 1, ?, ?)
+            ''', batch)
+            added += conn.total_changes - before
+        batch.clear()
+
+    for sha256, name, feed_category, feed_severity in read_feed(feed_path):
+        batch.append((str(uuid.uuid4()), sha256, name or threat_name, feed_category or category,
+                      feed_severity or severity, source, now, now))
+        if len(batch) >= IMPORT_BATCH_SIZE:
+            flush()
+    if batch:
+        flush()
+    return added
+
+
+def table_hashes(db_path: str) -> Iterator[str]:
+    with get_pool(db_path).connection() as conn:
+        ensure_schema(conn)
+        cursor = conn.execute('''
+            SELECT signature_value FROM threat_intelligence
+            WHERE signature_type = 'file_hash' AND is_active = 1
+        ''')
+        for (value,) in cursor:
+            if _SHA256_RE.match(value):
+                yield value
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Manage the known-bad file hash index')
+    parser.add_argument('--db', default=DEFAULT_DB_PATH)
+    parser.add_argument('--index', default=DEFAULT_INDEX_PATH)
+    commands = parser.add_subparsers(dest='command', required=True)
+    import_cmd = commands.add_parser('import', help='add a feed file to threat_intelligence and rebuild the index')
+    import_cmd.add_argument('feed')
+    import_cmd.add_argument('--source', default='external_feed')
+    import_cmd.add_argument('--threat-name', default='Known malicious file')
+    import_cmd.add_argument('--category', default='malware')
+    import_cmd.add_argument('--severity', default='HIGH')
+    # The server only honours hashes with an active table row, so the index is always built from the table
+    commands.add_parser('build', help='rebuild the index from threat_intelligence')
+    check_cmd = commands.add_parser('check', help='look up one SHA-256')
+    check_cmd.add_argument('sha256')
+    args = parser.parse_args(argv)
+
+    if args.command == 'check':
+        known = args.sha256.lower() in ThreatHashIndex(args.index)
+        print(f"{'🚨 KNOWN BAD' if known else '✅ not listed'}: {args.sha256}")
+        return 1 if known else 0
+
+    if args.command == 'import':
+        started = time.monotonic()
+        added = import_feed(args.db, args.feed, args.source, args.threat_name, args.category, args.severity)
+        print(f"✅ Imported {added} new hashes from {args.feed} in {time.monotonic() - started:.1f}s")
+    hashes = table_hashes(args.db)
+
+    started = time.monotonic()
+    count = build_index(args.index, hashes)
+    print(f"✅ Indexed {count} hashes into {args.index} in {time.monotonic() - started:.1f}s")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
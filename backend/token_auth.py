@@ -0,0 +1,158 @@
+"""
+Cached JWT Authentication
+SmartSecure Sri Lanka - verified-claims LRU, token revocation and the request auth middleware
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Tuple
+
+import jwt
+from flask import Flask, current_app, g, jsonify, request
+
+from request_logging import get_logger
+
+log = get_logger('auth')
+
+# Verified tokens remembered per process; each entry is ~1 KB
+DEFAULT_CACHE_SIZE = 4096
+
+
+def token_digest(token: str) -> bytes:
+    return hashlib.blake2b(token.encode('utf-8'), digest_size=16).digest()
+
+
+class TokenVerifier:
+    """HMAC-verified JWT claims, cached by token digest until the token's ``exp``.
+
+    The first request with a token pays for the signature check and decode;
+    later ones are a dict lookup. Invalid tokens are never cached. Revoked
+    tokens are dropped from the cache and remembered until they would have
+    expired anyway, so the revocation list stays bounded by the token
+    lifetime. Both structures are per process. Returned claims are shared
+    between requests and must not be modified.
+    """
+
+    def __init__(self, secret_key: str, algorithm: str = 'HS256', max_entries: int = DEFAULT_CACHE_SIZE):
+        self.secret_key = secret_key
+        self.algorithm = algorithm
+        self.max_entries = max_entries
+        self._verified: 'OrderedDict[bytes, Tuple[float, Dict]]' = OrderedDict()
+        self._revoked: Dict[bytes, float] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def verify(self, token: Optional[str]) -> Optional[Dict]:
+        """Claims of a valid, unexpired, unrevoked token, else None"""
+        if not token:
+            return None
+        key = token_digest(token)
+        now = time.time()
+        with self._lock:
+            entry = self._verified.get(key)
+            if entry is not None:
+                if now < entry[0]:
+                    self._verified.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                del self._verified[key]
+            if key in self._revoked:
+                return None
+            self.misses += 1
+
+        try:
+            claims = jwt.decode(token, self.secret_key, algorithms=[self.algorithm], options={'require': ['exp']})
+        except jwt.InvalidTokenError as e:
+            log.info('Token verification error: %s', e)
+            return None
+
+        with self._lock:
+            if key in self._revoked:  # logged out while we were decoding
+                return None
+            self._verified[key] = (float(claims['exp']), claims)
+            if len(self._verified) > self.max_entries:
+                self._verified.popitem(last=False)
+        return claims
+
+    def revoke(self, token: Optional[str]) -> bool:
+        """Reject `token` from now on; returns False if it was not valid to begin with"""
+        claims = self.verify(token)
+        if claims is None:
+            return False
+        key = token_digest(token)
+        now = time.time()
+        with self._lock:
+            self._verified.pop(key, None)
+            self._revoked = {k: exp for k, exp in self._revoked.items() if exp > now}
+            self._revoked[key] = float(claims['exp'])
+        return True
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {'entries': len(self._verified), 'revoked': len(self._revoked),
+                    'hits': self.hits, 'misses': self.misses}
+
+
+def bearer_token() -> Optional[str]:
+    header = request.headers.get('Authorization', '')
+    if header[:7].lower() == 'bearer ':
+        header = header[7:]
+    return header.strip() or None  # a bare token has always been accepted too
+
+
+def login_required(view: Optional[Callable] = None, *, query_token: bool = False):
+    """Mark a view as needing a valid token; TokenAuth enforces it before the view runs.
+
+    ``query_token=True`` also accepts ``?token=`` (for links opened outside the SPA,
+    e.g. downloads). Use as ``@login_required`` or ``@login_required(query_token=True)``.
+    """
+    def mark(func):
+        func.auth_options = {'query_token': query_token}
+        return func
+    return mark(view) if view is not None else mark
+
+
+class TokenAuth:
+    """before_request middleware: resolves the bearer token once per request.
+
+    Sets ``g.user`` (the token claims, or None) and ``g.token`` for every
+    request, and answers 401 for views marked with login_required before they
+    run. CORS preflight (OPTIONS) requests are passed through untouched.
+    """
+
+    def __init__(self, app: Optional[Flask] = None, secret_key: Optional[str] = None,
+                 max_entries: int = DEFAULT_CACHE_SIZE):
+        self.verifier = TokenVerifier(secret_key, max_entries=max_entries) if secret_key else None
+        if app is not None:
+            self.init_app(app, secret_key)
+
+    def init_app(self, app: Flask, secret_key: Optional[str] = None):
+        if self.verifier is None:
+            self.verifier = TokenVerifier(secret_key or app.config['JWT_SECRET_KEY'])
+        app.extensions['token_auth'] = self
+        app.before_request(self._authenticate)
+
+    def _authenticate(self):
+        g.user = None
+        g.token = None
+        if request.method == 'OPTIONS':
+            return None
+        view = current_app.view_functions.get(request.endpoint)
+        options = getattr(view, 'auth_options', None)
+        token = bearer_token()
+        if token is None and options and options['query_token']:
+            token = request.args.get('token')
+        if token:
+            g.token = token
+            g.user = self.verifier.verify(token)
+        if options is not None and g.user is None:
+            return jsonify({'success': False, 'error': 'Unauthorized', 'message': 'Unauthorized'}), 401
+        return None
+
+    def verify(self, token: Optional[str]) -> Optional[Dict]:
+        return self.verifier.verify(token)
+
+    def revoke(self, token: Optional[str]) -> bool:
+        return self.verifier.revoke(token)
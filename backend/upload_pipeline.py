@@ -0,0 +1,142 @@
+"""
+Streaming Upload Pipeline
+SmartSecure Sri Lanka - single-pass write, hash, size and scan for uploads
+"""
+import hashlib
+import io
+import os
+import tempfile
+from typing import Dict, Optional
+
+from flask import Request
+from werkzeug.datastructures import FileStorage
+
+from ai_security import ThreatFeatureAccumulator, get_threat_detector
+
+# Size of the blocks read from the request body and written to disk
+CHUNK_SIZE = 64 * 1024
+
+
+class StreamingUploadSink(io.RawIOBase):
+    """Writable temp file inside the uploads directory that hashes and scans as it is written.
+
+    Werkzeug's multipart parser writes each file part straight into this object,
+    so the upload is read from the socket once and never held in memory. Until
+    commit() moves it into place the data lives in a hidden ``.part`` file that
+    is removed again on close().
+    """
+
+    def __init__(self, upload_dir: str):
+        super().__init__()
+        os.makedirs(upload_dir, exist_ok=True)
+        fd, self.temp_path = tempfile.mkstemp(prefix='.upload-', suffix='.part', dir=upload_dir)
+        self._file = os.fdopen(fd, 'w+b')
+        self._sha256 = hashlib.sha256()
+        self._md5 = hashlib.md5()
+        self.features = ThreatFeatureAccumulator(get_threat_detector())
+        self.committed_path: Optional[str] = None
+
+    # -- file object protocol used by werkzeug / FileStorage --
+
+    def readable(self):
+        return True
+
+    def writable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def write(self, data):
+        self._file.write(data)
+        self._sha256.update(data)
+        self._md5.update(data)
+        self.features.update(data)
+        return len(data)
+
+    def read(self, size=-1):
+        return self._file.read(size)
+
+    def readinto(self, buffer):
+        return self._file.readinto(buffer)
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        return self._file.seek(offset, whence)
+
+    def tell(self):
+        return self._file.tell()
+
+    def flush(self):
+        if not self._file.closed:
+            self._file.flush()
+
+    # -- results --
+
+    @property
+    def size(self) -> int:
+        return self.features.size
+
+    @property
+    def sha256(self) -> str:
+        return self._sha256.hexdigest()
+
+    @property
+    def md5(self) -> str:
+        return self._md5.hexdigest()
+
+    def commit(self, final_path: str) -> str:
+        """Move the fully written upload to its permanent path"""
+        self._file.flush()
+        self._file.close()
+        os.replace(self.temp_path, final_path)
+        self.committed_path = final_path
+        return final_path
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+        if self.committed_path is None and os.path.exists(self.temp_path):
+            os.unlink(self.temp_path)
+        super().close()
+
+
+class StreamingUploadRequest(Request):
+    """Flask request that streams multipart file parts into StreamingUploadSink objects"""
+
+    upload_dir: Optional[str] = None
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if self.upload_dir is None:
+            return super()._get_file_stream(total_content_length, content_type, filename, content_length)
+        return StreamingUploadSink(self.upload_dir)
+
+
+def install_streaming_uploads(app, upload_dir: str):
+    """Make every multipart file part of `app` stream into `upload_dir`"""
+    app.request_class = type('AppStreamingUploadRequest', (StreamingUploadRequest,), {'upload_dir': upload_dir})
+
+
+def receive_upload(file: FileStorage, upload_dir: str) -> StreamingUploadSink:
+    """Return the sink holding `file`, copying it through one in chunks if it was not streamed"""
+    if isinstance(file.stream, StreamingUploadSink):
+        return file.stream
+
+    sink = StreamingUploadSink(upload_dir)
+    try:
+        while True:
+            chunk = file.stream.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            sink.write(chunk)
+    except Exception:
+        sink.close()
+        raise
+    return sink
+
+
+def scan_result(sink: StreamingUploadSink, filename: str, scan_cache=None) -> Dict:
+    """Score the features gathered while the upload was written, caching them by content hash"""
+    features = sink.features.finalize(filename, sink.sha256)
+    engine = get_threat_detector()
+    engine.cache_features(scan_cache, features)
+    return engine.score_features(filename, features)
@@ -28,14 +28,8 @@ const AdvancedFileManager = () => {
 
   const loadFiles = async () => {
     try {
-      const response = await fetch(`${authService.getApiUrl()}/files`, {
-        headers: {
-          'Authorization': `Bearer ${authService.getToken()}`
-        }
-      });
-      
-      if (response.ok) {
-        const data = await response.json();
+      const data = await authService.getFiles();
+      if (data.success) {
         setFiles(data.files || []);
       }
     } catch (error) {
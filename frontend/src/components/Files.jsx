@@ -87,7 +87,10 @@ const Files = () => {
 
   const handleDownload = async (file) => {
     try {
-      const downloadUrl = `${authService.getApiUrl()}${file.downloadUrl}?token=${authService.getToken()}`;
+      // Signed links expire on their own, so the session token never ends up in URLs or access logs
+      const downloadUrl = file.signedDownloadUrl
+        ? `${authService.getApiUrl()}${file.signedDownloadUrl}`
+        : `${authService.getApiUrl()}${file.downloadUrl}?token=${authService.getToken()}`;
       const link = document.createElement('a');
       link.href = downloadUrl;
       link.download = file.filename;
@@ -108,7 +111,9 @@ const Files = () => {
   const ImagePreview = ({ file }) => {
     const [imageLoaded, setImageLoaded] = useState(false);
     const [imageError, setImageError] = useState(false);
-    const previewUrl = `${authService.getApiUrl()}${file.previewUrl}?token=${authService.getToken()}`;
+    const previewUrl = file.signedPreviewUrl
+      ? `${authService.getApiUrl()}${file.signedPreviewUrl}`
+      : `${authService.getApiUrl()}${file.previewUrl}?token=${authService.getToken()}`;
 
     return (
       <div className="relative w-full h-32 bg-gray-100 rounded-lg overflow-hidden">
@@ -227,14 +227,25 @@ class AuthService {
     }
   }
 
-  // Get user files
+  // Get user files (every page: /files returns them newest first, a page at a time)
   async getFiles() {
     try {
-      const response = await fetch(`${API_BASE_URL}/files`, {
-        headers: this.getAuthHeaders(),
-      });
+      const files = [];
+      let cursor = null;
+      do {
+        const query = cursor ? `?cursor=${encodeURIComponent(cursor)}` : '';
+        const response = await fetch(`${API_BASE_URL}/files${query}`, {
+          headers: this.getAuthHeaders(),
+        });
+        const data = await response.json();
+        if (!data.success) {
+          return data;
+        }
+        files.push(...(data.files || []));
+        cursor = data.next_cursor;
+      } while (cursor);
 
-      return await response.json();
+      return { success: true, files };
     } catch (error) {
       console.error('Get files error:', error);
       return { success: false, error: 'Failed to fetch files' };